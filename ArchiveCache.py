@@ -0,0 +1,420 @@
+'''Local store of filing archives (enclosure zip files) shared by Edgar rendering, formula runs and
+storing filings into xbrlDB
+
+Archives are stored content addressed (by sha256 of the zip file) under the cache folder and indexed
+in `filingArchives` table (collection in mongodb) of the rssDB by accession number and enclosure size
+as listed in the rss feed, so the same filing processed repeatedly (with different formulae for example)
+is downloaded only once. The total size of the stored archives is kept under a disk budget by evicting
+the least recently used archives.
+
+Consumers use the local archive either directly (`entryUrl` returns the path of the filing entry point
+inside the local zip file) or through arelle web cache (`linkIntoWebCache`) for code that loads filings
+from the enclosure url, such as Edgar renderer.
+
+`archivePrefetcher` downloads the archives of the next filings in background threads while the current
+filing is processed, all downloads in the process are spaced to stay within SEC request rate limit.
+'''
+
+import os, time, shutil, hashlib, logging, tempfile, threading, concurrent.futures
+from collections import OrderedDict, deque
+from contextlib import closing
+from datetime import datetime
+
+archiveIndexTable = 'filingArchives'
+archiveIndexCols = ['accessionNumber', 'enclosureSize', 'sha256', 'enclosureUrl', 'path', 'sizeBytes', 'dateTimeAdded', 'lastAccessed', 'hits']
+defaultMaxBytes = 20 * 1024 ** 3
+downloadChunkSize = 1024 * 1024
+# SEC fair access policy allows up to 10 requests per second
+secMaxRequestsPerSec = 10
+defaultPrefetchAhead = 4
+
+archiveIndexDDL = {
+    'sqlite': '''CREATE TABLE IF NOT EXISTS "filingArchives" (
+                    "accessionNumber" TEXT NOT NULL,
+                    "enclosureSize" INTEGER NOT NULL DEFAULT 0,
+                    "sha256" TEXT NOT NULL,
+                    "enclosureUrl" TEXT,
+                    "path" TEXT NOT NULL,
+                    "sizeBytes" INTEGER,
+                    "dateTimeAdded" TEXT,
+                    "lastAccessed" TEXT,
+                    "hits" INTEGER DEFAULT 0,
+                    PRIMARY KEY ("accessionNumber", "enclosureSize"))''',
+    'postgres': '''CREATE TABLE IF NOT EXISTS "filingArchives" (
+                    "accessionNumber" TEXT NOT NULL,
+                    "enclosureSize" BIGINT NOT NULL DEFAULT 0,
+                    "sha256" TEXT NOT NULL,
+                    "enclosureUrl" TEXT,
+                    "path" TEXT NOT NULL,
+                    "sizeBytes" BIGINT,
+                    "dateTimeAdded" TIMESTAMP WITHOUT TIME ZONE,
+                    "lastAccessed" TIMESTAMP WITHOUT TIME ZONE,
+                    "hits" INTEGER DEFAULT 0,
+                    PRIMARY KEY ("accessionNumber", "enclosureSize"))'''
+}
+
+def archiveKey(rssItem):
+    '''Returns (accessionNumber, enclosureSize) of rssItem'''
+    enclosure = rssItem.find('enclosure')
+    size = enclosure.get('length') if enclosure is not None else None
+    return (rssItem.accessionNumber, int(size) if size and str(size).isdigit() else 0)
+
+def enclosureUrl(rssItem):
+    url = getattr(rssItem, 'enclosureUrl', None)
+    if not url:
+        enclosure = rssItem.find('enclosure')
+        url = enclosure.get('url') if enclosure is not None else None
+    return url
+
+class requestRateLimiter:
+    '''Spaces requests made from any thread to at most maxPerSec'''
+    def __init__(self, maxPerSec=secMaxRequestsPerSec):
+        self.lock = threading.Lock()
+        self.nextTime = 0
+        self.setRate(maxPerSec)
+
+    def setRate(self, maxPerSec):
+        self.interval = 1.0 / maxPerSec if maxPerSec else 0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            waitTime = self.nextTime - now
+            self.nextTime = max(now, self.nextTime) + self.interval
+        if waitTime > 0:
+            time.sleep(waitTime)
+
+# shared by all SEC requests of the process, rate is set once from --rssDBsecMaxRequestsPerSec
+secRateLimiter = requestRateLimiter()
+
+def getArchiveCache(conn):
+    '''Returns archive cache of the connection, created from controller config `rssDBArchiveCacheDir` and
+    `rssDBArchiveCacheMaxBytes` if not already set, None if not configured'''
+    archiveCache = getattr(conn, 'archiveCache', None)
+    if archiveCache is None:
+        cacheDir = conn.cntlr.config.get('rssDBArchiveCacheDir')
+        if cacheDir:
+            archiveCache = conn.archiveCache = filingArchiveCache(conn, cacheDir, conn.cntlr.config.get('rssDBArchiveCacheMaxBytes', defaultMaxBytes))
+    return archiveCache
+
+class filingArchiveCache:
+    '''Size bounded store of filing archives with LRU eviction, indexed in the rssDB
+
+    Downloads are done outside the lock so archives can be fetched from several threads, index
+    updates (and db writes) are serialized.
+    '''
+    def __init__(self, conn, cacheDir, maxBytes=defaultMaxBytes, prefetchAhead=defaultPrefetchAhead):
+        self.conn = conn
+        self.cacheDir = os.path.abspath(cacheDir)
+        self.tmpDir = os.path.join(self.cacheDir, 'tmp')
+        os.makedirs(self.tmpDir, exist_ok=True)
+        self.maxBytes = int(maxBytes)
+        self.prefetchAhead = prefetchAhead
+        self.rateLimiter = secRateLimiter
+        self.lock = threading.RLock()
+        # (accessionNumber, enclosureSize): entry, least recently used first
+        self.index = OrderedDict()
+        self.stats = OrderedDict([('hits', 0), ('misses', 0), ('evicted', 0), ('downloadedBytes', 0)])
+        self.dbFile = conn.conParams.get('database', '')
+        self.verifyIndexTable()
+        self.loadIndex()
+
+    @property
+    def totalBytes(self):
+        return sum(x['sizeBytes'] or 0 for x in self.index.values())
+
+    def verifyIndexTable(self):
+        if self.conn.product == 'mongodb':
+            self.conn.dbConn[archiveIndexTable].create_index([('accessionNumber', 1), ('enclosureSize', 1)], unique=True, background=False)
+        elif archiveIndexTable not in self.conn.tablesInDB():
+            try:
+                self.conn.execute(archiveIndexDDL[self.conn.product], fetch=False, close=False)
+                self.conn.commit()
+                self.conn.refreshSchemaCache()
+            except Exception as e:
+                self.conn.rollback()
+                raise e
+
+    def loadIndex(self):
+        '''Loads index from db, dropping entries with missing archive files'''
+        if self.conn.product == 'mongodb':
+            rows = list(self.conn.dbConn[archiveIndexTable].find({}, {'_id': 0}))
+        else:
+            res = self.conn.execute('SELECT {} FROM "{}"'.format(', '.join('"{}"'.format(c) for c in archiveIndexCols), archiveIndexTable), close=False)
+            rows = [dict(zip(archiveIndexCols, x)) for x in res]
+        missing = []
+        for row in sorted(rows, key=lambda x: str(x['lastAccessed'] or '')):
+            key = (row['accessionNumber'], row['enclosureSize'])
+            if os.path.isfile(os.path.join(self.cacheDir, row['path'])):
+                self.index[key] = row
+            else:
+                missing.append(key)
+        if missing:
+            self._deleteEntries(missing)
+        return len(self.index)
+
+    def _saveEntry(self, entry):
+        if self.conn.product == 'mongodb':
+            self.conn.dbConn[archiveIndexTable].replace_one({'accessionNumber': entry['accessionNumber'], 'enclosureSize': entry['enclosureSize']},
+                                                            dict(entry), upsert=True)
+            return
+        try:
+            self._deleteEntries([(entry['accessionNumber'], entry['enclosureSize'])], commit=False)
+            self.conn.execute('INSERT INTO "{}" ({}) VALUES ({})'.format(archiveIndexTable, ', '.join('"{}"'.format(c) for c in archiveIndexCols),
+                                ', '.join(self._sqlValue(entry[c]) for c in archiveIndexCols)), fetch=False, close=False)
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            raise e
+
+    def _sqlValue(self, value):
+        if value is None:
+            return 'NULL'
+        if isinstance(value, int):
+            return str(value)
+        if isinstance(value, datetime):
+            value = value.strftime('%Y-%m-%d %H:%M:%S')
+        return self.conn.dbStr(value)
+
+    def _deleteEntries(self, keys, commit=True):
+        if not keys:
+            return
+        if self.conn.product == 'mongodb':
+            for accessionNumber, enclosureSize in keys:
+                self.conn.dbConn[archiveIndexTable].delete_one({'accessionNumber': accessionNumber, 'enclosureSize': enclosureSize})
+            return
+        try:
+            for accessionNumber, enclosureSize in keys:
+                self.conn.execute('DELETE FROM "{}" WHERE "accessionNumber" = {} AND "enclosureSize" = {}'.format(
+                                    archiveIndexTable, self.conn.dbStr(accessionNumber), int(enclosureSize)), fetch=False, close=False)
+            if commit:
+                self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            raise e
+
+    def _touch(self, key):
+        entry = self.index[key]
+        entry['lastAccessed'] = datetime.now()
+        entry['hits'] = (entry['hits'] or 0) + 1
+        self.index.move_to_end(key)
+        if self.conn.product == 'mongodb':
+            self.conn.dbConn[archiveIndexTable].update_one({'accessionNumber': key[0], 'enclosureSize': key[1]},
+                                                            {'$set': {'lastAccessed': entry['lastAccessed'], 'hits': entry['hits']}})
+            return
+        try:
+            self.conn.execute('UPDATE "{}" SET "lastAccessed" = {}, "hits" = {} WHERE "accessionNumber" = {} AND "enclosureSize" = {}'.format(
+                                archiveIndexTable, self._sqlValue(entry['lastAccessed']), entry['hits'], self.conn.dbStr(key[0]), int(key[1])),
+                                fetch=False, close=False)
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            raise e
+
+    def lookup(self, rssItem):
+        '''Returns path of cached archive of rssItem or None if not cached'''
+        key = archiveKey(rssItem)
+        with self.lock:
+            if key not in self.index:
+                return None
+            path = os.path.join(self.cacheDir, self.index[key]['path'])
+            if not os.path.isfile(path):
+                self.index.pop(key)
+                self._deleteEntries([key])
+                return None
+            self._touch(key)
+            self.stats['hits'] += 1
+            return path
+
+    def _download(self, url):
+        '''Downloads url to a temp file in cache folder, returns (tempPath, sha256, size)'''
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmpPath = tempfile.mkstemp(suffix='.zip', dir=self.tmpDir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                self.rateLimiter.wait()
+                with closing(self.conn.cntlr.webCache.opener.open(url)) as resp:
+                    while True:
+                        chunk = resp.read(downloadChunkSize)
+                        if not chunk:
+                            break
+                        sha.update(chunk)
+                        size += len(chunk)
+                        f.write(chunk)
+        except Exception as e:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise e
+        return tmpPath, sha.hexdigest(), size
+
+    def get(self, rssItem, reload=False):
+        '''Returns local path of rssItem archive, downloading it if not cached (or reload)'''
+        if not reload:
+            path = self.lookup(rssItem)
+            if path:
+                return path
+        return self._store(*self._fetch(rssItem, reload=True))
+
+    def _fetch(self, rssItem, reload=False):
+        '''Downloads archive of rssItem unless cached (or reload), returns (key, url, download, elapsed), download
+        is None if cached else (tempPath, sha256, size), does not touch the db so can be called from any thread'''
+        key = archiveKey(rssItem)
+        url = enclosureUrl(rssItem)
+        if not reload:
+            with self.lock:
+                if key in self.index and os.path.isfile(os.path.join(self.cacheDir, self.index[key]['path'])):
+                    return key, url, None, 0
+        return self._fetchUrl(key, url)
+
+    def _fetchUrl(self, key, url):
+        if not url:
+            raise Exception(_('No enclosure url for filing {}').format(key[0]))
+        startTime = time.perf_counter()
+        download = self._download(url)
+        return key, url, download, time.perf_counter() - startTime
+
+    def _store(self, key, url, download, elapsed=0):
+        '''Adds downloaded archive to the store and index, returns local path'''
+        if download is None:
+            with self.lock:
+                entry = self.index.get(key)
+                path = os.path.join(self.cacheDir, entry['path']) if entry else None
+                if path and os.path.isfile(path):
+                    self._touch(key)
+                    self.stats['hits'] += 1
+                    return path
+            # evicted after fetch
+            key, url, download, elapsed = self._fetchUrl(key, url)
+        tmpPath, sha, size = download
+        if key[1] and size != key[1]:
+            self.conn.addToLog(_('Archive size of {} ({:,} bytes) differs from enclosure size in feed ({:,} bytes)').format(key[0], size, key[1]),
+                                messageCode="RssDB.Info", file=self.dbFile, level=logging.INFO)
+        relPath = os.path.join(sha[:2], sha + '.zip')
+        path = os.path.join(self.cacheDir, relPath)
+        with self.lock:
+            self.stats['misses'] += 1
+            self.stats['downloadedBytes'] += size
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.isfile(path):
+                # same content already stored for another key
+                os.remove(tmpPath)
+            else:
+                os.replace(tmpPath, path)
+            oldEntry = self.index.pop(key, None)
+            if oldEntry and oldEntry['path'] != relPath:
+                self._removeFile(oldEntry['path'])
+            now = datetime.now()
+            entry = OrderedDict([('accessionNumber', key[0]), ('enclosureSize', key[1]), ('sha256', sha), ('enclosureUrl', url),
+                                 ('path', relPath), ('sizeBytes', size), ('dateTimeAdded', now), ('lastAccessed', now),
+                                 ('hits', 0)])
+            self.index[key] = entry
+            self._saveEntry(entry)
+            self.evict(keep=key)
+        self.conn.metrics.observe('fetch', elapsed, source='filingArchive')
+        return path
+
+    def entryUrl(self, rssItem, reload=False, archivePath=None):
+        '''Returns path of rssItem entry point (instance or inline document) inside the local archive'''
+        fileName = (rssItem.url or '').rpartition('/')[2]
+        return (archivePath or self.get(rssItem, reload=reload)) + '/' + fileName
+
+    def _removeFile(self, relPath):
+        # archives are content addressed, keep file if used by another entry
+        if any(x['path'] == relPath for x in self.index.values()):
+            return
+        path = os.path.join(self.cacheDir, relPath)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def evict(self, keep=None):
+        '''Removes least recently used archives until total size is within the disk budget'''
+        evicted = []
+        with self.lock:
+            total = self.totalBytes
+            for key in list(self.index.keys()):
+                if total <= self.maxBytes:
+                    break
+                if key == keep:
+                    continue
+                entry = self.index.pop(key)
+                self._removeFile(entry['path'])
+                total -= entry['sizeBytes'] or 0
+                evicted.append(key)
+            if evicted:
+                self._deleteEntries(evicted)
+                self.stats['evicted'] += len(evicted)
+                self.conn.addToLog(_('Evicted {} archive(s) from filing archive cache, cache size {:,} bytes').format(len(evicted), total),
+                                    messageCode="RssDB.Info", file=self.dbFile, level=logging.INFO)
+        return evicted
+
+    def linkIntoWebCache(self, webCache, rssItem, archivePath=None):
+        '''Places the cached archive of rssItem at arelle web cache path of its enclosure url, so arelle loads
+        it from the local store, returns web cache path'''
+        url = enclosureUrl(rssItem)
+        path = archivePath or self.get(rssItem)
+        if not url or not hasattr(webCache, 'urlToCachepath'):
+            return None
+        cachePath = webCache.urlToCachepath(url)
+        if os.path.isfile(cachePath) and os.path.getsize(cachePath) == os.path.getsize(path):
+            return cachePath
+        os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+        if os.path.exists(cachePath):
+            os.remove(cachePath)
+        try:
+            os.link(path, cachePath)
+        except OSError:
+            shutil.copyfile(path, cachePath)
+        return cachePath
+
+class archivePrefetcher:
+    '''Iterates over rssItems yielding (rssItem, archivePath, error) in order, while the archives of the next
+    `ahead` items are downloaded in background threads
+
+    Only downloads run in the threads, archives are added to the store (and index) by the iterating thread.
+    With entryUrls, the path of the filing entry point inside the archive is yielded instead of archive path.
+    '''
+    def __init__(self, archiveCache, rssItems, ahead=None, entryUrls=False):
+        self.archiveCache = archiveCache
+        self.rssItems = list(rssItems)
+        self.ahead = max(1, ahead or archiveCache.prefetchAhead or defaultPrefetchAhead)
+        self.entryUrls = entryUrls
+
+    def __len__(self):
+        return len(self.rssItems)
+
+    def __iter__(self):
+        cache = self.archiveCache
+        inFlight = deque()
+        items = iter(self.rssItems)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.ahead, thread_name_prefix='rssDBPrefetch')
+
+        def submitNext():
+            for rssItem in items:
+                inFlight.append((rssItem, executor.submit(cache._fetch, rssItem)))
+                return True
+            return False
+
+        try:
+            for _ in range(self.ahead):
+                if not submitNext():
+                    break
+            while inFlight:
+                rssItem, future = inFlight.popleft()
+                submitNext()
+                try:
+                    path = cache._store(*future.result())
+                    if self.entryUrls:
+                        path = cache.entryUrl(rssItem, archivePath=path)
+                except Exception as e:
+                    yield rssItem, None, e
+                    continue
+                yield rssItem, path, None
+        finally:
+            # iteration stopped early, remove downloads that were not added to the store
+            executor.shutdown(wait=True)
+            for rssItem, future in inFlight:
+                if not future.cancelled() and future.exception() is None:
+                    download = future.result()[2]
+                    if download and os.path.exists(download[0]):
+                        os.remove(download[0])
@@ -0,0 +1,185 @@
+'''Prefix autocomplete of filers names and ticker symbols
+
+Filers conformed names, former names and ticker symbols are loaded once into sorted arrays of case folded
+keys, prefix lookups are a binary search (bisect) followed by a scan of the matching run, so suggestions
+can be computed on each key stroke. The index is shared by connections to the same database and refreshed
+from filersInfo itself: filers added since the last refresh (cikNumbers not in the index) are read
+incrementally, the index is reloaded when lastUpdate changed (a finished update may have changed names of
+existing filers), the (small) ticker mapping is reloaded whenever the index changes.
+'''
+
+import bisect, json, time, threading, logging
+from .Constants import rssTables
+from .SearchCache import _databaseKey
+
+# seconds between checks for changed filers
+refreshInterval = 60
+# filers read per query in incremental refresh
+filersChunkSize = 500
+_indexes = dict()
+_indexesLock = threading.Lock()
+
+def _formerNames(value):
+    if not value:
+        return ()
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return ()
+    return tuple(x['name'] for x in value if isinstance(x, dict) and x.get('name'))
+
+class filerNamesIndex:
+    '''Sorted arrays index of filers names and ticker symbols for prefix lookups'''
+    def __init__(self):
+        self.filers = dict()    # cikNumber: (conformedName, formerNames)
+        self.tickers = dict()   # cikNumber: ticker symbols
+        self.lastUpdate = None  # lastUpdate of the db at last refresh
+        self.lastRefresh = 0
+        self.refreshing = False
+        # (name keys, names, ticker keys, tickers) replaced as a whole so lookups never see a partial build
+        self._arrays = ([], [], [], [])
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.lastRefresh > 0
+
+    def isStale(self, maxAge=refreshInterval):
+        return not self.refreshing and time.monotonic() - self.lastRefresh > maxAge
+
+    def _fetchLastUpdate(self, conn):
+        if conn.product == 'mongodb':
+            res = conn.dbConn[rssTables[6]].find_one({'id': 0}, {'lastUpdate': 1, '_id': 0})
+            return str(res.get('lastUpdate')) if res else None
+        res = conn.execute('SELECT max("lastUpdate") FROM "{}"'.format(rssTables[6]), fetch=True, close=False)
+        return str(res[0][0]) if res else None
+
+    def _fetchCikNumbers(self, conn):
+        if conn.product == 'mongodb':
+            return set(conn.dbConn[rssTables[3]].distinct('cikNumber'))
+        return {x[0] for x in conn.execute('SELECT "cikNumber" FROM "{}"'.format(rssTables[3]), fetch=True, close=False)}
+
+    def _fetchFilers(self, conn, cikNumbers=None):
+        if conn.product == 'mongodb':
+            qry = {} if cikNumbers is None else {'cikNumber': {'$in': list(cikNumbers)}}
+            return [(x['cikNumber'], x.get('conformedName'), x.get('formerNames'))
+                    for x in conn.dbConn[rssTables[3]].find(qry, {'cikNumber': 1, 'conformedName': 1, 'formerNames': 1, '_id': 0})]
+        qry = 'SELECT "cikNumber", "conformedName", "formerNames" FROM "{}"'.format(rssTables[3])
+        if cikNumbers is None:
+            return conn.execute(qry, fetch=True, close=False)
+        cikNumbers = sorted(cikNumbers)
+        rows = []
+        for i in range(0, len(cikNumbers), filersChunkSize):
+            rows.extend(conn.execute(qry + ' WHERE "cikNumber" IN ({})'.format(', '.join(conn.dbStr(x) for x in cikNumbers[i:i + filersChunkSize])),
+                                        fetch=True, close=False))
+        return rows
+
+    def _fetchTickers(self, conn):
+        if conn.product == 'mongodb':
+            rows = [(x['cikNumber'], x['tickerSymbol']) for x in conn.dbConn[rssTables[5]].find({}, {'cikNumber': 1, 'tickerSymbol': 1, '_id': 0})]
+        else:
+            rows = conn.execute('SELECT "cikNumber", "tickerSymbol" FROM "{}"'.format(rssTables[5]), fetch=True, close=False)
+        tickers = dict()
+        for cik, ticker in rows:
+            if ticker:
+                tickers.setdefault(cik, []).append(ticker)
+        return tickers
+
+    def refresh(self, conn, full=False):
+        '''Loads the index (full, or when lastUpdate changed) or the filers added since the last refresh, returns
+        number of filers read'''
+        startTime = time.perf_counter()
+        self.refreshing = True
+        try:
+            lastUpdate = self._fetchLastUpdate(conn)
+            if full or not self.loaded or lastUpdate != self.lastUpdate:
+                newCikNumbers = None
+            else:
+                # filers inserted by an update still running (lastUpdate is written when the update is done)
+                newCikNumbers = self._fetchCikNumbers(conn) - set(self.filers)
+                if not newCikNumbers:
+                    self.lastRefresh = time.monotonic()
+                    return 0
+            filerRows = self._fetchFilers(conn, newCikNumbers)
+            tickers = self._fetchTickers(conn)
+            with self._lock:
+                filers = dict() if newCikNumbers is None else dict(self.filers)
+                for cik, conformedName, formerNames in filerRows:
+                    filers[cik] = (conformedName, _formerNames(formerNames))
+                self._build(filers, tickers)
+                self.lastUpdate = lastUpdate
+            self.lastRefresh = time.monotonic()
+        finally:
+            self.refreshing = False
+        conn.addToLog(_('Filers names index {} with {} filer(s) in {} secs').format('loaded' if newCikNumbers is None else 'refreshed',
+                        len(filerRows), round(time.perf_counter() - startTime, 3)), messageCode="RssDB.Info",
+                        file=conn.conParams.get('database', ''), level=logging.INFO)
+        return len(filerRows)
+
+    def _build(self, filers, tickers):
+        names = []
+        for cik, (conformedName, formerNames) in filers.items():
+            if conformedName:
+                names.append((conformedName.casefold(), conformedName, cik, None))
+            for formerName in formerNames:
+                if formerName != conformedName:
+                    names.append((formerName.casefold(), formerName, cik, conformedName))
+        names.sort()
+        tickerRows = sorted((t.casefold(), t, cik) for cik, ts in tickers.items() for t in ts)
+        self.filers = filers
+        self.tickers = tickers
+        self._arrays = ([x[0] for x in names], [x[1:] for x in names], [x[0] for x in tickerRows], [x[1:] for x in tickerRows])
+
+    @staticmethod
+    def _prefixRange(keys, prefix):
+        start = bisect.bisect_left(keys, prefix)
+        # '\U0010ffff' sorts after any character that can follow the prefix
+        end = bisect.bisect_right(keys, prefix + '\U0010ffff', lo=start)
+        return start, end
+
+    def suggestNames(self, prefix, limit=10):
+        '''Returns list of (name, cikNumber, current name if name is a former name else None) starting with prefix'''
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+        keys, names = self._arrays[:2]
+        start, end = self._prefixRange(keys, prefix)
+        result, seen = [], set()
+        for i in range(start, end):
+            name, cik, currentName = names[i]
+            if currentName and currentName.casefold().startswith(prefix):
+                # current name also matches, suggest it instead of the former name
+                name, currentName = currentName, None
+            if cik not in seen:
+                seen.add(cik)
+                result.append((name, cik, currentName))
+                if len(result) >= limit:
+                    break
+        return result
+
+    def suggestTickers(self, prefix, limit=10):
+        '''Returns list of (tickerSymbol, cikNumber, conformedName) starting with prefix'''
+        prefix = prefix.strip().casefold()
+        if not prefix:
+            return []
+        keys, values = self._arrays[2:]
+        filers = self.filers
+        start, end = self._prefixRange(keys, prefix)
+        return [(ticker, cik, filers.get(cik, (None,))[0]) for ticker, cik in values[start:min(end, start + limit)]]
+
+def getFilerNamesIndex(conn):
+    '''Returns filers names index of the database of conn (not loaded until refreshed)'''
+    key = _databaseKey(conn)
+    with _indexesLock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = filerNamesIndex()
+    return index
+
+def suggestFilers(conn, prefix, limit=10):
+    '''Returns dict with names and tickers suggestions for prefix, loading or refreshing the index if needed'''
+    index = getFilerNamesIndex(conn)
+    if index.isStale():
+        index.refresh(conn)
+    return {'names': index.suggestNames(prefix, limit), 'tickers': index.suggestTickers(prefix, limit)}
@@ -0,0 +1,353 @@
+'''Offline ingestion benchmark for rssDB
+
+Generates synthetic monthly feeds shaped like SEC `xbrlrss-YYYY-MM.xml` files into a local folder,
+these can be loaded with `doAll(loc=folder)` without network access, and runs the ingestion against
+one or more databases (sqlite, postgres, mongodb) reporting feeds/s, rows/s, peak RSS and db size.
+Results can be stored as a baseline json file and later runs compared to it to spot regressions.
+
+Benchmark targets should be new/empty databases, otherwise feeds already in the db are skipped and
+results are not comparable.
+'''
+
+import os, sys, time, json, random, logging, platform
+from datetime import datetime, timedelta
+from calendar import monthrange
+from collections import OrderedDict
+from lxml import etree
+from .Constants import rssTables
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+edgrNs = 'https://www.sec.gov/Archives/edgar'
+atomNs = 'http://www.w3.org/2005/Atom'
+secArchives = 'https://www.sec.gov/Archives/edgar/data/'
+
+# metrics where a higher value is better, the rest are lower is better
+higherIsBetter = ('feedsPerSec', 'rowsPerSec')
+comparedMetrics = ('feedsPerSec', 'rowsPerSec', 'peakRssMB', 'dbSizeMB')
+
+_formTypes = ['10-Q', '10-Q', '10-Q', '10-K', '8-K', '20-F', '40-F', '6-K', 'S-1', '10-K/A', '10-Q/A', 'N-CSR', '485BPOS']
+_sicCodes = [1311, 2834, 2836, 3571, 3674, 3711, 4911, 5812, 6021, 6022, 6189, 6311, 6798, 7372, 8731, 0]
+_nameParts = ['ACME', 'GLOBAL', 'UNITED', 'FIRST', 'AMERICAN', 'PACIFIC', 'NORTHERN', 'APEX', 'SUMMIT', 'PIONEER',
+              'HOLDINGS', 'BANCORP', 'THERAPEUTICS', 'ENERGY', 'SYSTEMS', 'REALTY', 'TRUST', 'INDUSTRIES']
+_nameSuffixes = ['INC', 'CORP', 'CO', 'LTD', 'LLC', 'PLC', 'L.P.']
+_linkbases = [('EX-101.SCH', 'xsd', 'XBRL TAXONOMY EXTENSION SCHEMA DOCUMENT'),
+              ('EX-101.CAL', '_cal.xml', 'XBRL TAXONOMY EXTENSION CALCULATION LINKBASE DOCUMENT'),
+              ('EX-101.DEF', '_def.xml', 'XBRL TAXONOMY EXTENSION DEFINITION LINKBASE DOCUMENT'),
+              ('EX-101.LAB', '_lab.xml', 'XBRL TAXONOMY EXTENSION LABEL LINKBASE DOCUMENT'),
+              ('EX-101.PRE', '_pre.xml', 'XBRL TAXONOMY EXTENSION PRESENTATION LINKBASE DOCUMENT')]
+
+def _rfcDate(dt):
+    return dt.strftime('%a, %d %b %Y %H:%M:%S') + ' EST'
+
+def _makeFiler(rnd, i):
+    cik = str(rnd.randint(1000, 1900000)).zfill(10)
+    name = ' '.join(rnd.sample(_nameParts, 2) + [rnd.choice(_nameSuffixes)])
+    return {'cikNumber': cik, 'companyName': name, 'assignedSic': rnd.choice(_sicCodes), 'ticker': 'X{}'.format(i),
+            'fiscalYearEnd': rnd.choice(['1231', '1231', '1231', '0630', '0930', '0331']),
+            'fileNumber': '{:03d}-{:05d}'.format(rnd.choice([0, 1, 333]), rnd.randint(1, 99999))}
+
+def makeSyntheticFeed(saveToDir, feedMonth, items=1000, filesPerItem=6, inlineRatio=0.6, filers=None, seed=None):
+    '''Writes synthetic xbrlrss-YYYY-MM.xml feed to saveToDir and returns its path
+
+    feedMonth: 'YYYY-MM' string or date in the month
+    items: number of filings (rss items) in the feed
+    filesPerItem: number of xbrlFile entries per filing (instance, schema and linkbases, cycled if more)
+    inlineRatio: proportion of filings that are inline XBRL
+    filers: number of distinct filers the filings are drawn from, defaults to half the items
+    seed: random seed, defaults to the feed month so the same feed is generated on each run
+    '''
+    if not isinstance(feedMonth, str):
+        feedMonth = feedMonth.strftime('%Y-%m')
+    year, month = (int(x) for x in feedMonth.split('-'))
+    rnd = random.Random(seed if seed is not None else year * 100 + month)
+    lastDay = monthrange(year, month)[1]
+    monthStart = datetime(year, month, 1)
+    fileName = 'xbrlrss-{}.xml'.format(feedMonth)
+    feedUrl = 'https://www.sec.gov/Archives/edgar/monthly/' + fileName
+    filersList = [_makeFiler(rnd, i) for i in range(filers or max(1, items // 2))]
+
+    edgr = '{' + edgrNs + '}'
+    nsmap = {'edgar': edgrNs}
+    rss = etree.Element('rss', version='2.0', nsmap={'atom': atomNs})
+    channel = etree.SubElement(rss, 'channel')
+    buildDate = monthStart + timedelta(days=lastDay - 1, hours=22)
+    for tag, text in (('title', 'All XBRL Data Submitted to the SEC for {}'.format(feedMonth)), ('link', feedUrl)):
+        etree.SubElement(channel, tag).text = text
+    etree.SubElement(channel, '{' + atomNs + '}link', href=feedUrl, rel='self', type='application/rss+xml')
+    for tag, text in (('description', 'This is a list all of the filings containing XBRL for {}'.format(feedMonth)),
+                      ('language', 'en-us'), ('pubDate', _rfcDate(buildDate)), ('lastBuildDate', _rfcDate(buildDate))):
+        etree.SubElement(channel, tag).text = text
+
+    acceptedTimes = sorted(monthStart + timedelta(seconds=rnd.randint(6 * 3600, lastDay * 86400 - 3600)) for _ in range(items))
+    for seq, accepted in enumerate(acceptedTimes):
+        filer = rnd.choice(filersList)
+        formType = rnd.choice(_formTypes)
+        isInline = rnd.random() < inlineRatio
+        accession = '{}-{}-{:06d}'.format(filer['cikNumber'], str(year)[2:], seq + 1)
+        folder = '{}{}/{}/'.format(secArchives, int(filer['cikNumber']), accession.replace('-', ''))
+        enclosureUrl = folder + accession + '-xbrl.zip'
+        prefix = filer['ticker'].lower()
+        periodEnd = datetime(year, month, 1) - timedelta(days=rnd.choice([1, 31, 61]))
+        docBase = '{}-{}'.format(prefix, periodEnd.strftime('%Y%m%d'))
+
+        item = etree.SubElement(channel, 'item')
+        etree.SubElement(item, 'title').text = '{} ({}) (Filer)'.format(filer['companyName'], filer['cikNumber'])
+        etree.SubElement(item, 'link').text = folder + accession + '-index.htm'
+        etree.SubElement(item, 'guid').text = enclosureUrl
+        etree.SubElement(item, 'enclosure', url=enclosureUrl, length=str(rnd.randint(20000, 5000000)), type='application/zip')
+        etree.SubElement(item, 'description').text = formType
+        etree.SubElement(item, 'pubDate').text = _rfcDate(accepted)
+        filing = etree.SubElement(item, edgr + 'xbrlFiling', nsmap=nsmap)
+        for tag, text in (('companyName', filer['companyName']), ('formType', formType),
+                          ('filingDate', accepted.strftime('%m/%d/%Y')), ('cikNumber', filer['cikNumber']),
+                          ('accessionNumber', accession), ('fileNumber', filer['fileNumber']),
+                          ('acceptanceDatetime', accepted.strftime('%Y%m%d%H%M%S')), ('period', periodEnd.strftime('%Y%m%d')),
+                          ('assistantDirector', 'Office of {}'.format(rnd.choice(['Technology', 'Finance', 'Energy & Transportation']))),
+                          ('assignedSic', str(filer['assignedSic'])), ('fiscalYearEnd', filer['fiscalYearEnd'])):
+            etree.SubElement(filing, edgr + tag).text = text
+        xbrlFiles = etree.SubElement(filing, edgr + 'xbrlFiles')
+        filesDefs = []
+        if isInline:
+            filesDefs.append((formType, docBase + '.htm', formType, 'true'))
+            filesDefs.append(('EX-101.INS', docBase + '_htm.xml', 'EXTRACTED XBRL INSTANCE DOCUMENT', 'false'))
+        else:
+            filesDefs.append(('EX-101.INS', docBase + '.xml', 'XBRL INSTANCE DOCUMENT', 'false'))
+        filesDefs.extend((_type, prefix + '-' + periodEnd.strftime('%Y%m%d') + (_ext if _ext.startswith('_') else '.' + _ext), _desc, 'false')
+                            for _type, _ext, _desc in _linkbases)
+        for fileSeq in range(filesPerItem):
+            _type, _file, _desc, _inline = filesDefs[fileSeq % len(filesDefs)]
+            if fileSeq >= len(filesDefs):
+                _file = 'ex{}-{}'.format(fileSeq, _file)
+            etree.SubElement(xbrlFiles, edgr + 'xbrlFile', OrderedDict([
+                (edgr + 'sequence', str(fileSeq + 1)), (edgr + 'file', _file), (edgr + 'type', _type),
+                (edgr + 'size', str(rnd.randint(2000, 3000000))), (edgr + 'description', _desc),
+                (edgr + 'inlineXBRL', _inline), (edgr + 'url', folder + _file)]))
+
+    if not os.path.isdir(saveToDir):
+        os.makedirs(saveToDir)
+    fPath = os.path.join(saveToDir, fileName)
+    with open(fPath, 'wb') as f:
+        f.write(etree.tostring(rss, xml_declaration=True, encoding='utf-8', pretty_print=True))
+    return fPath
+
+def makeSyntheticFeeds(saveToDir, months=12, lastMonth=None, items=1000, filesPerItem=6, inlineRatio=0.6, seed=None):
+    '''Writes `months` consecutive synthetic feeds ending with lastMonth ('YYYY-MM', defaults to last month), returns list of paths'''
+    if lastMonth is None:
+        lastMonth = (datetime.today().replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    year, month = (int(x) for x in lastMonth.split('-'))
+    feedsPaths = []
+    for i in range(months):
+        _month = (year * 12 + month - 1) - i
+        feedMonth = '{}-{:02d}'.format(_month // 12, _month % 12 + 1)
+        feedsPaths.append(makeSyntheticFeed(saveToDir, feedMonth, items=items, filesPerItem=filesPerItem, inlineRatio=inlineRatio,
+                                            seed=None if seed is None else seed + i))
+    return sorted(feedsPaths)
+
+def _peakRssMB():
+    '''Peak resident set size of this process and of its (finished) worker processes in MB'''
+    if resource is None:
+        return None, None
+    # ru_maxrss is in KB on linux and in bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    selfPeak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+    childrenPeak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / divisor
+    return round(selfPeak, 1), round(childrenPeak, 1)
+
+def _dbSizeBytes(conn):
+    '''Size of data and indexes of the rssDB tables/collections in bytes'''
+    dbSize = None
+    if conn.product == 'sqlite':
+        _dbfile = conn.conParams['database']
+        dbSize = sum(os.path.getsize(f) for f in (_dbfile, _dbfile + '-wal') if os.path.isfile(f))
+    elif conn.product == 'postgres':
+        _qry = '''SELECT sum(pg_total_relation_size(quote_ident(schemaname) || '.' || quote_ident(tablename)))
+                    FROM pg_tables
+                    WHERE schemaname = \'{}\' '''
+        try:
+            dbSize = int(conn.execute(_qry.format(conn.conParams['schema']))[0][0] or 0)
+        except Exception:
+            conn.rollback()
+    elif conn.product == 'mongodb':
+        _stats = conn.dbConn.command('dbstats')
+        dbSize = int(_stats.get('storageSize', 0) + _stats.get('indexSize', 0))
+    return dbSize
+
+def benchmarkConnection(conn, feedsDir, maxWorkers=None, label=None):
+    '''Runs doAll on conn loading feeds from local feedsDir and returns benchmark result dict
+
+    Filers information and tickers are not retrieved (requires network), only feeds, filings, files and rss items.
+    '''
+    label = label or conn.product
+    existingFeeds = conn.getExistingFeeds()
+    if existingFeeds:
+        conn.addToLog(_('Benchmark target {} already contains {} feeds, results are not comparable to a fresh load').format(label, len(existingFeeds)),
+                        messageCode="RssDB.Info", file=conn.conParams.get('database', ''), level=logging.INFO)
+    startTime = time.perf_counter()
+    res = conn.doAll(loc=feedsDir, includeLatest=False, getFilers=False, updateTickers=False, getXML=True,
+                        returnInfo=True, maxWorkers=maxWorkers)
+    elapsed = time.perf_counter() - startTime
+    if not res:
+        raise Exception(_('Benchmark run for {} did not return results, see log for errors').format(label))
+    summary = res['summary']
+    feeds = summary.get(rssTables[0], {}).get('insert', 0) + summary.get(rssTables[0], {}).get('update', 0)
+    rows = sum(v.get('insert', 0) + v.get('update', 0) for k, v in summary.items() if isinstance(v, dict))
+    dbSize = _dbSizeBytes(conn)
+    selfPeak, childrenPeak = _peakRssMB()
+    result = OrderedDict([
+        ('label', label),
+        ('product', conn.product),
+        ('dataset', OrderedDict([('feeds', feeds), ('filings', summary.get(rssTables[1], {}).get('insert', 0)), ('rows', rows)])),
+        ('elapsedSecs', round(elapsed, 3)),
+        ('feedsPerSec', round(feeds / elapsed, 3) if elapsed else None),
+        ('rowsPerSec', round(rows / elapsed, 1) if elapsed else None),
+        ('peakRssMB', max(selfPeak, childrenPeak) if selfPeak is not None else None),
+        ('peakRssMainMB', selfPeak),
+        ('peakRssWorkersMB', childrenPeak),
+        ('dbSizeMB', round(dbSize / (1024 * 1024), 2) if dbSize is not None else None),
+        ('stages', res.get('metrics', {}).get('stages', {})),
+        ('runAt', datetime.now().replace(microsecond=0).isoformat()),
+        ('host', platform.node()),
+        ('python', platform.python_version())
+    ])
+    conn.addToLog(_('Benchmark {}: {} feeds, {} rows in {} secs ({} feeds/s, {} rows/s), peak RSS {} MB, db size {} MB').format(
+                        label, feeds, rows, result['elapsedSecs'], result['feedsPerSec'], result['rowsPerSec'], result['peakRssMB'], result['dbSizeMB']),
+                    messageCode="RssDB.Info", file=conn.conParams.get('database', ''), level=logging.INFO)
+    return result
+
+def compareToBaseline(results, baselineFile, tolerance=0.15):
+    '''Compares benchmark results to baseline stored in baselineFile
+
+    Returns list of regressions, each a dict with label, metric, baseline, current and change (ratio),
+    a metric is regressed when it is worse than baseline by more than tolerance (0.15 = 15%).
+    Results for a different dataset (feeds/filings count) than the baseline are not compared.
+    '''
+    regressions = []
+    if not os.path.isfile(baselineFile):
+        return regressions
+    with open(baselineFile, 'r') as f:
+        baseline = json.load(f)
+    for result in results:
+        base = baseline.get(result['label'])
+        if not base or base.get('dataset') != result.get('dataset'):
+            continue
+        for metric in comparedMetrics:
+            baseVal, curVal = base.get(metric), result.get(metric)
+            if not baseVal or curVal is None:
+                continue
+            change = (curVal - baseVal) / baseVal
+            worse = -change if metric in higherIsBetter else change
+            if worse > tolerance:
+                regressions.append(OrderedDict([('label', result['label']), ('metric', metric), ('baseline', baseVal),
+                                                ('current', curVal), ('change', round(change, 3))]))
+    return regressions
+
+def saveBaseline(results, baselineFile):
+    '''Saves (or updates entries of) baseline file with results keyed by label'''
+    baseline = dict()
+    if os.path.isfile(baselineFile):
+        with open(baselineFile, 'r') as f:
+            baseline = json.load(f)
+    for result in results:
+        baseline[result['label']] = result
+    with open(baselineFile, 'w') as f:
+        json.dump(baseline, f, indent=2)
+    return baselineFile
+
+def runBenchmark(cntlr, feedsDir, targets, maxWorkers=None, baselineFile=None, updateBaseline=False, tolerance=0.15):
+    '''Runs the ingestion benchmark for each target in targets and compares to baseline if any
+
+    targets: list of dicts of rssDBConnection kwargs (product, database, host, port, user, password, schema...),
+             optionally with a 'label' key used to identify the target in the baseline (defaults to product)
+    Returns dict with 'results' and 'regressions'.
+    '''
+    from .RssDB import rssDBConnection
+    results = []
+    for target in targets:
+        conKwargs = dict(target)
+        label = conKwargs.pop('label', None)
+        conKwargs.setdefault('createDB', True)
+        conn = rssDBConnection(cntlr, **conKwargs)
+        try:
+            results.append(benchmarkConnection(conn, feedsDir, maxWorkers=maxWorkers, label=label))
+        except Exception as e:
+            cntlr.addToLog(_('Benchmark failed for {}:\n{}').format(label or conKwargs.get('product'), str(e)),
+                            messageCode="RssDB.Error", file=conKwargs.get('database', ''), level=logging.ERROR)
+        finally:
+            conn.close()
+    return reportBenchmark(cntlr, results, baselineFile=baselineFile, updateBaseline=updateBaseline, tolerance=tolerance)
+
+def reportBenchmark(cntlr, results, baselineFile=None, updateBaseline=False, tolerance=0.15):
+    '''Logs regressions of results against baselineFile and updates baseline if updateBaseline'''
+    regressions = []
+    if baselineFile:
+        regressions = compareToBaseline(results, baselineFile, tolerance)
+        for r in regressions:
+            cntlr.addToLog(_('Performance regression {} {}: baseline {}, current {} ({:+.1%})').format(
+                                r['label'], r['metric'], r['baseline'], r['current'], r['change']),
+                            messageCode="RssDB.Error", file=baselineFile, level=logging.ERROR)
+        if not regressions:
+            cntlr.addToLog(_('No performance regressions against baseline {}').format(baselineFile),
+                            messageCode="RssDB.Info", file=baselineFile, level=logging.INFO)
+        if updateBaseline and results:
+            saveBaseline(results, baselineFile)
+    return {'results': results, 'regressions': regressions}
+
+# plugin entry modules measured by benchmarkStartup
+startupModules = ('RssDB', 'CommonFunctions')
+
+def _parseImportTime(stderr):
+    '''Returns {module: cumulative secs} from `python -X importtime` output'''
+    imports = dict()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            cumulative = int(parts[1]) / 1e6
+        except ValueError:
+            continue # header line
+        name = parts[2].strip()
+        imports[name] = max(imports.get(name, 0), cumulative)
+    return imports
+
+def benchmarkStartup(modules=startupModules, repeat=3, top=15):
+    '''Measures import time of plugin modules each in a fresh interpreter (`python -X importtime`), returns
+    {module: {'importSecs': best of repeat, 'modulesImported': count, 'topImports': [(module, cumulative secs)]}}'''
+    import subprocess
+    package = __package__ or 'rssDB'
+    # parent of the plugin folder so that the package can be imported by name
+    pythonPath = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] + [p for p in sys.path if p]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(pythonPath))
+    results = OrderedDict()
+    for module in modules:
+        code = ('import gettext, time; gettext.install("arelle"); startTime = time.perf_counter(); '
+                'import {}.{}; print(time.perf_counter() - startTime)').format(package, module)
+        best = None
+        for i in range(repeat):
+            proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE, universal_newlines=True, env=env)
+            if proc.returncode:
+                raise Exception(_('Could not import {}.{}\n{}').format(package, module, proc.stderr.strip().splitlines()[-1:]))
+            secs = float(proc.stdout.strip().splitlines()[-1])
+            if best is None or secs < best['importSecs']:
+                imports = _parseImportTime(proc.stderr)
+                best = OrderedDict(importSecs=round(secs, 4), modulesImported=len(imports),
+                                   topImports=[(k, round(v, 4)) for k, v in sorted(imports.items(), key=lambda x: -x[1])[:top]])
+        results[module] = best
+    return results
+
+def reportStartupBenchmark(cntlr, results):
+    '''Logs import times and heaviest imports of benchmarkStartup results'''
+    for module, result in results.items():
+        cntlr.addToLog(_('Startup {}: imported in {} secs ({} modules), heaviest imports (cumulative secs):\n{}').format(
+                            module, result['importSecs'], result['modulesImported'],
+                            '\n'.join('    {}: {}'.format(k, v) for k, v in result['topImports'])),
+                        messageCode="RssDB.Info", file=module, level=logging.INFO)
+    return results
@@ -0,0 +1,266 @@
+'''Cold storage of filesInfo and rssItems rows of old feeds
+
+Files and rss items of feeds older than a few years are rarely read but make up most of the database,
+storeColdFeeds moves the rows of a feed month into a compressed file (json of the rows compressed with
+the rssDB codec) in a cold storage folder and records the feed in coldFeeds table (collection in
+mongodb), which is the stub telling readers where the rows went. Rows of cold feeds are fetched from the
+files on demand (fetchColdRows), searchFilings(getFiles=True), getById and _makeRssFeedLikeXml add them
+to the rows found in the database, recently read files are kept in memory. restoreColdFeeds moves the
+rows back into the database.
+
+The folder is cntlr.rssDBColdStoreDir or config 'rssDBColdStoreDir', by default '<database>_coldStore' folder
+next to the sqlite database or in arelle user app folder for postgres and mongodb.
+'''
+
+import os, json, hashlib, threading, time, logging
+from collections import OrderedDict
+from datetime import datetime
+from .Constants import rssTables
+from .Compression import compressValue, decompressValue, resolveCodec, defaultCodec
+from .Sharding import shardTables
+
+coldTable = 'coldFeeds'
+coldCols = ['feedId', 'path', 'sha256', 'filesCount', 'rssItemsCount', 'sizeBytes', 'dateTimeStored']
+coldTables = (rssTables[2], rssTables[4])
+filingIdMultiplier = 10**6
+fileIdMultiplier = 10**9
+# cold files kept in memory after being read
+cachedColdFiles = 8
+
+coldTableDDL = {
+    'sqlite': '''CREATE TABLE IF NOT EXISTS "coldFeeds" (
+                    "feedId" INTEGER NOT NULL PRIMARY KEY,
+                    "path" TEXT NOT NULL,
+                    "sha256" TEXT NOT NULL,
+                    "filesCount" INTEGER,
+                    "rssItemsCount" INTEGER,
+                    "sizeBytes" INTEGER,
+                    "dateTimeStored" TEXT);''',
+    'postgres': '''CREATE TABLE IF NOT EXISTS "coldFeeds" (
+                    "feedId" BIGINT NOT NULL PRIMARY KEY,
+                    "path" TEXT NOT NULL,
+                    "sha256" TEXT NOT NULL,
+                    "filesCount" INTEGER,
+                    "rssItemsCount" INTEGER,
+                    "sizeBytes" BIGINT,
+                    "dateTimeStored" TIMESTAMP);''',
+}
+
+_coldFiles = OrderedDict()
+_coldFilesLock = threading.Lock()
+
+def coldStoreDir(conn, folder=None):
+    '''Returns (and creates) the cold storage folder of the database of conn'''
+    cntlr = conn.cntlr
+    folder = folder or getattr(cntlr, 'rssDBColdStoreDir', None) or cntlr.config.get('rssDBColdStoreDir', None)
+    if not folder:
+        if conn.product == 'sqlite':
+            base = os.path.splitext(os.path.abspath(conn.conParams['database']))[0]
+            folder = base + '_coldStore'
+        else:
+            folder = os.path.join(cntlr.userAppDir, 'rssDBColdStore', '{}_{}'.format(conn.conParams.get('database') or getattr(conn, 'dbName', ''),
+                                    conn.conParams.get('schema') or ''))
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def _hasColdTable(conn):
+    if conn.product == 'mongodb':
+        return coldTable in conn.dbConn.list_collection_names()
+    return conn.hasTable(coldTable)
+
+def verifyColdTable(conn):
+    if conn.product == 'mongodb':
+        conn.dbConn[coldTable].create_index('feedId', unique=True)
+    elif not _hasColdTable(conn):
+        conn.execute(coldTableDDL[conn.product], fetch=False, commit=True)
+        conn.refreshSchemaCache()
+
+def coldFeeds(conn, feedIds=None):
+    '''Returns {feedId: (path, sha256)} of cold feeds (limited to feedIds)'''
+    if not _hasColdTable(conn):
+        return dict()
+    if conn.product == 'mongodb':
+        qry = {'feedId': {'$in': list(feedIds)}} if feedIds is not None else {}
+        return {x['feedId']: (x['path'], x['sha256']) for x in conn.dbConn[coldTable].find(qry, {'_id': 0, 'feedId': 1, 'path': 1, 'sha256': 1})}
+    qry = 'SELECT "feedId", "path", "sha256" FROM "{}"'.format(coldTable)
+    if feedIds is not None:
+        if not feedIds:
+            return dict()
+        qry += ' WHERE "feedId" IN ({})'.format(', '.join(str(int(x)) for x in feedIds))
+    return {x[0]: (x[1], x[2]) for x in conn.execute(qry, fetch=True, close=False)}
+
+def _idRange(table, feedId):
+    if table == rssTables[2]:
+        return 'fileId', feedId * fileIdMultiplier, (feedId + 1) * fileIdMultiplier
+    return 'filingId', feedId * filingIdMultiplier, (feedId + 1) * filingIdMultiplier
+
+def _fetchFeedRows(conn, table, feedId):
+    col, lower, upper = _idRange(table, feedId)
+    if conn.product == 'mongodb':
+        rows = list(conn.dbConn[table].find({col: {'$gte': lower, '$lt': upper}}, {'_id': 0}))
+        cols = list(OrderedDict.fromkeys(k for x in rows for k in x))
+        return cols, [[x.get(c) for c in cols] for x in rows]
+    res = conn.execute('SELECT * FROM "{}" WHERE "{}" >= {} AND "{}" < {} ORDER BY "{}"'.format(table, col, lower, col, upper, col),
+                        fetch=True, close=False)
+    cols = [x[0].decode() if isinstance(x[0], bytes) else x[0] for x in conn.cursor.description]
+    return cols, [list(x) for x in res]
+
+def _deleteFeedRows(conn, table, feedId):
+    col, lower, upper = _idRange(table, feedId)
+    if conn.product == 'mongodb':
+        conn.dbConn[table].delete_many({col: {'$gte': lower, '$lt': upper}})
+        return
+    for _table in shardTables(conn, table):
+        conn.execute('DELETE FROM {} WHERE "{}" >= {} AND "{}" < {}'.format(_table, col, lower, col, upper), fetch=False, close=False)
+
+def _jsonDefault(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return decompressValue(value)
+    return str(value)
+
+def _readColdFile(path, sha256=None):
+    '''Returns {table: {'cols': [..], 'rows': [[..]]}} of cold file, checked against sha256'''
+    key = (path, sha256)
+    with _coldFilesLock:
+        if key in _coldFiles:
+            _coldFiles.move_to_end(key)
+            return _coldFiles[key]
+    with open(path, 'rb') as f:
+        data = f.read()
+    if sha256 and hashlib.sha256(data).hexdigest() != sha256:
+        raise Exception(_('Cold storage file {} does not match its recorded hash').format(path))
+    content = json.loads(decompressValue(data))['tables']
+    with _coldFilesLock:
+        _coldFiles[key] = content
+        while len(_coldFiles) > cachedColdFiles:
+            _coldFiles.popitem(last=False)
+    return content
+
+def fetchColdRows(conn, table, filingIds):
+    '''Returns list of dicts of table rows of filingIds in cold feeds'''
+    if table not in coldTables or not filingIds:
+        return []
+    filingIds = {int(x) for x in filingIds}
+    feeds = coldFeeds(conn, {x // filingIdMultiplier for x in filingIds})
+    result = []
+    for feedId, (path, sha256) in sorted(feeds.items()):
+        content = _readColdFile(path, sha256).get(table)
+        if not content:
+            continue
+        cols = content['cols']
+        iFiling = cols.index('filingId')
+        result.extend(dict(zip(cols, row)) for row in content['rows'] if row[iFiling] in filingIds)
+    return result
+
+def storeColdFeed(conn, feedId, folder=None):
+    '''Moves filesInfo and rssItems rows of feedId into a cold storage file, returns stats dict'''
+    feedId = int(feedId)
+    startTime = time.perf_counter()
+    verifyColdTable(conn)
+    if coldFeeds(conn, [feedId]):
+        return {'feedId': feedId, 'status': 'already stored'}
+    content = OrderedDict()
+    for table in coldTables:
+        cols, rows = _fetchFeedRows(conn, table, feedId)
+        content[table] = {'cols': cols, 'rows': rows}
+    codec = resolveCodec(getattr(conn, 'compression', None))
+    data = compressValue(json.dumps({'feedId': feedId, 'tables': content}, default=_jsonDefault, separators=(',', ':')),
+                         defaultCodec() if codec == 'none' else codec)
+    path = os.path.join(coldStoreDir(conn, folder), 'feed-{}.json.cold'.format(feedId))
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmpPath, path)
+    sha256 = hashlib.sha256(data).hexdigest()
+    # rows are deleted only after the file is read back
+    stored = _readColdFile(path, sha256)
+    for table in coldTables:
+        if len(stored[table]['rows']) != len(content[table]['rows']):
+            raise Exception(_('Cold storage file {} is incomplete').format(path))
+    stub = OrderedDict(zip(coldCols, [feedId, path, sha256, len(content[rssTables[2]]['rows']), len(content[rssTables[4]]['rows']),
+                                        len(data), datetime.now().replace(microsecond=0)]))
+    if conn.product == 'mongodb':
+        conn.dbConn[coldTable].insert_one(dict(stub))
+        for table in coldTables:
+            _deleteFeedRows(conn, table, feedId)
+    else:
+        try:
+            conn.execute('INSERT INTO "{}" ({}) VALUES ({})'.format(coldTable, ', '.join('"{}"'.format(c) for c in coldCols),
+                            ', '.join(str(v) if isinstance(v, int) else conn.dbStr(str(v)) for v in stub.values())), fetch=False, close=False)
+            for table in coldTables:
+                _deleteFeedRows(conn, table, feedId)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+    stat = OrderedDict([('feedId', feedId), ('status', 'stored'), ('files', stub['filesCount']), ('rssItems', stub['rssItemsCount']),
+                        ('sizeBytes', stub['sizeBytes']), ('secs', round(time.perf_counter() - startTime, 3))])
+    conn.addToLog(_('Moved {} file(s) and {} rss item(s) of feed {} to cold storage {} ({:,} bytes) in {} secs').format(
+                    stat['files'], stat['rssItems'], feedId, path, stat['sizeBytes'], stat['secs']), messageCode="RssDB.Info",
+                    file=conn.conParams.get('database', ''), level=logging.INFO)
+    return stat
+
+def restoreColdFeed(conn, feedId, keepFile=False):
+    '''Moves rows of cold feed feedId back into filesInfo and rssItems, returns stats dict'''
+    feedId = int(feedId)
+    feeds = coldFeeds(conn, [feedId])
+    if not feeds:
+        return {'feedId': feedId, 'status': 'not in cold storage'}
+    path, sha256 = feeds[feedId]
+    content = _readColdFile(path, sha256)
+    stat = OrderedDict([('feedId', feedId), ('status', 'restored')])
+    try:
+        for table in coldTables:
+            cols, rows = content[table]['cols'], content[table]['rows']
+            data = [dict(zip(cols, row)) for row in rows]
+            if data:
+                conn.insertUpdateRssDB(data, table, 'insert')
+            if conn.product != 'mongodb' and table == rssTables[2]:
+                # duplicate flag is not an inserted column of filesInfo
+                dups = [{'fileId': x['fileId'], 'duplicate': 1} for x in data if x.get('duplicate')]
+                if dups:
+                    conn.insertUpdateRssDB(dups, table, 'update', updateCols='duplicate', idCol='fileId')
+            stat[table] = len(data)
+        if conn.product == 'mongodb':
+            conn.dbConn[coldTable].delete_one({'feedId': feedId})
+        else:
+            conn.execute('DELETE FROM "{}" WHERE "feedId" = {}'.format(coldTable, feedId), fetch=False, close=False)
+            conn.commit()
+    except Exception as e:
+        if conn.product != 'mongodb':
+            conn.rollback()
+        raise e
+    if not keepFile:
+        os.remove(path)
+    conn.addToLog(_('Restored {} file(s) and {} rss item(s) of feed {} from cold storage').format(
+                    stat[rssTables[2]], stat[rssTables[4]], feedId), messageCode="RssDB.Info",
+                    file=conn.conParams.get('database', ''), level=logging.INFO)
+    return stat
+
+def _feedIdsInRange(conn, fromFeedId, toFeedId):
+    if conn.product == 'mongodb':
+        feedIds = conn.dbConn[rssTables[0]].distinct('feedId')
+    else:
+        feedIds = [x[0] for x in conn.execute('SELECT "feedId" FROM "{}"'.format(rssTables[0]), fetch=True, close=False)]
+    return sorted(x for x in feedIds if int(fromFeedId) <= x <= int(toFeedId))
+
+def parseFeedRange(value):
+    '''Returns (fromFeedId, toFeedId) from "YYYYMM" or "YYYYMM-YYYYMM"'''
+    parts = [x.strip() for x in str(value).split('-')]
+    if len(parts) not in (1, 2) or not all(len(x) == 6 and x.isdigit() for x in parts):
+        raise ValueError(_('Feed range must be YYYYMM or YYYYMM-YYYYMM, {} was entered').format(value))
+    return int(parts[0]), int(parts[-1])
+
+def storeColdFeeds(conn, fromFeedId, toFeedId, folder=None):
+    '''Moves rows of feeds in feedId range (inclusive) to cold storage, returns list of stats'''
+    result = [storeColdFeed(conn, feedId, folder) for feedId in _feedIdsInRange(conn, fromFeedId, toFeedId)]
+    if conn.product == 'sqlite':
+        conn.addToLog(_('Vacuum the database to release the space of rows moved to cold storage'), messageCode="RssDB.Info",
+                        file=conn.conParams.get('database', ''), level=logging.INFO)
+    return result
+
+def restoreColdFeeds(conn, fromFeedId, toFeedId, keepFile=False):
+    '''Restores cold feeds in feedId range (inclusive), returns list of stats'''
+    return [restoreColdFeed(conn, feedId, keepFile) for feedId in sorted(coldFeeds(conn)) if int(fromFeedId) <= feedId <= int(toFeedId)]
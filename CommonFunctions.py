@@ -15,56 +15,74 @@ from urllib import request
 from calendar import monthrange
 from lxml import html, etree
 from .Constants import rssTables, getTablesFuncs, pathToSQL, rssCols, RSSFEEDS, stateCodes, wait_duration, pathToTemplates
+from .Profiling import taskProfiler, newProfileRun, mergeProfiles
+from .ArchiveCache import archivePrefetcher
+from .Partitioning import idRangeClause
+from .Records import filingsInfoRecord, filesInfoRecord, rssItemsRecord
+from .ColdStorage import fetchColdRows
+from .FeedManifest import loadManifest, localFeedUnchanged, contentDigest, accessionsDigest
 from arelle.UrlUtil import parseRfcDatetime
-from arelle import XmlUtil, ValidateXbrl, ModelXbrl, Cntlr
+from arelle import XmlUtil, ModelXbrl, Cntlr
 from arelle.FileSource import openFileSource
 from arelle.PluginManager import pluginClassMethods
 
 try:
     from arellepy.HelperFuncs import chkToList, convert_size, xmlFileFromString
     from arellepy.CntlrPy import CntlrPy, subProcessCntlrPy, renderEdgarReportsFromRssItems
-    from arellepy.LocalViewerStandalone import initViewer
 except:
     from .arellepy.HelperFuncs import chkToList, convert_size, xmlFileFromString
     from .arellepy.CntlrPy import CntlrPy, renderEdgarReportsFromRssItems
-    from .arellepy.LocalViewerStandalone import initViewer
 
-try:
-    from xbrlDB import storeIntoDB, dbProduct
-    from xbrlDB.XbrlSemanticSqlDB import XbrlSqlDatabaseConnection
-    from xbrlDB.XbrlOpenSqlDB import XbrlSqlDatabaseConnection as OpenXbrlSqlDatabaseConnection
-    from xbrlDB.XbrlPublicPostgresDB import XbrlPostgresDatabaseConnection
-except:
+# xbrlDB plugin and EdgarRenderer are only needed to store filings into xbrlDB, they are imported on
+# first use of storeIntoDB, dbProduct, _dbTypes, RefManager or hasRefManager (see _loadXbrlDB)
+_xbrlDBNames = ('storeIntoDB', 'dbProduct', '_dbTypes', 'RefManager', 'hasRefManager')
+
+def _loadXbrlDB():
+    '''Imports xbrlDB plugin and EdgarRenderer RefManager (if available) into module globals'''
+    if '_dbTypes' in globals():
+        return
     try:
-        from arelle.plugin.xbrlDB import storeIntoDB, dbProduct
-        from arelle.plugin.xbrlDB.XbrlSemanticSqlDB import XbrlSqlDatabaseConnection
-        from arelle.plugin.xbrlDB.XbrlOpenSqlDB import XbrlSqlDatabaseConnection as OpenXbrlSqlDatabaseConnection
-        from arelle.plugin.xbrlDB.XbrlPublicPostgresDB import XbrlPostgresDatabaseConnection
+        from xbrlDB import storeIntoDB, dbProduct
+        from xbrlDB.XbrlSemanticSqlDB import XbrlSqlDatabaseConnection
+        from xbrlDB.XbrlOpenSqlDB import XbrlSqlDatabaseConnection as OpenXbrlSqlDatabaseConnection
+        from xbrlDB.XbrlPublicPostgresDB import XbrlPostgresDatabaseConnection
     except:
-        from plugin.xbrlDB import storeIntoDB, dbProduct
-        from plugin.xbrlDB.XbrlSemanticSqlDB import XbrlSqlDatabaseConnection
-        from plugin.xbrlDB.XbrlOpenSqlDB import XbrlSqlDatabaseConnection as OpenXbrlSqlDatabaseConnection
-        from plugin.xbrlDB.XbrlPublicPostgresDB import XbrlPostgresDatabaseConnection
-
-hasRefManager = False
+        try:
+            from arelle.plugin.xbrlDB import storeIntoDB, dbProduct
+            from arelle.plugin.xbrlDB.XbrlSemanticSqlDB import XbrlSqlDatabaseConnection
+            from arelle.plugin.xbrlDB.XbrlOpenSqlDB import XbrlSqlDatabaseConnection as OpenXbrlSqlDatabaseConnection
+            from arelle.plugin.xbrlDB.XbrlPublicPostgresDB import XbrlPostgresDatabaseConnection
+        except:
+            from plugin.xbrlDB import storeIntoDB, dbProduct
+            from plugin.xbrlDB.XbrlSemanticSqlDB import XbrlSqlDatabaseConnection
+            from plugin.xbrlDB.XbrlOpenSqlDB import XbrlSqlDatabaseConnection as OpenXbrlSqlDatabaseConnection
+            from plugin.xbrlDB.XbrlPublicPostgresDB import XbrlPostgresDatabaseConnection
 
-try:
-    from EdgarRenderer import RefManager
-    hasRefManager = True
-except:
-    pass
+    RefManager = None
+    hasRefManager = False
+    try:
+        from EdgarRenderer import RefManager
+        hasRefManager = True
+    except:
+        pass
 
+    globals().update(storeIntoDB=storeIntoDB, dbProduct=dbProduct, RefManager=RefManager, hasRefManager=hasRefManager,
+        _dbTypes = {
+            "postgres":XbrlPostgresDatabaseConnection,
+            "mssqlSemantic": XbrlSqlDatabaseConnection,
+            "mysqlSemantic": XbrlSqlDatabaseConnection,
+            "orclSemantic": XbrlSqlDatabaseConnection,
+            "pgSemantic": XbrlSqlDatabaseConnection,
+            "sqliteSemantic": XbrlSqlDatabaseConnection,
+            "sqliteDpmDB": XbrlSqlDatabaseConnection,
+            "pgOpenDB": OpenXbrlSqlDatabaseConnection,
+        })
 
-_dbTypes = {
-        "postgres":XbrlPostgresDatabaseConnection,
-        "mssqlSemantic": XbrlSqlDatabaseConnection,
-        "mysqlSemantic": XbrlSqlDatabaseConnection,
-        "orclSemantic": XbrlSqlDatabaseConnection,
-        "pgSemantic": XbrlSqlDatabaseConnection,
-        "sqliteSemantic": XbrlSqlDatabaseConnection,
-        "sqliteDpmDB": XbrlSqlDatabaseConnection,
-        "pgOpenDB": OpenXbrlSqlDatabaseConnection,
-    }   
+def __getattr__(name):
+    if name in _xbrlDBNames:
+        _loadXbrlDB()
+        return globals()[name]
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 
@@ -176,6 +194,7 @@ def updateCikTickerMapping(conn, createTable=False, returnStats=False):
                             "cikNumber" TEXT,
                             "tickerSymbol" TEXT
                             )''', fetch=False)
+            conn.refreshSchemaCache()
         elif conn.product == 'mongodb':
             conn.dbConn[rssTables[5]].drop()
             conn.dbConn.create_collection(rssTables[5])
@@ -185,9 +204,10 @@ def updateCikTickerMapping(conn, createTable=False, returnStats=False):
                             messageCode="RssDB.Info", messageArgs=conn.conParams.get('database',''), file="",  level=logging.INFO)
         _stat = _('{} not updated').format(rssTables[5])
     else:
-        resp = request.urlopen(url)
+        with conn.metrics.span('fetch', source='tickers'):
+            resp = request.urlopen(url)
+            resp_lines = [x.decode() for x in resp.readlines()] if resp.code == 200 else []
         if resp.code == 200:
-            resp_lines = [x.decode() for x in resp.readlines()]
             lines = {tuple(l) for l in list(csv.reader(resp_lines, delimiter='\t'))} # remove dups
             data = [{'tickerSymbol':x[0], 'cikNumber': x[1].zfill(10)} for x in lines if x[0]]
             if conn.product in ['sqlite', 'postgres']:
@@ -248,24 +268,49 @@ def _getLastBuild(fPath, feedMonth):
     return fd
 
 def _getFeedInfo(conn, link, lastModifiedDate, isNew, reloadCache=False):
-    """Gets feed info ready to insert in db"""
+    """Gets feed info ready to insert in db, returns (feedInfo, rss items, feed manifest entry)"""
     startAllTime = time.perf_counter()
-    # always reload cache for modified feeds otherwise reload when reloadCache is specified
-    if not isNew or (isNew and reloadCache):
+    feedLabel = os.path.basename(link)
+    # always reload cache for modified feeds otherwise reload when reloadCache is specified,
+    # feed is fetched into cache here (not by the model loader) to time the download separately
+    _reload = not isNew or (isNew and reloadCache)
+    if _reload:
         conn.showStatus(_('Updating cached {}').format(link))
+    feedPath = None
+    with conn.metrics.span('fetch', feed=feedLabel):
         # account for multiple processes trying to create same cache folder when cache is cleared
         while True:
             try:
                 gettext.install('arelle')
-                conn.cntlr.webCache.getfilename(link, reload=True)
+                feedPath = conn.cntlr.webCache.getfilename(link, reload=_reload)
             except FileExistsError as e:
                 time.sleep(.5)
                 continue
             break
+    # manifest entry of monthly feeds, content unchanged since recorded in the manifest is not parsed
+    manifestEntry = None
+    recorded = None
+    _feedMonth = re.search(r"\d{4}-\d{2}", feedLabel)
+    if _feedMonth and feedPath and os.path.isfile(feedPath):
+        _feedId = int(_feedMonth.group().replace('-', ''))
+        size, sha256 = contentDigest(feedPath)
+        manifestEntry = OrderedDict([('feedId', _feedId), ('url', link), ('lastModified', lastModifiedDate), ('etag', None),
+                                     ('sizeBytes', size), ('sha256', sha256), ('itemsCount', None), ('accessionsDigest', None)])
+        recorded = loadManifest(conn, [_feedId]).get(_feedId) if not isNew else None
+        if recorded and recorded.get('sha256') == sha256:
+            feedInfo = _recordedFeedInfo(conn, _feedId)
+            if feedInfo:
+                feedInfo['lastModifiedDate'] = lastModifiedDate
+                manifestEntry['itemsCount'] = recorded.get('itemsCount')
+                manifestEntry['accessionsDigest'] = recorded.get('accessionsDigest')
+                conn.addToLog(_('{} is unchanged since last update, not parsed').format(link), messageCode="RssDB.Info",
+                                file=conn.conParams.get('database', ''), level=logging.INFO)
+                return feedInfo, [], manifestEntry
     mdlXbrl = None
-    while not mdlXbrl:
-        conn.cntlr.runKwargs(file=link, keepOpen='')
-        mdlXbrl = conn.cntlr.modelManager.modelXbrl
+    with conn.metrics.span('parse', feed=feedLabel):
+        while not mdlXbrl:
+            conn.cntlr.runKwargs(file=link, keepOpen='')
+            mdlXbrl = conn.cntlr.modelManager.modelXbrl
     modelDoc = mdlXbrl.modelDocument
     conn.showStatus(_("Getting feed info from {}").format(link))
     feedInfo = OrderedDict.fromkeys(rssCols[rssTables[0]])
@@ -301,13 +346,20 @@ def _getFeedInfo(conn, link, lastModifiedDate, isNew, reloadCache=False):
     conn.showStatus(_("Getting feed items from {}").format(link))
     modelDoc.rssItems.reverse()
     _rssItemsList = modelDoc.rssItems
-    if not isNew:
-        doc_accessions = modelDoc.xmlDocument.xpath('.//*[local-name()="accessionNumber"]/text()')
+    doc_accessions = modelDoc.xmlDocument.xpath('.//*[local-name()="accessionNumber"]/text()')
+    if manifestEntry is not None:
+        manifestEntry['itemsCount'] = len(modelDoc.rssItems)
+        manifestEntry['accessionsDigest'] = accessionsDigest(doc_accessions)
+    if not isNew and recorded and recorded.get('accessionsDigest') == manifestEntry['accessionsDigest']:
+        # same accessions as when last ingested, no new items
+        _rssItemsList = []
+    elif not isNew:
+        diffStartTime = time.perf_counter()
         db_accessions = []
 
         if not isNew:
             if conn.product in ['sqlite', 'postgres'] and rssTables[1] in conn.tablesInDB():
-                _qry = 'SELECT "accessionNumber" FROM "{}" where "feedId"={}'.format(rssTables[1], feedInfo['feedId'])
+                _qry = 'SELECT "accessionNumber" FROM "{}" where "feedId"={}{}'.format(rssTables[1], feedInfo['feedId'], idRangeClause(conn, feedId=feedInfo['feedId']))
                 try:
                     _db = conn.execute(_qry, close = False)
                     db_accessions = [x[0] for x in _db]
@@ -318,9 +370,19 @@ def _getFeedInfo(conn, link, lastModifiedDate, isNew, reloadCache=False):
                 _db = list(conn.dbConn[rssTables[1]].find({"feedId":feedInfo['feedId']}, {"accessionNumber":1, "_id":0}))
                 db_accessions = [x['accessionNumber'] for x in _db]
         
-        _new_accessions = [x for x in doc_accessions if x not in db_accessions]
+        _new_accessions = set(doc_accessions) - set(db_accessions)
         _rssItemsList = [x for x in modelDoc.rssItems if x.accessionNumber in _new_accessions]
-    return feedInfo, _rssItemsList
+        conn.metrics.observe('diff', time.perf_counter() - diffStartTime, feed=feedLabel)
+    return feedInfo, _rssItemsList, manifestEntry
+
+def _recordedFeedInfo(conn, feedId):
+    '''Returns feedsInfo row of feedId from db as feed info dict, None if not found'''
+    cols = rssCols[rssTables[0]]
+    if conn.product == 'mongodb':
+        row = conn.dbConn[rssTables[0]].find_one({'feedId': feedId}, {c: 1 for c in cols})
+        return OrderedDict((c, row.get(c)) for c in cols) if row else None
+    res = conn.execute('SELECT {} FROM "{}" WHERE "feedId" = {}'.format(', '.join('"{}"'.format(c) for c in cols), rssTables[0], int(feedId)), close=False)
+    return OrderedDict(zip(cols, res[0])) if res else None
 
 def getFilesInfo(modelRssItem, feedId, filingId):
     """Gets files information from modelRssItems ready to be inserted in db
@@ -329,9 +391,11 @@ def getFilesInfo(modelRssItem, feedId, filingId):
     filesInfoList = []
     itemFiles = XmlUtil.descendants(_i, _i.edgr, 'xbrlFile')
     for _f in itemFiles:
-        filesInfoDict = OrderedDict.fromkeys(rssCols['filesInfo'])
+        filesInfoDict = filesInfoRecord()
         for _t in _f.elementAttributesTuple:
-            filesInfoDict[_t[0].replace('{'+_i.edgr+'}', '')] = _t[1]
+            _attr = _t[0].replace('{'+_i.edgr+'}', '')
+            if _attr in filesInfoDict:
+                filesInfoDict[_attr] = _t[1]
         filesInfoDict['feedId'] = feedId
         filesInfoDict['filingId'] = filingId
         filesInfoDict['duplicate'] = 0
@@ -367,6 +431,11 @@ def getFilesInfo(modelRssItem, feedId, filingId):
         filesInfoList.append(filesInfoDict)
     return filesInfoList
 
+def _parseFeedsIndex(feedsPage):
+    """Returns [(href, last modified date)] of the files listed in SEC monthly feeds index page"""
+    tree = html.parse(feedsPage).getroot().xpath('.//table//tr[child::td]')
+    return [(x.xpath('td/a/@href')[0], parser.parse(x.xpath('td[3]/text()')[0])) for x in tree]
+
 def _getMonthlyFeedsLinks(conn, loc=None, maxWorkers=None, dateFrom=None, dateTo=None, last=None, _log=False):
     """Returns Monthly feeds Links  that are not in DB or with lastModified date later than in DB"""
     if not maxWorkers:
@@ -379,12 +448,19 @@ def _getMonthlyFeedsLinks(conn, loc=None, maxWorkers=None, dateFrom=None, dateTo
     feeds = []
     compareCol = 'lastModifiedDate'
     startTime = time.perf_counter()
-    # For testing on local files only
+    # Local folder of feeds, such as a mirror of the monthly feeds (see Mirror.syncMonthlyMirror)
     if os.path.isdir(loc):
         # Reduce time and keep lxml memory usage in subprocesses, not for windows though!
+        a1 = [os.path.join(p,_f) for p,d,f in list(os.walk(loc)) for _f in f if rssPattern.match(_f)]
+        a2 = [yearMonPattern.search(_f).group() for _f in a1]
+        # feeds with the content recorded in the feeds manifest are not parsed
+        manifest = loadManifest(conn, conn.getExistingFeeds())
+        _unchanged = {_a1 for _a1, _a2 in zip(a1, a2) if localFeedUnchanged(manifest.get(int(_a2.replace('-', ''))), _a1)}
+        if _unchanged:
+            conn.addToLog(_('{} feed(s) unchanged since last update').format(len(_unchanged)), messageCode="RssDB.Info", file=conn.conParams.get('database',''),  level=logging.INFO)
+            a2 = [_a2 for _a1, _a2 in zip(a1, a2) if _a1 not in _unchanged]
+            a1 = [_a1 for _a1 in a1 if _a1 not in _unchanged]
         with concurrent.futures.ProcessPoolExecutor(max_workers=maxWorkers) as executor: 
-            a1 = [os.path.join(p,_f) for p,d,f in list(os.walk(loc)) for _f in f if rssPattern.match(_f)]
-            a2 = [yearMonPattern.search(_f).group() for _f in a1]
             _feeds = [executor.submit(_getLastBuild, _a1, _a2) for _a1, _a2 in zip(a1, a2)]
             for _fd in concurrent.futures.as_completed(_feeds):
                 feeds.append(_fd.result())
@@ -394,12 +470,11 @@ def _getMonthlyFeedsLinks(conn, loc=None, maxWorkers=None, dateFrom=None, dateTo
     elif urlPattern.match(loc):
         feedsPage = None
         try:
-            feedsPage = conn.cntlr.webCache.opener.open(loc) #request.urlopen(loc)
+            with conn.metrics.span('fetch', source='feedsIndex'):
+                feedsPage = conn.cntlr.webCache.opener.open(loc) #request.urlopen(loc)
             if feedsPage.code == 200:
                 conn.showStatus(_('Getting feeds info from {}').format(loc))
-                tree = html.parse(feedsPage).getroot().xpath('.//table//tr[child::td]')
-                href = [(x.xpath('td/a/@href')[0], parser.parse(x.xpath('td[3]/text()')[0])) for x in tree]
-                for h in href:
+                for h in _parseFeedsIndex(feedsPage):
                     if rssPattern.match(h[0]):
                         fd = dict()
                         feedMonth = yearMonPattern.search(h[0]).group()
@@ -423,9 +498,7 @@ def _getMonthlyFeedsLinks(conn, loc=None, maxWorkers=None, dateFrom=None, dateTo
 def getRssItemInfo(modelRssItem, feedId, filingId, getFiles=True, getXML=False):
     """Gets filingInfo info ready to insert in db"""
     _i = modelRssItem
-    itemInfoDict = OrderedDict.fromkeys(rssCols[rssTables[1]])
-    itemInfoDict['inlineXBRL'] = 0
-    itemInfoDict['duplicate'] = 0
+    itemInfoDict = filingsInfoRecord(inlineXBRL=0, duplicate=0)
     inlineAttrib = _i.xpath('.//@*[local-name()="inlineXBRL"]')
     if inlineAttrib:
         isInlineXbrl = inlineAttrib[0]
@@ -484,9 +557,7 @@ def getRssItemInfo(modelRssItem, feedId, filingId, getFiles=True, getXML=False):
             result[rssTables[2]] = filesInfo
 
     if getXML:
-        rssXml = OrderedDict.fromkeys(rssCols[rssTables[4]])
-        rssXml['filingId'] = filingId
-        rssXml['rssItem'] = etree.tostring(modelRssItem).decode(modelRssItem.document.xmlDocument.docinfo.encoding)
+        rssXml = rssItemsRecord(filingId, etree.tostring(modelRssItem).decode(modelRssItem.document.xmlDocument.docinfo.encoding))
         result[rssTables[4]] = rssXml
     return result
 
@@ -542,17 +613,21 @@ def _getFilerInformation(conn, ciks:list, i=None, _all=None, timeOut=5, maxWorke
     if sys.platform.lower().startswith('win'):
         # windows app and multiprocessing issues!
         conn.addToLog(_('Not using multiprocessing to get filers information'), messageCode="RssDB.Info", file=conn.conParams.get('database',''),  level=logging.INFO)
-        for c in ciksLst:
-            res = _filerInformation(c, timeOut=timeOut, dbType=conn.product, mp=False, webcache=conn.cntlr.webCache)
+        for n, c in enumerate(ciksLst):
+            conn.metrics.gauge('queue_depth', len(ciksLst) - n, queue='filers')
+            res = _filerInformation(c, timeOut=timeOut, dbType=conn.product, mp=False, webcache=conn.cntlr.webCache, profileOpts=getattr(conn, 'profileOpts', None))
+            conn.metrics.observe('fetch', res['elapsed'], source='filer')
             hasInfo = res.get('filerInfo')
             cik_db = res.get('cik')
             msg = '{}/{} '.format(i, _all)
             if hasInfo:
                 filerInfos.append(res)
+                conn.metrics.incr('filers', 1, status='retrieved')
                 msg = msg + 'Retrived cik {} -- {}'.format(cik_db, hasInfo.get('conformedName'))
             else:
                 msg = msg + 'Could not retrive cik {}'.format(cik_db)
                 missing.append(cik_db)
+                conn.metrics.incr('filers', 1, status='missing')
             conn.showStatus(msg, 2000, end='\r')
             i +=1
     else:
@@ -561,17 +636,23 @@ def _getFilerInformation(conn, ciks:list, i=None, _all=None, timeOut=5, maxWorke
             a1 = ciksLst
             a2 = [timeOut] * len(a1)
             a3 = [conn.product] * len(a1)
-            _filerInfos = [executor.submit(_filerInformation, _a1, _a2, _a3) for _a1, _a2, _a3 in zip(a1, a2, a3)]
-            for _info in concurrent.futures.as_completed(_filerInfos):
+            profileOpts = getattr(conn, 'profileOpts', None)
+            _filerInfos = [executor.submit(_filerInformation, _a1, _a2, _a3, profileOpts=profileOpts) for _a1, _a2, _a3 in zip(a1, a2, a3)]
+            conn.metrics.gauge('queue_depth', len(_filerInfos), queue='filers')
+            for n, _info in enumerate(concurrent.futures.as_completed(_filerInfos)):
+                conn.metrics.gauge('queue_depth', len(_filerInfos) - n - 1, queue='filers')
+                conn.metrics.observe('fetch', _info.result()['elapsed'], source='filer')
                 hasInfo = _info.result().get('filerInfo')
                 cik_db = _info.result().get('cik')
                 msg = '{}/{} '.format(i, _all)
                 if hasInfo:
                     filerInfos.append(_info.result())
+                    conn.metrics.incr('filers', 1, status='retrieved')
                     msg = msg + 'Retrived cik {} -- {}'.format(cik_db, hasInfo.get('conformedName'))
                 else:
                     msg = msg + 'Could not retrive cik {}'.format(cik_db)
                     missing.append(cik_db)
+                    conn.metrics.incr('filers', 1, status='missing')
                 conn.showStatus(msg, 2000, end='\r')
                 i +=1
     b = time.perf_counter()
@@ -580,7 +661,10 @@ def _getFilerInformation(conn, ciks:list, i=None, _all=None, timeOut=5, maxWorke
         conn.addToLog(_('Could not retrieve {} cik(s): {}').format(len(missing), missing), messageCode="RssDB.Info", file=conn.conParams.get('database',''),  level=logging.INFO)
     return {'retrived':filerInfos, 'missing': missing, 'i':i}
 
-def _filerInformation(cik, timeOut, dbType, waitTime=1, mp=True, webcache=None):
+def _filerInformation(cik, timeOut, dbType, waitTime=1, mp=True, webcache=None, profileOpts=None):
+    if profileOpts:
+        with taskProfiler(profileOpts, 'filer', cik):
+            return _filerInformation(cik, timeOut, dbType, waitTime=waitTime, mp=mp, webcache=webcache)
     if mp:
         from arelle import Cntlr
         c = Cntlr.Cntlr(logFileName="logToPrint")
@@ -588,6 +672,7 @@ def _filerInformation(cik, timeOut, dbType, waitTime=1, mp=True, webcache=None):
 
     url = 'https://www.sec.gov/cgi-bin/browse-edgar?CIK={}&action=getcompany&output=atom'.format(cik)
     filerInformation = dict()
+    startTime = time.perf_counter()
     try:
         # resp = request.urlopen(url, timeout=timeOut)
         resp = webcache.opener.open(url, timeout=timeOut)
@@ -634,16 +719,18 @@ def _filerInformation(cik, timeOut, dbType, waitTime=1, mp=True, webcache=None):
             filerInformation['country'] =  stateCodes.get(state.upper())[0]
     except Exception:
         pass
+    elapsed = time.perf_counter() - startTime
     if mp:
         del webcache
         c.close()
         del c
     time.sleep(waitTime) # make sure we don't spam sec.gov
-    return {'filerInfo' : filerInformation, 'cik': cik }
+    return {'filerInfo' : filerInformation, 'cik': cik, 'elapsed': elapsed}
 
 def _xDoAll(conn, loc=None, last=None, dateFrom=None, dateTo=None, getRssItems=True, returnInfo=False, 
             maxWorkers=None, updateDB=True, reloadCache=False, updateExisting=True, refreshAll=False, 
-            timeOut=3, retries=3, includeLatest=True, getFiles=True, getXML=False, getFilers=True, updateTickers=True, q=None):
+            timeOut=3, retries=3, includeLatest=True, getFiles=True, getXML=False, getFilers=True, updateTickers=True, q=None, metricsFile=None,
+            profile=None, profileMemory=False):
     '''Creates and populates rssDB or jus updates db if db exists 
 
     args:  
@@ -669,20 +756,48 @@ def _xDoAll(conn, loc=None, last=None, dateFrom=None, dateTo=None, getRssItems=T
         getFilers: get filers data
         updateTickers: update ticker cik mapping from SEC website
         q: multiprocessing.Manager().queue to transfer stat message in multiprocessing
+        metricsFile: path to file to save stage timing metrics of this run, json summary if file extension is .json
+                     otherwise Prometheus text format (rewritten after each run, suitable for textfile collectors)
+        profile: folder to save profiles of this run, profiles main process and each worker task with cProfile and
+                 merges them into one pstats file with a report of top functions
+        profileMemory: also trace memory allocations with tracemalloc in each task when profile is set (slow)
     '''
+    if profile:
+        conn.profileOpts = newProfileRun(profile, traceMemory=profileMemory)
+        conn.addToLog(_('Profiling update to {}').format(conn.profileOpts['dir']), messageCode="RssDB.Info", file=conn.conParams.get('database',''),  level=logging.INFO)
+        results = None
+        try:
+            with taskProfiler(conn.profileOpts, 'main'):
+                results = _xDoAll(conn, loc=loc, last=last, dateFrom=dateFrom, dateTo=dateTo, getRssItems=getRssItems, returnInfo=returnInfo,
+                                    maxWorkers=maxWorkers, updateDB=updateDB, reloadCache=reloadCache, updateExisting=updateExisting, refreshAll=refreshAll,
+                                    timeOut=timeOut, retries=retries, includeLatest=includeLatest, getFiles=getFiles, getXML=getXML, getFilers=getFilers,
+                                    updateTickers=updateTickers, q=q, metricsFile=metricsFile)
+        finally:
+            profileOpts, conn.profileOpts = conn.profileOpts, None
+            profileResult = mergeProfiles(profileOpts)
+            conn.addToLog(_('Merged {} task profiles into {}, report {}{}').format(profileResult['tasks'], profileResult['pstats'], profileResult['report'],
+                                ', allocations report {}'.format(profileResult['allocations']) if profileResult['allocations'] else ''),
+                            messageCode="RssDB.Info", file=conn.conParams.get('database',''),  level=logging.INFO)
+        if returnInfo and results:
+            results['profile'] = profileResult
+        return results
+
     conn.updateStarted = True
     startTime = time.perf_counter()
+    conn.metrics.reset()
     
     rssFeeds = conn.updateRssFeeds(loc=loc, last=last, dateFrom=dateFrom, dateTo=dateTo, getRssItems=getRssItems,
                                 returnInfo=returnInfo, maxWorkers=maxWorkers, updateDB=updateDB, reloadCache=reloadCache, 
                                 includeLatest=includeLatest, getFiles=getFiles, getXML=getXML, q=q)
     filersInfo = None
     if getFilers:
-        filersInfo = conn.updateFilersInfo(updateExisting=updateExisting, refreshAll=refreshAll, updateDB=updateDB,
-                                        maxWorkers=maxWorkers, timeOut=timeOut, retries=retries, returnData=returnInfo)
+        with conn.metrics.span('filers'):
+            filersInfo = conn.updateFilersInfo(updateExisting=updateExisting, refreshAll=refreshAll, updateDB=updateDB,
+                                            maxWorkers=maxWorkers, timeOut=timeOut, retries=retries, returnData=returnInfo)
     cikTickerMapping = None
     if updateTickers:
-        cikTickerMapping = updateCikTickerMapping(conn, returnStats=True)
+        with conn.metrics.span('tickers'):
+            cikTickerMapping = updateCikTickerMapping(conn, returnStats=True)
     updatedOn = parser.parse(datetime.today().strftime("%Y-%m-%d %H:%M:%S"))
     if conn.product == 'postgres':
         conn.execute(f'UPDATE "lastUpdate" SET "lastUpdate"=$${str(updatedOn)}$$::timestamp WHERE "id"=0', fetch=False) # quick fix for now
@@ -699,7 +814,8 @@ def _xDoAll(conn, loc=None, last=None, dateFrom=None, dateTo=None, getRssItems=T
 
     dupMsg = None
     if rssFeeds['summary']['feedsInfo']['insert'] > 0:
-        dupStat = conn.updateDuplicateFilings()
+        with conn.metrics.span('duplicates'):
+            dupStat = conn.updateDuplicateFilings()
         rssFeeds['summary']['filingsInfo']['update'] = rssFeeds['summary']['filingsInfo']['update'] + dupStat['filingsInfo']['update']
         rssFeeds['summary']['filesInfo']['update'] = rssFeeds['summary']['filesInfo']['update'] + dupStat['filesInfo']['update']
         dupMsg = dupStat['msg']
@@ -721,9 +837,16 @@ def _xDoAll(conn, loc=None, last=None, dateFrom=None, dateTo=None, getRssItems=T
     conn.addToLog(_msg, messageCode="RssDB.Info", file=conn.conParams.get('database',''),  level=logging.INFO)
     conn.showStatus(_msg)
     rssFeeds['stats'].append(_msg)
+    conn.metrics.observe('update', endTime - startTime)
     results = {'summary': rssFeeds['summary'], 'stats': rssFeeds['stats']}
+    if metricsFile:
+        try:
+            conn.metrics.save(metricsFile)
+        except Exception as e:
+            conn.addToLog(_('Could not save metrics to {}:\n{}').format(metricsFile, str(e)), messageCode="RssDB.Error", file=conn.conParams.get('database',''),  level=logging.ERROR)
     if returnInfo:
         results['feeds'] = rssFeeds['feeds'] 
+        results['metrics'] = conn.metrics.summary()
         if filersInfo:
             results['filers'] = filersInfo
     # # update filers' dump
@@ -734,7 +857,8 @@ def _xDoAll(conn, loc=None, last=None, dateFrom=None, dateTo=None, getRssItems=T
 def _doAll(conn, setAutoUpdate=False, waitFor=timedelta(minutes=wait_duration), duration=timedelta(hours=1),
                 loc=None, last=None, dateFrom=None, dateTo=None, getRssItems=True, returnInfo=False, 
                 maxWorkers=None, updateDB=True, reloadCache=False, updateExisting=True, refreshAll=False, 
-                timeOut=3, retries=3, includeLatest=True, getFiles=True, getXML=False, getFilers=True, updateTickers=True, q=None):
+                timeOut=3, retries=3, includeLatest=True, getFiles=True, getXML=False, getFilers=True, updateTickers=True, q=None, metricsFile=None,
+                profile=None, profileMemory=False):
     results = None
     if setAutoUpdate:
         conn.updateStopped = False
@@ -756,7 +880,8 @@ def _doAll(conn, setAutoUpdate=False, waitFor=timedelta(minutes=wait_duration),
                     results = _xDoAll(conn, loc=loc, last=last, dateFrom=dateFrom, dateTo=dateTo, getRssItems=getRssItems, returnInfo=False, # don't return anything
                                         maxWorkers=maxWorkers, updateDB=updateDB, reloadCache=reloadCache, updateExisting=updateExisting, 
                                         refreshAll=refreshAll, timeOut=timeOut, retries=retries, includeLatest=includeLatest, getFiles=getFiles, 
-                                        getXML=getXML, getFilers=getFilers, updateTickers=updateTickers, q=q)
+                                        getXML=getXML, getFilers=getFilers, updateTickers=updateTickers, q=q, metricsFile=metricsFile,
+                                        profile=profile, profileMemory=profileMemory)
                 except Exception as e:
                     conn.cntlr.addToLog(_('Error while updating db:\n{}\n{}').format(str(e), traceback.format_tb(sys.exc_info()[2])), messageCode="RssDB.Error", file=conn.conParams['database'], level=logging.ERROR)
             cycleTime = datetime.now()
@@ -774,7 +899,7 @@ def _doAll(conn, setAutoUpdate=False, waitFor=timedelta(minutes=wait_duration),
             results = _xDoAll(conn, loc=loc, last=last, dateFrom=dateFrom, dateTo=dateTo, getRssItems=getRssItems, returnInfo=returnInfo,
                                 maxWorkers=maxWorkers, updateDB=updateDB, reloadCache=reloadCache, updateExisting=updateExisting, refreshAll=refreshAll, 
                                 timeOut=timeOut, retries=retries, includeLatest=includeLatest, getFiles=getFiles, getXML=getXML, getFilers=getFilers, 
-                                updateTickers=updateTickers, q=q)
+                                updateTickers=updateTickers, q=q, metricsFile=metricsFile, profile=profile, profileMemory=profileMemory)
         except Exception as e:
             conn.cntlr.addToLog(_('Error while updating db:\n{}\n{}').format(str(e), traceback.format_tb(sys.exc_info()[2])), messageCode="RssDB.Error", file=conn.conParams['database'], level=logging.ERROR)
     return results
@@ -783,6 +908,9 @@ def _makeRssFeedLikeXml(conn, dbFilings_dicts, dbFiles_dicts, saveAs=None, retur
     '''Create xml document like rss feed that can be loaded to arelle'''
     # prep data for to write XML
     conn.showStatus(_('preparing data'),2000)
+    # files of filings in feeds moved to cold storage
+    _filingsWithFiles = {f['filingId'] for f in dbFiles_dicts}
+    dbFiles_dicts = list(dbFiles_dicts) + fetchColdRows(conn, rssTables[2], {d['filingId'] for d in dbFilings_dicts} - _filingsWithFiles)
     # re-attach files to filing
     for d in dbFilings_dicts:
         d['files'] = [f for f in dbFiles_dicts if f['filingId']==d['filingId']]
@@ -928,8 +1056,20 @@ def _makeRssFeedLikeXml(conn, dbFilings_dicts, dbFiles_dicts, saveAs=None, retur
             rssIt.download_url = download_url
     return fpath, rssItems
 
-def runRenderEdgar(mainCntlr, rssItems=None, saveToFolder=None, pluginsDirs=None):
+def runRenderEdgar(mainCntlr, rssItems=None, saveToFolder=None, pluginsDirs=None, archiveCache=None):
     reportFolder = None
+    if archiveCache:
+        # renderer loads filings from enclosure urls, serve them from the local archive store via web cache,
+        # all archives are linked before rendering starts so the renderer never requests an enclosure that is
+        # not linked yet, downloads run in the prefetcher threads, store and index (db) updates in this thread
+        for rssItem, archivePath, error in archivePrefetcher(archiveCache, rssItems or []):
+            try:
+                if error:
+                    raise error
+                archiveCache.linkIntoWebCache(mainCntlr.webCache, rssItem, archivePath=archivePath)
+            except Exception as e:
+                mainCntlr.addToLog(_('Could not get filing archive {} from archive cache\n{}').format(rssItem.accessionNumber, str(e)),
+                                    messageCode="RssDB.Info", file="runRenderEdgar",  level=logging.INFO)
     try:
         reportFolder = renderEdgarReportsFromRssItems(mainCntlr=mainCntlr, rssItems=rssItems, saveToFolder=saveToFolder, pluginsDirs=pluginsDirs)
     except Exception as e:
@@ -938,11 +1078,41 @@ def runRenderEdgar(mainCntlr, rssItems=None, saveToFolder=None, pluginsDirs=None
     return reportFolder   
 
 def initLocalEdgarViewer(cntlr, lookinFolder=None, edgarDir=None, threaded=True):
+    try:
+        from arellepy.LocalViewerStandalone import initViewer
+    except:
+        from .arellepy.LocalViewerStandalone import initViewer
     initViewer(cntlr=cntlr, lookinFolders=lookinFolder, edgarDir=edgarDir, threaded=threaded)
     return
 
-def storeInToXbrlDB(cntlr, rssItems, params, selectionButton=None):
-    global hasRefManager
+def getExistingXbrlDBFilings(cntlr, modelXbrl, dbParams):
+    '''Returns dict of accession number: accepted timestamp of filings in xbrlDB from one query'''
+    existingFilings = dict()
+    _loadXbrlDB()
+    conFunc = _dbTypes.get(dbParams[6], None)
+    if not conFunc:
+        return existingFilings
+    conn = None
+    try:
+        conn = conFunc(modelXbrl, dbParams[2], dbParams[3],dbParams[0], dbParams[1], dbParams[4], dbParams[5], dbProduct.get(dbParams[6], None))
+        result = conn.execute("SELECT filing_accession_number, accepted_timestamp FROM accession" if dbParams[6]=='postgres' \
+                                else  "SELECT filing_number, accepted_timestamp FROM filing", fetch=True)
+        existingFilings = dict((filingNumber, timestamp) 
+                            for filingNumber, timestamp in result)
+    except Exception as e:
+        cntlr.addToLog(_("Could not make initial check if items exist in DB"), messageCode='arellePy.Info', level=logging.INFO)
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+    return existingFilings
+
+def storeInToXbrlDB(cntlr, rssItems, params, selectionButton=None, archiveCache=None, maxWorkers=None):
+    '''Stores rssItems filings into xbrlDB, filings already in xbrlDB are skipped, with maxWorkers > 1 filings
+    are stored by a pool of worker processes each keeping its own xbrlDB connection (see XbrlDBStore)'''
+    _loadXbrlDB()
     if selectionButton:
         selectionButton.config(state='disabled')
     dbCon =[x.strip() for x in params.split(',')]
@@ -951,15 +1121,7 @@ def storeInToXbrlDB(cntlr, rssItems, params, selectionButton=None):
     # check if items already in db
     conFunc = _dbTypes.get(_dbCon[6], None)
     if conFunc:
-        existingFilings = dict()
-        try:
-            conn = conFunc(mx, _dbCon[2], _dbCon[3],_dbCon[0], _dbCon[1], _dbCon[4], _dbCon[5], dbProduct.get(_dbCon[6], None))
-            result = conn.execute("SELECT filing_accession_number, accepted_timestamp FROM accession" if _dbCon[6]=='postgres' \
-                                    else  "SELECT filing_number, accepted_timestamp FROM filing", fetch=True)
-            existingFilings = dict((filingNumber, timestamp) 
-                                for filingNumber, timestamp in result)
-        except Exception as e:
-            cntlr.addToLog(_("Could not make initial check if items exist in DB"), messageCode='arellePy.Info', level=logging.INFO)
+        existingFilings = getExistingXbrlDBFilings(cntlr, mx, _dbCon)
         for _i in rssItems:
             _i.skipRssItem = False
             if (_i.accessionNumber in existingFilings and
@@ -974,57 +1136,91 @@ def storeInToXbrlDB(cntlr, rssItems, params, selectionButton=None):
         if _cntlr.hasGui:
             rssItem.modelXbrl.modelManager.viewModelObject(rssItem.modelXbrl, rssItem.objectId())
         return
-    for rssItem in rssItems:
-        modelXbrl = None
-        hasMxVar = True
-        viewObj(rssItem, stat='Checking if in DB' )
-        if rssItem.skipRssItem:
-            viewObj(rssItem, 'Skipped', 'Already In DB')
-            cntlr.addToLog(_("Filing with accession {} already in DB - Skipped").format(rssItem.accessionNumber), file=rssItem.url, messageCode='arellePy.Info', level=logging.INFO)
-            continue
+
+    if maxWorkers and maxWorkers > 1 and conFunc and not sys.platform.lower().startswith('win'):
         try:
-            retries = 0
-            badUrl = True
-            viewObj(rssItem, "Getting Filing")
-            while badUrl and retries <=3: # try to get filing 3 times without file not downloaded error
-                modelXbrl = ModelXbrl.load(cntlr.modelManager, openFileSource(rssItem.zippedUrl, cntlr))
-                if 'FileNotLoadable' in modelXbrl.errors:
-                    viewObj(rssItem, stat="not loadable try {}".format(retries+1))
-                    modelXbrl.close()
-                    del modelXbrl
-                    hasMxVar = False
-                    badUrl = True
-                    retries +=1
-                else:
-                    badUrl = False
-            if badUrl:
-                viewObj(rssItem, res='Download Failed')
-                cntlr.addToLog(_('Could not fetch filing {}').format(rssItem.url), messageCode='arellePy.Error', level=logging.ERROR)
+            from .XbrlDBStore import storeFilingsParallel
+        except:
+            from rssDB.XbrlDBStore import storeFilingsParallel
+        try:
+            storeFilingsParallel(cntlr, rssItems, _dbCon, viewObj, maxWorkers=maxWorkers, archiveCache=archiveCache)
+        finally:
+            if selectionButton:
+                selectionButton.config(state='normal')
+        return
+
+    prefetcher = None
+    if archiveCache:
+        # download next filings while the current one is loaded and stored
+        prefetcher = iter(archivePrefetcher(archiveCache, [x for x in rssItems if not getattr(x, 'skipRssItem', False)], entryUrls=True))
+    try:
+        for rssItem in rssItems:
+            modelXbrl = None
+            hasMxVar = True
+            viewObj(rssItem, stat='Checking if in DB' )
+            if getattr(rssItem, 'skipRssItem', False):
+                viewObj(rssItem, 'Skipped', 'Already In DB')
+                cntlr.addToLog(_("Filing with accession {} already in DB - Skipped").format(rssItem.accessionNumber), file=rssItem.url, messageCode='arellePy.Info', level=logging.INFO)
                 continue
-            viewObj(rssItem, 'Filing Downloaded')
-            if hasRefManager and hasMxVar:
-                cntlr.logDebug = lambda x: cntlr.addToLog(x, level=logging.DEBUG) # needed for ref manager
-                try:
-                    viewObj(rssItem, stat='Getting Refs')
-                    edgarResourcesFolder = os.path.join(os.path.dirname(RefManager.__file__), 'resources')
-                    RefManager.RefManager(edgarResourcesFolder).loadAddedUrls(modelXbrl, modelXbrl.modelManager.cntlr)
-                    viewObj(rssItem, res='Downloaded Refs')
-                except Exception as e:
-                    cntlr.addToLog(_('Could not load additional files for filing {}\n{}').format(rssItem.url, str(e)), messageCode='arellePy.Info', level=logging.INFO)
-            viewObj(rssItem, stat="Inserting Into DB")
-            storeIntoDB(dbCon, modelXbrl, rssItem)
-            viewObj(rssItem, res="Inserted Into DB", stat="Finished")
-            modelXbrl.close()
-            del modelXbrl
-            hasMxVar = False
-        except Exception as e:
-            cntlr.addToLog('{}\n{}'.format(str(e), traceback.format_tb(sys.exc_info()[2])), messageCode='arellePy.Error', level=logging.ERROR)
-            viewObj(rssItem, res="Failed")
-            if hasMxVar:
-                modelXbrl.close() if modelXbrl else None
-            del modelXbrl
-            hasMxVar = False
-            continue
+            prefetched = next(prefetcher, None) if prefetcher else None
+            if prefetched is not None and prefetched[0] is not rssItem:
+                raise Exception(_('Prefetched archive of {} does not match filing {}').format(prefetched[0].accessionNumber, rssItem.accessionNumber))
+            try:
+                retries = 0
+                badUrl = True
+                viewObj(rssItem, "Getting Filing")
+                while badUrl and retries <=3: # try to get filing 3 times without file not downloaded error
+                    filingUrl = rssItem.zippedUrl
+                    if prefetched is not None and retries == 0 and prefetched[1]:
+                        filingUrl = prefetched[1]
+                    elif archiveCache:
+                        try:
+                            filingUrl = archiveCache.entryUrl(rssItem, reload=retries > 0)
+                        except Exception as e:
+                            cntlr.addToLog(_('Could not get filing archive {} from archive cache\n{}').format(rssItem.accessionNumber, str(e)),
+                                            messageCode='arellePy.Info', level=logging.INFO)
+                    modelXbrl = ModelXbrl.load(cntlr.modelManager, openFileSource(filingUrl, cntlr))
+                    if 'FileNotLoadable' in modelXbrl.errors:
+                        viewObj(rssItem, stat="not loadable try {}".format(retries+1))
+                        modelXbrl.close()
+                        del modelXbrl
+                        hasMxVar = False
+                        badUrl = True
+                        retries +=1
+                    else:
+                        badUrl = False
+                if badUrl:
+                    viewObj(rssItem, res='Download Failed')
+                    cntlr.addToLog(_('Could not fetch filing {}').format(rssItem.url), messageCode='arellePy.Error', level=logging.ERROR)
+                    continue
+                viewObj(rssItem, 'Filing Downloaded')
+                if hasRefManager and hasMxVar:
+                    cntlr.logDebug = lambda x: cntlr.addToLog(x, level=logging.DEBUG) # needed for ref manager
+                    try:
+                        viewObj(rssItem, stat='Getting Refs')
+                        edgarResourcesFolder = os.path.join(os.path.dirname(RefManager.__file__), 'resources')
+                        RefManager.RefManager(edgarResourcesFolder).loadAddedUrls(modelXbrl, modelXbrl.modelManager.cntlr)
+                        viewObj(rssItem, res='Downloaded Refs')
+                    except Exception as e:
+                        cntlr.addToLog(_('Could not load additional files for filing {}\n{}').format(rssItem.url, str(e)), messageCode='arellePy.Info', level=logging.INFO)
+                viewObj(rssItem, stat="Inserting Into DB")
+                storeIntoDB(dbCon, modelXbrl, rssItem)
+                viewObj(rssItem, res="Inserted Into DB", stat="Finished")
+                modelXbrl.close()
+                del modelXbrl
+                hasMxVar = False
+            except Exception as e:
+                cntlr.addToLog('{}\n{}'.format(str(e), traceback.format_tb(sys.exc_info()[2])), messageCode='arellePy.Error', level=logging.ERROR)
+                viewObj(rssItem, res="Failed")
+                if hasMxVar:
+                    modelXbrl.close() if modelXbrl else None
+                del modelXbrl
+                hasMxVar = False
+                continue
+    finally:
+        if prefetcher:
+            # stops prefetch downloads and removes unused ones if storing ends early
+            prefetcher.close()
     if selectionButton:
         selectionButton.config(state='normal')        
     return
@@ -0,0 +1,291 @@
+'''Compression of large text columns in rssDB
+
+rss items xml (`rssItems.rssItem`) and formula results (`formulaeResults.formulaOutput`, `assertionsResults`
+and `processingLog`) make up most of the database size, these values are stored compressed (zstd if
+zstandard package is available, otherwise zlib) prefixed with a marker identifying the codec. Values
+without the marker (stored before compression was enabled) are returned as they are, so compressed and
+uncompressed rows can be mixed in the same table and existing rows can be compressed later in place
+with `compressExistingRows`.
+
+On postgres compressed values need BYTEA columns, existing databases with XML/JSON columns are left
+uncompressed until migrated. MongoDB documents are not changed (validators require the rss item as
+a string), instead the collections are created with WiredTiger block compression.
+'''
+
+import os, zlib, time, json, logging
+from collections import OrderedDict
+from .Constants import rssTables, pathToSQL
+from .Records import rssRecord
+from .Sharding import shardTables, attachShards
+
+hasZstd = True
+try:
+    import zstandard
+except Exception:
+    hasZstd = False
+
+codecMarker = b'\x00rDB'
+codecIds = OrderedDict([('zstd', b's'), ('zlib', b'z')])
+codecLevels = {'zstd': 10, 'zlib': 6}
+codecChoices = ('zstd', 'zlib', 'none')
+mongodbSchemaFile = os.path.join(pathToSQL, 'mongodbSchema.json')
+
+compressedCols = OrderedDict([
+    (rssTables[4], ['rssItem']),
+    (rssTables[8], ['formulaOutput', 'assertionsResults', 'processingLog']),
+])
+
+keyCols = {
+    rssTables[4]: ['filingId'],
+    rssTables[8]: ['filingId', 'formulaId'],
+}
+
+def defaultCodec():
+    return 'zstd' if hasZstd else 'zlib'
+
+def resolveCodec(codec=None):
+    '''Returns codec to use for codec name (None for default), falls back to zlib if zstandard is not installed'''
+    if not codec:
+        return defaultCodec()
+    codec = codec.lower()
+    if codec not in codecChoices:
+        raise ValueError(_('Unknown compression codec {}, must be one of {}').format(codec, ', '.join(codecChoices)))
+    if codec == 'zstd' and not hasZstd:
+        return 'zlib'
+    return codec
+
+def isCompressed(value):
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:len(codecMarker)]) == codecMarker
+
+def compressValue(value, codec):
+    '''Returns value compressed with codec prefixed by marker, codec "none" returns utf-8 bytes of value,
+    None, already compressed and non text values (dicts in mongodb) are returned unchanged'''
+    if value is None or codec is None:
+        return value
+    if isinstance(value, str):
+        data = value.encode('utf-8')
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        if isCompressed(data):
+            return data
+    else:
+        return value
+    if codec == 'none':
+        return data
+    if codec == 'zstd':
+        payload = zstandard.ZstdCompressor(level=codecLevels['zstd']).compress(data)
+    elif codec == 'zlib':
+        payload = zlib.compress(data, codecLevels['zlib'])
+    else:
+        raise ValueError(_('Unknown compression codec {}').format(codec))
+    return codecMarker + codecIds[codec] + payload
+
+def _splitCompressed(data):
+    _data = memoryview(data)
+    codecId = bytes(_data[len(codecMarker):len(codecMarker) + 1])
+    payload = _data[len(codecMarker) + 1:]
+    for codec, _id in codecIds.items():
+        if _id == codecId:
+            if codec == 'zstd' and not hasZstd:
+                raise Exception(_('zstandard package is required to read values compressed with zstd'))
+            return codec, payload
+    raise ValueError(_('Unknown compression codec id {}').format(codecId))
+
+def decompressValue(value):
+    '''Returns text of value, decompressing it if compressed'''
+    if value is None or isinstance(value, str) or not isinstance(value, (bytes, bytearray, memoryview)):
+        return value
+    if not isCompressed(value):
+        return bytes(value).decode('utf-8')
+    codec, payload = _splitCompressed(value)
+    if codec == 'zstd':
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(payload)
+    else:
+        data = zlib.decompress(payload)
+    return data.decode('utf-8')
+
+def blobCodec(conn, table):
+    '''Returns codec to use when writing compressed columns of table for the connection, None if values
+    should be written as they are'''
+    if conn.product == 'mongodb' or table not in compressedCols:
+        return None
+    codec = getattr(conn, 'compression', None) or defaultCodec()
+    if conn.product == 'postgres':
+        # compressed (binary) values can only be written to BYTEA columns
+        binaryTables = conn.__dict__.setdefault('_binaryBlobTables', dict())
+        if table not in binaryTables:
+            # no columns found (table missing or other schema) is not taken as binary
+            colTypes = _pgColTypes(conn, table)
+            binaryTables[table] = bool(colTypes) and all(t == 'bytea' for t in colTypes.values())
+        return codec if binaryTables[table] else None
+    return None if codec == 'none' else codec
+
+def compressRows(rows, table, codec):
+    '''Returns copies of rows (dicts or records) with compressed columns of table compressed'''
+    if not codec or table not in compressedCols:
+        return rows
+    cols = compressedCols[table]
+    return [row.replace(**{c: compressValue(row[c], codec) for c in cols if c in row}) if isinstance(row, rssRecord) else
+            dict(row, **{c: compressValue(row[c], codec) for c in cols if c in row}) for row in rows]
+
+def decompressRows(rows, table):
+    '''Decompresses compressed columns of table in dict rows in place'''
+    for row in rows or []:
+        for c in compressedCols.get(table, []):
+            if c in row:
+                row[c] = decompressValue(row[c])
+    return rows
+
+def _pgColTypes(conn, table):
+    res = conn.execute("SELECT column_name, data_type FROM information_schema.columns WHERE table_schema = '{}' AND table_name = '{}'".format(
+                        conn.conParams['schema'], table), close=False)
+    return {x[0]: x[1] for x in res if x[0] in compressedCols[table]}
+
+def verifyBinaryCols(conn, table):
+    '''Changes compressed columns of table on postgres to BYTEA (existing values are kept as utf-8 bytes)'''
+    if conn.product != 'postgres':
+        return []
+    changedCols = []
+    try:
+        for col, colType in _pgColTypes(conn, table).items():
+            if colType != 'bytea':
+                conn.execute('ALTER TABLE "{0}" ALTER COLUMN "{1}" TYPE BYTEA USING convert_to("{1}"::text, \'UTF8\')'.format(table, col),
+                                fetch=False, close=False)
+                changedCols.append(col)
+        if changedCols:
+            conn.commit()
+            conn.addToLog(_('Changed column(s) {} of {} to BYTEA').format(', '.join(changedCols), table),
+                            messageCode="RssDB.Info", file=conn.conParams.get('database', ''), level=logging.INFO)
+    except Exception as e:
+        conn.rollback()
+        raise e
+    conn.resetTableColTypes(table)
+    conn.__dict__.get('_binaryBlobTables', dict()).pop(table, None)
+    return changedCols
+
+def _compressTableRows(conn, table, codec, batchSize):
+    keys = keyCols[table]
+    cols = compressedCols[table]
+    stats = OrderedDict([('rows', 0), ('compressed', 0), ('bytesBefore', 0), ('bytesAfter', 0)])
+    keysStr = ', '.join('"{}"'.format(k) for k in keys)
+    # tables of a sharded sqlite db are compressed shard by shard
+    for source in shardTables(conn, table):
+        lastKey = None
+        while True:
+            where = ''
+            if lastKey is not None:
+                where = 'WHERE ({}) > ({})'.format(keysStr, ', '.join(str(k) for k in lastKey))
+            rows = conn.execute('SELECT {}, {} FROM {} {} ORDER BY {} LIMIT {}'.format(
+                                keysStr, ', '.join('"{}"'.format(c) for c in cols), source, where, keysStr, batchSize), close=False)
+            if not rows:
+                break
+            stmts = []
+            for row in rows:
+                key, values = row[:len(keys)], row[len(keys):]
+                settings = []
+                for col, value in zip(cols, values):
+                    if value is None:
+                        continue
+                    before = len(value.encode('utf-8')) if isinstance(value, str) else len(value)
+                    stats['bytesBefore'] += before
+                    if isCompressed(value):
+                        stats['bytesAfter'] += before
+                        continue
+                    newValue = compressValue(value, codec)
+                    stats['bytesAfter'] += len(newValue)
+                    settings.append('"{}" = {}'.format(col, conn.dbBytes(newValue)))
+                if settings:
+                    stmts.append('UPDATE {} SET {} WHERE {}'.format(source, ', '.join(settings),
+                                    ' AND '.join('"{}" = {}'.format(k, v) for k, v in zip(keys, key))))
+                stats['rows'] += 1
+            try:
+                for stmt in stmts:
+                    conn.execute(stmt, fetch=False, close=False)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+            stats['compressed'] += len(stmts)
+            lastKey = rows[-1][:len(keys)]
+            conn.showStatus(_('Compressed {:,} of {:,} rows in {}').format(stats['compressed'], stats['rows'], table))
+    return stats
+
+def _mongoCompressCollection(conn, collection, codec, batchSize):
+    '''Recreates collection with WiredTiger block compressor set to codec, copying documents in batches'''
+    stats = OrderedDict([('rows', 0), ('compressed', 0)])
+    db = conn.dbConn
+    if collection not in db.list_collection_names():
+        return stats
+    options = db[collection].options()
+    configString = 'block_compressor={}'.format(codec)
+    if options.get('storageEngine', {}).get('wiredTiger', {}).get('configString') == configString:
+        return stats
+    with open(mongodbSchemaFile, 'r') as jf:
+        validator = json.load(jf).get(collection, {})
+    tmpName = collection + '_compress'
+    db.drop_collection(tmpName)
+    db.create_collection(tmpName, validator=validator, validationLevel='strict', validationAction='error',
+                            storageEngine={'wiredTiger': {'configString': configString}})
+    batch = []
+    for doc in db[collection].find({}, {'_id': 0}):
+        batch.append(doc)
+        if len(batch) >= batchSize:
+            db[tmpName].insert_many(batch)
+            stats['rows'] += len(batch)
+            batch = []
+    if batch:
+        db[tmpName].insert_many(batch)
+        stats['rows'] += len(batch)
+    for name, index in db[collection].index_information().items():
+        if name == '_id_':
+            continue
+        db[tmpName].create_index(index['key'], name=name, unique=index.get('unique', False))
+    db[tmpName].rename(collection, dropTarget=True)
+    stats['compressed'] = stats['rows']
+    return stats
+
+def mongoStorageOptions(conn, collection):
+    '''Returns create_collection kwargs for block compression of collections with large text fields'''
+    codec = getattr(conn, 'compression', None) or defaultCodec()
+    if collection not in compressedCols or codec == 'none':
+        return dict()
+    return {'storageEngine': {'wiredTiger': {'configString': 'block_compressor={}'.format(codec)}}}
+
+def compressExistingRows(conn, codec=None, batchSize=500, vacuum=True):
+    '''Compresses existing uncompressed values of compressed columns in place
+
+    On postgres columns are changed to BYTEA first, on sqlite the database is vacuumed after compression
+    (if vacuum) to release the freed space, on mongodb the collections are recreated with block compression.
+
+    Returns dict of table: stats (rows, compressed rows, bytes before and after for sql dbs)
+    '''
+    codec = resolveCodec(codec or getattr(conn, 'compression', None))
+    dbFile = conn.conParams.get('database', '')
+    startTime = time.perf_counter()
+    result = OrderedDict()
+    if conn.product == 'mongodb':
+        if codec == 'none':
+            return result
+        for collection in compressedCols:
+            result[collection] = _mongoCompressCollection(conn, collection, codec, batchSize)
+    else:
+        if codec == 'none':
+            raise ValueError(_('A compression codec is required to compress existing rows'))
+        tablesInDB = conn.tablesInDB()
+        for table in compressedCols:
+            if table not in tablesInDB:
+                continue
+            verifyBinaryCols(conn, table)
+            result[table] = _compressTableRows(conn, table, codec, batchSize)
+            conn.addToLog(_('Compressed {:,} rows in {} with {}, {:,} bytes to {:,} bytes').format(
+                            result[table]['compressed'], table, codec, result[table]['bytesBefore'], result[table]['bytesAfter']),
+                            messageCode="RssDB.Info", file=dbFile, level=logging.INFO)
+        if conn.product == 'sqlite' and vacuum:
+            conn.showStatus(_('Vacuuming database'))
+            conn.execute('VACUUM', fetch=False, close=False)
+            if attachShards(conn):
+                for schema in conn._shards.values():
+                    conn.execute('VACUUM "{}"'.format(schema), fetch=False, close=False)
+    conn.addToLog(_('Finished compressing existing rows in {} secs').format(round(time.perf_counter() - startTime, 3)),
+                    messageCode="RssDB.Info", file=dbFile, level=logging.INFO)
+    return result
@@ -3,12 +3,18 @@
 
 import os
 from urllib import request
-from lxml import html
 from collections import OrderedDict
-from arelle.DialogRssWatch import rssFeeds
 
+# RSSFEEDS (arelle.DialogRssWatch.rssFeeds) is imported on first use, so that modules used by headless
+# connections do not import arelle through this module (see __getattr__)
+
+def __getattr__(name):
+    if name == 'RSSFEEDS':
+        from arelle.DialogRssWatch import rssFeeds
+        globals()['RSSFEEDS'] = rssFeeds
+        return rssFeeds
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
-RSSFEEDS = rssFeeds
 pathToModule = os.path.dirname(os.path.abspath(__file__))
 pathToSQL = os.path.join(pathToModule, 'ddlScripts')
 pathToTemplates =  os.path.join(pathToModule, 'templates')
@@ -60,7 +66,8 @@ rssCols = OrderedDict(
         ),
         (
             rssTables[8],
-            ['filingId', 'formulaId', 'inlineXBRL', 'formulaOutput', 'assertionsResults', 'dateTimeProcessed', 'processingLog']
+            ['filingId', 'formulaId', 'inlineXBRL', 'formulaOutput', 'assertionsResults', 'dateTimeProcessed', 'processingLog',
+             'formulaHash', 'arelleVersion']
         )
     ]
 )
@@ -84,6 +91,7 @@ wait_duration = 1
 
 def _getEdgarStateCodes(getLocation=True):
     """Extracts Edgar state codes from 'https://www.sec.gov/edgar/searchedgar/edgarstatecodes.htm'"""
+    from lxml import html
     url = 'https://www.sec.gov/edgar/searchedgar/edgarstatecodes.htm'
     countries_resp = request.urlopen(url)
     tree = html.parse(countries_resp)
@@ -156,6 +164,7 @@ def _getEdgarStateCodes(getLocation=True):
 
 
 def _getSP100():
+    from lxml import html
     url = 'https://en.wikipedia.org/wiki/S%26P_100'
     sp100_resp = request.urlopen(url)
     tree = html.parse(sp100_resp)
@@ -171,6 +180,7 @@ def _getSP100():
 
 
 def _getSP500():
+    from lxml import html
     url = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
     sp500_resp = request.urlopen(url)
     tree = html.parse(sp500_resp)
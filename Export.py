@@ -0,0 +1,225 @@
+'''Incremental parquet export of rssDB for analytics
+
+filingsInfo, filesInfo and formulaeResults are written to parquet partitioned by feedId (hive layout
+`<exportDir>/<table>/feedId=YYYYMM/part-0.parquet`, feedId column comes from the path), filersInfo to a single
+`<exportDir>/filersInfo/part-0.parquet`.
+A manifest in the export folder keeps the feedsInfo.lastModifiedDate and number of filings tagged duplicate
+of each exported feed (and count and last processed time of formula results per feed), on each export only
+partitions of feeds that changed since the last export are rewritten (including older feeds with filings
+tagged duplicate by a later update), partitions of feeds no longer in the db are removed. Files are written
+to a temporary file and moved in place so readers never see a partial partition.
+
+Requires pyarrow package.
+'''
+
+import os, json, time, shutil, logging
+from datetime import datetime, date
+from collections import OrderedDict
+from dateutil import parser
+from .Constants import rssTables
+from .Compression import decompressValue
+from .Partitioning import idRangeClause
+
+hasPyarrow = True
+try:
+    import pyarrow
+    import pyarrow.parquet
+except Exception:
+    hasPyarrow = False
+
+manifestFileName = '_rssDBExport.json'
+exportTables = [rssTables[1], rssTables[2], rssTables[8], rssTables[3]]
+feedPartitionedTables = exportTables[:3]
+# multiplier from feedId to ids of tables without feedId column (see Partitioning)
+filingIdMultiplier = 10**6
+
+# column types of exported tables, values are coerced to these types so that all partitions share a schema
+exportColTypes = {
+    rssTables[1]: OrderedDict([
+        ('filingId', 'int64'), ('feedId', 'int32'), ('filingLink', 'string'), ('entryPoint', 'string'), ('enclosureUrl', 'string'),
+        ('enclosureSize', 'int64'), ('pubDate', 'timestamp'), ('companyName', 'string'), ('formType', 'string'), ('inlineXBRL', 'int32'),
+        ('filingDate', 'timestamp'), ('cikNumber', 'string'), ('accessionNumber', 'string'), ('fileNumber', 'string'),
+        ('acceptanceDatetime', 'timestamp'), ('period', 'date'), ('assignedSic', 'int32'), ('assistantDirector', 'string'),
+        ('fiscalYearEnd', 'string'), ('fiscalYearEndMonth', 'int32'), ('fiscalYearEndDay', 'int32'), ('duplicate', 'int32')]),
+    rssTables[2]: OrderedDict([
+        ('fileId', 'int64'), ('filingId', 'int64'), ('feedId', 'int32'), ('accessionNumber', 'string'), ('sequence', 'int32'),
+        ('file', 'string'), ('type', 'string'), ('size', 'int64'), ('description', 'string'), ('inlineXBRL', 'int32'),
+        ('url', 'string'), ('type_tag', 'string'), ('duplicate', 'int32')]),
+    rssTables[3]: OrderedDict([
+        ('cikNumber', 'string'), ('formerNames', 'string'), ('industry_code', 'int32'), ('industry_description', 'string'),
+        ('stateOfIncorporation', 'string'), ('mailingState', 'string'), ('mailingCity', 'string'), ('mailingZip', 'string'),
+        ('conformedName', 'string'), ('businessCity', 'string'), ('businessState', 'string'), ('businessZip', 'string'),
+        ('country', 'string')]),
+    rssTables[8]: OrderedDict([
+        ('filingId', 'int64'), ('formulaId', 'int64'), ('inlineXBRL', 'int32'), ('formulaOutput', 'string'),
+        ('assertionsResults', 'string'), ('dateTimeProcessed', 'timestamp'), ('processingLog', 'string'),
+        ('formulaHash', 'string'), ('arelleVersion', 'string')]),
+}
+
+def _arrowType(colType):
+    return {'int64': pyarrow.int64(), 'int32': pyarrow.int32(), 'string': pyarrow.string(),
+            'timestamp': pyarrow.timestamp('us'), 'date': pyarrow.date32()}[colType]
+
+def arrowSchema(table):
+    return pyarrow.schema([(c, _arrowType(t)) for c, t in exportColTypes[table].items()])
+
+def _coerce(value, colType):
+    if value is None or value == '':
+        return None
+    if colType in ('int64', 'int32'):
+        return int(value)
+    if colType == 'string':
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return decompressValue(value)
+        if isinstance(value, (list, dict)):
+            return json.dumps(value)
+        return str(value)
+    if colType == 'timestamp':
+        if isinstance(value, str):
+            value = parser.parse(value)
+        elif isinstance(value, date) and not isinstance(value, datetime):
+            value = datetime.combine(value, datetime.min.time())
+        return value.replace(tzinfo=None) if value.tzinfo else value
+    if colType == 'date':
+        if isinstance(value, str):
+            value = parser.parse(value)
+        return value.date() if isinstance(value, datetime) else value
+    return value
+
+def _toArrowTable(table, rows):
+    '''rows are tuples in exportColTypes[table] order'''
+    colTypes = exportColTypes[table]
+    columns = list(zip(*rows)) if rows else [()] * len(colTypes)
+    arrays = [pyarrow.array([_coerce(v, t) for v in values], type=_arrowType(t)) for values, (c, t) in zip(columns, colTypes.items())]
+    return pyarrow.Table.from_arrays(arrays, schema=arrowSchema(table))
+
+def _feedCondition(conn, table, feedId):
+    if table == rssTables[8]:
+        return '"filingId" >= {} and "filingId" < {}'.format(feedId * filingIdMultiplier, (feedId + 1) * filingIdMultiplier)
+    return '"feedId" = {}{}'.format(feedId, idRangeClause(conn, feedId=feedId, table=table))
+
+def _fetchRows(conn, table, feedId=None):
+    cols = list(exportColTypes[table])
+    if conn.product == 'mongodb':
+        if feedId is None:
+            qry = {}
+        elif table == rssTables[8]:
+            qry = {'filingId': {'$gte': feedId * filingIdMultiplier, '$lt': (feedId + 1) * filingIdMultiplier}}
+        else:
+            qry = {'feedId': feedId}
+        return [tuple(x.get(c) for c in cols) for x in conn.dbConn[table].find(qry, {c: 1 for c in cols})]
+    # columns added by later versions (formulaHash, arelleVersion) are exported as NULL for dbs without them
+    existingCols = set(x.lower() for x in conn.columnTypeFunctions(table)) or set(x.lower() for x in cols)
+    sql = 'SELECT {} FROM "{}"'.format(', '.join('"{}"'.format(c) if c.lower() in existingCols else 'NULL' for c in cols), table)
+    if feedId is not None:
+        sql += ' WHERE ' + _feedCondition(conn, table, feedId)
+    return conn.execute(sql, fetch=True)
+
+def _feedsState(conn):
+    '''Returns ({feedId: [lastModifiedDate, duplicate filings]}, {feedId: [count, last processed]} of formula results)'''
+    if conn.product == 'mongodb':
+        duplicates = {x['_id']: x['count'] for x in conn.dbConn[rssTables[1]].aggregate([
+                        {'$match': {'duplicate': 1}}, {'$group': {'_id': '$feedId', 'count': {'$sum': 1}}}])}
+        feeds = {x['feedId']: [str(x.get('lastModifiedDate')), duplicates.get(x['feedId'], 0)]
+                    for x in conn.dbConn[rssTables[0]].find({}, {'feedId': 1, 'lastModifiedDate': 1, '_id': 0})}
+        formulae = {int(x['_id']): [x['count'], str(x['last'])] for x in conn.dbConn[rssTables[8]].aggregate([
+                        {'$group': {'_id': {'$floor': {'$divide': ['$filingId', filingIdMultiplier]}},
+                                    'count': {'$sum': 1}, 'last': {'$max': '$dateTimeProcessed'}}}])}
+    else:
+        # duplicate is set on filings of older feeds whose lastModifiedDate does not change
+        duplicates = {x[0]: int(x[1]) for x in conn.execute('SELECT "feedId", count(*) FROM "{}" WHERE "duplicate" = 1 GROUP BY "feedId"'.format(
+                        rssTables[1]), fetch=True)}
+        feeds = {x[0]: [str(x[1]), duplicates.get(x[0], 0)] for x in conn.execute('SELECT "feedId", "lastModifiedDate" FROM "{}"'.format(rssTables[0]), fetch=True)}
+        formulae = {int(x[0]): [x[1], str(x[2])] for x in conn.execute(
+                        'SELECT "filingId" / {0} AS "feedId", count(*), max("dateTimeProcessed") FROM "{1}" GROUP BY "filingId" / {0}'.format(
+                        filingIdMultiplier, rssTables[8]), fetch=True)}
+    return feeds, formulae
+
+def loadManifest(exportDir):
+    manifestFile = os.path.join(exportDir, manifestFileName)
+    if os.path.exists(manifestFile):
+        with open(manifestFile) as f:
+            return json.load(f)
+    return {'feeds': {}, 'formulae': {}}
+
+def _saveManifest(exportDir, manifest):
+    manifestFile = os.path.join(exportDir, manifestFileName)
+    with open(manifestFile + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifestFile + '.tmp', manifestFile)
+
+def _partitionDir(exportDir, table, feedId=None):
+    return os.path.join(exportDir, table, 'feedId={}'.format(feedId)) if feedId is not None else os.path.join(exportDir, table)
+
+def _writePartition(exportDir, table, rows, feedId=None, compression='zstd'):
+    partitionDir = _partitionDir(exportDir, table, feedId)
+    os.makedirs(partitionDir, exist_ok=True)
+    target = os.path.join(partitionDir, 'part-0.parquet')
+    if not rows and feedId is not None:
+        if os.path.exists(target):
+            os.remove(target)
+        return 0
+    tmpFile = target + '.tmp'
+    arrowTable = _toArrowTable(table, rows)
+    if feedId is not None and 'feedId' in arrowTable.column_names:
+        # feedId comes from the partition path
+        arrowTable = arrowTable.drop(['feedId'])
+    pyarrow.parquet.write_table(arrowTable, tmpFile, compression=compression)
+    os.replace(tmpFile, target)
+    return len(rows)
+
+def exportParquet(conn, exportDir, full=False, compression='zstd'):
+    '''Exports rssDB tables to parquet in exportDir, rewriting only partitions of feeds changed since the
+    last export (all if full), returns dict with feeds exported, removed and rows written per table'''
+    if not hasPyarrow:
+        conn.addToLog(_('pyarrow package is required to export parquet'), messageCode="RssDB.Error",
+                        file=conn.conParams.get('database', ''), level=logging.ERROR)
+        raise Exception('pyarrow package is required to export parquet')
+    startTime = time.perf_counter()
+    os.makedirs(exportDir, exist_ok=True)
+    if full:
+        for table in exportTables:
+            shutil.rmtree(_partitionDir(exportDir, table), ignore_errors=True)
+    manifest = {'feeds': {}, 'formulae': {}} if full else loadManifest(exportDir)
+    feeds, formulae = _feedsState(conn)
+    # json keys are strings
+    exportedFeeds = {int(k): v for k, v in manifest.get('feeds', {}).items()}
+    exportedFormulae = {int(k): v for k, v in manifest.get('formulae', {}).items()}
+    changedFeeds = sorted(k for k, v in feeds.items() if exportedFeeds.get(k) != v)
+    changedFormulae = sorted(k for k, v in formulae.items() if exportedFormulae.get(k) != v or k in changedFeeds)
+    removedFeeds = sorted(set(exportedFeeds) - set(feeds))
+    removedFormulae = sorted(set(exportedFormulae) - set(formulae))
+    result = {'changedFeeds': changedFeeds, 'removedFeeds': removedFeeds, 'rows': {t: 0 for t in exportTables}}
+
+    for feedId in removedFeeds:
+        for table in feedPartitionedTables:
+            shutil.rmtree(_partitionDir(exportDir, table, feedId), ignore_errors=True)
+        exportedFeeds.pop(feedId, None)
+        exportedFormulae.pop(feedId, None)
+    for feedId in removedFormulae:
+        shutil.rmtree(_partitionDir(exportDir, rssTables[8], feedId), ignore_errors=True)
+        exportedFormulae.pop(feedId, None)
+
+    for feedId in changedFeeds:
+        for table in (rssTables[1], rssTables[2]):
+            result['rows'][table] += _writePartition(exportDir, table, _fetchRows(conn, table, feedId), feedId, compression)
+        # manifest saved after each feed so an interrupted export resumes with the remaining feeds
+        exportedFeeds[feedId] = feeds[feedId]
+        _saveManifest(exportDir, {'feeds': exportedFeeds, 'formulae': exportedFormulae})
+        conn.showStatus(_('Exported feed {}').format(feedId))
+
+    for feedId in changedFormulae:
+        result['rows'][rssTables[8]] += _writePartition(exportDir, rssTables[8], _fetchRows(conn, rssTables[8], feedId), feedId, compression)
+        exportedFormulae[feedId] = formulae[feedId]
+        _saveManifest(exportDir, {'feeds': exportedFeeds, 'formulae': exportedFormulae})
+
+    # filersInfo is not partitioned by feed, rewritten when any feed changed
+    if changedFeeds or removedFeeds or not os.path.exists(os.path.join(_partitionDir(exportDir, rssTables[3]), 'part-0.parquet')):
+        result['rows'][rssTables[3]] = _writePartition(exportDir, rssTables[3], _fetchRows(conn, rssTables[3]), None, compression)
+
+    manifest = {'feeds': exportedFeeds, 'formulae': exportedFormulae, 'lastExport': str(datetime.now().replace(microsecond=0))}
+    _saveManifest(exportDir, manifest)
+    conn.addToLog(_('Exported {} changed feed(s) to parquet in {} ({}) in {} secs').format(len(changedFeeds), exportDir,
+                    ', '.join('{}: {} rows'.format(t, n) for t, n in result['rows'].items()), round(time.perf_counter() - startTime, 3)),
+                    messageCode="RssDB.Info", file=conn.conParams.get('database', ''), level=logging.INFO)
+    return result
@@ -0,0 +1,208 @@
+'''Manifest of ingested monthly feeds for change detection without parsing
+
+feedManifest table (collection in mongodb) keeps for each ingested monthly feed its url, Last-Modified and
+ETag as returned by the server, size and sha256 of the feed content, number of items and a digest of the
+accession numbers of the items. It is written after the feeds of an update are stored and read once per
+getMonthlyFeedsLinks into a dict keyed by feedId:
+    - local feeds (loc folder) with the size and sha256 of the manifest are skipped before being parsed,
+    - listed remote feeds with no last modified date in feedsInfo are checked against the manifest last
+      modified date, then with a conditional HEAD request (If-None-Match/If-Modified-Since), unchanged
+      feeds are skipped instead of being downloaded and parsed,
+    - a downloaded feed with the sha256 of the manifest is not parsed, one with the same accessions digest
+      has no new items, otherwise the feed accessions are diffed with those in the db as sets.
+'''
+
+import os, hashlib, logging
+from collections import OrderedDict
+from contextlib import closing
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from urllib import request
+from urllib.error import HTTPError
+from .ArchiveCache import secRateLimiter
+
+manifestTable = 'feedManifest'
+manifestCols = ['feedId', 'url', 'lastModified', 'etag', 'sizeBytes', 'sha256', 'itemsCount', 'accessionsDigest', 'dateTimeChecked']
+hashChunkSize = 1024 * 1024
+
+manifestTableDDL = {
+    'sqlite': '''CREATE TABLE IF NOT EXISTS "feedManifest" (
+                    "feedId" INTEGER NOT NULL PRIMARY KEY,
+                    "url" TEXT NOT NULL,
+                    "lastModified" TEXT,
+                    "etag" TEXT,
+                    "sizeBytes" INTEGER,
+                    "sha256" TEXT,
+                    "itemsCount" INTEGER,
+                    "accessionsDigest" TEXT,
+                    "dateTimeChecked" TEXT);''',
+    'postgres': '''CREATE TABLE IF NOT EXISTS "feedManifest" (
+                    "feedId" BIGINT NOT NULL PRIMARY KEY,
+                    "url" TEXT NOT NULL,
+                    "lastModified" TEXT,
+                    "etag" TEXT,
+                    "sizeBytes" BIGINT,
+                    "sha256" TEXT,
+                    "itemsCount" INTEGER,
+                    "accessionsDigest" TEXT,
+                    "dateTimeChecked" TIMESTAMP);''',
+}
+
+def contentDigest(path):
+    '''Returns (size, sha256) of file at path'''
+    sha = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(hashChunkSize)
+            if not chunk:
+                break
+            sha.update(chunk)
+            size += len(chunk)
+    return size, sha.hexdigest()
+
+def accessionsDigest(accessionNumbers):
+    '''Returns digest of the set of accessionNumbers (independent of order and duplicates)'''
+    return hashlib.sha256('\n'.join(sorted(set(accessionNumbers))).encode()).hexdigest()
+
+def _hasManifestTable(conn):
+    if conn.product == 'mongodb':
+        return manifestTable in conn.dbConn.list_collection_names()
+    return conn.hasTable(manifestTable)
+
+def verifyManifestTable(conn):
+    if conn.product == 'mongodb':
+        conn.dbConn[manifestTable].create_index('feedId', unique=True)
+    elif not _hasManifestTable(conn):
+        conn.execute(manifestTableDDL[conn.product], fetch=False, commit=True)
+        conn.refreshSchemaCache()
+
+def loadManifest(conn, feedIds=None):
+    '''Returns {feedId: manifest entry dict} (limited to feedIds)'''
+    if not _hasManifestTable(conn):
+        return dict()
+    if conn.product == 'mongodb':
+        qry = {'feedId': {'$in': list(feedIds)}} if feedIds is not None else {}
+        return {x['feedId']: x for x in conn.dbConn[manifestTable].find(qry, {'_id': 0})}
+    qry = 'SELECT {} FROM "{}"'.format(', '.join('"{}"'.format(c) for c in manifestCols), manifestTable)
+    if feedIds is not None:
+        if not feedIds:
+            return dict()
+        qry += ' WHERE "feedId" IN ({})'.format(', '.join(str(int(x)) for x in feedIds))
+    return {x[0]: OrderedDict(zip(manifestCols, x)) for x in conn.execute(qry, fetch=True, close=False)}
+
+def saveManifest(conn, entries):
+    '''Inserts or replaces manifest entries (dicts with manifestCols keys)'''
+    entries = [OrderedDict((c, e.get(c)) for c in manifestCols) for e in entries if e and e.get('feedId')]
+    if not entries:
+        return 0
+    verifyManifestTable(conn)
+    now = datetime.now().replace(microsecond=0)
+    for e in entries:
+        e['dateTimeChecked'] = now
+        if isinstance(e['lastModified'], datetime):
+            e['lastModified'] = e['lastModified'].isoformat()
+    if conn.product == 'mongodb':
+        for e in entries:
+            conn.dbConn[manifestTable].replace_one({'feedId': e['feedId']}, dict(e), upsert=True)
+        return len(entries)
+    try:
+        conn.execute('DELETE FROM "{}" WHERE "feedId" IN ({})'.format(manifestTable, ', '.join(str(int(e['feedId'])) for e in entries)),
+                        fetch=False, close=False)
+        for e in entries:
+            conn.execute('INSERT INTO "{}" ({}) VALUES ({})'.format(manifestTable, ', '.join('"{}"'.format(c) for c in manifestCols),
+                            ', '.join('NULL' if v is None else str(v) if isinstance(v, int) else conn.dbStr(str(v)) for v in e.values())),
+                            fetch=False, close=False)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    return len(entries)
+
+def _sameLastModified(listed, recorded):
+    if listed is None or not recorded:
+        return False
+    try:
+        recorded = datetime.fromisoformat(str(recorded))
+    except ValueError:
+        return False
+    if (listed.tzinfo is None) != (recorded.tzinfo is None):
+        listed, recorded = listed.replace(tzinfo=None), recorded.replace(tzinfo=None)
+    return listed <= recorded
+
+def localFeedUnchanged(entry, path):
+    '''True if file at path has the size and sha256 of manifest entry'''
+    if not entry or not entry.get('sha256'):
+        return False
+    try:
+        if os.path.getsize(path) != entry.get('sizeBytes'):
+            return False
+        return contentDigest(path)[1] == entry['sha256']
+    except OSError:
+        return False
+
+def remoteFeedUnchanged(conn, entry, url, lastModified=None):
+    '''Returns (unchanged, etag), unchanged is True if remote feed at url did not change since manifest entry by
+    listed lastModified or a conditional HEAD request, etag is the current ETag if a HEAD request was made'''
+    if not entry or not entry.get('sha256'):
+        return False, None
+    if _sameLastModified(lastModified, entry.get('lastModified')):
+        return True, None
+    headers = dict()
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('lastModified'):
+        try:
+            since = datetime.fromisoformat(str(entry['lastModified']))
+            # listed dates without timezone are taken as UTC, earlier than the actual time so a change is never missed
+            headers['If-Modified-Since'] = format_datetime(since.astimezone(timezone.utc) if since.tzinfo else since.replace(tzinfo=timezone.utc), usegmt=True)
+        except (ValueError, TypeError):
+            pass
+    if not headers:
+        return False, None
+    try:
+        secRateLimiter.wait()
+        with closing(conn.cntlr.webCache.opener.open(request.Request(url, headers=headers, method='HEAD'))) as resp:
+            etag = resp.headers.get('ETag')
+            size = resp.headers.get('Content-Length')
+    except HTTPError as e:
+        e.close()
+        return e.code == 304, entry.get('etag') if e.code == 304 else None
+    except Exception as e:
+        conn.addToLog(_('Could not check {} for changes: {}').format(url, str(e)), messageCode="RssDB.Info",
+                        file=conn.conParams.get('database', ''), level=logging.INFO)
+        return False, None
+    return bool(etag and etag == entry.get('etag') and (not size or int(size) == entry.get('sizeBytes'))), etag
+
+def listedFeedUnchanged(conn, entry, feed):
+    '''Returns (unchanged, etag) of a feed listed by getMonthlyFeedsLinks against its manifest entry'''
+    link = feed['link']
+    if os.path.isfile(link):
+        return localFeedUnchanged(entry, link), None
+    return remoteFeedUnchanged(conn, entry, link, feed.get('lastModifiedDate'))
+
+def recordFeedsManifest(conn, links, feeds):
+    '''Saves manifest entries of feeds processed by an update, links as returned by getMonthlyFeedsLinks
+    (with lastModifiedDate and etag when known) and feeds results with the manifest entries of workers'''
+    linksInfo = {x['link']: x for x in links if x.get('link')}
+    entries = []
+    for feed in feeds:
+        entry = feed.get('manifest')
+        if not entry:
+            continue
+        link = linksInfo.get(feed.get('link'), {})
+        if entry.get('lastModified') is None:
+            entry['lastModified'] = link.get('lastModifiedDate')
+        if entry.get('etag') is None:
+            entry['etag'] = link.get('etag')
+        entries.append(entry)
+    try:
+        saved = saveManifest(conn, entries)
+    except Exception as e:
+        conn.addToLog(_('Could not save feeds manifest: {}').format(str(e)), messageCode="RssDB.Error",
+                        file=conn.conParams.get('database', ''), level=logging.ERROR)
+        return 0
+    if saved:
+        conn.addToLog(_('Recorded {} feed(s) in feeds manifest').format(saved), messageCode="RssDB.Info",
+                        file=conn.conParams.get('database', ''), level=logging.INFO)
+    return saved
@@ -0,0 +1,372 @@
+'''Parallel formula runner for rssDB filings
+
+Runs a formula stored in the db over many filings using a pool of worker processes, each worker
+gets the formula linkbase once (written to a temp file at worker start) and keeps its own controller
+for all the filings it processes, filings are fanned out to the workers and the results are sent back
+to the main process where a single writer inserts them into `formulaeResults` in batches.
+
+Each filing is still loaded with its own DTS (formula linkbase imported) and the formula compiled
+for that DTS, as arelle formula processing is bound to the loaded model.
+
+Each result is stored with a hash of the formula content (linkbase and additional imports) and the
+arelle version used, filings with a result produced by an identical formula are skipped on reruns.
+'''
+
+import os, sys, time, json, gc, logging, tempfile, traceback, hashlib, concurrent.futures, multiprocessing, multiprocessing.util
+from collections import OrderedDict
+from datetime import datetime
+from lxml import etree
+from .Constants import rssCols, rssTables
+from .ArchiveCache import archivePrefetcher
+
+try:
+    from arellepy.CntlrPy import subProcessCntlrPy
+except:
+    from .arellepy.CntlrPy import subProcessCntlrPy
+
+formulaResultsTable = rssTables[8]
+# columns added to formulaeResults after the initial schema, added to existing dbs when missing
+formulaResultsNewCols = OrderedDict([('formulaHash', 'TEXT'), ('arelleVersion', 'TEXT')])
+_formulaWorker = dict()
+
+def getArelleVersion():
+    from arelle import Version
+    return getattr(Version, '__version__', None) or getattr(Version, 'version', None)
+
+def formulaContentHash(formulaLinkbase, additionalImports=None):
+    '''sha256 of the formula linkbase and the content of additional imports (in the given order)'''
+    h = hashlib.sha256()
+    h.update(formulaLinkbase.encode('utf-8') if isinstance(formulaLinkbase, str) else formulaLinkbase)
+    for imp in ([x for x in additionalImports.split('|') if x] if additionalImports else []):
+        h.update(b'\0')
+        if os.path.isfile(imp):
+            with open(imp, 'rb') as f:
+                h.update(f.read())
+        else:
+            # url, content is not fetched, identified by the url only
+            h.update(imp.encode('utf-8'))
+    return h.hexdigest()
+
+def _formulaWorkerInit(setConfigDir, targetResDir, formulaId, formulaLinkbase, additionalImports=None, removeDups=False, formulaHash=None, arelleVersion=None):
+    '''Worker initializer, creates the worker controller and writes the formula linkbase to a temp file once per process'''
+    import gettext
+    gettext.install('arelle')
+    cntlr = subProcessCntlrPy(instConfigDir=setConfigDir, useResDir=targetResDir, logFileName="logToBuffer", loadPlugins=True)
+    cntlr.rssDBFormulaRemoveDups = removeDups
+    fd, formulaFile = tempfile.mkstemp(prefix='rssDB_formula_{}_'.format(formulaId), suffix='.xml')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(formulaLinkbase)
+    importFiles = [formulaFile] + ([x for x in additionalImports.split('|') if x] if additionalImports else [])
+    _formulaWorker.clear()
+    _formulaWorker.update({'cntlr': cntlr, 'formulaId': formulaId, 'formulaFile': formulaFile, 'importFiles': '|'.join(importFiles),
+                           'formulaHash': formulaHash, 'arelleVersion': arelleVersion})
+    if multiprocessing.current_process().name != 'MainProcess':
+        # remove temp formula file when worker process exits
+        multiprocessing.util.Finalize(None, _formulaWorkerClose, exitpriority=10)
+    return
+
+def _formulaWorkerClose():
+    if _formulaWorker.get('formulaFile') and os.path.isfile(_formulaWorker['formulaFile']):
+        os.remove(_formulaWorker['formulaFile'])
+    if _formulaWorker.get('cntlr'):
+        _formulaWorker['cntlr'].close()
+    _formulaWorker.clear()
+    return
+
+def _runFormulaOnFiling(filingId, inlineXBRL, entryUrl, product, saveToFolder=None):
+    '''Runs worker formula on one filing, returns dict with the formulaeResults row or the error'''
+    startTime = time.perf_counter()
+    cntlr = _formulaWorker['cntlr']
+    formulaId = _formulaWorker['formulaId']
+    result = {'filingId': filingId, 'row': None, 'error': None, 'elapsed': None}
+    modelXbrl = None
+    try:
+        cntlr.runKwargs(file=entryUrl, importFiles=_formulaWorker['importFiles'], formulaAction='run', keepOpen=True)
+        modelXbrl = cntlr.modelManager.modelXbrl
+        if modelXbrl is None or modelXbrl.modelDocument is None:
+            raise Exception(_('Could not load {}').format(entryUrl))
+        outputInstance = getattr(modelXbrl, 'formulaOutputInstance', None)
+        formulaOutput = ''
+        if outputInstance is not None and outputInstance.modelDocument is not None:
+            formulaOutput = etree.tostring(outputInstance.modelDocument.xmlDocument, encoding='unicode')
+        assertionsResults = OrderedDict()
+        for varSet in getattr(modelXbrl, 'modelVariableSets', ()):
+            if hasattr(varSet, 'countSatisfied'):
+                assertionsResults[varSet.id or varSet.xlinkLabel] = {'satisfied': varSet.countSatisfied, 'notSatisfied': varSet.countNotSatisfied}
+        processingLog = None
+        try:
+            processingLog = cntlr.logHandler.getXml()
+            cntlr.logHandler.clearLogBuffer()
+        except AttributeError:
+            processingLog = '\n'.join(cntlr.logHandler.getLines())
+
+        row = OrderedDict.fromkeys(rssCols[formulaResultsTable])
+        row['filingId'] = filingId
+        row['formulaId'] = formulaId
+        row['inlineXBRL'] = inlineXBRL
+        row['formulaOutput'] = formulaOutput
+        row['assertionsResults'] = assertionsResults if product == 'mongodb' else json.dumps(assertionsResults)
+        row['dateTimeProcessed'] = datetime.now().replace(microsecond=0)
+        row['processingLog'] = processingLog
+        row['formulaHash'] = _formulaWorker['formulaHash']
+        row['arelleVersion'] = _formulaWorker['arelleVersion']
+        result['row'] = row
+        if saveToFolder and formulaOutput:
+            with open(os.path.join(saveToFolder, '{}_formula_{}.xml'.format(filingId, formulaId)), 'w', encoding='utf-8') as f:
+                f.write(formulaOutput)
+    except Exception as e:
+        result['error'] = '{}\n{}'.format(str(e), ''.join(traceback.format_tb(sys.exc_info()[2])))
+    finally:
+        if modelXbrl is not None:
+            outputInstance = getattr(modelXbrl, 'formulaOutputInstance', None)
+            if outputInstance is not None:
+                outputInstance.close()
+        cntlr.modelManager.close()
+        gc.collect()
+    result['elapsed'] = time.perf_counter() - startTime
+    return result
+
+def _filingTask(rssItem):
+    '''Picklable (filingId, inlineXBRL, entryUrl) from a rssItem of a search result'''
+    filingId = getattr(rssItem, 'filingId', None)
+    if filingId is None and rssItem.find('filingId') is not None:
+        filingId = rssItem.find('filingId').text
+    inlineXBRL = 0
+    _inline = rssItem.find('isInlineXBRL')
+    if _inline is not None and _inline.text and 't' in _inline.text.lower():
+        inlineXBRL = 1
+    return (int(filingId) if filingId is not None else None, inlineXBRL, getattr(rssItem, 'url', None))
+
+def getFormulaLinkbase(conn, formulaId):
+    '''Returns formula linkbase string stored in db for formulaId'''
+    if conn.product == 'mongodb':
+        doc = conn.dbConn[rssTables[7]].find_one({'formulaId': int(formulaId)}, {'_id': 0, 'formulaLinkbase': 1})
+        return doc.get('formulaLinkbase') if doc else None
+    res = conn.execute('SELECT "formulaLinkbase" FROM "{}" WHERE "formulaId"={}'.format(rssTables[7], int(formulaId)), close=False)
+    return res[0][0] if res else None
+
+def verifyFormulaResultsCols(conn):
+    '''Adds formulaHash and arelleVersion columns to formulaeResults table of dbs created before these were added'''
+    if conn.product == 'mongodb' or formulaResultsTable not in conn.tablesInDB():
+        return []
+    if conn.product == 'sqlite':
+        existingCols = [x[1] for x in conn.execute('PRAGMA table_info("{}")'.format(formulaResultsTable), close=False)]
+    else:
+        existingCols = [x[0] for x in conn.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = '{}' AND table_name = '{}'".format(
+                                                    conn.conParams['schema'], formulaResultsTable), close=False)]
+    addedCols = []
+    try:
+        for col, colType in formulaResultsNewCols.items():
+            if col not in existingCols:
+                conn.execute('ALTER TABLE "{}" ADD COLUMN "{}" {}'.format(formulaResultsTable, col, colType), fetch=False)
+                addedCols.append(col)
+        if addedCols:
+            conn.commit()
+            conn.resetTableColTypes(formulaResultsTable)
+            conn.addToLog(_('Added column(s) {} to {}').format(', '.join(addedCols), formulaResultsTable),
+                            messageCode="RssDB.Info", file=conn.conParams.get('database', ''), level=logging.INFO)
+    except Exception as e:
+        conn.rollback()
+        raise e
+    return addedCols
+
+def getExistingFormulaResults(conn, formulaId, filingIds):
+    '''Returns dict of filingId: formulaHash for filingIds that already have results for formulaId,
+    formulaHash is None for results stored before formula hashes were recorded'''
+    _ids = [int(x) for x in filingIds]
+    if not _ids:
+        return dict()
+    if conn.product == 'mongodb':
+        res = conn.dbConn[formulaResultsTable].find({'formulaId': int(formulaId), 'filingId': {'$in': _ids}}, {'_id': 0, 'filingId': 1, 'formulaHash': 1})
+        return {x['filingId']: x.get('formulaHash') for x in res}
+    if formulaResultsTable not in conn.tablesInDB():
+        return dict()
+    verifyFormulaResultsCols(conn)
+    res = conn.execute('SELECT "filingId", "formulaHash" FROM "{}" WHERE "formulaId"={} AND "filingId" in ({})'.format(
+                            formulaResultsTable, int(formulaId), ', '.join(str(x) for x in _ids)), close=False)
+    return {x[0]: x[1] for x in res}
+
+def writeFormulaResults(conn, rows, replaceExisting=False):
+    '''Writes a batch of formulaeResults rows in one transaction, existing results for the same
+    filing and formula are replaced if replaceExisting'''
+    if not rows:
+        return 0
+    formulaId = rows[0]['formulaId']
+    filingIds = [x['filingId'] for x in rows]
+    if conn.product == 'mongodb':
+        if replaceExisting:
+            conn.dbConn[formulaResultsTable].delete_many({'formulaId': formulaId, 'filingId': {'$in': filingIds}})
+        # insert_many adds _id to the docs
+        conn.insertUpdateRssDB([dict(x) for x in rows], formulaResultsTable, 'insert')
+    else:
+        try:
+            if replaceExisting:
+                conn.execute('DELETE FROM "{}" WHERE "formulaId"={} AND "filingId" in ({})'.format(
+                                formulaResultsTable, int(formulaId), ', '.join(str(int(x)) for x in filingIds)), fetch=False)
+            conn.insertUpdateRssDB(rows, formulaResultsTable, 'insert')
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+    return len(rows)
+
+def runFormulaParallel(conn, rssItems, formulaId, additionalImports=None, insertResultIntoDb=True, updateExistingResults=False,
+                        saveResultsToFolder=False, folderPath=None, maxWorkers=None, batchSize=50, returnResults=False,
+                        recomputeUnchanged=False, dryRun=False, archiveCache=None):
+    '''Runs formula `formulaId` from db on rssItems (from a search result) using a pool of worker processes
+
+    args:
+        conn: rss db connection, used by the main process only to get the formula and write results
+        rssItems: rssItems with filingId (such as search results items)
+        formulaId: id of formula in db to run
+        additionalImports: '|' separated additional files to import with the formula linkbase
+        insertResultIntoDb: insert results into formulaeResults table
+        updateExistingResults: recompute and replace existing results of the same formula and filing that were produced
+                               by a different formula content (linkbase or additional imports changed, or results
+                               stored without formula hash), otherwise filings with existing results are skipped
+        recomputeUnchanged: with updateExistingResults, also recompute results produced by an identical formula
+        saveResultsToFolder, folderPath: save formula output instance of each filing to folderPath
+        maxWorkers: number of worker processes, defaults to half of cpu count
+        batchSize: number of results to write to db at once
+        returnResults: include results rows in the returned dict
+        dryRun: do not run the formula, only report how many filings need (re)computation
+        archiveCache: filingArchiveCache, filings are loaded from archives in the local store (downloaded once),
+                      archives of the next filings are downloaded while the submitted ones are processed
+
+    Returns dict with counts of processed, failed and skipped filings and list of failures (filingId, error),
+    for dryRun returns dict of counts of filings by status (new, changed, unchanged) and to compute.
+    '''
+    startTime = time.perf_counter()
+    dbFile = conn.conParams.get('database', '')
+    if formulaId is None:
+        conn.addToLog(_('A formula Id to run must be entered'), messageCode="RssDB.Error", file=dbFile, level=logging.ERROR)
+        return None
+    formulaId = int(formulaId)
+    formulaLinkbase = getFormulaLinkbase(conn, formulaId)
+    if not formulaLinkbase:
+        conn.addToLog(_('Formula id {} not found in db').format(formulaId), messageCode="RssDB.Error", file=dbFile, level=logging.ERROR)
+        return None
+    if isinstance(formulaLinkbase, bytes):
+        formulaLinkbase = formulaLinkbase.decode('utf-8')
+    saveToFolder = folderPath if saveResultsToFolder and folderPath and os.path.isdir(folderPath) else None
+    if saveResultsToFolder and not saveToFolder:
+        conn.addToLog(_('Folder to save results "{}" not found, results will not be saved to folder').format(folderPath),
+                        messageCode="RssDB.Error", file=dbFile, level=logging.ERROR)
+
+    formulaHash = formulaContentHash(formulaLinkbase, additionalImports)
+    arelleVersion = getArelleVersion()
+
+    tasks = OrderedDict()
+    taskItems = dict()
+    failed = []
+    for rssItem in rssItems:
+        task = _filingTask(rssItem)
+        if task[0] is None or not task[2]:
+            failed.append((task[0], _('No filing id or instance url for {}').format(getattr(rssItem, 'accessionNumber', rssItem))))
+            continue
+        tasks.setdefault(task[0], task)
+        taskItems.setdefault(task[0], rssItem)
+    existing = dict()
+    if insertResultIntoDb or dryRun:
+        existing = getExistingFormulaResults(conn, formulaId, tasks.keys())
+    unchanged = [x for x, h in existing.items() if h == formulaHash]
+    changed = [x for x, h in existing.items() if h != formulaHash]
+    if not updateExistingResults:
+        skipFilings = unchanged + changed
+    else:
+        skipFilings = [] if recomputeUnchanged else unchanged
+
+    if dryRun:
+        report = OrderedDict([('formulaId', formulaId), ('formulaHash', formulaHash), ('filings', len(tasks)),
+                                ('new', len(tasks) - len(existing)), ('changed', len(changed)), ('unchanged', len(unchanged)),
+                                ('toCompute', len(tasks) - len(skipFilings)), ('invalid', len(failed))])
+        conn.addToLog(_('Dry run formula {}: {} filing(s), {} without result, {} with result from a different formula, '
+                        '{} with result from identical formula, {} filing(s) to compute').format(
+                        formulaId, report['filings'], report['new'], report['changed'], report['unchanged'], report['toCompute']),
+                        messageCode="RssDB.Info", file=dbFile, level=logging.INFO)
+        return report
+
+    for filingId in skipFilings:
+        tasks.pop(filingId, None)
+    skipped = len(skipFilings)
+    if skipped:
+        conn.addToLog(_('Skipping {} filing(s) with existing results for formula id {} ({} produced by identical formula)').format(
+                        skipped, formulaId, len(set(skipFilings).intersection(unchanged))),
+                        messageCode="RssDB.Info", file=dbFile, level=logging.INFO)
+
+    if not maxWorkers:
+        maxWorkers = os.cpu_count()/2
+    maxWorkers = max(1, min(int(maxWorkers), len(tasks) or 1))
+    setConfigDir = os.path.dirname(conn.cntlr.userAppDir)
+    targetResDir = os.path.dirname(conn.cntlr.imagesDir)
+    initArgs = (setConfigDir, targetResDir, formulaId, formulaLinkbase, additionalImports, getattr(conn.cntlr, 'rssDBFormulaRemoveDups', False),
+                formulaHash, arelleVersion)
+    product = conn.product
+    total = len(tasks)
+
+    def taskIter():
+        if not archiveCache:
+            yield from tasks.values()
+            return
+        prefetcher = archivePrefetcher(archiveCache, [taskItems[x] for x in tasks], ahead=max(maxWorkers, archiveCache.prefetchAhead), entryUrls=True)
+        for (filingId, inlineXBRL, entryUrl), (rssItem, localUrl, error) in zip(tasks.values(), prefetcher):
+            if error:
+                conn.addToLog(_('Could not get filing archive for filing {} from archive cache, loading from {}\n{}').format(filingId, entryUrl, str(error)),
+                                messageCode="RssDB.Info", file=dbFile, level=logging.INFO)
+            yield filingId, inlineXBRL, localUrl or entryUrl
+    pending = []
+    results = []
+    inserted = 0
+    processed = 0
+
+    def handleResult(res):
+        nonlocal processed, inserted
+        processed += 1
+        if res['error']:
+            failed.append((res['filingId'], res['error']))
+            conn.addToLog(_('{}/{} Failed running formula {} on filing {}:\n{}').format(processed, total, formulaId, res['filingId'], res['error']),
+                            messageCode="RssDB.Error", file=dbFile, level=logging.ERROR)
+        else:
+            conn.showStatus(_('{}/{} Ran formula {} on filing {} in {} secs').format(processed, total, formulaId, res['filingId'], round(res['elapsed'], 3)))
+            if insertResultIntoDb:
+                pending.append(res['row'])
+            if returnResults:
+                results.append(res['row'])
+        if len(pending) >= batchSize:
+            inserted += writeFormulaResults(conn, pending, replaceExisting=updateExistingResults)
+            pending.clear()
+        return
+
+    conn.addToLog(_('Running formula {} on {} filing(s) with {} worker(s)').format(formulaId, total, maxWorkers),
+                    messageCode="RssDB.Info", file=dbFile, level=logging.INFO)
+    if sys.platform.lower().startswith('win'):
+        # windows app and multiprocessing issues!
+        _formulaWorkerInit(*initArgs)
+        try:
+            for filingId, inlineXBRL, entryUrl in taskIter():
+                handleResult(_runFormulaOnFiling(filingId, inlineXBRL, entryUrl, product, saveToFolder))
+        finally:
+            _formulaWorkerClose()
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=maxWorkers, initializer=_formulaWorkerInit, initargs=initArgs) as executor:
+            # filings are submitted as their archives arrive, workers start on the first ones while the rest download
+            futures = set()
+            for filingId, inlineXBRL, entryUrl in taskIter():
+                futures.add(executor.submit(_runFormulaOnFiling, filingId, inlineXBRL, entryUrl, product, saveToFolder))
+                for future in [x for x in futures if x.done()]:
+                    futures.discard(future)
+                    handleResult(future.result())
+            for future in concurrent.futures.as_completed(futures):
+                handleResult(future.result())
+    if pending:
+        inserted += writeFormulaResults(conn, pending, replaceExisting=updateExistingResults)
+        pending.clear()
+
+    _msg = _('Finished running formula {} on {} filing(s) in {} secs, {} failed, {} skipped, {} result(s) written to db').format(
+                formulaId, processed, round(time.perf_counter() - startTime, 3), len(failed), skipped, inserted)
+    conn.addToLog(_msg, messageCode="RssDB.Info", file=dbFile, level=logging.INFO)
+    conn.showStatus(_msg)
+    result = {'processed': processed, 'inserted': inserted, 'skipped': skipped, 'failed': failed}
+    if returnResults:
+        result['results'] = results
+    return result
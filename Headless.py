@@ -0,0 +1,192 @@
+'''Lightweight rssDB connection for headless use (query API threads and dashboard)
+
+rssHeadlessDbConnection has the query methods of rssSqlDbConnection (both use the rssSqlQueries mixin of
+SqlQueries), but is opened directly with the db driver (sqlite3 or pg8000), without an arelle controller,
+xbrlDB SqlDbConnection or ModelXbrl, and this module does not import arelle, so connections are cheap to
+create in numbers. Messages go to an optional logger (arelle cntlr.logger can be used), other controller
+settings (config, rssDBCompression, rssDBColdStoreDir, ...) are given as keyword arguments. Headless
+connections work on an existing rssDB, updates (feeds are parsed by arelle) and the worker processes of
+updates and formula runs use the full connection.
+'''
+
+import os, sqlite3, logging, gettext, tempfile
+from datetime import datetime, date
+from dateutil import parser
+from .SqlQueries import rssSqlQueries, pg8000
+from .Metrics import rssDBMetrics
+from .Compression import resolveCodec
+from .SqliteProfile import resolveSqliteProfile, applySqlitePragmas, restorePendingIndexes
+from .Sharding import attachShards
+
+class headlessCntlr:
+    '''Stands in for arelle controller where connection methods use one, logs to logger'''
+    hasGui = False
+
+    def __init__(self, logger=None, config=None, **kwargs):
+        self.logger = logger or logging.getLogger('rssDB')
+        self.config = config if config is not None else dict()
+        self.userAppDir = os.path.join(tempfile.gettempdir(), 'rssDB')
+        self.__dict__.update(kwargs)
+
+    def addToLog(self, message, messageCode='', file='', level=logging.INFO, **kwargs):
+        # extra fields expected by arelle log handlers when cntlr.logger is used
+        self.logger.log(level, message, extra={'messageCode': messageCode, 'refs': [{'href': file}] if file else []})
+
+    def showStatus(self, message, clearAfter=None):
+        if message:
+            self.logger.debug(message)
+
+    def saveConfig(self):
+        pass
+
+def _dbDateTime(value):
+    if value is None or isinstance(value, (datetime, date)):
+        return value
+    return parser.parse(str(value))
+
+class rssHeadlessDbConnection(rssSqlQueries):
+    '''rssDB sql connection opened with the db driver only (see module docstring)'''
+    def __init__(self, product, database, user=None, password=None, host=None, port=None, timeout=None, schema=None,
+                 sqliteProfile=None, logger=None, config=None, **cntlrSettings):
+        gettext.install('arelle')
+        if product not in ('sqlite', 'postgres'):
+            raise Exception('Headless connection product must be one of sqlite, postgres, {} was entered'.format(product))
+        self.cntlr = headlessCntlr(logger, config, **cntlrSettings)
+        self.metrics = rssDBMetrics()
+        self.compression = resolveCodec(getattr(self.cntlr, 'rssDBCompression', None))
+        self.product = product
+        self.tableColTypes = dict()
+        self.tableColDeclaration = dict()
+        self._cursor = None
+        self.conParams = {'cntlr': None, 'user': user,
+                            'password': password, 'host': host,
+                            'port': port, 'database': database,
+                            'timeout': timeout, 'product': product, 'schema': schema}
+        if product == 'sqlite':
+            if not database == ':memory:' and not os.path.exists(database):
+                self.addToLog(_('Database "{}" does not Exist').format(database), messageCode="RssDB.Error",  file=database,  level=logging.ERROR)
+                raise Exception('Database "{}" does not Exist'.format(database))
+            self.conn = sqlite3.connect(database, timeout=timeout or 60, check_same_thread=False,
+                                        detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
+            self.schema = schema
+            self.sqliteProfile, self.sqlitePragmas = resolveSqliteProfile(self, sqliteProfile)
+            self.conParams['sqliteProfile'] = self.sqliteProfile
+            self.pragmaValues = applySqlitePragmas(self, self.sqlitePragmas)
+            restorePendingIndexes(self)
+            attachShards(self)
+        else:
+            if pg8000 is None:
+                raise Exception('pg8000 package is required for postgres connections')
+            self.conn = pg8000.connect(user=user, password=password, host=host or 'localhost', port=int(port or 5432),
+                                       database=database, timeout=int(timeout or 60))
+            self.schema = schema or 'rssFeeds'
+            self.conParams['schema'] = self.schema
+            self.execute('SET search_path = "{}";'.format(self.schema), fetch=False, commit=True)
+
+        if not self.checkConnection():
+            self.close()
+            raise Exception('Could not connet to database {}'.format(database))
+
+    # db driver methods, as xbrlDB SqlDbConnection has them for the full connection
+
+    @property
+    def cursor(self):
+        if self._cursor is None:
+            self._cursor = self.conn.cursor()
+        return self._cursor
+
+    def closeCursor(self):
+        if self._cursor is not None:
+            try:
+                self._cursor.close()
+            except Exception:
+                pass
+            self._cursor = None
+
+    def execute(self, sql, commit=False, close=True, fetch=True, params=None, action="execute"):
+        cursor = self.cursor
+        try:
+            if isinstance(params, dict):
+                cursor.execute(sql, **params)
+            elif isinstance(params, (tuple, list)):
+                cursor.execute(sql, params)
+            else:
+                cursor.execute(sql)
+        except Exception as ex:
+            raise Exception(_('{} error {}').format(action, str(ex)))
+        result = cursor.fetchall() if fetch else None
+        if commit:
+            self.conn.commit()
+        if close:
+            self.closeCursor()
+        return result
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        try:
+            self.closeCursor()
+            self.conn.rollback()
+        except Exception:
+            pass
+
+    def close(self, rollback=False):
+        try:
+            self.closeCursor()
+            if rollback:
+                self.conn.rollback()
+            self.conn.close()
+        finally:
+            self.__dict__.clear() # dereference everything
+
+    @property
+    def isClosed(self):
+        return not bool(self.__dict__) # closed when dict is empty
+
+    def dbStr(self, s):
+        if s is None:
+            return "NULL"
+        return "'" + str(s).replace("'", "''") + "'"
+
+    def pyBoolFromDbBool(self, value):
+        return value not in (False, 0, '0', 'f', 'false', 'FALSE', None)
+
+    def columnTypeFunctions(self, table):
+        '''Returns {column: (type cast, python conversion function)} of table, as SqlDbConnection does'''
+        if table not in self.tableColTypes:
+            if self.product == 'postgres':
+                colTypesResult = self.execute("SELECT c.column_name, c.data_type FROM information_schema.columns c "
+                                              "WHERE c.table_name = '{}' AND c.table_schema = '{}' ORDER BY c.ordinal_position;".format(table, self.schema))
+            else:
+                colTypesResult = [(colType[1].lower(), colType[2].lower()) for colType in self.execute("PRAGMA table_info('{}')".format(table))]
+            self.tableColTypes[table] = dict(
+                (name, ('::' + typename if typename in ("integer", "smallint", "int", "bigint", "real", "numeric",
+                                                        "int2", "int4", "int8", "float4", "float8", "boolean", "date", "timestamp")
+                        else "::double precision" if fulltype.startswith("double precision") else '',
+                        int if typename in ("integer", "smallint", "int", "bigint", "number") else
+                        float if typename in ("double", "real", "numeric") else
+                        self.pyBoolFromDbBool if typename in ("bit", "boolean") else
+                        _dbDateTime if typename in ("date", "timestamp") else
+                        str))
+                for name, fulltype in colTypesResult
+                for typename in (fulltype.partition(' ')[0],))
+            if self.product == 'sqlite':
+                # declarations of temp input table columns
+                self.tableColDeclaration[table] = dict(colTypesResult)
+        return self.tableColTypes[table]
+
+def headlessConnection(conParams, logger=None, cntlr=None, **kwargs):
+    '''Returns headless connection with the conParams of an existing connection, settings of cntlr (if any)
+    are carried over, mongodb is not supported (returns None)'''
+    conParams = {k: v for k, v in conParams.items() if k in ('product', 'database', 'user', 'password', 'host', 'port',
+                                                             'timeout', 'schema', 'sqliteProfile')}
+    if conParams.get('product') not in ('sqlite', 'postgres'):
+        return None
+    if cntlr is not None:
+        logger = logger or getattr(cntlr, 'logger', None)
+        kwargs.setdefault('config', getattr(cntlr, 'config', None))
+        for setting in ('rssDBCompression', 'rssDBColdStoreDir', 'rssDBPartitionBy'):
+            if getattr(cntlr, setting, None) is not None:
+                kwargs.setdefault(setting, getattr(cntlr, setting))
+    return rssHeadlessDbConnection(logger=logger, **conParams, **kwargs)
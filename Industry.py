@@ -0,0 +1,56 @@
+'''SEC industry classification hierarchy in searches and reports
+
+SEC industry codes (assignedSic of filings, industry_code of filers) are the leaves or inner nodes of the
+division > major group > industry group > industry hierarchy kept in the industry table and its closure
+table industry_level (ancestor, descendant pairs), codes are unique across levels. In search parameters
+a code followed by '*' (e.g. '20*' or '3570*') selects the code and all its descendants, the expansion is
+done by the database with a sub query of industry_level instead of listing all the leaf codes. On MongoDB
+the industry collection documents carry their ancestors and are used in the same way.
+'''
+
+sicClassification = 'SEC'
+
+def splitSicCodes(values):
+    '''Returns (codes, group codes) from list of codes, codes include the group codes (without '*')'''
+    codes, groups = [], []
+    for x in values:
+        x = str(x).strip()
+        if not x:
+            continue
+        if x.endswith('*'):
+            x = x[:-1].strip()
+            groups.append(x)
+        codes.append(x)
+    return codes, groups
+
+def sicCondition(col, codes, groups):
+    '''Returns sql condition with placeholders for codes then groups (see splitSicCodes)'''
+    condition = '{} IN ({})'.format(col, ', '.join('?' * len(codes)))
+    if groups:
+        condition = '''({} OR {} IN (SELECT "descendant_code" FROM "industry_level"
+                            WHERE "industry_classification" = '{}' AND "ancestor_code" IN ({})))'''.format(
+                            condition, col, sicClassification, ', '.join('?' * len(groups)))
+    return condition
+
+def mongoSicCodes(conn, codes, groups):
+    '''Returns list of int codes with descendants of groups (see splitSicCodes) from industry collection'''
+    result = {int(x) for x in codes}
+    if groups:
+        result.update(conn.dbConn.industry.distinct('industry_code', {'industry_classification': sicClassification,
+                                                    'ancestors.industry_code': {'$in': [int(x) for x in groups]}}))
+    return sorted(result)
+
+def sicDivisions(conn):
+    '''Returns {industry code (str): {'division_name': description of the code division}} for SEC codes'''
+    if conn.product == 'mongodb':
+        result = dict()
+        for a in conn.dbConn.industry.find({'industry_classification': sicClassification}, {'_id': 0, 'industry_code': 1, 'industry_description': 1, 'ancestors': 1}):
+            ancestors = a.get('ancestors') or []
+            result[str(a['industry_code'])] = {'division_name': ancestors[0]['industry_description'] if ancestors else a['industry_description']}
+        return result
+    qry = '''SELECT l."descendant_code", i."industry_description" FROM "industry_level" l
+                JOIN "industry" i ON i."industry_id" = l."ancestor_id"
+                WHERE l."industry_classification" = '{0}' AND l."ancestor_depth" = 1
+             UNION ALL
+             SELECT "industry_code", "industry_description" FROM "industry" WHERE "industry_classification" = '{0}' AND "depth" = 1'''.format(sicClassification)
+    return {str(code): {'division_name': description} for code, description in conn.execute(qry, fetch=True, close=False)}
@@ -19,6 +19,8 @@ except:
     from plugin.arellepy.CntlrPy import CntlrPy
     
 from .RssDB import rssDBConnection
+from .Headless import headlessConnection
+from .QueryApi import rssDBQueryApi
 
 
 class RssDBDash:
@@ -27,14 +29,17 @@ class RssDBDash:
         # Create a connection for the report
         xconn.cntlr.addToLog(_('Creating New Connection for DB report'), messageCode="RssDB.Info", file="",  level=logging.INFO)
         xconn.cntlr.showStatus(_('Creating New Connection for DB report'))
-        setConfigDir = os.path.dirname(xconn.cntlr.userAppDir)
-        targetResDir = os.path.dirname(xconn.cntlr.configDir)
-        a = CntlrPy(
-            instConfigDir=setConfigDir,
-            useResDir=targetResDir,
-            logFileName="logToBuffer"
-        )
-        conn = rssDBConnection(a, **{k:v for k,v in xconn.conParams.items() if not k =='cntlr'})
+        # sql dbs get a headless connection (no arelle controller), mongodb a full one
+        conn = headlessConnection(xconn.conParams, cntlr=xconn.cntlr)
+        if conn is None:
+            setConfigDir = os.path.dirname(xconn.cntlr.userAppDir)
+            targetResDir = os.path.dirname(xconn.cntlr.configDir)
+            a = CntlrPy(
+                instConfigDir=setConfigDir,
+                useResDir=targetResDir,
+                logFileName="logToBuffer"
+            )
+            conn = rssDBConnection(a, **{k:v for k,v in xconn.conParams.items() if not k =='cntlr'})
 
         self.conn = conn
         self.dbStats = conn.getDbStats()['dictResult']
@@ -97,6 +102,8 @@ class RssDBDash:
         self.app = dash.Dash(__name__, meta_tags=[{"name": "viewport", "content": "width=device-width"}])
         self.app.title = os.path.basename(conn.conParams['database'])
         self.server = self.app.server
+        # read-only json api on the same server
+        self.api = rssDBQueryApi(self.server, conn)
         self.app.layout = self.appLayout()
 
         self.app.clientside_callback(
@@ -199,14 +206,16 @@ class RssDBDash:
         if xconn.product in ('sqlite', 'mongodb'):
             xconn.cntlr.addToLog(_('Creating New Connection for {} in new thread/process').format(xconn.product), messageCode="RssDB.Info", file="",  level=logging.INFO)
             xconn.cntlr.showStatus(_('Creating New Connection for {} in new thread/process').format(xconn.product))
-            setConfigDir = os.path.dirname(xconn.cntlr.userAppDir)
-            targetResDir = os.path.dirname(xconn.cntlr.configDir)
-            a = CntlrPy(
-                instConfigDir=setConfigDir,
-                useResDir=targetResDir,
-                logFileName="logToBuffer"
-            )
-            conn = rssDBConnection(a, **{k:v for k,v in xconn.conParams.items() if not k =='cntlr'})
+            conn = headlessConnection(xconn.conParams, cntlr=xconn.cntlr)
+            if conn is None:
+                setConfigDir = os.path.dirname(xconn.cntlr.userAppDir)
+                targetResDir = os.path.dirname(xconn.cntlr.configDir)
+                a = CntlrPy(
+                    instConfigDir=setConfigDir,
+                    useResDir=targetResDir,
+                    logFileName="logToBuffer"
+                )
+                conn = rssDBConnection(a, **{k:v for k,v in xconn.conParams.items() if not k =='cntlr'})
             newConn = True
         else:
             conn = self.conn
@@ -637,13 +646,9 @@ class RssDBDash:
                             legend=dict(orientation="h", yanchor="bottom", y=-0.25, xanchor="left", x=0, title=''),
                                     yaxis={'categoryorder':'array', 'categoryarray':grp3_sort, 'range':grp3_range, 'title':''}, )
 
-        _data_filers = filers_df.copy()
-        slcd_filers = list(data['cikNumber'].unique())
-        data_filers = _data_filers[(_data_filers['cikNumber'].isin(slcd_filers))]
-        grp_4 = data.groupby(['cikNumber'])['count'].sum().reset_index()
-        filers_map = pd.merge(grp_4, data_filers, on='cikNumber')
-        reGrp = filers_map.groupby(['code']).agg({'count':'sum', 'cikNumber':'count', 'longitude':'max', 'latitude':'max',
-                                        'country': lambda x: x.iloc[0], 'stateProvince': lambda x: x.iloc[0]}).reset_index()
+        # filings summary rows carry the location code of the filer, locations come with their coordinates
+        grp_4 = data.groupby(['locationCode']).agg({'count':'sum', 'cikNumber':'nunique'}).reset_index().rename(columns={'locationCode': 'code'})
+        reGrp = pd.merge(grp_4, filers_df[['code', 'longitude', 'latitude', 'country', 'stateProvince']], on='code')
         reGrp.stateProvince = [x if x else '' for x in reGrp.stateProvince]
         reGrp.columns = ['code', 'Count of Filings','Count of Filers', 'longitude', 'latitude', 'Country', 'State']
         px.set_mapbox_access_token(self.mapbox_access_token)
@@ -0,0 +1,206 @@
+'''Stage level timing and counters for rssDB ingestion
+
+Collects spans (timed stages such as fetch, parse, diff and insert), counters
+(rows, requests) and gauges (queue depths) during an update run, metrics collected
+in worker processes are exported as plain dicts, returned with the worker results
+and merged into the metrics object of the main connection.
+
+Metrics can be exported in Prometheus text exposition format (to be picked up by
+node exporter textfile collector for example) or as a json like summary dict that
+is returned with `doAll(returnInfo=True)` results.
+'''
+
+import os, time, threading, json
+from contextlib import contextmanager
+
+metricsPrefix = 'rssdb'
+
+def _labelsKey(labels):
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items() if v is not None))
+
+def _escapeLabelValue(val):
+    return val.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _formatLabels(labelsKey, extra=None):
+    _labels = list(labelsKey) + (list(extra) if extra else [])
+    if not _labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, _escapeLabelValue(v)) for k, v in _labels) + '}'
+
+class rssDBMetrics:
+    '''Container for spans, counters and gauges collected during an update run
+
+    Spans keep count, sum, min and max of the durations in seconds by span name and labels,
+    counters are summed and gauges keep the last and the max observed value.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.startedAt = time.time()
+            self.spans = dict()
+            self.counters = dict()
+            self.gauges = dict()
+        return
+
+    def observe(self, name, seconds, **labels):
+        '''Adds a duration observation to span `name`'''
+        key = (name, _labelsKey(labels))
+        with self._lock:
+            stat = self.spans.get(key)
+            if stat is None:
+                self.spans[key] = [1, seconds, seconds, seconds]
+            else:
+                stat[0] += 1
+                stat[1] += seconds
+                stat[2] = min(stat[2], seconds)
+                stat[3] = max(stat[3], seconds)
+        return
+
+    @contextmanager
+    def span(self, name, **labels):
+        '''Times the enclosed block as span `name`'''
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - startTime, **labels)
+
+    def incr(self, name, value=1, **labels):
+        key = (name, _labelsKey(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        return
+
+    def gauge(self, name, value, **labels):
+        key = (name, _labelsKey(labels))
+        with self._lock:
+            last, _max = self.gauges.get(key, (value, value))
+            self.gauges[key] = (value, max(_max, value))
+        return
+
+    def export(self):
+        '''Returns metrics as picklable plain lists to be sent back from worker processes'''
+        with self._lock:
+            return {
+                'spans': [(k[0], k[1], list(v)) for k, v in self.spans.items()],
+                'counters': [(k[0], k[1], v) for k, v in self.counters.items()],
+                'gauges': [(k[0], k[1], list(v)) for k, v in self.gauges.items()]
+            }
+
+    def merge(self, exported):
+        '''Merges metrics exported from another rssDBMetrics object (usually from a worker process)'''
+        if not exported:
+            return
+        with self._lock:
+            for name, labelsKey, (count, _sum, _min, _max) in exported.get('spans', []):
+                key = (name, tuple(tuple(x) for x in labelsKey))
+                stat = self.spans.get(key)
+                if stat is None:
+                    self.spans[key] = [count, _sum, _min, _max]
+                else:
+                    stat[0] += count
+                    stat[1] += _sum
+                    stat[2] = min(stat[2], _min)
+                    stat[3] = max(stat[3], _max)
+            for name, labelsKey, value in exported.get('counters', []):
+                key = (name, tuple(tuple(x) for x in labelsKey))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labelsKey, (last, _max) in exported.get('gauges', []):
+                key = (name, tuple(tuple(x) for x in labelsKey))
+                prior = self.gauges.get(key)
+                self.gauges[key] = (last, max(prior[1], _max) if prior else _max)
+        return
+
+    def summary(self):
+        '''Json serializable summary, span totals by stage, row counts and rows/s by table'''
+        with self._lock:
+            spans = {k: list(v) for k, v in self.spans.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        stages = dict()
+        for (name, labelsKey), (count, _sum, _min, _max) in spans.items():
+            stage = stages.setdefault(name, {'count': 0, 'seconds': 0, 'min': _min, 'max': _max})
+            stage['count'] += count
+            stage['seconds'] += _sum
+            stage['min'] = min(stage['min'], _min)
+            stage['max'] = max(stage['max'], _max)
+        for stage in stages.values():
+            stage['seconds'] = round(stage['seconds'], 3)
+            stage['mean'] = round(stage['seconds'] / stage['count'], 4) if stage['count'] else None
+            stage['min'] = round(stage['min'], 4)
+            stage['max'] = round(stage['max'], 4)
+
+        rows = dict()
+        insertSecs = dict()
+        for (name, labelsKey), v in spans.items():
+            if name == 'insert':
+                _tbl = dict(labelsKey).get('table')
+                insertSecs[_tbl] = insertSecs.get(_tbl, 0) + v[1]
+        for (name, labelsKey), v in counters.items():
+            if name == 'rows':
+                _labels = dict(labelsKey)
+                tbl = rows.setdefault(_labels.get('table'), {'insert': 0, 'update': 0})
+                tbl[_labels.get('action', 'insert')] = tbl.get(_labels.get('action', 'insert'), 0) + v
+        for _tbl, tbl in rows.items():
+            secs = insertSecs.get(_tbl, 0)
+            tbl['seconds'] = round(secs, 3)
+            tbl['rowsPerSec'] = round((tbl['insert'] + tbl['update']) / secs, 1) if secs else None
+
+        elapsed = time.time() - self.startedAt
+        return {
+            'elapsedSecs': round(elapsed, 3),
+            'stages': stages,
+            'tables': rows,
+            'counters': {name + _formatLabels(labelsKey): v for (name, labelsKey), v in counters.items()},
+            'queues': {name + _formatLabels(labelsKey): {'last': v[0], 'max': v[1]} for (name, labelsKey), v in gauges.items()}
+        }
+
+    def toPrometheus(self, prefix=metricsPrefix):
+        '''Returns metrics in Prometheus text exposition format'''
+        with self._lock:
+            spans = sorted(self.spans.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        lines = []
+        spanMetric = '{}_stage_duration_seconds'.format(prefix)
+        if spans:
+            lines.append('# HELP {} Duration of ingestion stages'.format(spanMetric))
+            lines.append('# TYPE {} summary'.format(spanMetric))
+            for (name, labelsKey), (count, _sum, _min, _max) in spans:
+                _labels = _formatLabels(labelsKey, [('stage', name)])
+                lines.append('{}_sum{} {}'.format(spanMetric, _labels, repr(float(_sum))))
+                lines.append('{}_count{} {}'.format(spanMetric, _labels, count))
+            lines.append('# TYPE {}_max gauge'.format(spanMetric))
+            for (name, labelsKey), (count, _sum, _min, _max) in spans:
+                lines.append('{}_max{} {}'.format(spanMetric, _formatLabels(labelsKey, [('stage', name)]), repr(float(_max))))
+        typed = set()
+        for (name, labelsKey), v in counters:
+            _metric = '{}_{}_total'.format(prefix, name)
+            if _metric not in typed:
+                lines.append('# TYPE {} counter'.format(_metric))
+                typed.add(_metric)
+            lines.append('{}{} {}'.format(_metric, _formatLabels(labelsKey), v))
+        gaugeNames = sorted(set(name for (name, labelsKey), v in gauges))
+        for gaugeName in gaugeNames:
+            _metric = '{}_{}'.format(prefix, gaugeName)
+            for suffix, i in (('', 0), ('_max', 1)):
+                lines.append('# TYPE {}{} gauge'.format(_metric, suffix))
+                for (name, labelsKey), v in gauges:
+                    if name == gaugeName:
+                        lines.append('{}{}{} {}'.format(_metric, suffix, _formatLabels(labelsKey), v[i]))
+        return '\n'.join(lines) + '\n'
+
+    def save(self, fileName, fmt=None):
+        '''Saves metrics to file, Prometheus text format unless fmt is json or file extension is .json'''
+        if fmt is None:
+            fmt = 'json' if fileName.lower().endswith('.json') else 'prometheus'
+        text = json.dumps(self.summary(), indent=2) if fmt == 'json' else self.toPrometheus()
+        # write then rename so that scrapers never read a partially written file
+        tmpName = fileName + '.tmp'
+        with open(tmpName, 'w') as f:
+            f.write(text)
+        os.replace(tmpName, fileName)
+        return fileName
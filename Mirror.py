@@ -0,0 +1,184 @@
+'''Local mirror of SEC monthly XBRL feeds
+
+syncMonthlyMirror keeps a local folder in sync with https://www.sec.gov/Archives/edgar/monthly/ without a
+db connection. Only feeds listed with a last modified date different from the previous sync are requested,
+with a conditional GET (If-None-Match/If-Modified-Since) so unchanged feeds are not downloaded again. Feeds
+are downloaded to a hidden temp file and moved in place, so rssDB updates reading the mirror (loc=mirrorDir,
+--rssDBupdateLoc) never see a partial file, and a lock file keeps concurrent syncs of the same mirror (from
+several rssDB instances) from running at the same time. The state of the mirror (ETag, Last-Modified, size,
+sha256 of each feed) is kept in mirrorState.json in the mirror folder.
+'''
+
+import os, re, json, time, logging, hashlib
+from calendar import timegm
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict
+from contextlib import closing
+from urllib import request
+from urllib.error import HTTPError
+from dateutil import parser
+from .ArchiveCache import secRateLimiter
+
+monthlyFeedsUrl = 'https://www.sec.gov/Archives/edgar/monthly/'
+mirrorStateFile = 'mirrorState.json'
+mirrorLockFile = '.mirror.lock'
+staleLockSecs = 3600
+downloadChunkSize = 1024 * 1024
+feedFilePattern = re.compile(r'^xbrlrss-(\d{4})-(\d{2})\.xml$')
+
+def loadMirrorState(mirrorDir):
+    '''Returns {feed file name: state dict} of mirror'''
+    statePath = os.path.join(mirrorDir, mirrorStateFile)
+    if not os.path.isfile(statePath):
+        return dict()
+    with open(statePath, 'r') as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+def _saveMirrorState(mirrorDir, state):
+    tmpPath = os.path.join(mirrorDir, '.{}.{}.tmp'.format(mirrorStateFile, os.getpid()))
+    with open(tmpPath, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmpPath, os.path.join(mirrorDir, mirrorStateFile))
+
+def _acquireLock(mirrorDir):
+    '''Creates lock file of mirror, returns False if another sync holds it (stale locks are replaced)'''
+    lockPath = os.path.join(mirrorDir, mirrorLockFile)
+    for _try in range(2):
+        try:
+            fd = os.open(lockPath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, 'w') as f:
+                f.write('{} {}'.format(os.getpid(), datetime.now().isoformat()))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lockPath) < staleLockSecs:
+                    return False
+                os.remove(lockPath)
+            except OSError:
+                pass
+    return False
+
+def _touchLock(mirrorDir):
+    # long syncs keep the lock from being taken as stale
+    try:
+        os.utime(os.path.join(mirrorDir, mirrorLockFile))
+    except OSError:
+        pass
+
+def _releaseLock(mirrorDir):
+    try:
+        os.remove(os.path.join(mirrorDir, mirrorLockFile))
+    except OSError:
+        pass
+
+def _inRange(fileName, monthFrom, monthTo):
+    match = feedFilePattern.match(fileName)
+    if not match:
+        return False
+    month = int(match.group(1) + match.group(2))
+    return (monthFrom is None or month >= monthFrom) and (monthTo is None or month <= monthTo)
+
+def _monthOf(value):
+    if value is None or value == '':
+        return None
+    if not isinstance(value, datetime):
+        value = parser.parse(str(value))
+    return value.year * 100 + value.month
+
+def _download(cntlr, url, path, headers):
+    '''Conditional GET of url into path, returns None if not modified (304) otherwise (etag, lastModified, size, sha256)'''
+    secRateLimiter.wait()
+    try:
+        resp = cntlr.webCache.opener.open(request.Request(url, headers=headers))
+    except HTTPError as e:
+        e.close()
+        if e.code == 304:
+            return None
+        raise e
+    tmpPath = os.path.join(os.path.dirname(path), '.{}.{}.tmp'.format(os.path.basename(path), os.getpid()))
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        with closing(resp), open(tmpPath, 'wb') as f:
+            while True:
+                chunk = resp.read(downloadChunkSize)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        lastModified = resp.headers.get('Last-Modified')
+        if lastModified:
+            try:
+                mtime = timegm(parsedate_to_datetime(lastModified).utctimetuple())
+                os.utime(tmpPath, (mtime, mtime))
+            except (TypeError, ValueError):
+                pass
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+    return resp.headers.get('ETag'), lastModified, size, sha.hexdigest()
+
+def syncMonthlyMirror(cntlr, mirrorDir, url=monthlyFeedsUrl, dateFrom=None, dateTo=None, force=False):
+    '''Syncs monthly feeds (xbrlrss-YYYY-MM.xml) listed at url (within dateFrom-dateTo months) into mirrorDir,
+    returns dict of counts of downloaded, unchanged (listed with same date or 304) and failed feeds, None if
+    another sync of mirrorDir is running. force requests every feed (still conditional).'''
+    from .CommonFunctions import _parseFeedsIndex
+    mirrorDir = os.path.abspath(mirrorDir)
+    os.makedirs(mirrorDir, exist_ok=True)
+    if not url.endswith('/'):
+        url += '/'
+    if not _acquireLock(mirrorDir):
+        cntlr.addToLog(_('Mirror {} is being synced by another process').format(mirrorDir), messageCode="RssDB.Info", file=mirrorDir, level=logging.INFO)
+        return None
+    stats = OrderedDict([('listed', 0), ('downloaded', 0), ('unchanged', 0), ('failed', 0), ('downloadedBytes', 0)])
+    startTime = time.perf_counter()
+    try:
+        state = loadMirrorState(mirrorDir)
+        secRateLimiter.wait()
+        with closing(cntlr.webCache.opener.open(url)) as feedsPage:
+            listed = [(href.rpartition('/')[2], lastModified) for href, lastModified in _parseFeedsIndex(feedsPage)]
+        monthFrom, monthTo = _monthOf(dateFrom), _monthOf(dateTo)
+        listed = [x for x in listed if _inRange(x[0], monthFrom, monthTo)]
+        stats['listed'] = len(listed)
+        for fileName, listedDate in listed:
+            path = os.path.join(mirrorDir, fileName)
+            feedState = state.get(fileName, dict())
+            haveFile = os.path.isfile(path) and os.path.getsize(path) == feedState.get('sizeBytes')
+            if haveFile and not force and feedState.get('listedModified') == listedDate.isoformat():
+                stats['unchanged'] += 1
+                continue
+            headers = dict()
+            if haveFile:
+                if feedState.get('etag'):
+                    headers['If-None-Match'] = feedState['etag']
+                if feedState.get('lastModified'):
+                    headers['If-Modified-Since'] = feedState['lastModified']
+            _touchLock(mirrorDir)
+            try:
+                download = _download(cntlr, url + fileName, path, headers)
+            except Exception as e:
+                stats['failed'] += 1
+                cntlr.addToLog(_('Could not sync {}: {}').format(fileName, str(e)), messageCode="RssDB.Error", file=mirrorDir, level=logging.ERROR)
+                continue
+            if download is None:
+                stats['unchanged'] += 1
+            else:
+                etag, lastModified, size, sha = download
+                feedState = OrderedDict([('etag', etag), ('lastModified', lastModified), ('sizeBytes', size), ('sha256', sha)])
+                stats['downloaded'] += 1
+                stats['downloadedBytes'] += size
+                cntlr.addToLog(_('Synced {} ({:,} bytes)').format(fileName, size), messageCode="RssDB.Info", file=mirrorDir, level=logging.INFO)
+            feedState['listedModified'] = listedDate.isoformat()
+            feedState['dateTimeSynced'] = datetime.now().replace(microsecond=0).isoformat()
+            state[fileName] = feedState
+            # saved after each feed so an interrupted sync does not request finished feeds again
+            _saveMirrorState(mirrorDir, state)
+    finally:
+        _releaseLock(mirrorDir)
+    cntlr.addToLog(_('Mirror {} synced in {} secs: {listed} listed, {downloaded} downloaded, {unchanged} unchanged, {failed} failed').format(
+                        mirrorDir, round(time.perf_counter() - startTime, 3), **stats),
+                    messageCode="RssDB.Info", file=mirrorDir, level=logging.INFO)
+    return stats
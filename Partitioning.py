@@ -0,0 +1,127 @@
+'''Optional range partitioning of filingsInfo and filesInfo on postgres
+
+filingId is made of the feedId (YYYYMM) followed by a 6 digits sequence and fileId of the filingId followed
+by a 3 digits sequence, so partitions by feed month (or year) are declared as ranges of these ids. This keeps
+the primary keys (and the foreign keys from rssItems, filesInfo and formulaeResults) as they are, while
+queries scoped to a feed or a date range add the matching id range (see idRangeClause) to be pruned to
+the relevant partitions.
+
+Partitioning is chosen when the tables are created (cntlr.rssDBPartitionBy or config 'rssDBPartitionBy',
+'month' or 'year') and recorded as a comment on the partitioned table, partitions for new months are
+created when a feed is about to be inserted (ensureFeedPartitions). A default partition catches ids
+outside created partitions. Requires postgres 12 or later.
+'''
+
+import re, logging
+from datetime import date
+
+# table: (partition key, multiplier from feedId to key)
+partitionedTables = {'filingsInfo': ('filingId', 10**6), 'filesInfo': ('fileId', 10**9)}
+partitionGranularities = ('month', 'year')
+partitionMarker = re.compile(r'/\*rssDB:partitionBy\("(\w+)"\)\*/')
+partitionComment = 'rssDB:partitionBy={}'
+
+def requestedPartitioning(cntlr):
+    '''Partition granularity requested for new postgres rssDB, None if not partitioned'''
+    granularity = getattr(cntlr, 'rssDBPartitionBy', None) or cntlr.config.get('rssDBPartitionBy', None)
+    if granularity in (None, '', 'none'):
+        return None
+    if granularity not in partitionGranularities:
+        raise Exception('partition granularity must be one of {}, {} was entered'.format(', '.join(partitionGranularities), granularity))
+    return granularity
+
+def partitionDDL(conn, sql):
+    '''Replaces partition markers in create tables ddl with PARTITION BY clause and adds partitioned tables
+    comments and default partitions, when partitioning is requested'''
+    granularity = requestedPartitioning(conn.cntlr)
+    if not granularity or conn.product != 'postgres' or not partitionMarker.search(sql):
+        return sql
+    sql = partitionMarker.sub(lambda m: 'PARTITION BY RANGE ("{}")'.format(m.group(1)), sql)
+    for table in partitionedTables:
+        sql += ('\nCOMMENT ON TABLE "{0}" IS \'{1}\';\n'
+                'CREATE TABLE IF NOT EXISTS "{0}_default" PARTITION OF "{0}" DEFAULT;\n').format(table, partitionComment.format(granularity))
+    return sql
+
+def tablePartitioning(conn, table=None):
+    '''Returns partition granularity of existing partitioned filingsInfo (or table), None if not partitioned,
+    cached on the connection'''
+    table = table or 'filingsInfo'
+    if not hasattr(conn, '_partitioning'):
+        conn._partitioning = dict()
+    cache = conn._partitioning
+    if table not in cache:
+        granularity = None
+        if conn.product == 'postgres':
+            try:
+                res = conn.execute('''SELECT obj_description(c.oid, 'pg_class') FROM pg_partitioned_table p
+                                        JOIN pg_class c ON c.oid = p.partrelid JOIN pg_namespace n ON n.oid = c.relnamespace
+                                        WHERE n.nspname = '{}' AND c.relname = '{}';'''.format(conn.schema, table), fetch=True)
+                if res:
+                    comment = res[0][0] or ''
+                    granularity = comment.partition('=')[2] if comment.startswith('rssDB:partitionBy=') else 'month'
+            except Exception:
+                conn.rollback()
+        cache[table] = granularity
+    return cache[table]
+
+def partitionBounds(feedId, granularity, multiplier):
+    '''Returns (partition suffix, lower id, upper id) of the partition containing feedId'''
+    feedId = int(feedId)
+    if granularity == 'year':
+        year = feedId // 100
+        return 'y{}'.format(year), year * 100 * multiplier, (year + 1) * 100 * multiplier
+    return 'p{}'.format(feedId), feedId * multiplier, (feedId + 1) * multiplier
+
+def ensureFeedPartitions(conn, feedId):
+    '''Creates partitions of partitioned tables for feedId if missing, returns list of partitions created'''
+    created = []
+    if conn.product != 'postgres':
+        return created
+    if not hasattr(conn, '_knownPartitions'):
+        conn._knownPartitions = set()
+    known = conn._knownPartitions
+    for table, (key, multiplier) in partitionedTables.items():
+        granularity = tablePartitioning(conn, table)
+        if not granularity:
+            continue
+        suffix, lower, upper = partitionBounds(feedId, granularity, multiplier)
+        partition = '{}_{}'.format(table, suffix)
+        if partition in known:
+            continue
+        exists = conn.execute("SELECT 1 FROM pg_tables WHERE schemaname = '{}' AND tablename = '{}';".format(conn.schema, partition), fetch=True)
+        if not exists:
+            try:
+                conn.execute('CREATE TABLE IF NOT EXISTS "{}" PARTITION OF "{}" FOR VALUES FROM ({}) TO ({});'.format(partition, table, lower, upper),
+                                fetch=False, commit=True)
+                created.append(partition)
+                conn.addToLog(_('Created partition {}').format(partition), messageCode="RssDB.Info",
+                                file=conn.conParams.get('database', ''), level=logging.INFO)
+            except Exception as e:
+                # another process may have created the partition in the mean time
+                conn.rollback()
+                if not conn.execute("SELECT 1 FROM pg_tables WHERE schemaname = '{}' AND tablename = '{}';".format(conn.schema, partition), fetch=True):
+                    raise e
+        known.add(partition)
+    return created
+
+def _monthId(d, shift=0):
+    months = d.year * 12 + d.month - 1 + shift
+    return (months // 12) * 100 + months % 12 + 1
+
+def idRangeClause(conn, fromDate=None, toDate=None, feedId=None, table='filingsInfo', alias=None):
+    '''Returns sql condition (starting with " and ") restricting the table id to feedId or to the feeds of
+    a filingDate range (with a month margin), for partition pruning, empty string if not partitioned'''
+    if not tablePartitioning(conn, table):
+        return ''
+    key, multiplier = partitionedTables[table]
+    col = '{}."{}"'.format(alias, key) if alias else '"{}"'.format(key)
+    if feedId is not None:
+        return ' and {0} >= {1} and {0} < {2}'.format(col, int(feedId) * multiplier, (int(feedId) + 1) * multiplier)
+    clause = ''
+    if fromDate:
+        d = date.fromisoformat(str(fromDate)[:10])
+        clause += ' and {} >= {}'.format(col, _monthId(d, -1) * multiplier)
+    if toDate:
+        d = date.fromisoformat(str(toDate)[:10])
+        clause += ' and {} < {}'.format(col, (_monthId(d, 1) + 1) * multiplier)
+    return clause
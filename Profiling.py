@@ -0,0 +1,141 @@
+'''Profiling of rssDB update tasks including tasks running in worker processes
+
+Most of the update work runs in `ProcessPoolExecutor` workers (`_getFeedInfoHelper`, `_filerInformation`),
+where it is not visible to a profiler running in the main process. When profiling is enabled for an update
+each task enables cProfile (and optionally tracemalloc) in the process running it and dumps its own profile
+to the run folder, at the end of the update all task profiles are merged into one pstats file with a text
+report of the top functions and a report of the top allocation sites.
+'''
+
+import os, re, io, json, glob, itertools, tracemalloc, cProfile, pstats
+from datetime import datetime
+
+profileTopN = 30
+_taskCounter = itertools.count()
+# pid of the process with an active task profiler, fork started workers inherit it from the main process
+_profilerPid = None
+
+def newProfileRun(profileDir, traceMemory=False, topN=profileTopN):
+    '''Creates folder for this run profiles under profileDir and returns profile options to pass to tasks'''
+    runDir = os.path.join(profileDir, 'rssDB-profile-{}'.format(datetime.now().strftime('%Y%m%d%H%M%S')))
+    os.makedirs(runDir, exist_ok=True)
+    return {'dir': runDir, 'memory': traceMemory, 'topN': topN}
+
+class taskProfiler:
+    '''Profiles the enclosed task and dumps the profile (and allocation stats) to profileOpts['dir']
+
+    Does nothing when profileOpts is None, if another task profiler is already active in the process
+    (task running in the main process while the main process is profiled) cProfile is skipped as the
+    task is already included in the active profile.
+    '''
+    def __init__(self, profileOpts, taskName, label=''):
+        self.profileOpts = profileOpts
+        self.taskName = taskName
+        self.label = re.sub(r'[^\w.-]', '_', str(label))
+        self.profiler = None
+        self.ownTrace = False
+
+    def start(self):
+        if not self.profileOpts:
+            return self
+        if self.profileOpts.get('memory'):
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.ownTrace = True
+            elif hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        global _profilerPid
+        if _profilerPid == os.getpid():
+            # nested task in a profiled process, enabling another profiler would replace the active one
+            return self
+        self.profiler = cProfile.Profile()
+        try:
+            self.profiler.enable()
+            _profilerPid = os.getpid()
+        except ValueError:
+            self.profiler = None
+        return self
+
+    def stop(self):
+        if not self.profileOpts:
+            return
+        fileBase = os.path.join(self.profileOpts['dir'], '{}-{}-{}-{}'.format(
+                                    self.taskName, self.label, os.getpid(), next(_taskCounter)))
+        global _profilerPid
+        if self.profiler is not None:
+            self.profiler.disable()
+            _profilerPid = None
+            self.profiler.dump_stats(fileBase + '.prof')
+            self.profiler = None
+        if self.profileOpts.get('memory') and tracemalloc.is_tracing():
+            # allocations still alive at the end of the task, task results included
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>')))
+            peak = tracemalloc.get_traced_memory()[1]
+            if self.ownTrace:
+                tracemalloc.stop()
+                self.ownTrace = False
+            topStats = snapshot.statistics('lineno')[:200]
+            with open(fileBase + '.alloc.json', 'w') as f:
+                json.dump({'task': self.taskName, 'label': self.label, 'peak': peak,
+                           'stats': [(str(s.traceback[0]), s.size, s.count) for s in topStats]}, f)
+        return
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+        return False
+
+def mergeProfiles(profileOpts):
+    '''Merges task profiles in profileOpts['dir'] into merged.pstats, writes top functions report to
+    profileReport.txt and top allocation sites report to allocations.txt (if memory was traced),
+    returns dict of the created files paths'''
+    runDir = profileOpts['dir']
+    topN = profileOpts.get('topN', profileTopN)
+    result = {'dir': runDir, 'tasks': 0, 'pstats': None, 'report': None, 'allocations': None}
+    profFiles = sorted(glob.glob(os.path.join(runDir, '*.prof')))
+    if profFiles:
+        stats = pstats.Stats(profFiles[0])
+        for f in profFiles[1:]:
+            stats.add(f)
+        result['tasks'] = len(profFiles)
+        result['pstats'] = os.path.join(runDir, 'merged.pstats')
+        stats.dump_stats(result['pstats'])
+        stream = io.StringIO()
+        stream.write('Merged profile of {} tasks\n\n'.format(len(profFiles)))
+        reportStats = pstats.Stats(result['pstats'], stream=stream)
+        reportStats.strip_dirs()
+        for sortKey in ('cumulative', 'tottime'):
+            stream.write('Top {} functions by {}\n'.format(topN, sortKey))
+            reportStats.sort_stats(sortKey).print_stats(topN)
+        result['report'] = os.path.join(runDir, 'profileReport.txt')
+        with open(result['report'], 'w') as f:
+            f.write(stream.getvalue())
+
+    allocFiles = sorted(glob.glob(os.path.join(runDir, '*.alloc.json')))
+    if allocFiles:
+        sites = dict()
+        peaks = []
+        for fName in allocFiles:
+            with open(fName, 'r') as f:
+                alloc = json.load(f)
+            peaks.append((alloc['peak'], alloc['task'], alloc['label']))
+            for site, size, count in alloc['stats']:
+                total = sites.setdefault(site, [0, 0, 0])
+                total[0] += size
+                total[1] += count
+                total[2] = max(total[2], size)
+        lines = ['Top {} allocation sites (alive at end of task) across {} tasks'.format(topN, len(allocFiles)),
+                 '{:>14} {:>14} {:>10}  {}'.format('total KiB', 'max task KiB', 'blocks', 'site')]
+        for site, (size, count, maxSize) in sorted(sites.items(), key=lambda x: x[1][0], reverse=True)[:topN]:
+            lines.append('{:>14,.1f} {:>14,.1f} {:>10,}  {}'.format(size / 1024, maxSize / 1024, count, site))
+        lines.extend(['', 'Top {} tasks by peak traced memory'.format(topN), '{:>14}  {}'.format('peak MiB', 'task')])
+        for peak, task, label in sorted(peaks, reverse=True)[:topN]:
+            lines.append('{:>14,.1f}  {} {}'.format(peak / (1024 * 1024), task, label))
+        result['allocations'] = os.path.join(runDir, 'allocations.txt')
+        with open(result['allocations'], 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    return result
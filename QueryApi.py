@@ -0,0 +1,267 @@
+'''Read-only JSON query API served by the dashboard flask server
+
+Routes (all GET, under /api):
+    /api/stats                          database stats
+    /api/filings                        search filings (searchFilings params), newest first
+    /api/filings/<filingId>             one filing
+    /api/filings/<filingId>/files       files of a filing
+    /api/filers                         search filers (searchFilers params), by cikNumber
+    /api/filers/<cikNumber>             one filer with its ticker symbols
+
+List routes take `limit` (max 1000) and `cursor` for keyset pagination, response is {"data": [...], "next": cursor},
+`next` is null on the last page. Responses carry an ETag derived from the db lastUpdate and the request, so
+clients can revalidate with If-None-Match (304) and results are kept in an in-process LRU cache until the db
+is updated. Bodies over 1KB are gzipped when the client accepts it.
+
+The threaded server runs each request in a new thread, queries use a small bounded pool of connections
+shared by the request threads (sqlite/postgres use headless connections opened to be used from any thread,
+see Headless), a connection is used by one request at a time and returned to the pool afterwards. Postgres
+queries are serialized because searches switch pg8000 module paramstyle.
+'''
+
+import json, gzip, hashlib, threading, queue, time, logging
+from collections import OrderedDict
+from datetime import datetime, date
+from decimal import Decimal
+from flask import request, Response
+from .Constants import rssTables
+from .RssDB import rssDBConnection
+from .Headless import headlessConnection
+from .Compression import decompressValue
+
+apiPrefix = '/api'
+defaultPageSize = 100
+maxPageSize = 1000
+gzipMinSize = 1024
+# connections shared by request threads
+defaultPoolSize = 4
+# seconds lastUpdate is reused before querying the db again
+lastUpdateTtl = 5
+filingsParams = ('companyName', 'tickerSymbol', 'cikNumber', 'formType', 'assignedSic', 'dateFrom', 'dateTo', 'inlineXBRL')
+filersParams = ('companyName', 'tickerSymbol', 'cikNumber', 'industry')
+
+class apiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _jsonDefault(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return decompressValue(value)
+    return str(value)
+
+def _dumps(obj):
+    return json.dumps(obj, default=_jsonDefault, separators=(',', ':')).encode('utf-8')
+
+def _limit(args):
+    try:
+        limit = int(args.get('limit', defaultPageSize))
+    except ValueError:
+        raise apiError(_('limit must be an integer'))
+    if not 0 < limit <= maxPageSize:
+        raise apiError(_('limit must be between 1 and {}').format(maxPageSize))
+    return limit
+
+class rssDBQueryApi:
+    '''Registers the API routes on flask server, conn is the dashboard connection used as template for
+    the connections of request threads'''
+    def __init__(self, server, conn, cacheSize=256, poolSize=defaultPoolSize):
+        self.conn = conn
+        self.cacheSize = cacheSize
+        self._cache = OrderedDict()
+        self._cacheLock = threading.Lock()
+        self._queryLock = threading.Lock()
+        self.poolSize = max(1, poolSize)
+        self._pool = queue.LifoQueue()
+        self._poolCreated = 0
+        self._poolLock = threading.Lock()
+        self._lastUpdate = (None, 0)
+        routes = [
+            ('/stats', 'stats', self.stats),
+            ('/filings', 'filings', self.filings),
+            ('/filings/<int:filingId>', 'filing', self.filing),
+            ('/filings/<int:filingId>/files', 'filingFiles', self.filingFiles),
+            ('/filers', 'filers', self.filers),
+            ('/filers/<cikNumber>', 'filer', self.filer),
+        ]
+        for rule, name, handler in routes:
+            server.add_url_rule(apiPrefix + rule, 'rssDBApi_' + name, self._view(handler), methods=['GET'])
+
+    def _newConn(self):
+        return headlessConnection(self.conn.conParams, cntlr=self.conn.cntlr) or \
+                rssDBConnection(self.conn.cntlr, **{k:v for k,v in self.conn.conParams.items() if not k == 'cntlr'})
+
+    def acquireConn(self):
+        '''Returns a pooled connection (opened if the pool has less than poolSize), waits for one to be released
+        when all are in use'''
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._poolLock:
+            create = self._poolCreated < self.poolSize
+            if create:
+                self._poolCreated += 1
+        if create:
+            try:
+                return self._newConn()
+            except Exception as e:
+                with self._poolLock:
+                    self._poolCreated -= 1
+                raise e
+        return self._pool.get()
+
+    def releaseConn(self, conn, discard=False):
+        if discard:
+            with self._poolLock:
+                self._poolCreated -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        self._pool.put(conn)
+
+    def closeConnections(self):
+        '''Closes the connections in the pool'''
+        while True:
+            try:
+                self.releaseConn(self._pool.get_nowait(), discard=True)
+            except queue.Empty:
+                break
+
+    def _query(self, func, *args, **kwargs):
+        '''Runs func(conn, *args, **kwargs) with a pooled connection, the dashboard connection in the main thread'''
+        if threading.current_thread() is threading.main_thread():
+            return func(self.conn, *args, **kwargs)
+        conn = self.acquireConn()
+        discard = False
+        try:
+            if conn.product == 'postgres':
+                with self._queryLock:
+                    return func(conn, *args, **kwargs)
+            return func(conn, *args, **kwargs)
+        except Exception as e:
+            # connection may be unusable (closed by server or left in a failed transaction)
+            discard = not self._connOk(conn)
+            raise e
+        finally:
+            self.releaseConn(conn, discard)
+
+    @staticmethod
+    def _connOk(conn):
+        if getattr(conn, 'isClosed', False):
+            return False
+        try:
+            conn.rollback()
+            return conn.checkConnection() if conn.product != 'mongodb' else True
+        except Exception:
+            return False
+
+    def lastUpdate(self):
+        value, checked = self._lastUpdate
+        if checked and time.monotonic() - checked < lastUpdateTtl:
+            return value
+        def _get(conn):
+            if conn.product == 'mongodb':
+                res = conn.dbConn[rssTables[6]].find_one({'id': 0}, {'_id': 0, 'lastUpdate': 1})
+                return str(res['lastUpdate']) if res else ''
+            res = conn.execute('SELECT max("lastUpdate") FROM "{}"'.format(rssTables[6]), fetch=True, close=False)
+            return str(res[0][0]) if res else ''
+        value = self._query(_get)
+        self._lastUpdate = (value, time.monotonic())
+        return value
+
+    def _cacheGet(self, key, lastUpdate):
+        with self._cacheLock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] != lastUpdate:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry
+
+    def _cachePut(self, key, entry):
+        with self._cacheLock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cacheSize:
+                self._cache.popitem(last=False)
+
+    def _view(self, handler):
+        def view(**kwargs):
+            try:
+                lastUpdate = self.lastUpdate()
+                key = (request.path, tuple(sorted(request.args.items(multi=True))))
+                entry = self._cacheGet(key, lastUpdate)
+                if entry is None:
+                    body = _dumps(handler(request.args, **kwargs))
+                    etag = hashlib.sha1(repr((lastUpdate, key)).encode('utf-8')).hexdigest()
+                    entry = [lastUpdate, etag, body, None]
+                    self._cachePut(key, entry)
+            except apiError as e:
+                return Response(_dumps({'error': str(e)}), status=e.status, mimetype='application/json')
+            except Exception as e:
+                self.conn.addToLog(_('API request {} failed:\n{}').format(request.full_path, str(e)), messageCode="RssDB.Error",
+                                    file=self.conn.conParams.get('database', ''), level=logging.ERROR)
+                return Response(_dumps({'error': str(e)}), status=500, mimetype='application/json')
+            _lastUpdate, etag, body, gzBody = entry
+            headers = {'ETag': '"{}"'.format(etag), 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+            if request.if_none_match.contains(etag):
+                return Response(status=304, headers=headers)
+            if len(body) > gzipMinSize and request.accept_encodings['gzip']:
+                if gzBody is None:
+                    gzBody = entry[3] = gzip.compress(body, 6)
+                body = gzBody
+                headers['Content-Encoding'] = 'gzip'
+            return Response(body, status=200, mimetype='application/json', headers=headers)
+        view.__name__ = handler.__name__
+        return view
+
+    def stats(self, args):
+        return {'data': self._query(lambda conn: conn.getDbStats()['dictResult'])}
+
+    def filings(self, args):
+        limit = _limit(args)
+        kwargs = {k: args[k] for k in filingsParams if args.get(k)}
+        cursor = args.get('cursor')
+        if cursor:
+            if not cursor.isdigit():
+                raise apiError(_('cursor must be a filingId'))
+            kwargs['beforeFilingId'] = int(cursor)
+        if kwargs.get('inlineXBRL') and kwargs['inlineXBRL'].lower() not in ('yes', 'no'):
+            raise apiError(_('inlineXBRL must be yes or no'))
+        # one extra row tells if there is a next page
+        rows = self._query(lambda conn: conn.searchFilings(limit=limit + 1, **kwargs)['filings'])
+        nextCursor = rows[limit - 1]['filingId'] if len(rows) > limit else None
+        return {'data': rows[:limit], 'next': nextCursor}
+
+    def filing(self, args, filingId):
+        rows = self._query(lambda conn: conn.getById([filingId], rssTables[1]))
+        if not rows:
+            raise apiError(_('Filing {} not found').format(filingId), 404)
+        return {'data': rows[0]}
+
+    def filingFiles(self, args, filingId):
+        return {'data': self._query(lambda conn: conn.getById([filingId], rssTables[2], 'filingId'))}
+
+    def filers(self, args):
+        limit = _limit(args)
+        kwargs = {k: args[k] for k in filersParams if args.get(k)}
+        if args.get('cursor'):
+            kwargs['afterCikNumber'] = args['cursor']
+        rows = self._query(lambda conn: conn.searchFilers(limit=limit + 1, **kwargs)['filers'])
+        nextCursor = rows[limit - 1]['cikNumber'] if len(rows) > limit else None
+        return {'data': rows[:limit], 'next': nextCursor}
+
+    def filer(self, args, cikNumber):
+        rows = self._query(lambda conn: conn.searchFilers(cikNumber=cikNumber, limit=1)['filers'])
+        if not rows:
+            raise apiError(_('Filer {} not found').format(cikNumber), 404)
+        return {'data': rows[0]}
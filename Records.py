@@ -0,0 +1,105 @@
+'''Compact row records for rows extracted from rss feeds
+
+One record class per table with `__slots__` of the table columns (rssCols order), used from the feed
+parser (getRssItemInfo, getFilesInfo) to the db writers instead of an OrderedDict per row. Records keep
+dict style access (`row['col']`, get, keys, items) for existing consumers, give the column ordered
+tuple for sql inserts directly (astuple) and pickle as the class and a values tuple when results are
+returned from worker processes.
+'''
+
+from collections import OrderedDict
+from .Constants import rssCols, rssTables
+
+# columns set by the parser that are not part of rssCols (these use db defaults on sql insert)
+extraCols = {rssTables[2]: ['duplicate']}
+
+class rssRecord:
+    '''Base of table records, subclasses are created by makeRecordClass'''
+    __slots__ = ()
+    table = None
+    cols = ()
+
+    def __init__(self, *values, **kwargs):
+        for col, value in zip(self.cols, values):
+            object.__setattr__(self, col, value)
+        for col in self.cols[len(values):]:
+            object.__setattr__(self, col, kwargs.pop(col, None))
+        if kwargs:
+            raise KeyError('Unknown column(s) {} for {}'.format(', '.join(kwargs), self.table))
+
+    @classmethod
+    def fromTuple(cls, values):
+        return cls(*values)
+
+    def __reduce__(self):
+        return (self.__class__.fromTuple, (self.astuple(),))
+
+    def __getitem__(self, col):
+        # only columns, not methods or class attributes such as keys or table
+        if col not in self.cols:
+            raise KeyError(col)
+        return getattr(self, col)
+
+    def __setitem__(self, col, value):
+        if col not in self.cols:
+            raise KeyError(col)
+        setattr(self, col, value)
+
+    def __contains__(self, col):
+        return col in self.cols
+
+    def __iter__(self):
+        return iter(self.cols)
+
+    def __len__(self):
+        return len(self.cols)
+
+    def __eq__(self, other):
+        if isinstance(other, rssRecord):
+            return self.table == other.table and self.astuple() == other.astuple()
+        return NotImplemented
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, ', '.join('{}={!r}'.format(c, getattr(self, c)) for c in self.cols))
+
+    def get(self, col, default=None):
+        return getattr(self, col) if col in self.cols else default
+
+    def keys(self):
+        return self.cols
+
+    def values(self):
+        return self.astuple()
+
+    def items(self):
+        return zip(self.cols, self.astuple())
+
+    def astuple(self, cols=None):
+        '''Values in cols order (defaults to table columns)'''
+        if cols is None or cols is self.cols:
+            return tuple(getattr(self, c) for c in self.cols)
+        return tuple(getattr(self, c) for c in cols)
+
+    def asdict(self):
+        return OrderedDict(zip(self.cols, self.astuple()))
+
+    def replace(self, **kwargs):
+        '''Returns copy of record with kwargs columns replaced'''
+        new = self.__class__(*self.astuple())
+        for col, value in kwargs.items():
+            new[col] = value
+        return new
+
+def makeRecordClass(table):
+    cols = tuple(rssCols[table]) + tuple(extraCols.get(table, []))
+    name = table + 'Record'
+    cls = type(name, (rssRecord,), {'__slots__': cols, 'table': table, 'cols': cols, '__module__': __name__, '__qualname__': name})
+    return cls
+
+filingsInfoRecord = makeRecordClass(rssTables[1])
+filesInfoRecord = makeRecordClass(rssTables[2])
+rssItemsRecord = makeRecordClass(rssTables[4])
+
+def asDicts(rows):
+    '''Converts records in rows to dicts (for writers that need mappings such as pymongo)'''
+    return [x.asdict() if isinstance(x, rssRecord) else x for x in rows]
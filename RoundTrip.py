@@ -0,0 +1,137 @@
+'''Round trip checks of rssDB operations that change stored rows in place
+
+compressExistingRows rewrites values of existing rows and storeColdFeed deletes rows from the database once
+they are in the cold storage file, roundTripCheck writes a small synthetic feed uncompressed to an in-memory
+sqlite rssDB, runs these operations (then restores the feed from cold storage) and checks that the stored
+values changed as expected and that rows read back are the rows written, so a change that loses data is
+caught before it runs on a real database.
+'''
+
+import os, shutil, tempfile, logging
+from collections import OrderedDict
+from .Constants import rssTables, rssCols, pathToSQL
+from .Compression import compressExistingRows, resolveCodec, defaultCodec, isCompressed, decompressValue
+from .ColdStorage import filingIdMultiplier, fileIdMultiplier, coldTables, coldFeeds, fetchColdRows, storeColdFeed, restoreColdFeed
+from .RssDB import rssDBConnection, sqlScriptsFiles
+
+def syntheticFeedRows(feedId=200501, items=5, filesPerItem=3):
+    '''Returns {table: [row dicts]} of feedsInfo, filingsInfo, filesInfo and rssItems rows of a feed'''
+    month = '{}-{}-01'.format(str(feedId)[:4], str(feedId)[4:])
+    rows = OrderedDict((table, []) for table in (rssTables[0], rssTables[1], rssTables[2], rssTables[4]))
+    def newRow(table, **values):
+        row = OrderedDict((c, None) for c in rssCols[table])
+        row.update(values)
+        rows[table].append(row)
+    newRow(rssTables[0], feedId=feedId, feedMonth=month, title='Round trip feed {}'.format(feedId),
+           link='https://www.sec.gov/Archives/edgar/monthly/xbrlrss-{}.xml'.format(month[:7]),
+           feedLink='https://www.sec.gov/Archives/edgar/monthly/', language='en-us', pubDate=month + ' 00:00:00')
+    for i in range(items):
+        filingId = feedId * filingIdMultiplier + i
+        accessionNumber = '0000000000-{}-{:06d}'.format(str(feedId)[2:4], i)
+        # non ascii names and a repetitive xml like the real rss items
+        companyName = 'Société Générale Ünternehmen {} Inc'.format(i)
+        newRow(rssTables[1], filingId=filingId, feedId=feedId, companyName=companyName, formType='10-K',
+               inlineXBRL=i % 2, pubDate=month + ' 16:30:00', cikNumber=str(1000 + i).zfill(10), accessionNumber=accessionNumber)
+        for j in range(filesPerItem):
+            newRow(rssTables[2], fileId=feedId * fileIdMultiplier + i * 1000 + j, filingId=filingId, feedId=feedId,
+                   accessionNumber=accessionNumber, sequence=j + 1, file='file{}.xml'.format(j), type='EX-101.INS' if j == 0 else 'EX-101.SCH',
+                   size=1000 * (j + 1), description='XBRL – document {}'.format(j), inlineXBRL=i % 2, url='https://www.sec.gov/file{}.xml'.format(j))
+        newRow(rssTables[4], filingId=filingId,
+               rssItem='<item><title>{}</title>{}</item>'.format(companyName, ''.join(
+                   '<edgar:xbrlFile edgar:sequence="{}" edgar:file="file{}.xml"/>'.format(j + 1, j) for j in range(filesPerItem)) * 20))
+    return rows
+
+def _compareRows(expected, actual, idCol, step):
+    actual = {x[idCol]: x for x in actual}
+    for row in expected:
+        found = actual.pop(row[idCol], None)
+        if found is None:
+            raise Exception(_('Round trip check failed after {}: {} {} is missing').format(step, idCol, row[idCol]))
+        for col, value in row.items():
+            if found.get(col) != value:
+                raise Exception(_('Round trip check failed after {}: {} of {} {} is {!r}, {!r} was written').format(
+                                    step, col, idCol, row[idCol], found.get(col), value))
+    if actual:
+        raise Exception(_('Round trip check failed after {}: {} {} was not written').format(step, idCol, ', '.join(str(x) for x in actual)))
+
+def compressionRoundTrip(conn, rows, codec):
+    '''Compresses rssItems rows written uncompressed and checks stored values are compressed and read back
+    as written, returns stats of compressExistingRows'''
+    table = rssTables[4]
+    filingIds = [x['filingId'] for x in rows[table]]
+    stats = compressExistingRows(conn, codec, vacuum=False)
+    stored = dict(conn.execute('SELECT "filingId", "rssItem" FROM "{}" WHERE "filingId" IN ({})'.format(
+                                table, ', '.join(str(x) for x in filingIds)), fetch=True, close=False))
+    for row in rows[table]:
+        value = stored.get(row['filingId'])
+        if not isCompressed(value):
+            raise Exception(_('Round trip check failed after compression: rssItem of filingId {} is not compressed').format(row['filingId']))
+        if decompressValue(value) != row['rssItem']:
+            raise Exception(_('Round trip check failed after compression: rssItem of filingId {} does not decompress to the value written').format(
+                                row['filingId']))
+    _compareRows(rows[table], conn.getById(filingIds, table), 'filingId', 'compression')
+    return stats
+
+def coldStorageRoundTrip(conn, rows, folder):
+    '''Moves the feed of rows to cold storage in folder and restores it, checks rows are read from the cold
+    file while stored and are back in the database as written after restore, returns stats of both'''
+    feedId = rows[rssTables[0]][0]['feedId']
+    filingIds = [x['filingId'] for x in rows[rssTables[1]]]
+    idCols = {rssTables[2]: 'fileId', rssTables[4]: 'filingId'}
+    # duplicate flag is not an inserted column of filesInfo, restoreColdFeed sets it with an update
+    expected = {rssTables[2]: [OrderedDict(x, duplicate=1 if i == 0 else 0) for i, x in enumerate(rows[rssTables[2]])],
+                rssTables[4]: rows[rssTables[4]]}
+    conn.execute('UPDATE "{}" SET "duplicate" = 1 WHERE "fileId" = {}'.format(rssTables[2], expected[rssTables[2]][0]['fileId']),
+                    fetch=False, commit=True)
+    result = OrderedDict()
+    result['stored'] = storeColdFeed(conn, feedId, folder)
+    path = coldFeeds(conn, [feedId]).get(feedId, (None,))[0]
+    if not path or not os.path.exists(path):
+        raise Exception(_('Round trip check failed after storing in cold storage: feed {} has no cold storage file').format(feedId))
+    for table in coldTables:
+        left = conn.execute('SELECT COUNT(*) FROM "{}" WHERE "filingId" IN ({})'.format(table, ', '.join(str(x) for x in filingIds)),
+                            fetch=True, close=False)[0][0]
+        if left:
+            raise Exception(_('Round trip check failed after storing in cold storage: {} row(s) of feed {} left in {}').format(left, feedId, table))
+        _compareRows(expected[table], fetchColdRows(conn, table, filingIds), idCols[table], 'storing in cold storage')
+        _compareRows(expected[table], conn.getById(filingIds, table, idCol='filingId'), idCols[table], 'storing in cold storage')
+    result['restored'] = restoreColdFeed(conn, feedId)
+    if coldFeeds(conn, [feedId]) or os.path.exists(path):
+        raise Exception(_('Round trip check failed after restoring from cold storage: feed {} is still in cold storage').format(feedId))
+    for table in coldTables:
+        _compareRows(expected[table], conn.getById(filingIds, table, idCol='filingId'), idCols[table], 'restoring from cold storage')
+    return result
+
+def roundTripCheck(cntlr, codec=None, folder=None):
+    '''Runs round trip checks on a synthetic feed in an in-memory sqlite rssDB, returns dict of results,
+    raises if rows read back differ from rows written
+
+    codec: compression codec to check, defaults to --rssDBcompression (zstd or zlib if it is none)
+    folder: cold storage folder, defaults to a temporary folder removed after the check
+    '''
+    codec = resolveCodec(codec or getattr(cntlr, 'rssDBCompression', None))
+    if codec == 'none':
+        codec = defaultCodec()
+    rows = syntheticFeedRows()
+    result = OrderedDict()
+    coldFolder = folder or tempfile.mkdtemp(prefix='rssDBroundTrip')
+    conn = rssDBConnection(cntlr, database=':memory:', product='sqlite')
+    try:
+        # tables from the ddl script only, create (createDB) also downloads filers and tickers from SEC
+        with open(os.path.join(pathToSQL, sqlScriptsFiles['sqlite'][0]), 'r', encoding='utf-8') as f:
+            conn.conn.executescript(f.read())
+        conn.refreshSchemaCache()
+        # written uncompressed as in databases created before compression
+        conn.compression = 'none'
+        for table, tableRows in rows.items():
+            conn.insertUpdateRssDB(tableRows, table, 'insert')
+        conn.compression = codec
+        result['compression'] = compressionRoundTrip(conn, rows, codec)[rssTables[4]]
+        result['coldStorage'] = coldStorageRoundTrip(conn, rows, coldFolder)
+    finally:
+        conn.close()
+        if not folder:
+            shutil.rmtree(coldFolder, ignore_errors=True)
+    cntlr.addToLog(_('Round trip checks passed ({}): {}').format(codec, ', '.join(result)), messageCode="RssDB.Info",
+                    file=__name__, level=logging.INFO)
+    return result
@@ -4,21 +4,30 @@ implemented database products:
     - Postgresql
     - MongoDB
 """
-import sys, os, re, time, glob, io, json, gettext, gc, tempfile, logging, calendar, concurrent.futures, threading, traceback, pickle
+import sys, os, re, time, glob, io, json, gettext, gc, tempfile, logging, calendar, concurrent.futures, threading, traceback, pickle, importlib.util
 from math import isnan, isinf
 from decimal import Decimal
-from tkinter.filedialog import SaveAs
 from concurrent.futures import as_completed
 from collections import OrderedDict
 from datetime import datetime, date, timedelta
 from dateutil import parser, tz
 from calendar import monthrange
-from lxml import html, etree
 from urllib import request
-from arelle import ModelXbrl, XmlUtil
+from arelle import ModelXbrl
 from arelle.PythonUtil import flattenSequence
-from arelle.CntlrCmdLine import CntlrCmdLine
 from .Constants import pathToSQL, wait_duration, DBTypes, rssTables, rssCols, RSSFEEDS
+from .Metrics import rssDBMetrics
+from .Profiling import taskProfiler
+from .Compression import resolveCodec, blobCodec, compressRows, mongoStorageOptions
+from .SqliteProfile import resolveSqliteProfile, applySqlitePragmas, restorePendingIndexes
+from .Partitioning import partitionDDL, ensureFeedPartitions, idRangeClause
+from .Sharding import requestedShardYears, initShards, attachShards, ensureFeedShard, shardRows
+from .ColdStorage import coldTables, fetchColdRows
+from .FeedManifest import loadManifest, listedFeedUnchanged, recordFeedsManifest
+from .Records import rssRecord, asDicts
+from .SearchCache import cachedSearch
+from .SqlQueries import rssSqlQueries, _isCmdLineCntlr, dbSizeStr
+from .Industry import splitSicCodes, mongoSicCodes, sicDivisions
 from .CommonFunctions import updateCikTickerMapping, _populateFilersInfo, _doAll,\
     getFilerInformation, _getMonthlyFeedsLinks, _getFeedInfo, getRssItemInfo, _startDBReport
 
@@ -31,20 +40,24 @@ except:
         from plugin.xbrlDB.SqlDb import SqlDbConnection, XPDBException, pg8000
 
 try:
-    from arellepy.HelperFuncs import chkToList, convert_size, xmlFileFromString
-    from arellepy.CntlrPy import CntlrPy, subProcessCntlrPy, renderEdgarReportsFromRssItems
-    from arellepy.LocalViewerStandalone import initViewer
+    from arellepy.HelperFuncs import chkToList
+    from arellepy.CntlrPy import subProcessCntlrPy
 except:
-    from .arellepy.HelperFuncs import chkToList, convert_size, xmlFileFromString
-    from .arellepy.CntlrPy import CntlrPy, subProcessCntlrPy, renderEdgarReportsFromRssItems
-    from .arellepy.LocalViewerStandalone import initViewer
+    from .arellepy.HelperFuncs import chkToList
+    from .arellepy.CntlrPy import subProcessCntlrPy
 
-hasMongoDB = True
+# pymongo is imported when a mongodb connection is made (see _importPymongo)
+hasMongoDB = importlib.util.find_spec('pymongo') is not None
+MongoClient = ASCENDING = DESCENDING = None
 
-try:
-    from pymongo import MongoClient, ASCENDING, DESCENDING
-except Exception as e:
-    hasMongoDB = False
+def _importPymongo():
+    global hasMongoDB, MongoClient, ASCENDING, DESCENDING
+    try:
+        from pymongo import MongoClient, ASCENDING, DESCENDING
+        hasMongoDB = True
+    except Exception as e:
+        hasMongoDB = False
+    return hasMongoDB
 
 TRACESQLFILE = None
 
@@ -54,6 +67,12 @@ sqlScriptsFiles = {
 }
 
 mongodbSchemaFile = os.path.join(pathToSQL, 'mongodbSchema.json')
+# (collection, keys, name) of indexes supporting report aggregations, filingsInfo report match is
+# on (duplicate, filingDate) and grouped by the remaining keys so the aggregation is covered by the index
+mongoReportIndexes = [
+    (rssTables[1], ['duplicate', 'filingDate', 'formType', 'assignedSic', 'feedId', 'cikNumber', 'inlineXBRL'], 'report_duplicate_filingDate'),
+    (rssTables[3], ['businessState'], 'report_businessState'),
+]
 mongodbIndustryClassificationFile = os.path.join(pathToSQL, 'mongodbIndustryClassification.json')
 
 MAKEDOTS_RSSDB = False 
@@ -89,6 +108,7 @@ def rssDBConnection(cntlr, **kwargs):
         schema: in case of postgres a schema must to be provided
         createSchema: in case of prostgres, whether to create a schema and tables (initialize tables)
         createDB: whether to create database and tables, not relevant to postgres    
+        sqliteProfile: in case of sqlite, pragmas profile one of 'performance', 'safe', 'none' (see SqliteProfile)
     '''
     gettext.install('arelle')
     # cntlr.addToLog('Platform :{} Platform: {} GUI: {}'.format(sys.platform.lower().startswith('win'), sys.platform.lower(), cntlr.hasGui) )
@@ -103,6 +123,8 @@ def rssDBConnection(cntlr, **kwargs):
         'timeout': kwargs.get('timeout', None), 'product': kwargs.get('product', None), 'schema': kwargs.get('schema', None),
         'createSchema': kwargs.get('createSchema', None), 'createDB': kwargs.get('createDB', None),
         }
+    if kwargs.get('product') == 'sqlite':
+        conParams['sqliteProfile'] = kwargs.get('sqliteProfile', None)
 
     dbConn = None
     if kwargs.get('product') in ('postgres', 'sqlite'):
@@ -114,11 +136,7 @@ def rssDBConnection(cntlr, **kwargs):
         for p in rssDBaddToSysPath:
             if not p in sys.path:
                 sys.path.append(p)
-        try:
-            from pymongo import MongoClient, ASCENDING, DESCENDING
-            hasMongoDB = True
-        except Exception as e:
-            hasMongoDB = False        
+        _importPymongo()
         pyMongoPath = []
         fail_msg = _("No path was provided")
         fail_msg_2 = _('pymongo package required to use this feature is not available')
@@ -168,8 +186,12 @@ def rssDBConnection(cntlr, **kwargs):
     return dbConn
 
 def _getFeedInfoHelper(setConfigDir, targetResDir, conParams, feedLink, lastModifiedDate, isNew, product, 
-                        insertIntoDB=False, reloadCache=False, getFiles=True, getXML=False, returnInfo=False, isLatest=False, q=None):
+                        insertIntoDB=False, reloadCache=False, getFiles=True, getXML=False, returnInfo=False, isLatest=False, q=None, profileOpts=None):
     """helper function for concurrent executor gets feed info ready to insert in db"""
+    if profileOpts:
+        with taskProfiler(profileOpts, 'feed', os.path.basename(feedLink)):
+            return _getFeedInfoHelper(setConfigDir, targetResDir, conParams, feedLink, lastModifiedDate, isNew, product, insertIntoDB,
+                                        reloadCache, getFiles, getXML, returnInfo, isLatest, q)
     import gettext, datetime, time
     conn = None
     cntlr = None
@@ -192,6 +214,7 @@ def _getFeedInfoHelper(setConfigDir, targetResDir, conParams, feedLink, lastModi
     if isLatest:
         conn.showStatus(_('Getting Latest Filings'))
 
+    feedLabel = os.path.basename(feedLink)
     info = conn.getFeedInfo(feedLink, lastModifiedDate, isNew, reloadCache, getFiles, getXML)
     
     flatenFiles = []
@@ -200,6 +223,12 @@ def _getFeedInfoHelper(setConfigDir, targetResDir, conParams, feedLink, lastModi
         info[rssTables[2]] = flatenFiles
 
     insertUpdateStats = {x:{'insert':0, 'update':0} for x in rssTables} 
+    if insertIntoDB and product == 'postgres':
+        # partitions for a feed month seen for the first time
+        ensureFeedPartitions(conn, info[rssTables[0]][rssCols[rssTables[0]][0]])
+    elif insertIntoDB and product == 'sqlite':
+        # shard of the feed year if sharded, so that the feed is written to the shard only
+        ensureFeedShard(conn, info[rssTables[0]][rssCols[rssTables[0]][0]])
     _feedInfo = dict()
     if isLatest: # do not re-insert feedsInfo entry if it exists
         feedsIds = conn.getExistingFeeds()
@@ -233,7 +262,13 @@ def _getFeedInfoHelper(setConfigDir, targetResDir, conParams, feedLink, lastModi
 
     _feed = {rssTables[0]: info[rssTables[0]]} if isLatest else None
     results = {'link': feedLink,'stat': insertUpdateStats, 'feed': _feed}
+    if insertIntoDB:
+        # recorded in the feeds manifest by the parent process once all feeds are processed
+        results['manifest'] = info.pop('manifest', None)
     
+    conn.metrics.observe('feed', time.perf_counter() - startAllTime, feed=feedLabel)
+    conn.metrics.incr('feeds', 1)
+    results['metrics'] = conn.metrics.export()
     results['logMsg'] = _("Finished extracting data and inserting into db {} secs").format(round(time.perf_counter() - startAllTime, 3))
     conn.addToLog(results['logMsg'], messageCode="RssDB.Info", file=feedLink,  level=logging.INFO)
     
@@ -260,8 +295,10 @@ def _updateRssFeeds(conn, loc=None, getRssItems=False, updateDB=False, maxWorker
         # use half of available cpus
         maxWorkers = os.cpu_count()/2
     conParams = conn.conParams
+    profileOpts = getattr(conn, 'profileOpts', None)
     startTime = time.perf_counter()
-    links = conn.getMonthlyFeedsLinks(loc=loc, maxWorkers=maxWorkers, last=last, dateFrom=dateFrom, dateTo=dateTo)
+    with conn.metrics.span('links'):
+        links = conn.getMonthlyFeedsLinks(loc=loc, maxWorkers=maxWorkers, last=last, dateFrom=dateFrom, dateTo=dateTo)
     feeds = []
     if getRssItems:
         setConfigDir = os.path.dirname(conn.cntlr.userAppDir)
@@ -282,14 +319,17 @@ def _updateRssFeeds(conn, loc=None, getRssItems=False, updateDB=False, maxWorker
                 t.start()
             _links = [(x['link'], x.get('lastModifiedDate', None), x.get('isNew', None)) for x in links]
             for l, d, n in _links:
-                res = _getFeedInfoHelper(setConfigDir, targetResDir, conParams, l, d, n, conn.product, updateDB, reloadCache, getFiles, getXML, returnInfo, False, q)
+                conn.metrics.gauge('queue_depth', len(_links) - len(feeds), queue='feeds')
+                res = _getFeedInfoHelper(setConfigDir, targetResDir, conParams, l, d, n, conn.product, updateDB, reloadCache, getFiles, getXML, returnInfo, False, q, profileOpts)
+                conn.metrics.merge(res.pop('metrics', None))
                 feeds.append(res)
                 conn.addToLog(res['logMsg'], messageCode="RssDB.Info", file=l,  level=logging.INFO)
             
             latest = None
             if includeLatest:
                 latest = _getFeedInfoHelper(setConfigDir, targetResDir, conParams, RSSFEEDS['US SEC All Filings'], datetime.min, False, conn.product, updateDB,
-                                                    reloadCache, getFiles, getXML, returnInfo, True, q)
+                                                    reloadCache, getFiles, getXML, returnInfo, True, q, profileOpts)
+                conn.metrics.merge(latest.pop('metrics', None))
                 conn.addToLog('Latest: ' + latest['logMsg'], messageCode="RssDB.Info", file=RSSFEEDS['US SEC All Filings'],  level=logging.INFO)
                 feeds.append(latest)
             if latest:
@@ -322,7 +362,7 @@ def _updateRssFeeds(conn, loc=None, getRssItems=False, updateDB=False, maxWorker
                 a13 = [False] * argLen
                 # _feeds = executor.map(_getFeedInfoHelper, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12, a13, [q] * argLen)
                 argZ = zip(a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12, a13, [q] * argLen)
-                __feeds = [executor.submit(_getFeedInfoHelper, *x) for x in zip(a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12, a13, [None] * argLen) ]
+                __feeds = [executor.submit(_getFeedInfoHelper, *x, profileOpts=profileOpts) for x in zip(a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12, a13, [None] * argLen) ]
                 _feeds = []
                 
                 if conn.cntlr.hasGui:
@@ -330,16 +370,20 @@ def _updateRssFeeds(conn, loc=None, getRssItems=False, updateDB=False, maxWorker
                     t = threading.Thread(target=dotted, args=(conn.cntlr,), daemon=True)
                     t.start()
 
+                conn.metrics.gauge('queue_depth', len(__feeds), queue='feeds')
                 for x in as_completed(__feeds):
                     conn.addToLog(x.result()['logMsg'], messageCode="RssDB.Info", file=x.result()['link'],  level=logging.INFO)
+                    conn.metrics.merge(x.result().pop('metrics', None))
                     _feeds.append(x.result())
+                    conn.metrics.gauge('queue_depth', len(__feeds) - len(_feeds), queue='feeds')
                 feeds = list(_feeds)
                 latest = None
                 if includeLatest:
                     _latest = executor.submit(_getFeedInfoHelper, setConfigDir, targetResDir, conParams, RSSFEEDS['US SEC All Filings'],
                                                 datetime.min, False, conn.product, updateDB,
-                                                reloadCache, getFiles, getXML, returnInfo, True, None)
+                                                reloadCache, getFiles, getXML, returnInfo, True, None, profileOpts)
                     latest = _latest.result()
+                    conn.metrics.merge(latest.pop('metrics', None))
                     conn.addToLog('Latest: ' + latest['logMsg'], messageCode="RssDB.Info", file=RSSFEEDS['US SEC All Filings'],  level=logging.INFO)
                     feeds.append(latest)
                 if latest:
@@ -353,6 +397,10 @@ def _updateRssFeeds(conn, loc=None, getRssItems=False, updateDB=False, maxWorker
                     links.append(latestLink)
     if MAKEDOTS_RSSDB:
         MAKEDOTS_RSSDB = False
+    if getRssItems and updateDB:
+        # shards created by the workers
+        attachShards(conn)
+        recordFeedsManifest(conn, links, feeds)
     summaryList = [x['stat'] for x in feeds]
     summaryTotals = dict()
     for t in rssTables:
@@ -376,13 +424,15 @@ def _updateRssFeeds(conn, loc=None, getRssItems=False, updateDB=False, maxWorker
     conn.addToLog(_msg, messageCode="RssDB.Info", file=conn.conParams.get('database',''),  level=logging.INFO)
     return result
 
-class rssSqlDbConnection(SqlDbConnection):
+class rssSqlDbConnection(rssSqlQueries, SqlDbConnection):
     """Few modifications to sqlDBConnection class"""
-    def __init__(self, cntlr, user, password, host, port, database, timeout, product, schema, createSchema=False, createDB=False):
+    def __init__(self, cntlr, user, password, host, port, database, timeout, product, schema, createSchema=False, createDB=False, sqliteProfile=None):
         self.cntlr = cntlr
         self.autoUpdateSet = False
         self.updateStarted = False
         self.updateStopped = False
+        self.metrics = rssDBMetrics()
+        self.compression = resolveCodec(getattr(cntlr, 'rssDBCompression', None))
         _modelXbrl = cntlr.modelManager.modelXbrl
         if not _modelXbrl:
             _modelXbrl = ModelXbrl.ModelXbrl(cntlr.modelManager)
@@ -421,6 +471,10 @@ class rssSqlDbConnection(SqlDbConnection):
                 raise e
         self.schema = schema
         self.conParams['schema'] = schema
+        if product == 'sqlite':
+            self.sqliteProfile, self.sqlitePragmas = resolveSqliteProfile(self, sqliteProfile)
+            self.conParams['sqliteProfile'] = self.sqliteProfile
+            self.pragmaValues = applySqlitePragmas(self, self.sqlitePragmas)
 
         if product=='postgres' and createSchema:
             chkTables = self.verifyTables(createTables=False, dropPriorTables=False)
@@ -431,6 +485,14 @@ class rssSqlDbConnection(SqlDbConnection):
             chkTables = self.verifyTables(createTables=False, dropPriorTables=False)
             if not chkTables:
                 self.create([os.path.join(pathToSQL, f) for f in sqlScriptsFiles[self.product]], dropPriorTables=False)
+                _shardYears = requestedShardYears(cntlr)
+                if _shardYears:
+                    initShards(self, _shardYears)
+
+        if product == 'sqlite':
+            # indexes left deferred by an interrupted bulk load
+            restorePendingIndexes(self)
+            attachShards(self)
 
         chk = self.checkConnection()
         if not chk:
@@ -439,22 +501,11 @@ class rssSqlDbConnection(SqlDbConnection):
             return
 
 
-    def getFormulae(self):
-        qry = self.execute('select "formulaId", "description", "fileName", "dateTimeAdded" from formulae', fetch=True, close=False)
-        cols = [x[0].decode() if type(x[0]) is bytes else x[0] for x in self.cursor.description]
-        res = [dict(zip(cols, x) )for x in qry]
-        return res
-
-    def dbTableNameStr(self, tableName):
-        if self.product == "postgres":
-            return '"' + tableName + '"'
-        else:
-            return tableName
-
     def _getTable(self, table, idCol, newCols=None, matchCols=None, data=None, commit=False, 
                  comparisonOperator='=', checkIfExisting=False, insertIfNotMatched=True, 
-                 returnMatches=True, returnExistenceStatus=False):
-        '''Modified to accommodate camel case table/col name + only keeps pg and sqlite'''
+                 returnMatches=True, returnExistenceStatus=False, targetTable=None):
+        '''Modified to accommodate camel case table/col name + only keeps pg and sqlite, targetTable is
+        the (shard qualified) name to write to instead of table'''
         # generate SQL
         # note: comparison by = will never match NULL fields
         # use 'IS NOT DISTINCT FROM' to match nulls, but this is not indexed and verrrrry slooooow
@@ -511,17 +562,8 @@ class rssSqlDbConnection(SqlDbConnection):
                     colValues.append("'{:04}-{:02}-{:02}'".format(col.year, col.month, col.day))
                 elif col is None:
                     colValues.append('NULL')
-                elif isinstance(col, bytes) and isPostgres:
-                    hexvals = "".join([hex(x)[2:] for x in col])
-                    #get the hex values
-                    hexvals = [hex(x)[2:] for x in col]
-                    #fix up single digit values
-                    for i in range(len(hexvals)):
-                        if len(hexvals[i]) == 1:
-                            hexvals[i] = "0" + hexvals[i]
-
-                    colValues.append(r"E'\\x" + "".join(hexvals) + "'")
-                    #colValues.append(r"E'\\x" + col.decode() + "'" )
+                elif isinstance(col, bytes):
+                    colValues.append(self.dbBytes(col))
                 else:
                     colValues.append(self.dbStr(col))
             if not rowValues and isPostgres:  # first row
@@ -537,7 +579,7 @@ class rssSqlDbConnection(SqlDbConnection):
                 rowLongValues.append(None)
         values = ", \n".join(rowValues)
 
-        _table = self.dbTableNameStr(table)
+        _table = targetTable or self.dbTableNameStr(table)
         _inputTableName = self.tempInputTableName
         if self.product == "postgres":
             newCols = [self.dbTableNameStr(c) for c in newCols]
@@ -638,8 +680,9 @@ class rssSqlDbConnection(SqlDbConnection):
                            for i, colValue in enumerate(row))
                      for row in tableRows)
 
-    def _updateTable(self, table, cols=None, data=None, commit=False):
-        '''Modified to accommodate camel case table/col name + only keeps pg and sqlite'''
+    def _updateTable(self, table, cols=None, data=None, commit=False, targetTable=None):
+        '''Modified to accommodate camel case table/col name + only keeps pg and sqlite, targetTable is
+        the (shard qualified) name to write to instead of table'''
         # generate SQL
         # note: comparison by = will never match NULL fields
         # use 'IS NOT DISTINCT FROM' to match nulls, but this is not indexed and verrrrry slooooow
@@ -666,6 +709,8 @@ class rssSqlDbConnection(SqlDbConnection):
                     colValues.append(str(col))
                 elif col is None:
                     colValues.append('NULL')
+                elif isinstance(col, bytes):
+                    colValues.append(self.dbBytes(col))
                 else:
                     colValues.append(self.dbStr(col))
             if not rowValues and self.product == "postgres":  # first row
@@ -681,7 +726,7 @@ class rssSqlDbConnection(SqlDbConnection):
         if not isSQLite:
             values = ", \n".join(rowValues)
 
-        _table = self.dbTableNameStr(table)
+        _table = targetTable or self.dbTableNameStr(table)
         _inputTableName = self.tempInputTableName
         if self.product == "postgres":
             cols = [self.dbTableNameStr(c) for c in cols]
@@ -788,6 +833,7 @@ class rssSqlDbConnection(SqlDbConnection):
                 lb = fp.read().replace('\n', '')
 
         if lb:
+            from lxml import etree
             lb_xml = etree.fromstring(lb).getroottree()
             lb_string = etree.tostring(lb_xml) # , pretty_print=True, encoding=lb_xml.docinfo.encoding if lb_xml.docinfo.encoding else None
             formulaLinkBaseString = lb_string.decode(lb_xml.docinfo.encoding)
@@ -831,175 +877,6 @@ class rssSqlDbConnection(SqlDbConnection):
     def startDBReport(self, host='0.0.0.0', port=None, debug=False, asDaemon=True, fromDate=None, toDate=None, threaded=True):
         return _startDBReport(self, host, port, debug, asDaemon, fromDate, toDate, threaded)
 
-    def checkConnection(self):
-        chk = False
-        try:
-            db = self.conParams['database']
-            if self.product == 'postgres':
-                chk = self.execute('SELECT current_database();', fetch=True)[0][0] == db
-            elif self.product == 'sqlite':
-                if db == ':memory:':
-                    chk = True
-                else:
-                    chk = os.path.basename(self.execute('PRAGMA database_list;', fetch=True)[0][2]) == os.path.basename(db)
-        except Exception as e:
-            pass
-        return chk
-
-    def getDbStats(self):
-        result = {'textResult': OrderedDict(), 'dictResult':OrderedDict()}
-        qry = '''select 'LastUpdate' as description, cast(max("lastUpdate") as text) as val  from "lastUpdate"
-            union all
-            select 'LatestFiling' as description, cast(max("pubDate") as text) as val  from "filingsInfo"
-            union all
-            select 'EarliestFiling' as description, cast(min("pubDate") as text) as val  from "filingsInfo"
-            union all
-            select 'CountFilings' as description, cast(count("filingId") as text) as val from "filingsInfo" where "duplicate"=0
-            union all
-            select 'LatestFeed' as description, cast(max("feedId") as text) as val from "feedsInfo"
-            union all
-            select 'EarliestFeed' as description, cast(min("feedId") as text) as val from "feedsInfo"
-            union all
-            select 'CountFeeds' as description, cast(count("feedId") as text) as val from "feedsInfo"
-            union all
-            select 'CountFilers' as description, cast(count("cikNumber") as text) as val from "filersInfo"
-            union all
-            select 'CountFiles' as description, cast(count("fileId") as text) as val from "filesInfo"
-            '''
-
-        if self.checkConnection():
-            if self.verifyTables(createTables=False):
-                stats = self.execute(qry, fetch=True)
-                _result = {x[0]:x[1] for x in stats}
-                if _result:
-                    dbSize = ''
-                    if self.product == 'postgres':
-                        try:
-                            _relsSize = '''SELECT sum(pg_relation_size(quote_ident(schemaname) || '.' || quote_ident(tablename)))
-                                            FROM pg_tables 
-                                            WHERE schemaname = \'{}\' '''
-                            _dbSize = self.execute(_relsSize.format(self.conParams['schema']))[0][0]
-                            dbSize = convert_size(_dbSize, 'GB')[2]
-                        except Exception as e:
-                            self.rollback()
-                    elif self.product == 'sqlite':
-                        try:
-                            _dbfile = self.conParams['database']
-                            if os.path.isfile(_dbfile):
-                                _dbSize = os.path.getsize(_dbfile)
-                                dbSize = convert_size(_dbSize, 'GB')[2]
-                        except:
-                            conn.rollback()
-
-                    _result['DatabaseSize'] = dbSize
-                    
-                    result['dictResult'] = _result
-                    timeSinceLastUpdate = 'Never Updated'
-                    if parser.parse(_result['LastUpdate']).year == 1970:
-                        _result['LastUpdate'] = None
-                        timeSinceLastUpdate = 'Never Updated'
-                    else:
-                        td  = parser.parse(datetime.today().strftime("%Y-%m-%d %H:%M:%S"))  - parser.parse(_result['LastUpdate'])
-                        days = td.days
-                        hours, remainder = divmod(td.seconds, 3600)
-                        minutes, seconds = divmod(remainder, 60)
-                        timeSinceLastUpdate = '{} days, {} hours, {} minutes since last update'.format(days, hours, minutes)
-                    result['textResult'] = OrderedDict([
-                        ('LastUpdate', str(_result['LastUpdate']) +  ' - ('+timeSinceLastUpdate+')' if _result['LatestFiling'] else 'No Data'),
-                        ('CountFeeds', _result['CountFeeds']),
-                        ('LatestFeed', str(_result['LatestFeed'])[:4] + '-' + str(_result['LatestFeed'])[-2:] if _result['LatestFeed'] else 'No Data'),
-                        ('EarliestFeed', str(_result['EarliestFeed'])[:4] + '-' + str(_result['EarliestFeed'])[-2:] if _result['EarliestFeed'] else 'No Data'),
-                        ('CountFilings', _result['CountFilings']),
-                        ('LatestFiling', str(_result['LatestFiling']) if _result['LatestFiling'] else 'No Data'),
-                        ('EarliestFiling', str(_result['EarliestFiling']) if _result['EarliestFiling'] else 'No Data'),
-                        ('CountFiles', str(_result['CountFiles']) if _result['CountFiles'] else 'No Data'),
-                        ('CountFilers', _result['CountFilers']),
-                        ('DatabaseSize', _result['DatabaseSize'])
-                    ])                    
-            else:
-                result['textResult'] = {'missingTables': ', '.join(set(rssTables) - self.tablesInDB())}
-        else:
-            result['textResult'] = {'noConnection': 'Could not connect to database'}
-
-        return result
-
-    def getReportData(self, fromDate=None, toDate=None):
-        '''Get summaries used in db report'''
-        if not self.verifyTables(createTables=False):
-            return False
-        # validate Dates
-        for k,v in {'From': fromDate, 'To': toDate}.items():
-            if v:
-                try:
-                    datetime.strptime(v, '%Y-%m-%d')
-                except:
-                    self.cntlr.addToLog(_('{} Date is not in the correct fromat, date should be in the format yyyy-mm-dd').format(k),
-                                        messageCode="RssDB.Error", file=self.conParams.get('database', ''), level=logging.ERROR)
-                    return
-
-        if (fromDate and toDate) and (datetime.strptime(toDate, '%Y-%m-%d') <= datetime.strptime(fromDate, '%Y-%m-%d')):
-            self.cntlr.addToLog(_('To Date must be later than From date'),
-                                    messageCode="RssDB.Error", file=self.conParams.get('database', ''), level=logging.ERROR)
-            return
-        dbStats = self.getDbStats()['dictResult']
-        if not fromDate and not toDate:
-            lastFiling = dbStats.get('LatestFiling', None)
-            if lastFiling:
-                lastFilingYear = parser.parse(lastFiling).date().year
-                fromDate = str(date(lastFilingYear-2, 1, 1))
-
-        qFromDate = 'and "filingDate">=\'{}\''.format(str(fromDate)) if fromDate else ''
-        qToDate = 'and "filingDate"<=\'{}\''.format(str(toDate)) if toDate else ''
-
-
-        # filings summary query
-        sql1 = '''
-        with x as (
-        select a."cikNumber", b."conformedName", a."feedId", a."formType", a."assignedSic", a."inlineXBRL", count(a."filingId") as "count" 
-        from "filingsInfo" a 
-        left join "filersInfo" b on a."cikNumber" = b."cikNumber"
-        where a."duplicate" = 0 {} {}
-        group by a."cikNumber", b."conformedName", a."feedId", a."formType", a."assignedSic", a."inlineXBRL" order by a."feedId" desc)
-        select x.*, c."feedMonth" from x left join "feedsInfo" c on x."feedId"=c."feedId"
-        '''.format(qFromDate, qToDate)
-
-        # filers' locations
-        sql2 = '''select a."cikNumber", a."conformedName", b.* 
-                  from "filersInfo" a left join "locations" b on lower(a."businessState") = lower(b."code")'''
-
-        q1 = self.execute(sql1, fetch=True, close=False)
-        cols1 = [x[0].decode() if isinstance(x[0], bytes) else x[0] for x in self.cursor.description]
-        filingsDataDict = [dict(zip(cols1, x)) for x in q1]
-
-        with open(os.path.join(pathToSQL,'mongodbIndustryClassification.json'), 'r') as industries:
-            industry = json.load(industries)
-
-        res_industry = dict()
-        for a in industry['industry']:
-            if a['industry_classification'] == 'SEC':
-                res_industry[str(a['industry_code'])] = {'division_name': a['ancestors'][0]['industry_description'] if  a['ancestors'] else 0}
-
-        q2 = self.execute(sql2, fetch=True, close=False)
-        cols2 = [x[0].decode() if isinstance(x[0], bytes) else x[0] for x in self.cursor.description]
-        locationsDict = [dict(zip(cols2, x)) for x in q2]
-
-        return dbStats, filingsDataDict, res_industry, locationsDict
-
-    def showStatus(self, msg, clearAfter=2000, end='\n'):
-        if self.cntlr is not None:
-            if 'end' in self.cntlr.showStatus.__code__.co_varnames:
-                self.cntlr.showStatus(msg, clearAfter, end=end)
-            elif isinstance(self.cntlr, CntlrCmdLine):
-                print(msg, end=end)
-            else:
-                self.cntlr.showStatus(msg, clearAfter)
-        return
-
-    def addToLog(self, msg, **kwargs):
-        if self.cntlr is not None:
-            self.cntlr.addToLog(msg, **kwargs)
-        return
-
     def changeSchema(self, schema, createIfNotExist=True):
         if self.product in ['postgres']:
             self.schema = schema
@@ -1013,18 +890,9 @@ class rssSqlDbConnection(SqlDbConnection):
                         schema), action=stat, fetch=False, commit=True)
             self.execute('SET search_path = "{}";'.format(schema), fetch=False)
             self.showStatus(_('Path set to {}').format(schema))
+            self.refreshSchemaCache()
         return
 
-    def tablesInDB(self):
-        return set(tableRow[0]
-                   for tableRow in 
-                   self.execute({"postgres":"SELECT tablename FROM pg_tables WHERE schemaname = '{}';".format(self.schema),
-                                 "mysql": "SHOW tables;",
-                                 "mssql": "SELECT name FROM sys.TABLES;",
-                                 "orcl": "SELECT table_name FROM user_tables",
-                                 "sqlite": "SELECT name FROM sqlite_master WHERE type='table';"
-                                 }[self.product]))
-
     def verifyTables(self, createTables=True, dropPriorTables=False, populateFilersInfo=False):
         gettext.install('arelle')
         result = False
@@ -1047,6 +915,7 @@ class rssSqlDbConnection(SqlDbConnection):
 
     def create(self, ddlFiles, dropPriorTables=True, populateFilersInfo=True): # ddl Files may be a sequence (or not) of file names, glob wildcards ok, relative ok
         gettext.install('arelle')
+        self.refreshSchemaCache()
         if dropPriorTables:
             # drop tables
             startedAt = time.time()
@@ -1072,6 +941,9 @@ class rssSqlDbConnection(SqlDbConnection):
         for ddlFile in _ddlFiles:
             with io.open(ddlFile, 'rt', encoding='utf-8') as fh:
                 sql = fh.read().replace('%', '%%')
+
+            if self.product == 'postgres':
+                sql = partitionDDL(self, sql)
             
             # SQL server complains about 'GO' statement (SSMS artifact)
             if self.product == 'mssql':
@@ -1157,7 +1029,8 @@ class rssSqlDbConnection(SqlDbConnection):
                                    'DROP', 'CREATE TRIGGER',
                                    'SET',
                                    'CREATE INDEX', 'CREATE UNIQUE INDEX', # 'ALTER TABLE ONLY'
-                                   'CREATE VIEW', 'CREATE OR REPLACE VIEW', 'CREATE MATERIALIZED VIEW'
+                                   'CREATE VIEW', 'CREATE OR REPLACE VIEW', 'CREATE MATERIALIZED VIEW',
+                                   'COMMENT ON'
                                    )):
                     statusMsg, sep, rest = sql.strip().partition('\n')
                     self.showStatus(statusMsg[0:50])
@@ -1170,11 +1043,13 @@ class rssSqlDbConnection(SqlDbConnection):
                                      .format(i, sql, result))
                             fh.write(sql)
         
+        self.refreshSchemaCache()
         updateCikTickerMapping(self)
         if populateFilersInfo:
             _populateFilersInfo(self)
         self.showStatus("")
         self.conn.commit()
+        self._partitioning = dict()
         self.modelXbrl.profileStat(_("XbrlPublicDB: create tables"), time.time() - startedAt)
         self.closeCursor()
         return
@@ -1189,28 +1064,33 @@ class rssSqlDbConnection(SqlDbConnection):
         _tbl = dbTable
         _cols =  chkToList(updateCols, str) if action=='update' and updateCols else rssCols.get(_tbl, None)
         if not _cols:
-            _cols = inputData[0].keys()
+            _cols = list(inputData[0].keys())
         if action == 'update' and idCol and idCol not in _cols:
             _cols.insert(0, idCol)
         _action = action
         msg = {'update':_("Updating {}"), 'insert': _('Inserting into {}')}[_action].format(_tbl)
         startInsertTime = time.perf_counter()
         _inputData = inputData if isinstance(inputData, list) else [inputData]
+        _inputData = compressRows(_inputData, _tbl, blobCodec(self, _tbl))
         actionMsg = ''
         row_count = None
-        action_data = tuple(tuple(x[y] for y in _cols) for x in _inputData)
+        action_data = tuple(x.astuple(_cols) if isinstance(x, rssRecord) else tuple(x[y] for y in _cols) for x in _inputData)
         if len(action_data) > 0:
             try:
-                if _action == 'insert':
-                    _ret_tbl = self._getTable(dbTable, None, tuple(_cols), tuple(_cols), action_data, returnMatches=False, commit=commit)
-                    row_count = len(action_data)
-                elif _action == 'update':
-                    self._updateTable(dbTable, tuple(_cols), action_data, commit=commit)
-                    row_count = len(action_data)
+                # rows of sharded tables are written to the shard of their feed
+                targets = shardRows(self, dbTable, _cols, action_data) or {None: action_data}
+                for targetTable, targetData in targets.items():
+                    if _action == 'insert':
+                        _ret_tbl = self._getTable(dbTable, None, tuple(_cols), tuple(_cols), targetData, returnMatches=False, commit=commit, targetTable=targetTable)
+                    elif _action == 'update':
+                        self._updateTable(dbTable, tuple(_cols), targetData, commit=commit, targetTable=targetTable)
+                row_count = len(action_data)
             except Exception as e:
                 self.rollback()
                 raise e
             actionMsg = _('{} {} row(s) in {}').format(_action + ('ed' if _action=='insert' else 'd',)[0], row_count, _tbl)
+            self.metrics.observe('insert', time.perf_counter() - startInsertTime, table=_tbl, action=_action)
+            self.metrics.incr('rows', row_count, table=_tbl, action=_action)
         self.showStatus(actionMsg)
         self.addToLog(_("Finished {} in {} secs").format(msg, round(time.perf_counter() - startInsertTime, 3)),
                             messageCode="RssDB.Info", file=self.conParams.get('database', ''),  level=logging.INFO)
@@ -1233,12 +1113,12 @@ class rssSqlDbConnection(SqlDbConnection):
     def doAll(self, setAutoUpdate=False, waitFor=timedelta(minutes=wait_duration), duration=timedelta(hours=1), loc=None, last=None, 
                 dateFrom=None, dateTo=None, getRssItems=True, returnInfo=False, maxWorkers=None, updateDB=True, reloadCache=False, 
                 updateExisting=True, refreshAll=False, timeOut=3, retries=3, includeLatest=True, getFiles=True, getXML=False, 
-                getFilers=True, updateTickers=True, q=None):
+                getFilers=True, updateTickers=True, q=None, metricsFile=None, profile=None, profileMemory=False):
         '''Creates and populates rssDB'''
         return _doAll(self, setAutoUpdate=setAutoUpdate, waitFor=waitFor, duration=duration, loc=loc, last=last, dateFrom=dateFrom, dateTo=dateTo, 
                             getRssItems=getRssItems, returnInfo=returnInfo, maxWorkers=maxWorkers, updateDB=updateDB, reloadCache=reloadCache, updateExisting=updateExisting, 
                             refreshAll=refreshAll, timeOut=timeOut, retries=retries, includeLatest=includeLatest, getFiles=getFiles, getXML=getXML,
-                            getFilers=getFilers, updateTickers=updateTickers, q=q)
+                            getFilers=getFilers, updateTickers=updateTickers, q=q, metricsFile=metricsFile, profile=profile, profileMemory=profileMemory)
 
 
     def updateRssFeeds(self, loc=None, getRssItems=False, updateDB=False, maxWorkers=None, returnInfo=False,
@@ -1249,6 +1129,7 @@ class rssSqlDbConnection(SqlDbConnection):
 
     def updateFilersInfo(self, updateExisting=False, refreshAll=False, updateDB=False, 
                             maxWorkers=None, timeOut=3, retries=3, returnData=False):
+        attachShards(self)
         sql_new = '''
         SELECT distinct "cikNumber"
         FROM   "filingsInfo" a
@@ -1398,29 +1279,34 @@ class rssSqlDbConnection(SqlDbConnection):
                 _feeds = feeds[-last:]
                 feeds = _feeds
             existing = []
-            existingIds = []
+            existingIds = dict()
             if all([x in self.tablesInDB() for x in rssTables[:2]]):
                 self.showStatus(_('Getting existing feeds information'), 2000)
                 _qry = 'SELECT "feedId", "{}" from "{}"'.format(compareCol, rssTables[0])
                 _existing = self.execute(_qry, close=False)
                 existing = [(x[0], parser.parse(x[1],  tzinfos={'EST':'UTC-5:00', 'EDT':'UTC-4:00'}) if isinstance(
                     x[1], str) else x[1]) for x in _existing]
-                existingIds = [i[0] for i in existing]
+                existingIds = dict(existing)
             else:
                 self.showStatus(_('Rss DB tables not intialized, returning all available feeds'))
+            manifest = loadManifest(self, existingIds.keys()) if existingIds else dict()
             for x in feeds:
                 if x['feedId'] not in existingIds:
                     x['isNew'] = True
                     results.append(x)
                     self.addToLog(_('New: {}').format(x['link']), messageCode="RssDB.Info", file=self.conParams.get('database', ''),  level=logging.INFO)
                 # first check mod date to avoid downloading and parsing feeds with no new entries
-                elif existing[existingIds.index(x['feedId'])][1]:
-                    if x[compareCol] > existing[existingIds.index(x['feedId'])][1]:
+                elif existingIds[x['feedId']]:
+                    if x[compareCol] > existingIds[x['feedId']]:
                         x['isNew'] = False
                         results.append(x)
                         self.addToLog(_('Updatable: {}').format(x['link']), messageCode="RssDB.Info", file=self.conParams.get('database', ''),  level=logging.INFO)
                 # finally just download the and parse the document and compare it to existing
                 else:
+                    unchanged, x['etag'] = listedFeedUnchanged(self, manifest.get(x['feedId']), x)
+                    if unchanged:
+                        self.addToLog(_('Unchanged since last update: {}').format(x['link']), messageCode="RssDB.Info", file=self.conParams.get('database', ''),  level=logging.INFO)
+                        continue
                     x['isNew'] = False
                     results.append(x)
                     self.addToLog(_('May need update: {}').format(x['link']), messageCode="RssDB.Info", file=self.conParams.get('database', ''),  level=logging.INFO)
@@ -1434,13 +1320,13 @@ class rssSqlDbConnection(SqlDbConnection):
     def getFeedInfo(self, link, lastModifiedDate, isNew, reloadCache=False, getFiles=True, getXML=False):
         """Gets feed info ready to insert in db"""
         startAllTime = time.perf_counter()
-        feedInfo, _rssItemsList = _getFeedInfo(self, link, lastModifiedDate, isNew, reloadCache)
+        feedInfo, _rssItemsList, manifestEntry = _getFeedInfo(self, link, lastModifiedDate, isNew, reloadCache)
         f_id = int(str(feedInfo['feedId']) + '100000' ) + 1
         if not isNew and rssTables[1] in self.tablesInDB():
             _qry = '''select "feedId", max("filingId")
                         FROM "{}"
-                        WHERE "feedId"={}
-                        GROUP BY "feedId";'''.format(rssTables[1], feedInfo['feedId'])
+                        WHERE "feedId"={}{}
+                        GROUP BY "feedId";'''.format(rssTables[1], feedInfo['feedId'], idRangeClause(self, feedId=feedInfo['feedId']))
             try:
                 max_id_qry = self.execute(_qry, close=False)
                 if max_id_qry:
@@ -1450,39 +1336,32 @@ class rssSqlDbConnection(SqlDbConnection):
                 self.rollback()
                 raise e
         result = { x:[] for x in rssTables}
-        for rssI in _rssItemsList:
-            itemInfo = getRssItemInfo(rssI, feedInfo['feedId'], f_id, getFiles, getXML)
-            for _k in itemInfo.keys():
-                result[_k].append(itemInfo[_k]) 
-            f_id +=1
+        with self.metrics.span('extract', feed=os.path.basename(link)):
+            for rssI in _rssItemsList:
+                itemInfo = getRssItemInfo(rssI, feedInfo['feedId'], f_id, getFiles, getXML)
+                for _k in itemInfo.keys():
+                    result[_k].append(itemInfo[_k]) 
+                f_id +=1
+        self.metrics.incr('items', len(_rssItemsList), feed=os.path.basename(link))
         result[rssTables[0]] = feedInfo
         result['isNew'] = isNew
+        result['manifest'] = manifestEntry
         _msg = _("Finished extracting data from {} in {} secs").format(link, round(time.perf_counter() - startAllTime, 3))
         try:
             logs = self.cntlr.logHandler.getLines()
         except:
             pass
-        self.cntlr.modelManager.modelXbrl.close()
+        if self.cntlr.modelManager.modelXbrl is not None: # not loaded for feeds unchanged since last update
+            self.cntlr.modelManager.modelXbrl.close()
         self.cntlr.modelManager.close()
         gc.collect()
         self.addToLog(_msg, messageCode="RssDB.Info", file=self.conParams.get('database', ''),  level=logging.INFO)
         return result
 
 
-    def getExistingFeeds(self):
-        feedsIds = []
-        if rssTables[0] in self.tablesInDB():
-            try:
-                _feedsIds = self.execute('SELECT "{}" from "{}"'.format(rssCols[rssTables[0]][0], rssTables[0]), fetch= True)
-                feedsIds = [x[0] for x in _feedsIds]
-            except Exception as e:
-                self.rollback()
-                raise e
-        return feedsIds
-
-
     def updateDuplicateFilings(self, commit=True):
         statTime = time.perf_counter()
+        attachShards(self)
         dups = [{'filingId':x[0], 'duplicate': 1} for x in self.execute('SELECT * FROM v_duplicate_filings', fetch=True)]
         stat_filings = {'update':0}
         stat_files = {'update':0}
@@ -1504,220 +1383,6 @@ class rssSqlDbConnection(SqlDbConnection):
         return stat
 
 
-    def getById(self, idsList, tableName, idCol=None,  idDataType=int, returnCols=None, additionalWhereClauseString=None):
-        '''Get rows by ids from specified tables with optional where clause'''
-        result = None
-        if not idsList:
-            raise Exception('No ids to get')
-        
-        joiner = lambda x: "'" + str(x) + "'" if not idDataType == int else str(x)
-        _idsList = ', '.join([joiner(x) for x in chkToList(idsList, idDataType)])
-        _returnCols = '*'
-        if returnCols:
-            _returnCols = ', '.join(['"' + x + '"' for x in returnCols])
-        
-        if not additionalWhereClauseString:
-            additionalWhereClauseString = ''
-        
-        if not idCol:
-            idCol = rssCols[tableName][0]
-        
-        qry = 'SELECT {a} FROM "{b}" WHERE "{c}" in ({d}) {e}'.format(a=_returnCols, b=tableName, c=idCol, d=_idsList, e=additionalWhereClauseString)
-
-        try:
-            qryResult = self.execute(qry, fetch=True, close=False)
-            colNames = [x[0].decode() if isinstance(x[0], bytes) else x[0] for x in self.cursor.description]
-            result = [dict(x) for x in [zip(colNames, y) for y in qryResult]]
-        except Exception as e:
-            self.rollback()
-            raise e
-
-        return result
-
-    def searchFilings(self, companyName=None, tickerSymbol=None, cikNumber=None, formType=None, 
-                        assignedSic=None, dateFrom=None, dateTo=None, inlineXBRL=None, 
-                        limit=100, getFiles=False, filingIds=None, accessionNumbers=None, **kwargs):
-        # accommodate both list and string input
-        qry_result = {}
-        params = None
-        if not filingIds and not accessionNumbers: # shortcut
-            companyName = ','.join(companyName) if isinstance(companyName, (list, tuple, set)) else companyName
-            tickerSymbol = ','.join(tickerSymbol) if isinstance(tickerSymbol, (list, tuple, set)) else tickerSymbol
-            cikNumber = ','.join(cikNumber) if isinstance(cikNumber, (list, tuple, set)) else cikNumber
-            formType = ','.join(formType) if isinstance(formType, (list, tuple, set)) else formType
-            assignedSic = ','.join([str(x) for x in assignedSic]) if isinstance(assignedSic, (list, tuple, set)) else assignedSic
-            inlineFilter = {
-                'yes': '1',
-                'no': '0'
-            }
-            whereClause = OrderedDict([
-                ('companyName', ['%' + x.strip() + '%' for x in companyName.split(',')] if companyName else []),
-                ('tickerSymbol', [x.strip() for x in tickerSymbol.split(',')] if tickerSymbol else []),
-                ('cikNumber', [x.strip() for x in cikNumber.split(',')] if cikNumber else []),
-                ('formType', ['%' + x.strip() + '%' for x in formType.split(',')] if formType else []),  
-                ('assignedSic', [x.strip() for x in assignedSic.split(',')] if assignedSic else []), 
-                ('dateFrom', [dateFrom] if dateFrom else []),
-                ('dateTo', [dateTo] if dateTo else []),
-                ('inlineXBRL', [str(inlineFilter[inlineXBRL.lower()])] if inlineXBRL else []),
-                ('limit', [limit] if limit else [100])])
-
-            whereClausePlaceHolders = ' AND '.join(filter(None, [
-                '(' + ' OR '.join(filter(None, [
-                    ' OR '.join(['a."companyName" LIKE ?' for n in whereClause['companyName']]
-                                ) if whereClause['companyName'] else None,
-                    'b."tickerSymbol" IN ({})'.format(', '.join(
-                        '?' * len(whereClause['tickerSymbol']))) if whereClause['tickerSymbol'] else None,
-                    'a."cikNumber" IN ({})'.format(', '.join(
-                        '?' * len(whereClause['cikNumber']))) if whereClause['cikNumber'] else None
-                ])) + ')' if any([whereClause['companyName'], whereClause['tickerSymbol'], whereClause['cikNumber']]) else None,
-                '(' + ' OR '.join(['a."formType" LIKE ?' for n in whereClause['formType']]
-                                ) + ')' if whereClause['formType'] else None,
-                'a."assignedSic" IN ({})'.format(', '.join(
-                    '?' * len(whereClause['assignedSic']))) if whereClause['assignedSic'] else None,
-                'a."filingDate" >= ?' if whereClause['dateFrom'] else None, 
-                'a."filingDate" <= ?' if whereClause['dateTo'] else None,
-                'a."inlineXBRL" = ?' if whereClause['inlineXBRL'] else None,
-            ]))
-
-            params = tuple(filter(None,([i for x in whereClause.values() for i in x])))
-
-            qry='''
-            SELECT * 
-            FROM "filingsInfo" a
-                {}
-            {} {}
-            ORDER BY "filingId" DESC
-            LIMIT ?
-            '''.format('LEFT JOIN "cikTickerMapping" b on a."cikNumber" = b."cikNumber"' if tickerSymbol else '', 'WHERE' if whereClausePlaceHolders else '', whereClausePlaceHolders)
-
-        elif accessionNumbers:
-            if isinstance(accessionNumbers, str):
-                accessionNumbers = [x.strip() for x in accessionNumbers.split(',')]
-            accessionNumbers = ','.join(["'" + str(x) + "'" for x in accessionNumbers])
-            qry = f'SELECT * FROM "filingsInfo" WHERE "accessionNumber" in ({accessionNumbers})'
-            print(qry)
-        elif filingIds:
-            filingIds = ','.join([str(x) for x in filingIds]) if isinstance(filingIds, (list, tuple, set)) else filingIds
-            qry = f'SELECT * FROM "filingsInfo" WHERE "filingId" in ({filingIds})'
-            print(qry)
-
-        self.showStatus(_('Retriving Data'))
-        try:
-            if self.product == 'postgres':
-                paraStyle = pg8000.paramstyle
-                pg8000.paramstyle = 'qmark'
-                qry = qry.replace(' LIKE ', ' ILIKE ' )
-            qry_result = self.execute(qry, params=params, close=False)
-        except Exception as e:
-            self.rollback()
-            if self.product == 'postgres':
-                pg8000.paramstyle = paraStyle
-            raise e
-
-        resultDict = dict(filings=[], files=[])
-
-        _cols = [x[0] for x in self.cursor.description]
-        cols = [x.decode() if isinstance(x, bytes) else x for x in _cols]
-        resultDict['filings'] = [dict(zip(cols, x)) for x in qry_result]
-
-        if getFiles and qry_result:
-            filings_ids = tuple(x['filingId'] for x in resultDict['filings'])
-            qry_files = 'SELECT * From "filesInfo" WHERE "filingId" IN ({})'.format(', '.join(['?']*len(filings_ids)))
-            try:
-                # qry_result_files = self.execute(qry_files, params= filings_ids, close=False)
-                _qry_string = f'SELECT * From "filesInfo" WHERE "filingId" IN ({",".join([str(x) for x in filings_ids])})'
-                qry_result_files = self.execute(_qry_string, close=False)
-            except Exception as e:
-                self.rollback()
-                if self.product == 'postgres':
-                    pg8000.paramstyle = paraStyle
-                raise e
-            _cols_files = [x[0] for x in self.cursor.description]
-            cols_files = [x.decode() if isinstance(x, bytes) else x for x in _cols_files]
-            resultDict['files'] = [dict(zip(cols_files, x)) for x in qry_result_files]
-        self.addToLog(_('Retrived {} filing(s) and {} file(s)').format(len(resultDict['filings']), len(resultDict['files'])),
-                            messageCode="RssDB.Info", file=self.conParams.get('database', ''),  level=logging.INFO)
-        return resultDict
-
-    def searchFilers(self, companyName=None, tickerSymbol=None, cikNumber=None, industry=None, limit=100, **kwargs):
-        # accommodate both list and string input
-        companyName = ','.join(companyName) if isinstance(companyName, (list, tuple, set)) else companyName
-        tickerSymbol = ','.join(tickerSymbol) if isinstance(tickerSymbol, (list, tuple, set)) else tickerSymbol
-        cikNumber = ','.join(cikNumber) if isinstance(cikNumber, (list, tuple, set)) else cikNumber
-        industry = ','.join([str(x) for x in industry]) if isinstance(industry, (list, tuple, set)) else industry
-        whereClause = OrderedDict([
-            ('companyName', ['%' + x.strip() + '%' for x in companyName.split(',')] if companyName else []),
-            ('tickerSymbol', [x.strip() for x in tickerSymbol.split(',')] if tickerSymbol else []),
-            ('cikNumber', [x.strip() for x in cikNumber.split(',')] if cikNumber else []),
-            ('industry', [x.strip() for x in industry.split(',')] if industry else []), 
-            ('limit', [limit] if limit else [100])])
-
-        whereClausePlaceHolders = ' AND '.join(filter(None, [
-            '(' + ' OR '.join(filter(None, [
-                ' OR '.join(['a."conformedName" LIKE ?' for n in whereClause['companyName']]
-                            ) if whereClause['companyName'] else None,
-                'b."tickerSymbol" IN ({})'.format(', '.join(
-                    '?' * len(whereClause['tickerSymbol']))) if whereClause['tickerSymbol'] else None,
-                'a."cikNumber" IN ({})'.format(', '.join(
-                    '?' * len(whereClause['cikNumber']))) if whereClause['cikNumber'] else None
-            ])) + ')' if any([whereClause['companyName'], whereClause['tickerSymbol'], whereClause['cikNumber']]) else None,
-            'a."industry_code" IN ({})'.format(', '.join(
-                '?' * len(whereClause['industry']))) if whereClause['industry'] else None
-        ]))
-
-        params = tuple(filter(None,([i for x in whereClause.values() for i in x])))
-
-        qry='''
-        SELECT a.*, b."tickerSymbol" 
-        FROM "filersInfo" a
-            {}
-        {} {}
-        LIMIT ?
-        '''.format('LEFT JOIN "cikTickerMapping" b on a."cikNumber" = b."cikNumber"', 'WHERE' if whereClausePlaceHolders else '', whereClausePlaceHolders)
-
-        if self.product == 'postgres':
-            paraStyle = pg8000.paramstyle
-            pg8000.paramstyle = 'qmark'
-            qry = qry.replace(' LIKE ', ' ILIKE ' )
-
-        qry_result = {}
-        self.showStatus(_('Retriving Data'))
-        try:
-            qry_result = self.execute(qry, params=params, close=False)
-        except Exception as e:
-            self.rollback()
-            if self.product == 'postgres':
-                pg8000.paramstyle = paraStyle
-            raise e
-        
-        resultDict = dict(filers=[])
-
-        _cols = [x[0] for x in self.cursor.description]
-        cols = [x.decode() if isinstance(x, bytes) else x for x in _cols]
-        filersDicts = [dict(zip(cols, x)) for x in qry_result]
-
-        # make tickers unique
-        unique_ciks = {x['cikNumber'] for x in filersDicts}
-        unique_filers_dicts = []
-        for cik in unique_ciks:
-            tickersSet = set()
-            # find all tickers
-            for t in filersDicts:
-                if t['cikNumber'] == cik:
-                    if not t['tickerSymbol'] is None:
-                        tickersSet.add(t['tickerSymbol'])
-            # get 1 filer info
-            for d in filersDicts:
-                if d['cikNumber'] == cik:
-                    d['tickerSymbol'] = '|'.join(tickersSet)
-                    unique_filers_dicts.append(d)
-                    break
-        resultDict['filers'] = unique_filers_dicts
-
-        self.addToLog(_('Retrived {} filer(s) with {} ticker symbol(s)').format(len(unique_filers_dicts), len(filersDicts)),
-                            messageCode="RssDB.Info", file=getattr(self, 'dbName', ''),  level=logging.INFO)
-        return resultDict
-
     def dumpFilersInfo(self):
         """Creates dumps filers table to a pickle file 
         When creating db this file is used to populate filers' information, reducing the time needed to get this information. 
@@ -1748,31 +1413,6 @@ class rssSqlDbConnection(SqlDbConnection):
             pickle.dump(filersInfoDict, f)
         return
 
-    def get_existing_filing_numbers(self, form_types:list):
-        '''List of filing numbers (accession numbers) of form_types existing in db
-        returns cols: 
-            filingsInfo.filingId, filingsInfo.accessionNumber, filingsInfo.formType, filingsInfo.acceptanceDatetime
-        '''
-        qry = f'''SELECT "filingId", "accessionNumber", "formType", "acceptanceDatetime" FROM "filingsInfo"
-                WHERE "duplicate"=0'''
-
-        existing_filings = None
-        if form_types is not None:
-            if isinstance(form_types, (list, tuple, set)):
-                form_types = ','.join([self.dbStr(str(x)) for x in form_types])
-            else:
-                form_types = self.dbStr(form_types)
-            qry += f' AND "formType" IN ({form_types})'
-        try:
-            existing_filings = self.execute(qry, close=False)
-            cols = [x[0].decode() if type(x[0]) is bytes else x[0] for x in self.cursor.description]
-            existing_filings = [dict(zip(cols, x)) for x in existing_filings]
-        except Exception as ex:
-            if self.product == 'postgres':
-                self.rollback()
-            raise
-        return existing_filings
-
 class rssMongoDbConnection:
     def __init__(self, cntlr, host, database, user, password, port, timeout, product, schema, createSchema=False, createDB=False):
         self.conParams = {'cntlr': None, 'user': user, 
@@ -1783,6 +1423,8 @@ class rssMongoDbConnection:
         self.autoUpdateSet = False
         self.updateStarted = False   
         self.updateStopped = False     
+        self.metrics = rssDBMetrics()
+        self.compression = resolveCodec(getattr(cntlr, 'rssDBCompression', None))
         # relevant params
         _connParams = {'username': user, 'password': password, 'host': host, 'port': port if port else 27017, 'connectTimeoutMs': timeout*1000 if timeout else 20000}
         # if full connection string entered in host field remove other paramaters (username and password will conflict with host string)
@@ -1880,6 +1522,7 @@ class rssMongoDbConnection:
                 lb = fp.read().replace('\n', '')
 
         if lb:
+            from lxml import etree
             lb_xml = etree.fromstring(lb).getroottree()
             lb_string = etree.tostring(lb_xml) #, pretty_print=True, encoding=lb_xml.docinfo.encoding if lb_xml.docinfo.encoding else None
             formulaLinkBaseString = lb_string
@@ -2001,35 +1644,89 @@ class rssMongoDbConnection:
         if filingDate['filingDate']:
             q[0]['$match']['filingDate'] = filingDate['filingDate']
 
+        # join filer names and compute feedMonth (last day of feed month) in db
+        q.extend([
+            {
+                '$lookup': {
+                    'from': rssTables[3],
+                    'localField': 'cikNumber',
+                    'foreignField': 'cikNumber',
+                    'as': 'filer'
+                }
+            }, {
+                '$addFields': {
+                    'conformedName': {'$arrayElemAt': ['$filer.conformedName', 0]},
+                    'feedMonth': {
+                        '$dateToString': {
+                            'format': '%Y-%m-%d %H:%M:%S',
+                            'date': {
+                                '$dateFromParts': {
+                                    'year': {'$toInt': {'$floor': {'$divide': ['$feedId', 100]}}},
+                                    'month': {'$add': [{'$mod': ['$feedId', 100]}, 1]},
+                                    'day': 0
+                                }
+                            }
+                        }
+                    }
+                }
+            }, {
+                # location code of business state of the filer, unknown states are located at 'XX'
+                '$lookup': {
+                    'from': 'locations',
+                    'localField': 'filer.businessState',
+                    'foreignField': 'code',
+                    'as': 'location'
+                }
+            }, {
+                '$addFields': {
+                    'locationCode': {'$ifNull': [{'$arrayElemAt': ['$location.code', 0]}, 'XX']}
+                }
+            }, {
+                '$project': {'filer': 0, 'location': 0}
+            }
+        ])
         filingsDataDict = list(self.dbConn.filingsInfo.aggregate(q))
-        locationDict = list(self.dbConn.filersInfo.find({}, {'cikNumber':1,'conformedName':1, 'businessState':1,  '_id':0}))
-        filers_lookup = {x['cikNumber']:x for x in locationDict}
-
-        for f in filingsDataDict:
-            f['conformedName'] = filers_lookup[f['cikNumber']]['conformedName']
-            y = int(str(f['feedId'])[:4])
-            m = int(str(f['feedId'])[-2:])
-            f['feedMonth'] = str(datetime(y,m, calendar.monthrange(y,m)[1]))
-
-        locs = list(self.dbConn.locations.find({}, {'_id':0}))
-        locs_lookup = {x['code']:x for x in locs}
-
-        for xf in locationDict:
-            locator = locs_lookup.get(xf['businessState'], locs_lookup['XX'])
-            xf['code'] = locator['code']
-            xf['latitude'] = locator['latitude']
-            xf['longitude'] = locator['longitude']
-            xf['country'] = locator['country']
-            xf['stateProvince'] = locator['stateProvince']
-            del xf['businessState']
-
-        with open(os.path.join(pathToSQL,'mongodbIndustryClassification.json'), 'r') as industries:
-            industry = json.load(industries)
-
-        res_industry = dict()
-        for a in industry['industry']:
-            if a['industry_classification'] == 'SEC':
-                res_industry[str(a['industry_code'])] = {'division_name': a['ancestors'][0]['industry_description'] if  a['ancestors'] else 0}
+
+        # locations of filers with count of filers, grouped in db so only the locations are returned
+        qLocations = [
+            {
+                '$group': {'_id': '$businessState', 'filersCount': {'$sum': 1}}
+            }, {
+                '$lookup': {
+                    'from': 'locations',
+                    'localField': '_id',
+                    'foreignField': 'code',
+                    'as': 'location'
+                }
+            }, {
+                '$group': {
+                    '_id': {'$ifNull': [{'$arrayElemAt': ['$location.code', 0]}, 'XX']},
+                    'filersCount': {'$sum': '$filersCount'}
+                }
+            }, {
+                '$lookup': {
+                    'from': 'locations',
+                    'localField': '_id',
+                    'foreignField': 'code',
+                    'as': 'location'
+                }
+            }, {
+                '$replaceRoot': {
+                    'newRoot': {
+                        '$mergeObjects': [
+                            {'$arrayElemAt': ['$location', 0]},
+                            {'code': '$_id', 'filersCount': '$filersCount'}
+                        ]
+                    }
+                }
+            }, {
+                '$project': {'_id': 0, 'locationFix': 0}
+            }
+        ]
+        locationDict = list(self.dbConn.filersInfo.aggregate(qLocations))
+
+        # division of each industry code from the industry hierarchy
+        res_industry = sicDivisions(self)
 
         return dbStats, filingsDataDict, res_industry, locationDict
     
@@ -2071,7 +1768,7 @@ class rssMongoDbConnection:
                     _result['LastUpdate'] = lastUpdated
                     dbSize = ''
                     try:
-                        dbSize = convert_size(self.dbConn.command('dbstats')['storageSize'], 'GB')[2]
+                        dbSize = dbSizeStr(self.dbConn.command('dbstats')['storageSize'])
                     except:
                         pass
                     _result['DatabaseSize'] = dbSize
@@ -2121,7 +1818,7 @@ class rssMongoDbConnection:
         if self.cntlr is not None:
             if 'end' in self.cntlr.showStatus.__code__.co_varnames:
                 self.cntlr.showStatus(msg, clearAfter, end=end)
-            elif isinstance(self.cntlr, CntlrCmdLine):
+            elif _isCmdLineCntlr(self.cntlr):
                 print(msg, end=end)
             else:
                 self.cntlr.showStatus(msg, clearAfter)
@@ -2153,8 +1850,19 @@ class rssMongoDbConnection:
         elif missingColletions and not createCollections:
            self.addToLog(_("The following colletions are missing from {} database: {}").format(self.dbName,
                ', '.join(t for t in sorted(missingColletions))), messageCode="RssDB.Info", file=getattr(self, 'dbName', ''),  level=logging.INFO)
+        if result and not getattr(self, 'reportIndexesVerified', False):
+            self.verifyReportIndexes()
         return result
 
+    def verifyReportIndexes(self):
+        '''Creates indexes used by report aggregations if missing (also on databases created before these were added)'''
+        try:
+            for c, keys, name in mongoReportIndexes:
+                self.dbConn[c].create_index([(k, ASCENDING) for k in keys], name=name, background=True)
+            self.reportIndexesVerified = True
+        except Exception as e:
+            self.addToLog(_('Could not create report indexes:\n{}').format(str(e)), messageCode="RssDB.Error", file=getattr(self, 'dbName', ''),  level=logging.ERROR)
+
     def create(self, jsonFiles=None, dropPriorCollections=False, populateFilersInfo=True):
         with open(mongodbSchemaFile, 'r') as jf:
             schemas = json.load(jf)
@@ -2165,7 +1873,7 @@ class rssMongoDbConnection:
                 if dropPriorCollections:
                     self.dbConn.drop_collection(c)
                     self.addToLog(_('Dropped collection {}').format(c), messageCode="RssDB.Info", file=getattr(self, 'dbName', ''),  level=logging.INFO)
-                self.dbConn.create_collection(c, validator=schemas.get(c, {}), **opts)
+                self.dbConn.create_collection(c, validator=schemas.get(c, {}), **opts, **mongoStorageOptions(self, c))
                 # There are some duplicate ticker symbols with different ciks
                 if c == 'formulaeResults':
                     self.dbConn[c].create_index([(rssCols['formulaeResults'][0], DESCENDING), (rssCols['formulaeResults'][1], DESCENDING)], unique=True, background=False)
@@ -2222,7 +1930,7 @@ class rssMongoDbConnection:
                     "update": self.dbConn[dbCollection].update_many}[action]
         msg = {'update':_("Updating {}"), 'insert': _('Inserting into {}')}[action].format(dbCollection)
         startInsertTime = time.perf_counter()
-        _inputData = inputData if isinstance(inputData, list) else [inputData]
+        _inputData = asDicts(inputData if isinstance(inputData, list) else [inputData])
         res = None
         _count = 0
         if len(_inputData) > 0:
@@ -2243,6 +1951,8 @@ class rssMongoDbConnection:
                 res = self.dbConn[dbCollection].bulk_write(blkIds)
         if res:
             _count = {'insert': lambda x: len(x.inserted_ids), 'update': lambda x: x.modified_count}[action](res)
+            self.metrics.observe('insert', time.perf_counter() - startInsertTime, table=dbCollection, action=action)
+            self.metrics.incr('rows', _count, table=dbCollection, action=action)
         actionMsg = _('{} {} documents in {}').format(action + ('ed' if action=='insert' else 'd',)[0] , _count, dbCollection)
         self.showStatus(actionMsg)
         self.addToLog(_("Finished {} in {} secs").format(msg,
@@ -2267,12 +1977,12 @@ class rssMongoDbConnection:
     def doAll(self, setAutoUpdate=False, waitFor=timedelta(minutes=wait_duration), duration=timedelta(hours=1), loc=None, last=None, 
                 dateFrom=None, dateTo=None, getRssItems=True, returnInfo=False, maxWorkers=None, updateDB=True, reloadCache=False, 
                 updateExisting=True, refreshAll=False, timeOut=3, retries=3, includeLatest=True, getFiles=True, getXML=False, 
-                getFilers=True, updateTickers=False, q=None):
+                getFilers=True, updateTickers=False, q=None, metricsFile=None, profile=None, profileMemory=False):
         '''Creates and populates rssDB'''
         return _doAll(self, setAutoUpdate=setAutoUpdate, waitFor=waitFor, duration=duration, loc=loc, last=last, dateFrom=dateFrom, dateTo=dateTo, 
                             getRssItems=getRssItems, returnInfo=returnInfo, maxWorkers=maxWorkers, updateDB=updateDB, reloadCache=reloadCache, updateExisting=updateExisting, 
                             refreshAll=refreshAll, timeOut=timeOut, retries=retries, includeLatest=includeLatest, getFiles=getFiles, getXML=getXML,
-                            getFilers=getFilers, updateTickers=updateTickers, q=q)
+                            getFilers=getFilers, updateTickers=updateTickers, q=q, metricsFile=metricsFile, profile=profile, profileMemory=profileMemory)
 
 
     def updateRssFeeds(self, loc=None, getRssItems=False, updateDB=False, maxWorkers=None, returnInfo=False,
@@ -2408,28 +2118,33 @@ class rssMongoDbConnection:
                 _feeds = feeds[-last:]
                 feeds = _feeds
             existing = []
-            existingIds = []
+            existingIds = dict()
             if all([x in self.dbConn.list_collection_names() for x in rssTables[:2]]) :
                 self.showStatus(_('Getting existing feeds information'))
                 _existing = self.dbConn[rssTables[0]].find({}, {rssCols[rssTables[0]][0]: 1, compareCol: 1, "_id": 0}) 
                 existing = [(x['feedId'], parser.parse(x[compareCol], tzinfos={'EST':'UTC-5:00', 'EDT':'UTC-4:00'}) if isinstance(x[compareCol], str) else x[compareCol])
                             for x in _existing]
-                existingIds = [i[0] for i in existing]
+                existingIds = dict(existing)
             else:
                 self.showStatus(_('Rss DB collections not intialized, returning all available feeds'))
+            manifest = loadManifest(self, existingIds.keys()) if existingIds else dict()
             for x in feeds:
                 if x['feedId'] not in existingIds:
                     x['isNew'] = True
                     results.append(x)
                     self.addToLog(_('New: {}').format(x['link']), messageCode="RssDB.Info", file=getattr(self, 'dbName', ''),  level=logging.INFO)
                 # first check modified date to avoid downloading and parsing feeds with no new entries
-                elif existing[existingIds.index(x['feedId'])][1]:
-                    if x[compareCol] > existing[existingIds.index(x['feedId'])][1]:
+                elif existingIds[x['feedId']]:
+                    if x[compareCol] > existingIds[x['feedId']]:
                         x['isNew'] = False
                         results.append(x)
                         self.addToLog(_('Updatable: {}').format(x['link']), messageCode="RssDB.Info", file=getattr(self, 'dbName', ''),  level=logging.INFO)
                 # finally just download and parse the document and compare it to existing
                 else:
+                    unchanged, x['etag'] = listedFeedUnchanged(self, manifest.get(x['feedId']), x)
+                    if unchanged:
+                        self.addToLog(_('Unchanged since last update: {}').format(x['link']), messageCode="RssDB.Info", file=getattr(self, 'dbName', ''),  level=logging.INFO)
+                        continue
                     x['isNew'] = False
                     results.append(x)
                     self.addToLog(_('May need update: {}').format(x['link']), messageCode="RssDB.Info", file=getattr(self, 'dbName', ''),  level=logging.INFO)
@@ -2442,7 +2157,7 @@ class rssMongoDbConnection:
     def getFeedInfo(self, link, lastModifiedDate, isNew, reloadCache=False, getFiles=True, getXML=False):
         """Gets feed info ready to insert in db"""
         startAllTime = time.perf_counter()
-        feedInfo, _rssItemsList = _getFeedInfo(self, link, lastModifiedDate, isNew, reloadCache)
+        feedInfo, _rssItemsList, manifestEntry = _getFeedInfo(self, link, lastModifiedDate, isNew, reloadCache)
         f_id = int(str(feedInfo['feedId']) + '100000' ) + 1
         if not isNew  and rssTables[1] in self.dbConn.list_collection_names():
             _max_filings_id = list(self.dbConn[rssTables[1]].aggregate([
@@ -2456,13 +2171,16 @@ class rssMongoDbConnection:
             if max_filings_id:
                 f_id = max_filings_id + 1
         result = { x:[] for x in rssTables}
-        for rssI in _rssItemsList:
-            itemInfo = getRssItemInfo(rssI, feedInfo['feedId'], f_id, getFiles, getXML)
-            for _k in itemInfo.keys():
-                result[_k].append(itemInfo[_k]) 
-            f_id +=1
+        with self.metrics.span('extract', feed=os.path.basename(link)):
+            for rssI in _rssItemsList:
+                itemInfo = getRssItemInfo(rssI, feedInfo['feedId'], f_id, getFiles, getXML)
+                for _k in itemInfo.keys():
+                    result[_k].append(itemInfo[_k]) 
+                f_id +=1
+        self.metrics.incr('items', len(_rssItemsList), feed=os.path.basename(link))
         result[rssTables[0]] = feedInfo
         result['isNew'] = isNew
+        result['manifest'] = manifestEntry
         result['logMsg'] = _("Finished extracting data from {} in {} secs").format(link, round(time.perf_counter() - startAllTime, 3))
         try:
             logs = self.cntlr.logHandler.getLines()
@@ -2529,11 +2247,17 @@ class rssMongoDbConnection:
         idsFilter = {idField : { "$in": _idsList}}
 
         result = list(self.dbConn[collectionName].find({**idsFilter, **additionalWhereClauseDict}, {"_id":0, **_returnFields}))
+        if collectionName in coldTables and idField == 'filingId' and not additionalWhereClauseDict:
+            # rows of feeds moved to cold storage
+            result.extend(fetchColdRows(self, collectionName, set(_idsList) - {x['filingId'] for x in result}))
         return result
 
 
+    @cachedSearch
     def searchFilings(self, companyName=None, tickerSymbol=None, cikNumber=None, formType=None, assignedSic=None, 
-                        dateFrom=None, dateTo=None, inlineXBRL=None, limit=100, getFiles=False, filingIds=None, accessionNumbers=None, **kwargs):
+                        dateFrom=None, dateTo=None, inlineXBRL=None, limit=100, getFiles=False, filingIds=None, accessionNumbers=None, 
+                        beforeFilingId=None, **kwargs):
+        '''Search filings, newest (highest filingId) first, beforeFilingId gets the next page (keyset pagination)'''
         # accommodate both list and string input
         resultDict = dict(filings=[], files=[])
         filingsDicts = {}
@@ -2555,7 +2279,7 @@ class rssMongoDbConnection:
                 ('tickerSymbol', [x.strip() for x in tickerSymbol.split(',')] if tickerSymbol else []),
                 ('cikNumber', [x.strip() for x in cikNumber.split(',')] if cikNumber else []),
                 ('formType', ['%' + x.strip() + '%' for x in formType.split(',')] if formType else []),  
-                ('assignedSic', [int(x.strip()) for x in assignedSic.split(',')] if assignedSic else []), 
+                ('assignedSic', mongoSicCodes(self, *splitSicCodes(assignedSic.split(','))) if assignedSic else []), 
                 ('dateFrom', [dateFrom] if dateFrom else []),
                 ('dateTo', [dateTo] if dateTo else []),
                 ('inlineXBRL', [str(inlineFilter[inlineXBRL.lower()])] if inlineXBRL else []),
@@ -2589,6 +2313,8 @@ class rssMongoDbConnection:
                     mongoQry['filingDate']['$lte'] = datetime.strptime(dateTo, '%Y-%m-%d')
             if inlineXBRL:
                 mongoQry['inlineXBRL'] = inlineFilter[inlineXBRL.lower()]
+            if beforeFilingId:
+                mongoQry['filingId'] = {'$lt': int(beforeFilingId)}
 
             mongoQry_result = self.dbConn.filingsInfo.find(mongoQry, {'_id':0}, sort=[( 'filingId',  DESCENDING )]).limit(limit)
             filingsDicts = list(mongoQry_result)
@@ -2608,6 +2334,8 @@ class rssMongoDbConnection:
         if getFiles and filingsDicts:
             filings_ids = [x['filingId'] for x in filingsDicts]
             resultDict['files'] = list(self.dbConn.filesInfo.find({'filingId': {'$in':[x['filingId'] for x in filingsDicts]}}, {'_id':0}))
+            # files of feeds moved to cold storage
+            resultDict['files'].extend(fetchColdRows(self, rssTables[2], {x['filingId'] for x in filingsDicts} - {x['filingId'] for x in resultDict['files']}))
 
         self.addToLog(_('Retrived {} filing(s) and {} file(s)').format(len(resultDict['filings']), len(resultDict['files'])),
                             messageCode="RssDB.Info", file=getattr(self, 'dbName', ''),  level=logging.INFO)
@@ -2615,7 +2343,8 @@ class rssMongoDbConnection:
         return resultDict
 
 
-    def searchFilers(self, companyName=None, tickerSymbol=None, cikNumber=None, industry=None, limit=100, **kwargs):
+    def searchFilers(self, companyName=None, tickerSymbol=None, cikNumber=None, industry=None, limit=100, afterCikNumber=None, **kwargs):
+        '''Search filers ordered by cikNumber, limit applies to filers, afterCikNumber gets the next page (keyset pagination)'''
         # accommodate both list and string input
         companyName = ','.join(companyName) if isinstance(companyName, (list, tuple, set)) else companyName
         tickerSymbol = ','.join(tickerSymbol) if isinstance(tickerSymbol, (list, tuple, set)) else tickerSymbol
@@ -2627,7 +2356,7 @@ class rssMongoDbConnection:
             ('conformedName', ['%' + x.strip() + '%' for x in companyName.split(',')] if companyName else []),
             ('tickerSymbol', [x.strip() for x in tickerSymbol.split(',')] if tickerSymbol else []),
             ('cikNumber', [x.strip() for x in cikNumber.split(',')] if cikNumber else []),
-            ('industry', [int(x.strip()) for x in industry.split(',')] if industry else []), 
+            ('industry', mongoSicCodes(self, *splitSicCodes(industry.split(','))) if industry else []), 
             ('limit', [limit] if limit else [100])])
         
         self.showStatus(_('Retriving Data'))
@@ -2648,7 +2377,9 @@ class rssMongoDbConnection:
                     mongoQry['$or'].append({'cikNumber': {'$in': allCik}})
         if whereClause['industry']:
             mongoQry['industry_code'] = {'$in': whereClause['industry']}
-        mongoQry_result = self.dbConn.filersInfo.find(mongoQry, {'_id':0}).limit(limit)
+        if afterCikNumber:
+            mongoQry['cikNumber'] = {'$gt': str(afterCikNumber)}
+        mongoQry_result = self.dbConn.filersInfo.find(mongoQry, {'_id':0}, sort=[('cikNumber', ASCENDING)]).limit(limit)
         resultDict = dict(filers=[])
         filersDicts = list(mongoQry_result)
 
@@ -2658,22 +2389,16 @@ class rssMongoDbConnection:
         for d in filersDicts:
             d['tickerSymbol'] = t2_dict.get(d['cikNumber'], None)
         
-        # make tickers unique
-        unique_ciks = {x['cikNumber'] for x in filersDicts}
+        # make tickers unique, one filer info per cik in query order
+        unique_filers = OrderedDict()
+        for d in filersDicts:
+            filer, tickers = unique_filers.setdefault(d['cikNumber'], (d, OrderedDict()))
+            if not d['tickerSymbol'] is None:
+                tickers[d['tickerSymbol']] = None
         unique_filers_dicts = []
-        for cik in unique_ciks:
-            tickersSet = set()
-            # find all tickers
-            for t in filersDicts:
-                if t['cikNumber'] == cik:
-                    if not t['tickerSymbol'] is None:
-                        tickersSet.add(t['tickerSymbol'])
-            # get 1 filer info
-            for d in filersDicts:
-                if d['cikNumber'] == cik:
-                    d['tickerSymbol'] = '|'.join(tickersSet)
-                    unique_filers_dicts.append(d)
-                    break
+        for filer, tickers in unique_filers.values():
+            filer['tickerSymbol'] = '|'.join(tickers)
+            unique_filers_dicts.append(filer)
         resultDict['filers'] = unique_filers_dicts
 
         self.addToLog(_('Retrived {} filer(s) with {} ticker symbol(s)').format(len(unique_filers_dicts), len(filersDicts)),
@@ -17,17 +17,23 @@ from arellepy.HelperFuncs import chkToList
 from arelle.CntlrWinTooltip import ToolTip
 from arelle.UiUtil import checkbox, gridCombobox, label, gridCell
 from arelle.ViewWinTree import ViewTree
-from arellepy.CntlrPy import CntlrPy, runFormulaFromDBonRssItems, makeFormulaDict
+from arellepy.CntlrPy import CntlrPy, makeFormulaDict
 from arellepy.HelperFuncs import getExtractedXbrlInstance
 # from arelle.DialogUserPassword import askDatabase
 try:
     from .RssDB import rssDBConnection 
     from .Constants import DBTypes, pathToResources
-    from .CommonFunctions import _makeRssFeedLikeXml, storeInToXbrlDB, _dbTypes, dbProduct
+    from .CommonFunctions import _makeRssFeedLikeXml, storeInToXbrlDB
+    from .FormulaRunner import runFormulaParallel
+    from .ArchiveCache import getArchiveCache, archivePrefetcher
+    from .Autocomplete import getFilerNamesIndex
 except:
     from rssDB.RssDB import rssDBConnection 
     from rssDB.Constants import DBTypes, pathToResources
-    from rssDB.CommonFunctions import _makeRssFeedLikeXml, storeInToXbrlDB, _dbTypes, dbProduct
+    from rssDB.CommonFunctions import _makeRssFeedLikeXml, storeInToXbrlDB
+    from rssDB.FormulaRunner import runFormulaParallel
+    from rssDB.ArchiveCache import getArchiveCache, archivePrefetcher
+    from rssDB.Autocomplete import getFilerNamesIndex
 
 import tkinter as tkr
 from tkinter import messagebox, simpledialog
@@ -79,6 +85,24 @@ def flatenIndustry(a: dict, res=dict()):
 
 flatIndustry = flatenIndustry(res)
 
+def compactIndustrySelection(selection, tree=res):
+    '''Returns selected industry codes with 'code*' for nodes selected with all their descendants (expanded
+    by the database search), other selected codes are returned as is'''
+    selection = set(selection)
+    def allSelected(code, node):
+        return code in selection and all(allSelected(k, v) for k, v in node.get('children', {}).items())
+    result = []
+    def compact(nodes):
+        for code, node in nodes.items():
+            if node.get('children') and allSelected(code, node):
+                result.append(code + '*')
+                continue
+            if code in selection:
+                result.append(code)
+            compact(node.get('children', {}))
+    compact(tree)
+    return result
+
 industryCodesSelection = tuple()
 
 DBDescriptions = ("Postgres", "SQLite", "MongoDB")
@@ -479,6 +503,28 @@ class rssDBFrame(tkr.Frame):
             self.queryFrame.searchDB_btn.config(state='normal')
         return
 
+    def backgroundRefreshFilerNames(self):
+        '''Loads or refreshes the filers names index used for autocomplete of the search panel'''
+        conn = self.dbConnection
+        if not conn or not getattr(conn, 'conParams', False):
+            return
+        index = getFilerNamesIndex(conn)
+        if not index.isStale():
+            return
+        index.refreshing = True
+        try:
+            if conn.product == 'sqlite':
+                _conParams = conn.conParams
+                _conParams['cntlr'] = self.cntlr
+                conn = rssDBConnection(**_conParams)
+            index.refresh(conn)
+            if conn.product == 'sqlite':
+                conn.close()
+        except Exception as e:
+            index.refreshing = False
+            self.cntlr.addToLog(_('Could not load filers names for autocomplete:\n{}').format(str(e)), messageCode="RssDB.Error", file="",  level=logging.ERROR)
+        return
+
     def _destroy(self, event=None):
         self.disconnectDB(destroy=1)
         self.destroy()
@@ -1336,9 +1382,10 @@ class runFormulaDialog(tkr.Toplevel):
         sortedItems = sorted(pubDateRssItems, key=lambda x:x[0], reverse=True)
         sortedRssItems = [x[1] for x in sortedItems]
         try:
-            res = runFormulaFromDBonRssItems(conn=con, rssItems=sortedRssItems, formulaId=formulaId, additionalImports=additionalImports,
-                                                insertResultIntoDb=insertRes, updateExistingResults=updateExisting,
-                                                saveResultsToFolder=saveToFolder, folderPath=folderPath, returnResults=False)
+            res = runFormulaParallel(conn=con, rssItems=sortedRssItems, formulaId=formulaId, additionalImports=additionalImports,
+                                        insertResultIntoDb=insertRes, updateExistingResults=updateExisting,
+                                        saveResultsToFolder=saveToFolder, folderPath=folderPath, returnResults=False,
+                                        archiveCache=getArchiveCache(con))
 
         except Exception as e:
             if con.product == 'postgres':
@@ -1652,6 +1699,10 @@ class storeInXbrlDBSettings(tkr.Toplevel):
         if self.storeInXbrlDBEntry.value:
             items = sorted(self.selectedRssItems, key=lambda x:x.pubDate, reverse=True)
             try: # let make sure we have a connection to the db before we get excited
+                try: # imports xbrlDB plugin on first use
+                    from .CommonFunctions import _dbTypes, dbProduct
+                except:
+                    from rssDB.CommonFunctions import _dbTypes, dbProduct
                 _dbCon = [x.strip() if x.strip() else None for x in self.storeInXbrlDBEntry.value.split(',')]
                 conFunc = _dbTypes.get(_dbCon[6], None)
                 _conn = conFunc(self.modelXbrl, _dbCon[2], _dbCon[3],_dbCon[0], _dbCon[1], _dbCon[4], _dbCon[5], dbProduct.get(_dbCon[6], None))
@@ -1659,7 +1710,7 @@ class storeInXbrlDBSettings(tkr.Toplevel):
             except Exception as e:
                 self.cntlr.addToLog(_('Could not connect to db\n{}').format(str(e)), messageCode='rssDB.Error', level=logging.ERROR)
                 return
-            t1 = threading.Thread(target=storeInToXbrlDB, args=(self.cntlr, items, self.storeInXbrlDBEntry.value, self.selectionButton), daemon=True)
+            t1 = threading.Thread(target=self.backgroundStoreInToXbrlDB, args=(items, self.storeInXbrlDBEntry.value, self.selectionButton), daemon=True)
             t1.start()
         else:
             messagebox.showerror(_("RSS DB Error"), _("No Connection paramaters given"), parent=self.cntlr.parent)
@@ -1667,6 +1718,22 @@ class storeInXbrlDBSettings(tkr.Toplevel):
         self.closeAction()
         return
 
+    def backgroundStoreInToXbrlDB(self, items, params, selectionButton):
+        # archive cache writes its index from this thread, sqlite connection is reopened here
+        con = getattr(self.cntlr, 'dbConnection', None)
+        closeCon = False
+        if con and con.product == 'sqlite':
+            _conParams = con.conParams.copy()
+            _conParams['cntlr'] = self.cntlr
+            con = rssDBConnection(**_conParams)
+            closeCon = True
+        try:
+            storeInToXbrlDB(self.cntlr, items, params, selectionButton, archiveCache=getArchiveCache(con) if con else None)
+        finally:
+            if closeCon:
+                con.close()
+        return
+
     def btn_cmd_storeInXbrlDBparams(self):
         # from xbrlDB/DialogRssWatchExtender.py
         from arelle.DialogUserPassword import askDatabase
@@ -1962,39 +2029,63 @@ class ViewRssDBQuery(ViewWinRssFeed.ViewRssFeed):
         pubDateRssItems = []
         _items = [self.modelXbrl.modelObject(x) for x in ids]
         n = 0
+        dbConnection = getattr(self.modelXbrl.modelManager.cntlr, 'dbConnection', None)
+        closeCon = False
+        if dbConnection and dbConnection.product == 'sqlite':
+            # archive cache writes its index from this thread
+            _conParams = dbConnection.conParams.copy()
+            _conParams['cntlr'] = self.modelXbrl.modelManager.cntlr
+            dbConnection = rssDBConnection(**_conParams)
+            closeCon = True
+        archiveCache = getArchiveCache(dbConnection) if dbConnection else None
         for rssItem in _items:
             pubDateRssItems.append((rssItem.pubDate,rssItem.objectId()))
-        for pubDate, rssItemObjectId in sorted(pubDateRssItems, key=lambda x: x[0], reverse=True):
-            rssItem = self.modelXbrl.modelObject(rssItemObjectId)
-            if not isinstance(rssItem.results, list):
-                rssItem.results = []
-            self.modelXbrl.modelManager.viewModelObject(self.modelXbrl, rssItem.objectId())
-            # get information from item
-            res = []
-            reportFolder = None
-            plugins = pluginsDirs
-            statusMsg = ''
-            try:
-                rssItem.status = 'Render Edgar Reports'
+        sortedIds = [x[1] for x in sorted(pubDateRssItems, key=lambda x: x[0], reverse=True)]
+        sortedItems = [self.modelXbrl.modelObject(x) for x in sortedIds]
+        # archives of the next filings are downloaded while the current one is rendered
+        if archiveCache:
+            renderItems = iter(archivePrefetcher(archiveCache, sortedItems))
+        else:
+            renderItems = iter([(x, None, None) for x in sortedItems])
+        try:
+            for rssItem, archivePath, _archiveError in renderItems:
+                if not isinstance(rssItem.results, list):
+                    rssItem.results = []
                 self.modelXbrl.modelManager.viewModelObject(self.modelXbrl, rssItem.objectId())
-                _start = time.perf_counter()
-                reportFolder, errors = renderEdgarReports(rssItem, saveToFolder, plugins, self.multiprocessQueue)                   
-                _end = time.perf_counter()
-                if len(errors):
-                    rssItem.results.extend(errors)
-                    self.modelXbrl.modelManager.viewModelObject(self.modelXbrl, rssItem.objectId())
-                    statusMsg = _('Errors {}  while rendering form {} for {} in {} secs').format(','.join(errors), rssItem.formType, rssItem.companyName, round(_end-_start,3))
-                else:
-                    res.append(reportFolder)
-                    rssItem.results = [reportFolder]
+                # get information from item
+                res = []
+                reportFolder = None
+                plugins = pluginsDirs
+                statusMsg = ''
+                try:
+                    rssItem.status = 'Render Edgar Reports'
                     self.modelXbrl.modelManager.viewModelObject(self.modelXbrl, rssItem.objectId())
-                    statusMsg = _('Done rendering form {} for {} in {} secs').format(rssItem.formType, rssItem.companyName, round(_end-_start,3))
-                self.modelXbrl.modelManager.cntlr.addToLog(statusMsg, messageCode="RssDB.Info", file="",  level=logging.INFO)
-                n +=1
-            except Exception as e:
-                getQueue_render = False
-                # self.modelXbrl.modelManager.cntlr.addToLog('Error while processing {}'.format(str(rssItem)), messageCode="RssDB.Error", file="",  level=logging.ERROR)
-                tkr.messagebox.showerror(_("RSS DB Render Edgar error(s)"), '{}\n{}'.format(str(e), traceback.format_tb(sys.exc_info()[2])), parent=self.modelXbrl.modelManager.cntlr.parent)
+                    _start = time.perf_counter()
+                    if archivePath:
+                        archiveCache.linkIntoWebCache(self.modelXbrl.modelManager.cntlr.webCache, rssItem, archivePath=archivePath)
+                    reportFolder, errors = renderEdgarReports(rssItem, saveToFolder, plugins, self.multiprocessQueue)                   
+                    _end = time.perf_counter()
+                    if len(errors):
+                        rssItem.results.extend(errors)
+                        self.modelXbrl.modelManager.viewModelObject(self.modelXbrl, rssItem.objectId())
+                        statusMsg = _('Errors {}  while rendering form {} for {} in {} secs').format(','.join(errors), rssItem.formType, rssItem.companyName, round(_end-_start,3))
+                    else:
+                        res.append(reportFolder)
+                        rssItem.results = [reportFolder]
+                        self.modelXbrl.modelManager.viewModelObject(self.modelXbrl, rssItem.objectId())
+                        statusMsg = _('Done rendering form {} for {} in {} secs').format(rssItem.formType, rssItem.companyName, round(_end-_start,3))
+                    self.modelXbrl.modelManager.cntlr.addToLog(statusMsg, messageCode="RssDB.Info", file="",  level=logging.INFO)
+                    n +=1
+                except Exception as e:
+                    getQueue_render = False
+                    # self.modelXbrl.modelManager.cntlr.addToLog('Error while processing {}'.format(str(rssItem)), messageCode="RssDB.Error", file="",  level=logging.ERROR)
+                    tkr.messagebox.showerror(_("RSS DB Render Edgar error(s)"), '{}\n{}'.format(str(e), traceback.format_tb(sys.exc_info()[2])), parent=self.modelXbrl.modelManager.cntlr.parent)
+        finally:
+            # stops prefetch downloads and removes unused ones if rendering ends early
+            if archiveCache:
+                renderItems.close()
+            if closeCon:
+                dbConnection.close()
 
         getQueue_render = False
         MAKEDOTS_RSSDBPANEL[_key] = False
@@ -2312,6 +2403,84 @@ class rssDBUpdateSettings(tkr.LabelFrame):
     # def cancel_btn_func(self):
     #     self.master.destroy()
 
+class entryAutocomplete:
+    '''Drop down list of suggestions for the last comma separated value typed in an entry
+
+    suggestFunc(prefix, limit) returns list of (label, value), the selected value replaces the typed prefix.
+    '''
+    def __init__(self, entry:tkr.Entry, var:tkr.StringVar, suggestFunc, limit=10, minChars=2):
+        self.entry = entry
+        self.var = var
+        self.suggestFunc = suggestFunc
+        self.limit = limit
+        self.minChars = minChars
+        self.values = []
+        self.popup = None
+        self.listbox = None
+        entry.bind('<KeyRelease>', self.onKeyRelease, add='+')
+        entry.bind('<Down>', self.focusList, add='+')
+        entry.bind('<Escape>', self.hide, add='+')
+        entry.bind('<FocusOut>', lambda e: self.entry.after(200, self.hideIfUnfocused), add='+')
+
+    def onKeyRelease(self, event):
+        if event.keysym in ('Down', 'Up', 'Return', 'Escape', 'Tab', 'Shift_L', 'Shift_R'):
+            return
+        prefix = self.var.get().rpartition(',')[2].strip()
+        suggestions = self.suggestFunc(prefix, self.limit) if len(prefix) >= self.minChars else []
+        if not suggestions:
+            self.hide()
+            return
+        self.show(suggestions)
+
+    def show(self, suggestions):
+        if self.popup is None:
+            self.popup = tkr.Toplevel(self.entry)
+            self.popup.wm_overrideredirect(True)
+            self.listbox = tkr.Listbox(self.popup, exportselection=False, activestyle='dotbox')
+            self.listbox.pack(fill=tkr.BOTH, expand=True)
+            self.listbox.bind('<Return>', self.select)
+            self.listbox.bind('<Double-Button-1>', self.select)
+            self.listbox.bind('<Escape>', self.hide)
+            self.listbox.bind('<FocusOut>', lambda e: self.entry.after(200, self.hideIfUnfocused))
+        self.values = [x[1] for x in suggestions]
+        self.listbox.delete(0, tkr.END)
+        for label, value in suggestions:
+            self.listbox.insert(tkr.END, label)
+        self.listbox.config(height=len(suggestions))
+        self.popup.wm_geometry('{}x{}+{}+{}'.format(max(self.entry.winfo_width(), 300), self.listbox.winfo_reqheight(),
+                                self.entry.winfo_rootx(), self.entry.winfo_rooty() + self.entry.winfo_height()))
+        self.popup.deiconify()
+        self.popup.lift()
+
+    def focusList(self, event=None):
+        if self.popup is not None and self.values:
+            self.listbox.focus_set()
+            self.listbox.selection_clear(0, tkr.END)
+            self.listbox.selection_set(0)
+            self.listbox.activate(0)
+        return 'break'
+
+    def select(self, event=None):
+        selection = self.listbox.curselection()
+        if selection:
+            head, sep, _prefix = self.var.get().rpartition(',')
+            self.var.set(head + sep + (' ' if sep else '') + self.values[selection[0]])
+            self.entry.icursor(tkr.END)
+        self.hide()
+        self.entry.focus_set()
+        return 'break'
+
+    def hideIfUnfocused(self):
+        focused = self.entry.focus_get()
+        if focused not in (self.entry, self.listbox):
+            self.hide()
+
+    def hide(self, event=None):
+        if self.popup is not None:
+            self.popup.withdraw()
+        return
+
+
 class rssDBSearchDBPanel(tkr.LabelFrame):
     def __init__(self, master:rssDBFrame, **kw):
         self.accepted = False
@@ -2370,6 +2539,7 @@ class rssDBSearchDBPanel(tkr.LabelFrame):
         y_1+=1
         self.assignedSicEntry = tkr.Entry(firstGroupFrame, textvariable=self.assignedSicVar, name='assignedSicEntry', disabledbackground='white')
         self.assignedSicEntry.grid(row=y_1, column=0, columnspan=6, sticky=tkr.EW, pady=3, padx=3)
+        ToolTip(self.assignedSicEntry, text=_("Comma separated SEC industry codes, a code followed by * includes all the industries under it, example: 20*, 6770"), wraplength=360)
 
         y_1 += 1
         isInlineXbrl = tkr.Label(firstGroupFrame, text=_("Inline XBRL:"), underline=0, name='isInlineXbrl')
@@ -2409,6 +2579,9 @@ class rssDBSearchDBPanel(tkr.LabelFrame):
         self.cikNumberEntry.grid(row=y_2, column=1, columnspan=5, sticky=tkr.EW, pady=3, padx=3)
         ToolTip(self.cikNumberEntry, text=_("Comma separated cik Numbers, example: 0001234567, 0007654321,... \n Looks for the exact CIK Number(s) in addition to ticker symbol(s) and companies names."), wraplength=360) 
 
+        self.companyNameAutocomplete = entryAutocomplete(self.companyNameEntry, self.companyNameVar, self.suggestNames)
+        self.tickerSymbolAutocomplete = entryAutocomplete(self.tickerSymbolEntry, self.tickerSymbolVar, self.suggestTickers)
+
         y += 1
         btn_frame = tkr.Frame(self)
         btn_frame.grid(row=y, column=0, sticky=(tkr.E, tkr.W, tkr.N, tkr.S))
@@ -2472,11 +2645,33 @@ class rssDBSearchDBPanel(tkr.LabelFrame):
         t.start()
         return
         
+    def filerNamesIndex(self):
+        '''Returns filers names index of the connected db, loading or refreshing it in background when stale'''
+        conn = getattr(self, 'rssDBFrame', None) and self.rssDBFrame.dbConnection
+        if not conn or not getattr(conn, 'conParams', False):
+            return None
+        index = getFilerNamesIndex(conn)
+        if index.isStale():
+            threading.Thread(target=self.rssDBFrame.backgroundRefreshFilerNames, daemon=True).start()
+        return index if index.loaded else None
+
+    def suggestNames(self, prefix, limit):
+        index = self.filerNamesIndex()
+        if not index:
+            return []
+        return [('{} ({}{})'.format(name, cik, ', now ' + currentName if currentName else ''), name) for name, cik, currentName in index.suggestNames(prefix, limit)]
+
+    def suggestTickers(self, prefix, limit):
+        index = self.filerNamesIndex()
+        if not index:
+            return []
+        return [('{} - {}'.format(ticker, name or cik), ticker) for ticker, cik, name in index.suggestTickers(prefix, limit)]
+
     def openIndustrySelector(self):
         global industryCodesSelection
         selector = industrySelector(self, self.btn_industrySelect)
         if industryCodesSelection:
             self.assignedSicVar.set('')
-            self.assignedSicVar.set(', '.join(industryCodesSelection))
+            self.assignedSicVar.set(', '.join(compactIndustrySelection(industryCodesSelection)))
         return
 
@@ -0,0 +1,144 @@
+'''In-process cache of searchFilings results
+
+Results are kept per database (shared by connections to the same database, the GUI opens a new sqlite
+connection for each search), keyed on the normalized search (values of list parameters split, stripped,
+deduplicated and sorted, case folded for the parameters matched case insensitively), so the same search
+entered in a different order or case is served from the cache. Each entry records the db state it was
+computed at (lastUpdate and max filingId), entries are dropped as soon as either advances, i.e. after an
+update of the db by any process. Cache size is bounded by approximate memory of the results (arelle config
+'rssDBSearchCacheMB', default 32, 0 disables the cache), least recently used entries are evicted first.
+'''
+
+import sys, functools, threading
+from collections import OrderedDict
+from .Constants import rssTables
+
+defaultSearchCacheMB = 32
+# parameters matched with LIKE/ILIKE/regex case insensitive
+caseFoldedParams = ('companyName', 'formType')
+listParams = ('companyName', 'tickerSymbol', 'cikNumber', 'formType', 'assignedSic', 'filingIds', 'accessionNumbers')
+
+def _normalizeValue(name, value):
+    if value is None or value == '':
+        return None
+    if name in listParams:
+        values = value if isinstance(value, (list, tuple, set)) else str(value).split(',')
+        values = {str(x).strip() for x in values} - {''}
+        if name in caseFoldedParams:
+            values = {x.casefold() for x in values}
+        return tuple(sorted(values)) or None
+    if isinstance(value, str):
+        value = value.strip()
+        return value.casefold() if name == 'inlineXBRL' else value
+    return value
+
+def normalizeSearchQuery(kwargs):
+    '''Returns hashable key of searchFilings keyword arguments'''
+    return tuple(sorted((k, v) for k, v in ((k, _normalizeValue(k, v)) for k, v in kwargs.items()) if v is not None))
+
+def searchCacheState(conn):
+    '''Returns (lastUpdate, max filingId) of the db, the cached results are valid while these are unchanged'''
+    if conn.product == 'mongodb':
+        lastUpdate = conn.dbConn[rssTables[6]].find_one({'id': 0}, {'_id': 0, 'lastUpdate': 1})
+        maxFiling = conn.dbConn[rssTables[1]].find_one({}, {'_id': 0, 'filingId': 1}, sort=[('filingId', -1)])
+        return (str(lastUpdate.get('lastUpdate')) if lastUpdate else None, maxFiling.get('filingId') if maxFiling else None)
+    res = conn.execute('SELECT (SELECT max("lastUpdate") FROM "{}"), (SELECT max("filingId") FROM "{}")'.format(rssTables[6], rssTables[1]),
+                        fetch=True, close=False)
+    return (str(res[0][0]), res[0][1]) if res else (None, None)
+
+def _approxSize(result):
+    size = 0
+    for rows in result.values():
+        for row in rows:
+            size += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+    return size
+
+def _copyResult(result):
+    # callers may change the returned rows
+    return {k: [dict(row) for row in rows] for k, rows in result.items()}
+
+class searchResultsCache:
+    '''LRU cache of search results bounded by approximate size in bytes'''
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, state):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != state:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _copyResult(entry[1])
+
+    def put(self, key, state, result):
+        size = _approxSize(result)
+        if size > self.maxBytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (state, _copyResult(result), size)
+            self.size += size
+            while self.size > self.maxBytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+_searchCaches = dict()
+_searchCachesLock = threading.Lock()
+
+def _databaseKey(conn):
+    conParams = getattr(conn, 'conParams', {})
+    return (conn.product, conParams.get('host'), conParams.get('port'), conParams.get('database'), conParams.get('schema'))
+
+def getSearchCache(conn):
+    '''Returns search cache of the database of conn, None if disabled'''
+    try:
+        maxMB = float(conn.cntlr.config.get('rssDBSearchCacheMB', defaultSearchCacheMB))
+    except (TypeError, ValueError):
+        maxMB = defaultSearchCacheMB
+    if maxMB <= 0:
+        return None
+    key = _databaseKey(conn)
+    with _searchCachesLock:
+        cache = _searchCaches.get(key)
+        if cache is None:
+            cache = _searchCaches[key] = searchResultsCache(int(maxMB * 1024 * 1024))
+    return cache
+
+def cachedSearch(func):
+    '''Decorator of connection searchFilings serving repeated searches from the database search cache'''
+    @functools.wraps(func)
+    def wrapper(conn, *args, **kwargs):
+        cache = getSearchCache(conn)
+        if cache is None or args:
+            return func(conn, *args, **kwargs)
+        key = normalizeSearchQuery(kwargs)
+        try:
+            state = searchCacheState(conn)
+        except Exception:
+            if hasattr(conn, 'rollback'):
+                conn.rollback()
+            return func(conn, *args, **kwargs)
+        result = cache.get(key, state)
+        if result is None:
+            result = func(conn, *args, **kwargs)
+            cache.put(key, state, result)
+        return result
+    return wrapper
@@ -0,0 +1,256 @@
+'''Optional year-sharded storage of filingsInfo, filesInfo and rssItems on sqlite
+
+The large tables are kept in shard database files next to the (catalog) database, each shard holds the
+feeds of a range of years and is attached to the connections of the catalog. Temp views named as the
+tables (UNION ALL of the shards) shadow the empty tables of the catalog, and the catalog views over these
+tables are recreated as temp views, so queries read the shards unchanged. Rows are written directly to
+the shard of their feed (insertUpdateRssDB), so a feed update only locks its shard (and the catalog for
+feedsInfo) and writers of feeds in different shards do not wait for each other. searchFilings with a date
+range only reads the shards that can hold the filings (shardSource).
+
+Sharding is chosen when the database is created (cntlr.rssDBSqliteShardYears or config
+'rssDBSqliteShardYears', number of feed years per shard) and recorded in the catalog table
+rssDBShardConfig, shards are created when a feed is about to be inserted (ensureFeedShard). SQLite
+attaches at most 10 databases unless compiled with a higher SQLITE_MAX_ATTACHED, with a stock build 3
+years per shard covers the feeds from 2005 to 2034.
+'''
+
+import os, re, sqlite3, logging
+from collections import OrderedDict
+from datetime import date
+from .Partitioning import _monthId
+
+shardedTables = ('filingsInfo', 'filesInfo', 'rssItems')
+shardBaseYear = 2005
+shardConfigTable = 'rssDBShardConfig'
+shardsTable = 'rssDBShards'
+defaultAttachLimit = 10
+# pragmas that apply per attached database
+shardPragmas = ('journal_mode', 'synchronous')
+_foreignKey = re.compile(r',\s*FOREIGN\s+KEY\s*\([^)]*\)\s*REFERENCES\s+"?\w+"?\s*\([^)]*\)(\s+ON\s+(UPDATE|DELETE)\s+(SET\s+NULL|SET\s+DEFAULT|NO\s+ACTION|RESTRICT|CASCADE))*', re.I)
+_createTable = re.compile(r'^CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?', re.I)
+_createIndex = re.compile(r'^CREATE\s+(UNIQUE\s+)?INDEX\s+(IF\s+NOT\s+EXISTS\s+)?', re.I)
+_createView = re.compile(r'^CREATE\s+VIEW\s+(IF\s+NOT\s+EXISTS\s+)?', re.I)
+_indexTable = re.compile(r'\bON\s+"?(\w+)"?\s*\(', re.I)
+
+def requestedShardYears(cntlr):
+    '''Years per shard requested for new sqlite rssDB, None if not sharded'''
+    years = getattr(cntlr, 'rssDBSqliteShardYears', None) or cntlr.config.get('rssDBSqliteShardYears', None)
+    if years in (None, '', 'none', 0, '0'):
+        return None
+    try:
+        years = int(years)
+    except (TypeError, ValueError):
+        years = 0
+    if years < 1:
+        raise Exception('years per shard must be a positive integer, {} was entered'.format(years))
+    return years
+
+def initShards(conn, years):
+    '''Records years per shard in a new catalog database'''
+    if conn.conParams.get('database', '') == ':memory:':
+        raise Exception('Sharded storage requires a database file')
+    conn.execute('CREATE TABLE IF NOT EXISTS "{}" ("shardYears" INTEGER NOT NULL);'.format(shardConfigTable), fetch=False)
+    conn.execute('CREATE TABLE IF NOT EXISTS "{}" ("fromYear" INTEGER NOT NULL PRIMARY KEY, "toYear" INTEGER NOT NULL, '
+                 '"fileName" TEXT NOT NULL);'.format(shardsTable), fetch=False)
+    conn.execute('DELETE FROM "{}";'.format(shardConfigTable), fetch=False)
+    conn.execute('INSERT INTO "{}" ("shardYears") VALUES ({});'.format(shardConfigTable, int(years)), fetch=False, commit=True)
+    conn.refreshSchemaCache()
+    conn._shardYears = int(years)
+    conn._shards = OrderedDict()
+    conn.addToLog(_('Sharded storage with {} year(s) per shard').format(years), messageCode="RssDB.Info",
+                    file=conn.conParams.get('database', ''), level=logging.INFO)
+
+def shardYears(conn):
+    '''Returns years per shard of the sqlite catalog, None if not sharded, cached on the connection'''
+    if conn.product != 'sqlite':
+        return None
+    if not hasattr(conn, '_shardYears'):
+        years = None
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = '{}';".format(shardConfigTable), fetch=True):
+            res = conn.execute('SELECT "shardYears" FROM "{}";'.format(shardConfigTable), fetch=True)
+            years = res[0][0] if res else None
+        conn._shardYears = years
+    return conn._shardYears
+
+def shardBounds(years, year):
+    '''Returns (fromYear, toYear) of the shard holding feeds of year'''
+    fromYear = shardBaseYear + ((int(year) - shardBaseYear) // years) * years
+    return fromYear, fromYear + years - 1
+
+def shardSchema(fromYear):
+    return 's{}'.format(fromYear)
+
+def _shardPath(conn, fileName):
+    return os.path.join(os.path.dirname(os.path.abspath(conn.conParams['database'])), fileName)
+
+def _attachLimit(conn):
+    getlimit = getattr(conn.conn, 'getlimit', None)
+    return getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if getlimit else defaultAttachLimit
+
+def _attach(conn, fromYear, fileName):
+    schema = shardSchema(fromYear)
+    if len(conn._shards) >= _attachLimit(conn):
+        raise Exception(_('Can not attach shard {}, sqlite limit of {} attached databases reached, '
+                          'use more years per shard').format(fileName, _attachLimit(conn)))
+    conn.execute('ATTACH DATABASE ? AS "{}";'.format(schema), params=(_shardPath(conn, fileName),), fetch=False)
+    if getattr(conn.conn, 'in_transaction', False):
+        # journal mode can not be changed in a transaction, set when attached by the next connection
+        return schema
+    for name in shardPragmas:
+        value = getattr(conn, 'sqlitePragmas', {}).get(name)
+        if value is None:
+            continue
+        try:
+            conn.execute('PRAGMA "{}".{} = {};'.format(schema, name, value), fetch=True)
+        except Exception as e:
+            conn.addToLog(_('Could not set pragma {} = {} on shard {}:\n{}').format(name, value, fileName, str(e)), messageCode="RssDB.Error",
+                            file=conn.conParams.get('database', ''), level=logging.ERROR)
+    return schema
+
+def _catalogDDL(conn, types):
+    return conn.execute("SELECT type, name, tbl_name, sql FROM main.sqlite_master WHERE type IN ({}) AND sql IS NOT NULL ORDER BY rowid;".format(
+                            ', '.join("'{}'".format(t) for t in types)), fetch=True)
+
+def _createShardTables(conn, schema):
+    for _type, name, table, ddl in _catalogDDL(conn, ('table', 'index')):
+        if table not in shardedTables:
+            continue
+        if _type == 'table':
+            # foreign keys can not reference tables of another database file
+            ddl = _createTable.sub('CREATE TABLE IF NOT EXISTS "{}".'.format(schema), _foreignKey.sub('', ddl))
+        else:
+            ddl = _shardIndexDDL(schema, ddl)
+        conn.execute(ddl, fetch=False)
+
+def _shardIndexDDL(schema, ddl):
+    return _createIndex.sub(lambda m: 'CREATE {}INDEX IF NOT EXISTS "{}".'.format(m.group(1) or '', schema), ddl)
+
+def createShardIndexes(conn, indexes):
+    '''Creates catalog indexes (dict of index name: DDL) of sharded tables in every shard, used to restore the
+    indexes deferred by bulkLoad, which are missing from shards created during the load, returns number created'''
+    if not attachShards(conn):
+        return 0
+    created = 0
+    for name, ddl in indexes.items():
+        match = _indexTable.search(ddl)
+        if not match or match.group(1) not in shardedTables:
+            continue
+        for schema in conn._shards.values():
+            conn.execute(_shardIndexDDL(schema, ddl), fetch=False)
+            created += 1
+    conn.commit()
+    return created
+
+def _createViews(conn):
+    '''(Re)creates temp views of sharded tables over the attached shards, and of catalog views using them'''
+    for _type, name, table, ddl in reversed(_catalogDDL(conn, ('view',))):
+        conn.execute('DROP VIEW IF EXISTS temp."{}";'.format(name), fetch=False)
+    for table in shardedTables:
+        conn.execute('DROP VIEW IF EXISTS temp."{}";'.format(table), fetch=False)
+        if conn._shards:
+            conn.execute('CREATE TEMP VIEW "{}" AS {};'.format(table, ' UNION ALL '.join(
+                            'SELECT * FROM "{}"."{}"'.format(schema, table) for schema in conn._shards.values())), fetch=False)
+    if not conn._shards:
+        return
+    # catalog views only see catalog tables, temp views resolve the names to the views above
+    for _type, name, table, ddl in _catalogDDL(conn, ('view',)):
+        if any(re.search(r'\b{}\b'.format(t), ddl) for t in shardedTables):
+            conn.execute(_createView.sub('CREATE TEMP VIEW ', ddl), fetch=False)
+
+def attachShards(conn):
+    '''Attaches shards of a sharded sqlite catalog not yet attached to conn (including shards created by other
+    connections, such as the update workers) and recreates the views, returns True if sharded. Called when
+    connecting and before reading sharded tables (searches, reports, filers and duplicates updates)'''
+    if not shardYears(conn):
+        return False
+    if not hasattr(conn, '_shards'):
+        conn._shards = OrderedDict()
+    added = False
+    for fromYear, toYear, fileName in conn.execute('SELECT "fromYear", "toYear", "fileName" FROM "{}" ORDER BY "fromYear";'.format(shardsTable), fetch=True):
+        if fromYear not in conn._shards:
+            conn._shards[fromYear] = _attach(conn, fromYear, fileName)
+            added = True
+    if added:
+        conn._shards = OrderedDict(sorted(conn._shards.items()))
+        _createViews(conn)
+    return True
+
+def ensureShard(conn, year):
+    '''Returns schema of the shard holding feeds of year, creating and attaching it if missing'''
+    fromYear, toYear = shardBounds(shardYears(conn), year)
+    schema = conn._shards.get(fromYear)
+    if schema is None:
+        attachShards(conn)
+        schema = conn._shards.get(fromYear)
+    if schema is None:
+        base, ext = os.path.splitext(os.path.basename(conn.conParams['database']))
+        fileName = '{}.shard{}{}'.format(base, fromYear, ext or '.db')
+        schema = _attach(conn, fromYear, fileName)
+        conn._shards[fromYear] = schema
+        conn._shards = OrderedDict(sorted(conn._shards.items()))
+        _createShardTables(conn, schema)
+        # another process may have created the same shard in the mean time
+        conn.execute('INSERT OR IGNORE INTO "{}" ("fromYear", "toYear", "fileName") VALUES ({}, {}, ?);'.format(shardsTable, fromYear, toYear),
+                        params=(fileName,), fetch=False)
+        _createViews(conn)
+        conn.addToLog(_('Created shard {} for feeds {} to {}').format(fileName, fromYear, toYear), messageCode="RssDB.Info",
+                        file=conn.conParams.get('database', ''), level=logging.INFO)
+    return schema
+
+def ensureFeedShard(conn, feedId):
+    '''Creates shard for feedId if missing before inserting the feed, returns its schema, None if not sharded'''
+    if not shardYears(conn):
+        return None
+    schema = ensureShard(conn, int(feedId) // 100)
+    conn.commit()
+    return schema
+
+def _rowYear(cols, row):
+    if 'feedId' in cols:
+        return int(row[cols.index('feedId')]) // 100
+    if 'filingId' in cols:
+        return int(row[cols.index('filingId')]) // 10**8
+    return int(row[cols.index('fileId')]) // 10**11
+
+def shardRows(conn, table, cols, rows):
+    '''Returns OrderedDict of shard qualified table name: rows of table to be written to the shard, None if
+    table is not sharded'''
+    if table not in shardedTables or not shardYears(conn):
+        return None
+    cols = list(cols)
+    result = OrderedDict()
+    for row in rows:
+        schema = ensureShard(conn, _rowYear(cols, row))
+        result.setdefault('"{}"."{}"'.format(schema, table), []).append(row)
+    return result
+
+def shardTables(conn, table):
+    '''Returns list of names to write rows of table to, the shards tables if sharded'''
+    if table not in shardedTables or not attachShards(conn):
+        return ['"{}"'.format(table)]
+    return ['"{}"."{}"'.format(schema, table) for schema in conn._shards.values()]
+
+def shardSource(conn, table, fromDate=None, toDate=None):
+    '''Returns table expression of table limited to the shards that can hold filings of the filingDate range
+    (with a month margin), the table name if not sharded or not restricted'''
+    _table = '"{}"'.format(table)
+    if (not fromDate and not toDate) or table not in shardedTables or not attachShards(conn) or not conn._shards:
+        return _table
+    fromYear = _monthId(date.fromisoformat(str(fromDate)[:10]), -1) // 100 if fromDate else None
+    toYear = _monthId(date.fromisoformat(str(toDate)[:10]), 1) // 100 if toDate else None
+    years = shardYears(conn)
+    schemas = [schema for shardFrom, schema in conn._shards.items()
+                if (fromYear is None or shardFrom + years - 1 >= fromYear) and (toYear is None or shardFrom <= toYear)]
+    if len(schemas) == len(conn._shards):
+        return _table
+    if not schemas:
+        # keeps the columns, no rows
+        return '(SELECT * FROM {} WHERE 0)'.format(_table)
+    return '({})'.format(' UNION ALL '.join('SELECT * FROM "{}"."{}"'.format(schema, table) for schema in schemas))
+
+def shardFiles(conn):
+    '''Returns paths of the shard files of the sqlite catalog'''
+    if not attachShards(conn):
+        return []
+    return [_shardPath(conn, x[0]) for x in conn.execute('SELECT "fileName" FROM "{}" ORDER BY "fromYear";'.format(shardsTable), fetch=True)]
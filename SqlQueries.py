@@ -0,0 +1,534 @@
+'''Query methods shared by rssDB sql connections
+
+rssSqlQueries holds the read (search, stats, report) methods of sqlite and postgres connections, it is a
+mixin of both rssSqlDbConnection (RssDB, based on xbrlDB SqlDbConnection) and rssHeadlessDbConnection
+(Headless, db driver only). Methods only rely on the connection providing execute, cursor, commit, rollback,
+dbStr, product, schema, conParams and cntlr, this module (and what it imports) does not import arelle so
+headless connections can be used without it.
+'''
+
+import os, sys, logging
+from collections import OrderedDict
+from datetime import datetime, date
+from dateutil import parser
+from .Constants import rssTables, rssCols
+from .Compression import decompressRows
+from .Partitioning import idRangeClause
+from .Sharding import attachShards, shardSource, shardFiles
+from .ColdStorage import coldTables, fetchColdRows
+from .SearchCache import cachedSearch
+from .Industry import splitSicCodes, sicCondition, sicDivisions
+
+try:
+    import pg8000
+except ImportError:
+    pg8000 = None
+
+def _isCmdLineCntlr(cntlr):
+    # a cntlr can only be a CntlrCmdLine if arelle.CntlrCmdLine was imported, no need to import it here
+    cntlrCmdLine = sys.modules.get('arelle.CntlrCmdLine')
+    return cntlrCmdLine is not None and isinstance(cntlr, cntlrCmdLine.CntlrCmdLine)
+
+def _asList(value, dataType):
+    return [dataType(x) for x in (value if isinstance(value, (list, tuple, set)) else [value])]
+
+def dbSizeStr(sizeBytes):
+    '''Size of db in GB as shown in db stats'''
+    return '{:,.2f} GB'.format(sizeBytes / 1024 ** 3)
+
+class rssSqlQueries:
+    '''Read methods of rssDB sql connections (see module docstring)'''
+
+    def checkConnection(self):
+        chk = False
+        try:
+            db = self.conParams['database']
+            if self.product == 'postgres':
+                chk = self.execute('SELECT current_database();', fetch=True)[0][0] == db
+            elif self.product == 'sqlite':
+                if db == ':memory:':
+                    chk = True
+                else:
+                    chk = os.path.basename(self.execute('PRAGMA database_list;', fetch=True)[0][2]) == os.path.basename(db)
+        except Exception as e:
+            pass
+        return chk
+
+    def tablesInDB(self):
+        '''Returns set of tables in db, loaded once per connection (see refreshSchemaCache)'''
+        if getattr(self, '_tablesInDB', None) is None:
+            self._tablesInDB = frozenset(tableRow[0]
+                   for tableRow in 
+                   self.execute({"postgres":"SELECT tablename FROM pg_tables WHERE schemaname = '{}';".format(self.schema),
+                                 "mysql": "SHOW tables;",
+                                 "mssql": "SELECT name FROM sys.TABLES;",
+                                 "orcl": "SELECT table_name FROM user_tables",
+                                 "sqlite": "SELECT name FROM sqlite_master WHERE type='table';"
+                                 }[self.product]))
+        return set(self._tablesInDB)
+
+    def hasTable(self, table):
+        '''True if table is in db, a table missing from the cached list is looked up again as it may have been
+        created by another connection (e.g. coldFeeds by a command line run while the GUI is connected)'''
+        if table in self.tablesInDB():
+            return True
+        self._tablesInDB = None
+        return table in self.tablesInDB()
+
+    def refreshSchemaCache(self):
+        '''Drops cached tables and column types, to be called after creating or dropping tables (create and
+        changeSchema do this), altered columns of one table only need resetTableColTypes'''
+        self._tablesInDB = None
+        for cache in (getattr(self, 'tableColTypes', None), getattr(self, 'tableColDeclaration', None)):
+            if cache is not None:
+                cache.clear()
+
+    def resetTableColTypes(self, table):
+        '''Drops cached column types of table, to be called after altering table columns'''
+        for cache in (getattr(self, 'tableColTypes', None), getattr(self, 'tableColDeclaration', None)):
+            if cache is not None:
+                cache.pop(table, None)
+
+    def dbTableNameStr(self, tableName):
+        if self.product == "postgres":
+            return '"' + tableName + '"'
+        else:
+            return tableName
+
+    def dbBytes(self, value):
+        '''SQL literal for binary value'''
+        if self.product == "postgres":
+            return r"E'\\x" + bytes(value).hex() + "'::bytea"
+        return "X'" + bytes(value).hex() + "'"
+
+    def showStatus(self, msg, clearAfter=2000, end='\n'):
+        if self.cntlr is not None:
+            if 'end' in self.cntlr.showStatus.__code__.co_varnames:
+                self.cntlr.showStatus(msg, clearAfter, end=end)
+            elif _isCmdLineCntlr(self.cntlr):
+                print(msg, end=end)
+            else:
+                self.cntlr.showStatus(msg, clearAfter)
+        return
+
+    def addToLog(self, msg, **kwargs):
+        if self.cntlr is not None:
+            self.cntlr.addToLog(msg, **kwargs)
+        return
+
+    def verifyTables(self, createTables=False, dropPriorTables=False, populateFilersInfo=False):
+        '''True if the rssDB tables are in db, creating tables needs the full connection (rssSqlDbConnection)'''
+        if createTables:
+            raise Exception(_('Creating rssDB tables needs a full rssDB connection'))
+        missingTables = set(rssTables) - self.tablesInDB()
+        if missingTables == set(rssTables):
+            self.addToLog(_("The following tables are missing: {}").format(', '.join(t for t in sorted(missingTables))),
+                            messageCode="RssDB.Info", file=self.conParams.get('database', ''),  level=logging.INFO)
+        return not missingTables
+
+    def getDbStats(self):
+        result = {'textResult': OrderedDict(), 'dictResult':OrderedDict()}
+        attachShards(self)
+        qry = '''select 'LastUpdate' as description, cast(max("lastUpdate") as text) as val  from "lastUpdate"
+            union all
+            select 'LatestFiling' as description, cast(max("pubDate") as text) as val  from "filingsInfo"
+            union all
+            select 'EarliestFiling' as description, cast(min("pubDate") as text) as val  from "filingsInfo"
+            union all
+            select 'CountFilings' as description, cast(count("filingId") as text) as val from "filingsInfo" where "duplicate"=0
+            union all
+            select 'LatestFeed' as description, cast(max("feedId") as text) as val from "feedsInfo"
+            union all
+            select 'EarliestFeed' as description, cast(min("feedId") as text) as val from "feedsInfo"
+            union all
+            select 'CountFeeds' as description, cast(count("feedId") as text) as val from "feedsInfo"
+            union all
+            select 'CountFilers' as description, cast(count("cikNumber") as text) as val from "filersInfo"
+            union all
+            select 'CountFiles' as description, cast(count("fileId") as text) as val from "filesInfo"
+            '''
+
+        if self.checkConnection():
+            if self.verifyTables(createTables=False):
+                stats = self.execute(qry, fetch=True)
+                _result = {x[0]:x[1] for x in stats}
+                if _result:
+                    dbSize = ''
+                    if self.product == 'postgres':
+                        try:
+                            _relsSize = '''SELECT sum(pg_relation_size(quote_ident(schemaname) || '.' || quote_ident(tablename)))
+                                            FROM pg_tables 
+                                            WHERE schemaname = \'{}\' '''
+                            _dbSize = self.execute(_relsSize.format(self.conParams['schema']))[0][0]
+                            dbSize = dbSizeStr(_dbSize)
+                        except Exception as e:
+                            self.rollback()
+                    elif self.product == 'sqlite':
+                        try:
+                            _dbSize = sum(os.path.getsize(f) for f in [self.conParams['database']] + shardFiles(self) if os.path.isfile(f))
+                            dbSize = dbSizeStr(_dbSize)
+                        except:
+                            self.rollback()
+
+                    _result['DatabaseSize'] = dbSize
+                    
+                    result['dictResult'] = _result
+                    timeSinceLastUpdate = 'Never Updated'
+                    if parser.parse(_result['LastUpdate']).year == 1970:
+                        _result['LastUpdate'] = None
+                        timeSinceLastUpdate = 'Never Updated'
+                    else:
+                        td  = parser.parse(datetime.today().strftime("%Y-%m-%d %H:%M:%S"))  - parser.parse(_result['LastUpdate'])
+                        days = td.days
+                        hours, remainder = divmod(td.seconds, 3600)
+                        minutes, seconds = divmod(remainder, 60)
+                        timeSinceLastUpdate = '{} days, {} hours, {} minutes since last update'.format(days, hours, minutes)
+                    result['textResult'] = OrderedDict([
+                        ('LastUpdate', str(_result['LastUpdate']) +  ' - ('+timeSinceLastUpdate+')' if _result['LatestFiling'] else 'No Data'),
+                        ('CountFeeds', _result['CountFeeds']),
+                        ('LatestFeed', str(_result['LatestFeed'])[:4] + '-' + str(_result['LatestFeed'])[-2:] if _result['LatestFeed'] else 'No Data'),
+                        ('EarliestFeed', str(_result['EarliestFeed'])[:4] + '-' + str(_result['EarliestFeed'])[-2:] if _result['EarliestFeed'] else 'No Data'),
+                        ('CountFilings', _result['CountFilings']),
+                        ('LatestFiling', str(_result['LatestFiling']) if _result['LatestFiling'] else 'No Data'),
+                        ('EarliestFiling', str(_result['EarliestFiling']) if _result['EarliestFiling'] else 'No Data'),
+                        ('CountFiles', str(_result['CountFiles']) if _result['CountFiles'] else 'No Data'),
+                        ('CountFilers', _result['CountFilers']),
+                        ('DatabaseSize', _result['DatabaseSize'])
+                    ])                    
+            else:
+                result['textResult'] = {'missingTables': ', '.join(set(rssTables) - self.tablesInDB())}
+        else:
+            result['textResult'] = {'noConnection': 'Could not connect to database'}
+
+        return result
+
+    def getReportData(self, fromDate=None, toDate=None):
+        '''Get summaries used in db report'''
+        if not self.verifyTables(createTables=False):
+            return False
+        attachShards(self)
+        # validate Dates
+        for k,v in {'From': fromDate, 'To': toDate}.items():
+            if v:
+                try:
+                    datetime.strptime(v, '%Y-%m-%d')
+                except:
+                    self.cntlr.addToLog(_('{} Date is not in the correct fromat, date should be in the format yyyy-mm-dd').format(k),
+                                        messageCode="RssDB.Error", file=self.conParams.get('database', ''), level=logging.ERROR)
+                    return
+
+        if (fromDate and toDate) and (datetime.strptime(toDate, '%Y-%m-%d') <= datetime.strptime(fromDate, '%Y-%m-%d')):
+            self.cntlr.addToLog(_('To Date must be later than From date'),
+                                    messageCode="RssDB.Error", file=self.conParams.get('database', ''), level=logging.ERROR)
+            return
+        dbStats = self.getDbStats()['dictResult']
+        if not fromDate and not toDate:
+            lastFiling = dbStats.get('LatestFiling', None)
+            if lastFiling:
+                lastFilingYear = parser.parse(lastFiling).date().year
+                fromDate = str(date(lastFilingYear-2, 1, 1))
+
+        qFromDate = 'and "filingDate">=\'{}\''.format(str(fromDate)) if fromDate else ''
+        qToDate = 'and "filingDate"<=\'{}\''.format(str(toDate)) if toDate else ''
+        # restrict to partitions of the date range if filingsInfo is partitioned
+        qToDate += idRangeClause(self, fromDate=fromDate, toDate=toDate, alias='a')
+
+
+        # filings summary query, with location code of business state of the filer
+        sql1 = '''
+        with x as (
+        select a."cikNumber", b."conformedName", a."feedId", a."formType", a."assignedSic", a."inlineXBRL", l."code" as "locationCode", count(a."filingId") as "count" 
+        from "filingsInfo" a 
+        left join "filersInfo" b on a."cikNumber" = b."cikNumber"
+        left join "locations" l on lower(b."businessState") = lower(l."code")
+        where a."duplicate" = 0 {} {}
+        group by a."cikNumber", b."conformedName", a."feedId", a."formType", a."assignedSic", a."inlineXBRL", l."code" order by a."feedId" desc)
+        select x.*, c."feedMonth" from x left join "feedsInfo" c on x."feedId"=c."feedId"
+        '''.format(qFromDate, qToDate)
+
+        # locations of filers with count of filers
+        sql2 = '''select b.*, count(a."cikNumber") as "filersCount"
+                  from "filersInfo" a join "locations" b on lower(a."businessState") = lower(b."code")
+                  group by b."code"'''
+
+        q1 = self.execute(sql1, fetch=True, close=False)
+        cols1 = [x[0].decode() if isinstance(x[0], bytes) else x[0] for x in self.cursor.description]
+        filingsDataDict = [dict(zip(cols1, x)) for x in q1]
+
+        # division of each industry code from the industry hierarchy
+        res_industry = sicDivisions(self)
+
+        q2 = self.execute(sql2, fetch=True, close=False)
+        cols2 = [x[0].decode() if isinstance(x[0], bytes) else x[0] for x in self.cursor.description]
+        locationsDict = [dict(zip(cols2, x)) for x in q2]
+
+        return dbStats, filingsDataDict, res_industry, locationsDict
+
+    def getFormulae(self):
+        qry = self.execute('select "formulaId", "description", "fileName", "dateTimeAdded" from formulae', fetch=True, close=False)
+        cols = [x[0].decode() if type(x[0]) is bytes else x[0] for x in self.cursor.description]
+        res = [dict(zip(cols, x) )for x in qry]
+        return res
+
+    def getExistingFeeds(self):
+        feedsIds = []
+        if rssTables[0] in self.tablesInDB():
+            try:
+                _feedsIds = self.execute('SELECT "{}" from "{}"'.format(rssCols[rssTables[0]][0], rssTables[0]), fetch= True)
+                feedsIds = [x[0] for x in _feedsIds]
+            except Exception as e:
+                self.rollback()
+                raise e
+        return feedsIds
+
+    def getById(self, idsList, tableName, idCol=None,  idDataType=int, returnCols=None, additionalWhereClauseString=None):
+        '''Get rows by ids from specified tables with optional where clause'''
+        result = None
+        if not idsList:
+            raise Exception('No ids to get')
+        
+        joiner = lambda x: "'" + str(x) + "'" if not idDataType == int else str(x)
+        _idsList = ', '.join([joiner(x) for x in _asList(idsList, idDataType)])
+        _returnCols = '*'
+        if returnCols:
+            _returnCols = ', '.join(['"' + x + '"' for x in returnCols])
+        
+        if not additionalWhereClauseString:
+            additionalWhereClauseString = ''
+        
+        if not idCol:
+            idCol = rssCols[tableName][0]
+        
+        attachShards(self)
+        qry = 'SELECT {a} FROM "{b}" WHERE "{c}" in ({d}) {e}'.format(a=_returnCols, b=tableName, c=idCol, d=_idsList, e=additionalWhereClauseString)
+
+        try:
+            qryResult = self.execute(qry, fetch=True, close=False)
+            colNames = [x[0].decode() if isinstance(x[0], bytes) else x[0] for x in self.cursor.description]
+            result = decompressRows([dict(x) for x in [zip(colNames, y) for y in qryResult]], tableName)
+            if tableName in coldTables and idCol == 'filingId' and not additionalWhereClauseString:
+                # rows of feeds moved to cold storage
+                result.extend(fetchColdRows(self, tableName, set(_asList(idsList, idDataType)) - {x['filingId'] for x in result}))
+        except Exception as e:
+            self.rollback()
+            raise e
+
+        return result
+
+    @cachedSearch
+    def searchFilings(self, companyName=None, tickerSymbol=None, cikNumber=None, formType=None, 
+                        assignedSic=None, dateFrom=None, dateTo=None, inlineXBRL=None, 
+                        limit=100, getFiles=False, filingIds=None, accessionNumbers=None, beforeFilingId=None, **kwargs):
+        '''Search filings, newest (highest filingId) first, beforeFilingId gets the next page (keyset pagination)'''
+        # shards created by other connections since this one was opened
+        attachShards(self)
+        # accommodate both list and string input
+        qry_result = {}
+        params = None
+        if not filingIds and not accessionNumbers: # shortcut
+            companyName = ','.join(companyName) if isinstance(companyName, (list, tuple, set)) else companyName
+            tickerSymbol = ','.join(tickerSymbol) if isinstance(tickerSymbol, (list, tuple, set)) else tickerSymbol
+            cikNumber = ','.join(cikNumber) if isinstance(cikNumber, (list, tuple, set)) else cikNumber
+            formType = ','.join(formType) if isinstance(formType, (list, tuple, set)) else formType
+            assignedSic = ','.join([str(x) for x in assignedSic]) if isinstance(assignedSic, (list, tuple, set)) else assignedSic
+            inlineFilter = {
+                'yes': '1',
+                'no': '0'
+            }
+            # codes ending with '*' include descendants in the industry hierarchy
+            sicCodes, sicGroups = splitSicCodes(assignedSic.split(',')) if assignedSic else ([], [])
+            whereClause = OrderedDict([
+                ('companyName', ['%' + x.strip() + '%' for x in companyName.split(',')] if companyName else []),
+                ('tickerSymbol', [x.strip() for x in tickerSymbol.split(',')] if tickerSymbol else []),
+                ('cikNumber', [x.strip() for x in cikNumber.split(',')] if cikNumber else []),
+                ('formType', ['%' + x.strip() + '%' for x in formType.split(',')] if formType else []),  
+                ('assignedSic', sicCodes), 
+                ('assignedSicGroups', sicGroups),
+                ('dateFrom', [dateFrom] if dateFrom else []),
+                ('dateTo', [dateTo] if dateTo else []),
+                ('inlineXBRL', [str(inlineFilter[inlineXBRL.lower()])] if inlineXBRL else []),
+                ('beforeFilingId', [int(beforeFilingId)] if beforeFilingId else []),
+                ('limit', [limit] if limit else [100])])
+
+            whereClausePlaceHolders = ' AND '.join(filter(None, [
+                '(' + ' OR '.join(filter(None, [
+                    ' OR '.join(['a."companyName" LIKE ?' for n in whereClause['companyName']]
+                                ) if whereClause['companyName'] else None,
+                    'b."tickerSymbol" IN ({})'.format(', '.join(
+                        '?' * len(whereClause['tickerSymbol']))) if whereClause['tickerSymbol'] else None,
+                    'a."cikNumber" IN ({})'.format(', '.join(
+                        '?' * len(whereClause['cikNumber']))) if whereClause['cikNumber'] else None
+                ])) + ')' if any([whereClause['companyName'], whereClause['tickerSymbol'], whereClause['cikNumber']]) else None,
+                '(' + ' OR '.join(['a."formType" LIKE ?' for n in whereClause['formType']]
+                                ) + ')' if whereClause['formType'] else None,
+                sicCondition('a."assignedSic"', whereClause['assignedSic'], whereClause['assignedSicGroups']) if whereClause['assignedSic'] else None,
+                'a."filingDate" >= ?' if whereClause['dateFrom'] else None, 
+                'a."filingDate" <= ?' if whereClause['dateTo'] else None,
+                'a."inlineXBRL" = ?' if whereClause['inlineXBRL'] else None,
+                'a."filingId" < ?' if whereClause['beforeFilingId'] else None,
+            ]))
+
+            params = tuple(filter(None,([i for x in whereClause.values() for i in x])))
+
+            qry='''
+            SELECT * 
+            FROM {} a
+                {}
+            {} {}
+            ORDER BY "filingId" DESC
+            LIMIT ?
+            '''.format(shardSource(self, 'filingsInfo', dateFrom, dateTo), 'LEFT JOIN "cikTickerMapping" b on a."cikNumber" = b."cikNumber"' if tickerSymbol else '', 'WHERE' if whereClausePlaceHolders else '', whereClausePlaceHolders)
+
+        elif accessionNumbers:
+            if isinstance(accessionNumbers, str):
+                accessionNumbers = [x.strip() for x in accessionNumbers.split(',')]
+            accessionNumbers = ','.join(["'" + str(x) + "'" for x in accessionNumbers])
+            qry = f'SELECT * FROM "filingsInfo" WHERE "accessionNumber" in ({accessionNumbers})'
+            print(qry)
+        elif filingIds:
+            filingIds = ','.join([str(x) for x in filingIds]) if isinstance(filingIds, (list, tuple, set)) else filingIds
+            qry = f'SELECT * FROM "filingsInfo" WHERE "filingId" in ({filingIds})'
+            print(qry)
+
+        self.showStatus(_('Retriving Data'))
+        try:
+            if self.product == 'postgres':
+                paraStyle = pg8000.paramstyle
+                pg8000.paramstyle = 'qmark'
+                qry = qry.replace(' LIKE ', ' ILIKE ' )
+            qry_result = self.execute(qry, params=params, close=False)
+        except Exception as e:
+            self.rollback()
+            if self.product == 'postgres':
+                pg8000.paramstyle = paraStyle
+            raise e
+
+        resultDict = dict(filings=[], files=[])
+
+        _cols = [x[0] for x in self.cursor.description]
+        cols = [x.decode() if isinstance(x, bytes) else x for x in _cols]
+        resultDict['filings'] = [dict(zip(cols, x)) for x in qry_result]
+
+        if getFiles and qry_result:
+            filings_ids = tuple(x['filingId'] for x in resultDict['filings'])
+            qry_files = 'SELECT * From "filesInfo" WHERE "filingId" IN ({})'.format(', '.join(['?']*len(filings_ids)))
+            try:
+                # qry_result_files = self.execute(qry_files, params= filings_ids, close=False)
+                _qry_string = f'SELECT * From "filesInfo" WHERE "filingId" IN ({",".join([str(x) for x in filings_ids])})'
+                qry_result_files = self.execute(_qry_string, close=False)
+            except Exception as e:
+                self.rollback()
+                if self.product == 'postgres':
+                    pg8000.paramstyle = paraStyle
+                raise e
+            _cols_files = [x[0] for x in self.cursor.description]
+            cols_files = [x.decode() if isinstance(x, bytes) else x for x in _cols_files]
+            resultDict['files'] = [dict(zip(cols_files, x)) for x in qry_result_files]
+            # files of feeds moved to cold storage
+            resultDict['files'].extend(fetchColdRows(self, rssTables[2], set(filings_ids) - {x['filingId'] for x in resultDict['files']}))
+        self.addToLog(_('Retrived {} filing(s) and {} file(s)').format(len(resultDict['filings']), len(resultDict['files'])),
+                            messageCode="RssDB.Info", file=self.conParams.get('database', ''),  level=logging.INFO)
+        return resultDict
+
+    def searchFilers(self, companyName=None, tickerSymbol=None, cikNumber=None, industry=None, limit=100, afterCikNumber=None, **kwargs):
+        '''Search filers ordered by cikNumber, limit applies to filers, afterCikNumber gets the next page (keyset pagination)'''
+        # accommodate both list and string input
+        companyName = ','.join(companyName) if isinstance(companyName, (list, tuple, set)) else companyName
+        tickerSymbol = ','.join(tickerSymbol) if isinstance(tickerSymbol, (list, tuple, set)) else tickerSymbol
+        cikNumber = ','.join(cikNumber) if isinstance(cikNumber, (list, tuple, set)) else cikNumber
+        industry = ','.join([str(x) for x in industry]) if isinstance(industry, (list, tuple, set)) else industry
+        # codes ending with '*' include descendants in the industry hierarchy
+        industryCodes, industryGroups = splitSicCodes(industry.split(',')) if industry else ([], [])
+        whereClause = OrderedDict([
+            ('companyName', ['%' + x.strip() + '%' for x in companyName.split(',')] if companyName else []),
+            ('tickerSymbol', [x.strip() for x in tickerSymbol.split(',')] if tickerSymbol else []),
+            ('cikNumber', [x.strip() for x in cikNumber.split(',')] if cikNumber else []),
+            ('industry', industryCodes), 
+            ('industryGroups', industryGroups),
+            ('afterCikNumber', [str(afterCikNumber)] if afterCikNumber else []),
+            ('limit', [limit] if limit else [100])])
+
+        whereClausePlaceHolders = ' AND '.join(filter(None, [
+            '(' + ' OR '.join(filter(None, [
+                ' OR '.join(['a."conformedName" LIKE ?' for n in whereClause['companyName']]
+                            ) if whereClause['companyName'] else None,
+                'a."cikNumber" IN (SELECT "cikNumber" FROM "cikTickerMapping" WHERE "tickerSymbol" IN ({}))'.format(', '.join(
+                    '?' * len(whereClause['tickerSymbol']))) if whereClause['tickerSymbol'] else None,
+                'a."cikNumber" IN ({})'.format(', '.join(
+                    '?' * len(whereClause['cikNumber']))) if whereClause['cikNumber'] else None
+            ])) + ')' if any([whereClause['companyName'], whereClause['tickerSymbol'], whereClause['cikNumber']]) else None,
+            sicCondition('a."industry_code"', whereClause['industry'], whereClause['industryGroups']) if whereClause['industry'] else None,
+            'a."cikNumber" > ?' if whereClause['afterCikNumber'] else None
+        ]))
+
+        params = tuple(filter(None,([i for x in whereClause.values() for i in x])))
+
+        # limit filers before joining tickers so that all tickers of a filer are in the same page
+        qry='''
+        SELECT a.*, b."tickerSymbol" 
+        FROM (SELECT * FROM "filersInfo" a {} {} ORDER BY a."cikNumber" LIMIT ?) a
+            LEFT JOIN "cikTickerMapping" b on a."cikNumber" = b."cikNumber"
+        ORDER BY a."cikNumber"
+        '''.format('WHERE' if whereClausePlaceHolders else '', whereClausePlaceHolders)
+
+        if self.product == 'postgres':
+            paraStyle = pg8000.paramstyle
+            pg8000.paramstyle = 'qmark'
+            qry = qry.replace(' LIKE ', ' ILIKE ' )
+
+        qry_result = {}
+        self.showStatus(_('Retriving Data'))
+        try:
+            qry_result = self.execute(qry, params=params, close=False)
+        except Exception as e:
+            self.rollback()
+            if self.product == 'postgres':
+                pg8000.paramstyle = paraStyle
+            raise e
+        
+        resultDict = dict(filers=[])
+
+        _cols = [x[0] for x in self.cursor.description]
+        cols = [x.decode() if isinstance(x, bytes) else x for x in _cols]
+        filersDicts = [dict(zip(cols, x)) for x in qry_result]
+
+        # make tickers unique, one filer info per cik in query order
+        unique_filers = OrderedDict()
+        for d in filersDicts:
+            filer, tickers = unique_filers.setdefault(d['cikNumber'], (d, OrderedDict()))
+            if not d['tickerSymbol'] is None:
+                tickers[d['tickerSymbol']] = None
+        unique_filers_dicts = []
+        for filer, tickers in unique_filers.values():
+            filer['tickerSymbol'] = '|'.join(tickers)
+            unique_filers_dicts.append(filer)
+        resultDict['filers'] = unique_filers_dicts
+
+        self.addToLog(_('Retrived {} filer(s) with {} ticker symbol(s)').format(len(unique_filers_dicts), len(filersDicts)),
+                            messageCode="RssDB.Info", file=getattr(self, 'dbName', ''),  level=logging.INFO)
+        return resultDict
+
+    def get_existing_filing_numbers(self, form_types:list):
+        '''List of filing numbers (accession numbers) of form_types existing in db
+        returns cols: 
+            filingsInfo.filingId, filingsInfo.accessionNumber, filingsInfo.formType, filingsInfo.acceptanceDatetime
+        '''
+        qry = f'''SELECT "filingId", "accessionNumber", "formType", "acceptanceDatetime" FROM "filingsInfo"
+                WHERE "duplicate"=0'''
+
+        existing_filings = None
+        if form_types is not None:
+            if isinstance(form_types, (list, tuple, set)):
+                form_types = ','.join([self.dbStr(str(x)) for x in form_types])
+            else:
+                form_types = self.dbStr(form_types)
+            qry += f' AND "formType" IN ({form_types})'
+        try:
+            existing_filings = self.execute(qry, close=False)
+            cols = [x[0].decode() if type(x[0]) is bytes else x[0] for x in self.cursor.description]
+            existing_filings = [dict(zip(cols, x)) for x in existing_filings]
+        except Exception as ex:
+            if self.product == 'postgres':
+                self.rollback()
+            raise
+        return existing_filings
@@ -0,0 +1,174 @@
+'''SQLite connection performance profiles and bulk-load mode
+
+Profiles are sets of pragmas applied when an rssDB sqlite connection is opened, the default 'performance'
+profile switches the database to WAL journal so that readers (dashboard, GUI searches) are not blocked
+while an update is writing, with synchronous NORMAL (safe in WAL mode), memory mapped io, a larger page
+cache and temp tables in memory. 'safe' keeps WAL with synchronous FULL, 'none' leaves sqlite defaults.
+Pragmas of the selected profile can be overridden by a dict in arelle config key 'rssDBSqlitePragmas'.
+
+bulkLoad context temporarily relaxes synchronous during the initial backfill and defers creating the
+secondary indexes of empty tables until the load is done, then restores the profile settings and
+runs ANALYZE. During the load the connection parameters carry the 'bulk' profile, so the update worker
+connections (which do the feed inserts) are opened with the relaxed pragmas too. Index DDL deferred is kept in a side file next to the database until recreated, so indexes
+are restored on next connect if the load is interrupted.
+'''
+
+import os, sys, json, time, logging
+from contextlib import contextmanager
+from collections import OrderedDict
+from .Sharding import createShardIndexes
+
+bulkLoadPragmas = OrderedDict([('synchronous', 'OFF'), ('cache_size', -262144)])
+bulkLoadProfile = 'bulk'
+sqliteProfiles = {
+    'performance': OrderedDict([('journal_mode', 'WAL'), ('synchronous', 'NORMAL'), ('mmap_size', 268435456),
+                                ('cache_size', -65536), ('temp_store', 'MEMORY'), ('busy_timeout', 10000)]),
+    'safe': OrderedDict([('journal_mode', 'WAL'), ('synchronous', 'FULL'), ('busy_timeout', 10000)]),
+    'none': OrderedDict(),
+}
+sqliteProfiles[bulkLoadProfile] = OrderedDict(list(sqliteProfiles['performance'].items()) + list(bulkLoadPragmas.items()))
+defaultSqliteProfile = 'performance'
+
+def resolveSqliteProfile(conn, profile=None):
+    '''Returns pragmas dict for profile name (or cntlr.rssDBSqliteProfile/config), with config overrides'''
+    cntlr = conn.cntlr
+    profile = (profile or getattr(cntlr, 'rssDBSqliteProfile', None) or
+                cntlr.config.get('rssDBSqliteProfile', None) or defaultSqliteProfile)
+    if profile not in sqliteProfiles:
+        raise Exception('sqlite profile must be one of {}, {} was entered'.format(', '.join(sqliteProfiles), profile))
+    pragmas = OrderedDict(sqliteProfiles[profile])
+    if profile != 'none':
+        pragmas.update(cntlr.config.get('rssDBSqlitePragmas', None) or {})
+    if profile == bulkLoadProfile:
+        pragmas.update(bulkLoadPragmas)
+    return profile, pragmas
+
+def _pragma(conn, name, value=None):
+    if value is None:
+        res = conn.execute('PRAGMA {};'.format(name), fetch=True)
+    else:
+        res = conn.execute('PRAGMA {} = {};'.format(name, value), fetch=True)
+    return res[0][0] if res else None
+
+def applySqlitePragmas(conn, pragmas):
+    '''Sets pragmas on sqlite connection, returns dict of resulting values'''
+    result = OrderedDict()
+    if conn.product != 'sqlite':
+        return result
+    inMemory = conn.conParams.get('database', '') == ':memory:'
+    for name, value in pragmas.items():
+        if inMemory and name in ('journal_mode', 'mmap_size'):
+            continue
+        try:
+            _pragma(conn, name, value)
+            result[name] = _pragma(conn, name)
+        except Exception as e:
+            conn.addToLog(_('Could not set pragma {} = {}:\n{}').format(name, value, str(e)), messageCode="RssDB.Error",
+                            file=conn.conParams.get('database', ''), level=logging.ERROR)
+    conn.commit()
+    return result
+
+def _pendingIndexesFile(conn):
+    database = conn.conParams.get('database', '')
+    if not database or database == ':memory:':
+        return None
+    return database + '.pendingIndexes.json'
+
+def _processAlive(pid):
+    if pid == os.getpid():
+        return True
+    if sys.platform.lower().startswith('win'):
+        # os.kill terminates the process on windows, pending indexes are restored by any other connection
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _savePendingIndexes(conn, indexes):
+    pendingFile = _pendingIndexesFile(conn)
+    if not pendingFile:
+        return
+    if indexes:
+        with open(pendingFile, 'w') as f:
+            json.dump({'pid': os.getpid(), 'indexes': indexes}, f)
+    elif os.path.exists(pendingFile):
+        os.remove(pendingFile)
+
+def restorePendingIndexes(conn, indexes=None):
+    '''Recreates indexes deferred by bulkLoad, if indexes not given these are read from the side file left
+    by an interrupted load (skipped while the loading process is still running), returns number created'''
+    pendingFile = _pendingIndexesFile(conn)
+    if indexes is None:
+        if not pendingFile or not os.path.exists(pendingFile):
+            return 0
+        with open(pendingFile) as f:
+            pending = json.load(f)
+        if _processAlive(pending.get('pid')):
+            return 0
+        indexes = pending.get('indexes', {})
+    created = 0
+    for name, ddl in indexes.items():
+        startTime = time.perf_counter()
+        conn.execute(ddl.replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1) if 'IF NOT EXISTS' not in ddl.upper() else ddl, fetch=False)
+        conn.addToLog(_('Created index {} in {} secs').format(name, round(time.perf_counter() - startTime, 3)), messageCode="RssDB.Info",
+                        file=conn.conParams.get('database', ''), level=logging.INFO)
+        created += 1
+    conn.commit()
+    # shards created during the load were created without these indexes
+    created += createShardIndexes(conn, indexes)
+    _savePendingIndexes(conn, None)
+    return created
+
+def _deferIndexes(conn):
+    '''Drops secondary indexes on empty tables, returns dict of index name: DDL'''
+    deferred = OrderedDict()
+    res = conn.execute("SELECT name, tbl_name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL;", fetch=True)
+    emptyTables = dict()
+    for name, table, ddl in res:
+        if table not in emptyTables:
+            emptyTables[table] = not conn.execute('SELECT 1 FROM "{}" LIMIT 1;'.format(table), fetch=True)
+        # unique indexes enforce constraints during the load
+        if emptyTables[table] and not ddl.upper().startswith('CREATE UNIQUE'):
+            deferred[name] = ddl
+    # save before dropping so that indexes are restored if the load is interrupted
+    _savePendingIndexes(conn, deferred)
+    for name in deferred:
+        conn.execute('DROP INDEX IF EXISTS "{}";'.format(name), fetch=False)
+    conn.commit()
+    return deferred
+
+@contextmanager
+def bulkLoad(conn, deferIndexes=True):
+    '''Context for initial backfill of sqlite rssDB, relaxes synchronous and defers indexes of empty tables,
+    on exit indexes are created, prior pragma values restored and ANALYZE run. No-op for other products'''
+    if conn.product != 'sqlite':
+        yield conn
+        return
+    startTime = time.perf_counter()
+    deferred = _deferIndexes(conn) if deferIndexes else OrderedDict()
+    previous = OrderedDict((name, _pragma(conn, name)) for name in bulkLoadPragmas)
+    applySqlitePragmas(conn, bulkLoadPragmas)
+    # connections opened from conParams during the load (update workers) apply the bulk pragmas
+    previousProfile = conn.conParams.get('sqliteProfile')
+    conn.conParams['sqliteProfile'] = bulkLoadProfile
+    conn.addToLog(_('Bulk load mode on, deferred {} index(es)').format(len(deferred)), messageCode="RssDB.Info",
+                    file=conn.conParams.get('database', ''), level=logging.INFO)
+    try:
+        yield conn
+    finally:
+        conn.conParams['sqliteProfile'] = previousProfile
+        try:
+            conn.commit()
+            restorePendingIndexes(conn, deferred)
+            applySqlitePragmas(conn, previous)
+            conn.execute('ANALYZE;', fetch=False)
+            conn.commit()
+            conn.addToLog(_('Bulk load mode off, indexes restored and database analyzed, total time {} secs').format(round(time.perf_counter() - startTime, 3)),
+                            messageCode="RssDB.Info", file=conn.conParams.get('database', ''), level=logging.INFO)
+        except Exception as e:
+            conn.addToLog(_('Error while restoring settings after bulk load, indexes will be restored on next connect:\n{}').format(str(e)),
+                            messageCode="RssDB.Error", file=conn.conParams.get('database', ''), level=logging.ERROR)
@@ -0,0 +1,201 @@
+'''Parallel storing of filings into xbrlDB
+
+Filings are distributed over a pool of worker processes, each worker loads the search results rss feed
+once (to get the rssItems that filings are stored with), keeps its own controller and one long lived
+xbrlDB connection for all the filings it stores, instead of connecting (and verifying tables) for each
+filing. Filings already in xbrlDB are filtered out in the main process using the accession numbers
+from one query of xbrlDB before filings are sent to the workers, as are duplicate accession numbers in
+the selection, status of each filing is updated in the main process as results come back.
+'''
+
+import os, sys, time, gc, logging, inspect, traceback, concurrent.futures, multiprocessing, multiprocessing.util
+from collections import OrderedDict
+from arelle import ModelXbrl
+from arelle.FileSource import openFileSource
+from .CommonFunctions import _dbTypes, dbProduct, storeIntoDB, hasRefManager
+from .ArchiveCache import archivePrefetcher
+
+try:
+    from arellepy.CntlrPy import subProcessCntlrPy
+except:
+    from .arellepy.CntlrPy import subProcessCntlrPy
+
+if hasRefManager:
+    from .CommonFunctions import RefManager
+
+loadRetries = 3
+_storeWorker = dict()
+
+def _storeWorkerInit(setConfigDir, targetResDir, rssFeedPath, dbParams):
+    '''Worker initializer, creates the worker controller and loads the rss feed with the filings to store'''
+    import gettext
+    gettext.install('arelle')
+    cntlr = subProcessCntlrPy(instConfigDir=setConfigDir, useResDir=targetResDir, logFileName="logToBuffer", loadPlugins=True)
+    rssModelXbrl = ModelXbrl.load(cntlr.modelManager, openFileSource(rssFeedPath, cntlr))
+    _storeWorker.clear()
+    _storeWorker.update({'cntlr': cntlr, 'rssModelXbrl': rssModelXbrl, 'dbParams': dbParams, 'dbConn': None,
+                         'rssItems': {x.accessionNumber: x for x in rssModelXbrl.modelDocument.rssItems}})
+    if multiprocessing.current_process().name != 'MainProcess':
+        multiprocessing.util.Finalize(None, _storeWorkerClose, exitpriority=10)
+    return
+
+def _storeWorkerClose():
+    _closeWorkerDbConn()
+    if _storeWorker.get('rssModelXbrl'):
+        _storeWorker['rssModelXbrl'].close()
+    if _storeWorker.get('cntlr'):
+        _storeWorker['cntlr'].close()
+    _storeWorker.clear()
+    return
+
+def _closeWorkerDbConn(rollback=False):
+    conn = _storeWorker.get('dbConn')
+    _storeWorker['dbConn'] = None
+    if conn is not None:
+        try:
+            conn.close(rollback=rollback)
+        except Exception:
+            pass
+
+def _workerDbConn(modelXbrl):
+    '''Returns the worker xbrlDB connection bound to modelXbrl, connecting (and verifying tables) on first use'''
+    conn = _storeWorker.get('dbConn')
+    if conn is None:
+        dbParams = _storeWorker['dbParams']
+        conFunc = _dbTypes[dbParams[6]]
+        conn = conFunc(modelXbrl, dbParams[2], dbParams[3], dbParams[0], dbParams[1], dbParams[4], dbParams[5], dbProduct.get(dbParams[6], None))
+        if hasattr(conn, 'verifyTables'):
+            conn.verifyTables()
+        _storeWorker['dbConn'] = conn
+    conn.modelXbrl = modelXbrl
+    return conn
+
+def _insertFiling(modelXbrl, rssItem):
+    conn = _workerDbConn(modelXbrl)
+    insertXbrl = getattr(conn, 'insertXbrl', None)
+    if insertXbrl is None:
+        # connection type without per filing insert, store with a connection for this filing
+        storeIntoDB(_storeWorker['dbParams'], modelXbrl, rssItem)
+        return
+    params = inspect.signature(insertXbrl).parameters
+    kwargs = {'rssItem': rssItem} if 'rssItem' in params else {}
+    if 'entrypoint' in params:
+        kwargs['entrypoint'] = modelXbrl.modelDocument.uri
+    try:
+        insertXbrl(**kwargs)
+        conn.commit()
+    except Exception as e:
+        # connection state is unknown after a failed insert, reconnect for the next filing
+        _closeWorkerDbConn(rollback=True)
+        raise e
+
+def _storeFiling(accessionNumber, filingUrl):
+    '''Loads and stores one filing into xbrlDB, returns dict with status and error'''
+    startTime = time.perf_counter()
+    cntlr = _storeWorker['cntlr']
+    rssItem = _storeWorker['rssItems'].get(accessionNumber)
+    result = {'accessionNumber': accessionNumber, 'status': None, 'error': None, 'elapsed': 0}
+    modelXbrl = None
+    try:
+        if rssItem is None:
+            raise Exception(_('Filing {} not found in search results feed').format(accessionNumber))
+        for retry in range(loadRetries + 1):
+            modelXbrl = ModelXbrl.load(cntlr.modelManager, openFileSource(filingUrl if retry == 0 else rssItem.zippedUrl, cntlr))
+            if 'FileNotLoadable' not in modelXbrl.errors:
+                break
+            modelXbrl.close()
+            modelXbrl = None
+        if modelXbrl is None:
+            result['status'] = 'Download Failed'
+            result['error'] = _('Could not fetch filing {}').format(rssItem.url)
+            return result
+        if hasRefManager:
+            try:
+                edgarResourcesFolder = os.path.join(os.path.dirname(RefManager.__file__), 'resources')
+                RefManager.RefManager(edgarResourcesFolder).loadAddedUrls(modelXbrl, cntlr)
+            except Exception as e:
+                cntlr.addToLog(_('Could not load additional files for filing {}\n{}').format(rssItem.url, str(e)), messageCode='arellePy.Info', level=logging.INFO)
+        _insertFiling(modelXbrl, rssItem)
+        result['status'] = 'Inserted Into DB'
+    except Exception as e:
+        result['status'] = 'Failed'
+        result['error'] = '{}\n{}'.format(str(e), ''.join(traceback.format_tb(sys.exc_info()[2])))
+    finally:
+        if modelXbrl is not None:
+            modelXbrl.close()
+        gc.collect()
+        result['elapsed'] = time.perf_counter() - startTime
+    return result
+
+def storeFilingsParallel(cntlr, rssItems, dbParams, viewObj, maxWorkers=None, archiveCache=None):
+    '''Stores rssItems (not marked skipRssItem) into xbrlDB using maxWorkers processes
+
+    args:
+        cntlr: main controller
+        rssItems: rssItems from search results feed, all from the same feed document
+        dbParams: xbrlDB connection params list (host, port, user, password, database, timeout, product)
+        viewObj: function(rssItem, res, stat) to update the status of a filing
+        maxWorkers: number of worker processes, defaults to half of cpu count
+        archiveCache: filingArchiveCache, archives are prefetched while filings are stored
+
+    Returns dict with counts of stored, skipped and failed filings.
+    '''
+    startTime = time.perf_counter()
+    toStore = OrderedDict()
+    skipped = 0
+    for rssItem in rssItems:
+        if getattr(rssItem, 'skipRssItem', False):
+            viewObj(rssItem, 'Skipped', 'Already In DB')
+            skipped += 1
+        elif rssItem.accessionNumber in toStore:
+            viewObj(rssItem, 'Skipped', 'Duplicate accession number')
+            skipped += 1
+        else:
+            toStore[rssItem.accessionNumber] = rssItem
+    if skipped:
+        cntlr.addToLog(_("{} filing(s) already in DB or duplicate - Skipped").format(skipped), messageCode='arellePy.Info', level=logging.INFO)
+    result = {'stored': 0, 'skipped': skipped, 'failed': 0}
+    if not toStore:
+        return result
+
+    rssFeedPath = next(iter(toStore.values())).modelXbrl.modelDocument.uri
+    if not maxWorkers:
+        maxWorkers = os.cpu_count()/2
+    maxWorkers = max(1, min(int(maxWorkers), len(toStore)))
+    initArgs = (os.path.dirname(cntlr.userAppDir), os.path.dirname(cntlr.imagesDir), rssFeedPath, list(dbParams))
+
+    def filingsIter():
+        if not archiveCache:
+            for rssItem in toStore.values():
+                yield rssItem, rssItem.zippedUrl
+            return
+        for rssItem, localUrl, error in archivePrefetcher(archiveCache, list(toStore.values()), ahead=max(maxWorkers, archiveCache.prefetchAhead), entryUrls=True):
+            yield rssItem, localUrl or rssItem.zippedUrl
+
+    def handleResult(res):
+        rssItem = toStore[res['accessionNumber']]
+        if res['error']:
+            result['failed'] += 1
+            viewObj(rssItem, res=res['status'], stat='Finished')
+            cntlr.addToLog(_('Failed storing filing {} into xbrlDB:\n{}').format(res['accessionNumber'], res['error']), messageCode='arellePy.Error', level=logging.ERROR)
+        else:
+            result['stored'] += 1
+            viewObj(rssItem, res=res['status'], stat='Finished')
+            cntlr.addToLog(_('{}/{} Stored filing {} into xbrlDB in {} secs').format(result['stored'] + result['failed'], len(toStore), res['accessionNumber'], round(res['elapsed'], 3)),
+                            messageCode='arellePy.Info', level=logging.INFO)
+
+    cntlr.addToLog(_('Storing {} filing(s) into xbrlDB with {} worker(s)').format(len(toStore), maxWorkers), messageCode='arellePy.Info', level=logging.INFO)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=maxWorkers, initializer=_storeWorkerInit, initargs=initArgs) as executor:
+        futures = set()
+        for rssItem, filingUrl in filingsIter():
+            viewObj(rssItem, stat='Queued')
+            futures.add(executor.submit(_storeFiling, rssItem.accessionNumber, filingUrl))
+            for future in [x for x in futures if x.done()]:
+                futures.discard(future)
+                handleResult(future.result())
+        for future in concurrent.futures.as_completed(futures):
+            handleResult(future.result())
+    cntlr.addToLog(_('Finished storing filings into xbrlDB in {} secs, {} stored, {} failed, {} skipped').format(
+                    round(time.perf_counter() - startTime, 3), result['stored'], result['failed'], result['skipped']),
+                    messageCode='arellePy.Info', level=logging.INFO)
+    return result
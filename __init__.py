@@ -11,7 +11,7 @@ During the month the current month file is rebuilt to include most recent data
 and will usually contain filings up to date.
 '''
 
-import os, pathlib, logging, time, atexit, threading, gettext
+import os, pathlib, logging, time, atexit, threading, gettext, contextlib
 from datetime import datetime, timedelta
 from collections import defaultdict
 
@@ -52,6 +52,20 @@ def rssDBCmdLineOptionExtender(parser, *args, **kwargs):
     parser.add_option("--rssDBupdateDateTo", action='store', dest="rssDBupdateDateTo", default=None, help=_("Optional - To Date for date range to update formated as yyy-mmm-dd"))
     parser.add_option("--rssDBupdateDoNOTGetLatest", action='store_false', dest="rssDBupdateDoNOTGetLatest", default=True, help=_("Optional - Flag to stop update from retriving latest filing not yet in the monthly archived feeds on SEC website"))
     parser.add_option("--rssDBupdateMaxWorkers", action='store', dest="rssDBupdateMaxWorkers", default=None, help=_("Optional - max number of processes to use during the update, defaults to half available cpus"))
+    parser.add_option("--rssDBupdateLoc", action='store', dest="rssDBupdateLoc", default=None,
+                        help=_("Optional - Folder of monthly feeds (xbrlrss-YYYY-MM.xml) to update from instead of SEC website, such as a mirror synced with --rssDBmirrorSync, "
+                               "defaults to the mirror folder when --rssDBmirrorSync is given"))
+    parser.add_option("--rssDBmirrorSync", action='store', dest="rssDBmirrorSync", default=None,
+                        help=_("Folder to sync SEC monthly feeds into (does not need a db connection), only new or changed feeds are downloaded using conditional requests, "
+                               "limited to --rssDBupdateDateFrom and --rssDBupdateDateTo months if given, the folder can be shared by several rssDB instances"))
+    parser.add_option("--rssDBmirrorForce", action='store_true', dest="rssDBmirrorForce", default=False,
+                        help=_("Optional - Flag to send a conditional request for every feed on --rssDBmirrorSync, even when listed with the same date as the last sync"))
+    parser.add_option("--rssDBupdateMetricsFile", action='store', dest="rssDBupdateMetricsFile", default=None,
+                        help=_("Optional - file to save update stage timings and counters, json summary if file ends with .json otherwise Prometheus text format, rewritten after each update"))
+    parser.add_option("--rssDBprofile", action='store', dest="rssDBprofile", default=None,
+                        help=_("Optional - folder to save profiles of the update, profiles the main process and every worker task with cProfile and merges them into a single pstats file and report"))
+    parser.add_option("--rssDBprofileMemory", action='store_true', dest="rssDBprofileMemory", default=False,
+                        help=_("Optional - Flag to also trace memory allocations (tracemalloc) in each task when --rssDBprofile is set and report top allocation sites (slow)"))
     
     parser.add_option("--rssDBupdateEnableAuto", action='store_true', dest="rssDBupdateEnableAuto", default=False, 
                         help=_("Optional - Flag to enable auto-update, if set, runs a thread to check SEC site for updates every 10 minutes for the next period of time specified by" 
@@ -64,6 +78,23 @@ def rssDBCmdLineOptionExtender(parser, *args, **kwargs):
     parser.add_option("--rssDBupdateEnableAutoMinutes", action='store', dest="rssDBupdateEnableAutoMinutes", default=0, type='int',
                         help=_("Options - integer specifying number of minutes to keep updating the database, default 0 minute(s)"))
 
+    # benchmark group
+    parser.add_option("--rssDBbenchmarkMakeFeeds", action='store', dest="rssDBbenchmarkMakeFeeds", default=None,
+                        help=_("Folder to write synthetic monthly feeds (xbrlrss-YYYY-MM.xml) to be used for offline benchmark, see --rssDBbenchmarkMonths, "
+                               "--rssDBbenchmarkItems, --rssDBbenchmarkFilesPerItem and --rssDBbenchmarkInlineRatio"))
+    parser.add_option("--rssDBbenchmarkMonths", action='store', dest="rssDBbenchmarkMonths", default=12, type='int', help=_("Number of synthetic monthly feeds to generate, default 12"))
+    parser.add_option("--rssDBbenchmarkItems", action='store', dest="rssDBbenchmarkItems", default=1000, type='int', help=_("Number of filings in each synthetic feed, default 1000"))
+    parser.add_option("--rssDBbenchmarkFilesPerItem", action='store', dest="rssDBbenchmarkFilesPerItem", default=6, type='int', help=_("Number of files in each synthetic filing, default 6"))
+    parser.add_option("--rssDBbenchmarkInlineRatio", action='store', dest="rssDBbenchmarkInlineRatio", default=0.6, type='float', help=_("Proportion of inline XBRL filings in synthetic feeds, default 0.6"))
+    parser.add_option("--rssDBbenchmark", action='store', dest="rssDBbenchmark", default=None,
+                        help=_("Folder containing (synthetic) monthly feeds, runs the ingestion benchmark on the connected db (should be a new db) and reports feeds/s, rows/s, peak RSS and db size"))
+    parser.add_option("--rssDBbenchmarkBaseline", action='store', dest="rssDBbenchmarkBaseline", default=None, help=_("Optional - json file with baseline results to compare benchmark results to"))
+    parser.add_option("--rssDBbenchmarkUpdateBaseline", action='store_true', dest="rssDBbenchmarkUpdateBaseline", default=False, help=_("Optional - Flag to save benchmark results to baseline file"))
+    parser.add_option("--rssDBbenchmarkStartup", action='store', dest="rssDBbenchmarkStartup", default=None,
+                        help=_("Comma separated plugin modules (e.g. RssDB,CommonFunctions) to measure the import time of, each in a fresh python process, "
+                               "reports import time and heaviest imports, 'all' for the plugin entry modules"))
+    parser.add_option("--rssDBbenchmarkTolerance", action='store', dest="rssDBbenchmarkTolerance", default=0.15, type='float', help=_("Optional - allowed deterioration from baseline before reporting a regression, default 0.15 (15%)"))
+
     # db report group
     parser.add_option("--rssDBreportlaunch", action='store_true', dest="rssDBreportlaunch", help=_("Flag to launch db report (dash/flask flask app)"))
     parser.add_option("--rssDBreporthost", action='store', default='0.0.0.0', dest="rssDBreporthost", help=_("Host for db report defaults to 0.0.0.0"))
@@ -80,7 +111,7 @@ def rssDBCmdLineOptionExtender(parser, *args, **kwargs):
     parser.add_option("--rssDBsearchdateTo", action='store', dest="rssDBsearchdateTo", 
                         help=_("Filing date in the format: yyyy-mm-dd, if left empty, gets up to the latest filing date, filings are sorted descending by filing date, LIMITS the query to this end data."))
     parser.add_option("--rssDBsearchassignedSic", action='store', dest="rssDBsearchassignedSic", 
-                            help=_("Comma separated SEC industry code(s), LIMITS the query to selected industries"))
+                            help=_("Comma separated SEC industry code(s), a code followed by * includes all industries under it (e.g. 20* for manufacturing), LIMITS the query to selected industries"))
     parser.add_option("--rssDBsearchinlineXBRL", action='store', dest="rssDBsearchinlineXBRL", choices = ['yes', 'no'],
                             help=_("True, False or empty, True returns ONLY inlineXbrl filings, False returns ONLY non inlineXbrl, empty returns ALL"))
     parser.add_option("--rssDBsearchlimit", action='store', type='int', dest="rssDBsearchlimit", help=_("Limits the number of rows returned by query"))
@@ -93,6 +124,8 @@ def rssDBCmdLineOptionExtender(parser, *args, **kwargs):
                         help=_("Comma separated cik Numbers, example: 0001234567, 0007654321,... \n Looks for the EXACT CIK Number(s) in addition to ticker(s) and companies names."))
     parser.add_option("--rssDBsearchformType", action='store', dest="rssDBsearchformType",
                         help=_("Comma separated SEC form type, example: 10-K, 10-Q,..., limits the query to the selected form(s)"))
+    parser.add_option("--rssDBsuggest", action='store', dest="rssDBsuggest",
+                        help=_("Prints filers names (including former names) and ticker symbols starting with the given text, to find values for --rssDBsearchcompanyName and --rssDBsearchtickerSymbol"))
     # Result save
     parser.add_option("--rssDBsearchresultFile", action='store', dest="rssDBsearchresultFile",
                         help=_("Absolute path to file to save query result as an RSS feed (.xml) that can be processed by arelle"))
@@ -108,8 +141,62 @@ def rssDBCmdLineOptionExtender(parser, *args, **kwargs):
     parser.add_option("--rssDBsearchEdgarViewer", action='store_true', default=False, dest="rssDBsearchEdgarViewer",
                     help=_("Launches Edgar Viewer initially with the rendered reports from --rssDBSearchrenderEdgarReports"))
 
+    parser.add_option("--rssDBcompression", action='store', dest="rssDBcompression", default=None, choices=['zstd', 'zlib', 'none'],
+                        help=_("Compression codec for rss items and formula results columns, one of zstd (default if zstandard package is installed), zlib or none"))
+    parser.add_option("--rssDBcompressExisting", action='store_true', dest="rssDBcompressExisting", default=False,
+                        help=_("Compress existing uncompressed rss items and formula results in place after connecting (changes these columns to BYTEA on postgres)"))
+    parser.add_option("--rssDBroundTripCheck", action='store_true', dest="rssDBroundTripCheck", default=False,
+                        help=_("Check that rows of a synthetic feed read back as written after compressing existing rows and after storing in and restoring from "
+                                "cold storage, runs on an in-memory sqlite db "
+                                "(does not need a db connection), uses the --rssDBcompression codec"))
+
+    parser.add_option("--rssDBsqliteProfile", action='store', dest="rssDBsqliteProfile", default=None, choices=['performance', 'safe', 'none'],
+                        help=_("SQLite pragmas applied on connect, 'performance' (default) WAL journal with synchronous NORMAL, mmap and larger cache, "
+                                "'safe' WAL journal with synchronous FULL, 'none' sqlite defaults"))
+    parser.add_option("--rssDBpartitionBy", action='store', dest="rssDBpartitionBy", default=None, choices=['month', 'year', 'none'],
+                        help=_("Postgres only - when creating rssDB tables, range partition filingsInfo and filesInfo by feed month or year "
+                                "(requires postgres 12+), partitions for new months are created during updates"))
+    parser.add_option("--rssDBsqliteShardYears", action='store', type='int', dest="rssDBsqliteShardYears", default=None,
+                        help=_("SQLite only - when creating rssDB, keep filingsInfo, filesInfo and rssItems in shard database files "
+                                "next to the database, each holding the feeds of this number of years, shards are attached on connect "
+                                "(sqlite attaches at most 10 databases, 3 years per shard covers 2005-2034)"))
+    parser.add_option("--rssDBcoldStore", action='store', dest="rssDBcoldStore", default=None,
+                        help=_("Move filesInfo and rssItems rows of feeds YYYYMM or YYYYMM-YYYYMM to compressed cold storage files, "
+                                "these rows are read from the files when requested"))
+    parser.add_option("--rssDBcoldRestore", action='store', dest="rssDBcoldRestore", default=None,
+                        help=_("Restore rows of feeds YYYYMM or YYYYMM-YYYYMM from cold storage back into the database"))
+    parser.add_option("--rssDBcoldStoreDir", action='store', dest="rssDBcoldStoreDir", default=None,
+                        help=_("Folder for cold storage files, default is <database>_coldStore next to sqlite database or rssDBColdStore in arelle user app folder"))
+    parser.add_option("--rssDBexportParquet", action='store', dest="rssDBexportParquet", default=None,
+                        help=_("Folder to export filingsInfo, filesInfo, formulaeResults (partitioned by feedId) and filersInfo to parquet, "
+                                "only feeds changed since the last export to the folder are rewritten, requires pyarrow"))
+    parser.add_option("--rssDBexportParquetFull", action='store_true', dest="rssDBexportParquetFull", default=False,
+                        help=_("Rewrite all partitions when exporting to parquet with --rssDBexportParquet"))
+    parser.add_option("--rssDBbulkLoad", action='store_true', dest="rssDBbulkLoad", default=False,
+                        help=_("SQLite only - run update in bulk load mode, relaxes synchronous and defers indexes of empty tables during the update "
+                                "then restores indexes and settings and runs ANALYZE, intended for the initial backfill"))
+
+    parser.add_option("--rssDBarchiveCacheDir", action='store', dest="rssDBarchiveCacheDir", default=None,
+                        help=_("Folder for local store of filing archives used when rendering Edgar reports, running formulae and storing into xbrlDB, "
+                               "each filing archive is downloaded once"))
+    parser.add_option("--rssDBarchiveCacheMaxGB", action='store', dest="rssDBarchiveCacheMaxGB", default=20, type='float',
+                        help=_("Disk budget in GB for filing archives store, least recently used archives are removed when exceeded, default 20"))
+    parser.add_option("--rssDBarchivePrefetch", action='store', dest="rssDBarchivePrefetch", default=4, type='int',
+                        help=_("Number of filing archives to download ahead in background threads while filings are processed, default 4"))
+    parser.add_option("--rssDBsecMaxRequestsPerSec", action='store', dest="rssDBsecMaxRequestsPerSec", default=10, type='float',
+                        help=_("Maximum number of requests per second to SEC (filing archives, feeds, mirror) across all threads, default 10"))
+
     parser.add_option("--rssDBFormulaRemoveDups", action='store_true', dest="rssDBFormulaRemoveDups", default=False, 
                         help=_("Flag whether to remove duplicates after formula processing uses class 'ValidateFormula.Finished'"))
+    parser.add_option("--rssDBFormulaMaxWorkers", action='store', dest="rssDBFormulaMaxWorkers", default=None, type='int',
+                        help=_("Optional - number of processes to use when running formula from db on search results, defaults to half available cpus"))
+    parser.add_option("--rssDBFormulaBatchSize", action='store', dest="rssDBFormulaBatchSize", default=50, type='int',
+                        help=_("Optional - number of formula results to write to db at once, default 50"))
+    parser.add_option("--rssDBFormulaRecomputeUnchanged", action='store_true', dest="rssDBFormulaRecomputeUnchanged", default=False,
+                        help=_("With '--arellepyRunFormulaFromDBUpdateExistingResults', also recompute results produced by identical formula content, "
+                               "by default only results from a changed formula (linkbase or imports) are recomputed"))
+    parser.add_option("--rssDBFormulaDryRun", action='store_true', dest="rssDBFormulaDryRun", default=False,
+                        help=_("Only report how many filings would be (re)computed when running formula from db, formula is not run"))
 
     # Add formula to db
     parser.add_option("--rssDBAddFormula", action='store_true', dest="rssDBAddFormula", default=False, 
@@ -134,6 +221,9 @@ def rssDBCmdLineOptionExtender(parser, *args, **kwargs):
     parser.add_option("--rssDBStoreSearchResultsIntoXBRLDB", action='store', dest="rssDBStoreSearchResultsIntoXBRLDB",
                         help=_("Enter Connection paramaters for xbrlDB database to store search results (if any). Connection params are comma separated string as follows: "
                                 "host,port,user,password,database[,timeout[,{'postgres|mssqlSemantic|mysqlSemantic|orclSemantic|pgSemantic|sqliteSemantic|pgOpenDB|sqliteDpmDB|rexster|rdfDB|json'}]]"))
+    parser.add_option("--rssDBStoreIntoXBRLDBMaxWorkers", action='store', dest="rssDBStoreIntoXBRLDBMaxWorkers", default=None, type='int',
+                        help=_("Optional - number of processes to use when storing search results into xbrlDB, each process keeps its own xbrlDB connection, "
+                                "filings are stored one at a time if not set or 1"))
 
 def utilityRun(cntlr, options, **kwargs):
     gettext.install('arelle')
@@ -144,6 +234,29 @@ def utilityRun(cntlr, options, **kwargs):
 
     if getattr(options, 'rssDBFormulaRemoveDups', False):
         cntlr.rssDBFormulaRemoveDups = options.rssDBFormulaRemoveDups
+
+    if getattr(options, 'rssDBcompression', None):
+        cntlr.rssDBCompression = options.rssDBcompression
+
+    if getattr(options, 'rssDBpartitionBy', None):
+        cntlr.rssDBPartitionBy = options.rssDBpartitionBy
+
+    if getattr(options, 'rssDBsqliteProfile', None):
+        cntlr.rssDBSqliteProfile = options.rssDBsqliteProfile
+
+    if getattr(options, 'rssDBsqliteShardYears', None):
+        cntlr.rssDBSqliteShardYears = options.rssDBsqliteShardYears
+
+    if getattr(options, 'rssDBcoldStoreDir', None):
+        cntlr.rssDBColdStoreDir = options.rssDBcoldStoreDir
+
+    if getattr(options, 'rssDBsecMaxRequestsPerSec', None):
+        # one rate for all requests to SEC in the process (filing archives, feeds, mirror)
+        try:
+            from .ArchiveCache import secRateLimiter
+        except:
+            from rssDB.ArchiveCache import secRateLimiter
+        secRateLimiter.setRate(options.rssDBsecMaxRequestsPerSec)
     
     if not hasattr(cntlr, 'userAppTempDir'):
         cntlr.userAppTempDir = os.path.join(cntlr.userAppDir, 'temps')
@@ -166,6 +279,46 @@ def utilityRun(cntlr, options, **kwargs):
                     messageCode="arellepy.Error", file=__name__,  level=logging.ERROR)
             raise Exception(_('Only one of  "--arellepyRunFormulaFromDB" or "--arellepyRunFormula" can be chosen'))
 
+    if options.rssDBbenchmarkMakeFeeds:
+        try:
+            from .Benchmark import makeSyntheticFeeds
+        except:
+            from rssDB.Benchmark import makeSyntheticFeeds
+        feedsPaths = makeSyntheticFeeds(options.rssDBbenchmarkMakeFeeds, months=options.rssDBbenchmarkMonths, items=options.rssDBbenchmarkItems,
+                                        filesPerItem=options.rssDBbenchmarkFilesPerItem, inlineRatio=options.rssDBbenchmarkInlineRatio)
+        cntlr.addToLog(_('Created {} synthetic feeds in {}').format(len(feedsPaths), options.rssDBbenchmarkMakeFeeds),
+                        messageCode="RssDB.Info", file=options.rssDBbenchmarkMakeFeeds, level=logging.INFO)
+
+    if options.rssDBbenchmarkStartup:
+        try:
+            from .Benchmark import benchmarkStartup, reportStartupBenchmark, startupModules
+        except:
+            from rssDB.Benchmark import benchmarkStartup, reportStartupBenchmark, startupModules
+        _modules = startupModules if options.rssDBbenchmarkStartup.strip().lower() == 'all' else \
+                    [x.strip() for x in options.rssDBbenchmarkStartup.split(',') if x.strip()]
+        reportStartupBenchmark(cntlr, benchmarkStartup(_modules))
+
+    if options.rssDBroundTripCheck:
+        try:
+            from .RoundTrip import roundTripCheck
+        except:
+            from rssDB.RoundTrip import roundTripCheck
+        try:
+            roundTripCheck(cntlr)
+        except Exception as e:
+            cntlr.addToLog(_('Error while running round trip checks:\n{}').format(str(e)), messageCode="RssDB.Error", file=__name__, level=logging.ERROR)
+
+    if options.rssDBmirrorSync:
+        try:
+            from .Mirror import syncMonthlyMirror
+        except:
+            from rssDB.Mirror import syncMonthlyMirror
+        try:
+            syncMonthlyMirror(cntlr, options.rssDBmirrorSync, dateFrom=options.rssDBupdateDateFrom, dateTo=options.rssDBupdateDateTo,
+                                force=options.rssDBmirrorForce)
+        except Exception as e:
+            cntlr.addToLog(_('Error while syncing mirror:\n{}').format(str(e)), messageCode="RssDB.Error", file=options.rssDBmirrorSync, level=logging.ERROR)
+
     if options.rssDBconnect: # initiates rss db connection, everything depends on this
         try:
             from .RssDB import rssDBConnection
@@ -208,8 +361,43 @@ def utilityRun(cntlr, options, **kwargs):
                 cntlr.addToLog(_l, messageCode="RssDB.Info", file='{}{}{}'.format(options.rssDBhost, '/' if options.rssDBhost else '', os.path.basename(options.rssDBdatabase)),
                                  level=logging.INFO)
 
+        if options.rssDBarchiveCacheDir:
+            try:
+                from .ArchiveCache import filingArchiveCache
+            except:
+                from rssDB.ArchiveCache import filingArchiveCache
+            try:
+                con.archiveCache = filingArchiveCache(con, options.rssDBarchiveCacheDir, maxBytes=options.rssDBarchiveCacheMaxGB * 1024 ** 3,
+                                                      prefetchAhead=options.rssDBarchivePrefetch)
+            except Exception as e:
+                cntlr.addToLog(_('Could not initialize filing archive cache:\n{}').format(str(e)), messageCode="RssDB.Error", file=con.conParams.get('database', ''), level=logging.ERROR)
+
+        if options.rssDBcompressExisting:
+            try:
+                from .Compression import compressExistingRows
+            except:
+                from rssDB.Compression import compressExistingRows
+            try:
+                compressExistingRows(con)
+            except Exception as e:
+                cntlr.addToLog(_('Error while compressing existing rows:\n{}').format(str(e)), messageCode="RssDB.Error", file=con.conParams.get('database', ''), level=logging.ERROR)
+
+        if options.rssDBcoldStore or options.rssDBcoldRestore:
+            try:
+                from .ColdStorage import storeColdFeeds, restoreColdFeeds, parseFeedRange
+            except:
+                from rssDB.ColdStorage import storeColdFeeds, restoreColdFeeds, parseFeedRange
+            try:
+                if options.rssDBcoldRestore:
+                    restoreColdFeeds(con, *parseFeedRange(options.rssDBcoldRestore))
+                if options.rssDBcoldStore:
+                    storeColdFeeds(con, *parseFeedRange(options.rssDBcoldStore))
+            except Exception as e:
+                cntlr.addToLog(_('Error while moving rows to or from cold storage:\n{}').format(str(e)), messageCode="RssDB.Error", file=con.conParams.get('database', ''), level=logging.ERROR)
+
         # Update
         if options.rssDBupdate:
+            updateLoc = options.rssDBupdateLoc or options.rssDBmirrorSync
             if options.rssDBupdateEnableAuto:
                 duration = timedelta(days=options.rssDBupdateEnableAutoDays, hours=options.rssDBupdateEnableAutoHours, minutes=options.rssDBupdateEnableAutoMinutes)
                 
@@ -221,18 +409,49 @@ def utilityRun(cntlr, options, **kwargs):
                 
 
                 updateKwargsDict = {
-                    'setAutoUpdate': True, 'duration':duration,
+                    'setAutoUpdate': True, 'duration':duration, 'loc': updateLoc,
                     'dateFrom': options.rssDBupdateDateFrom,
                      'dateTo': options.rssDBupdateDateTo,
                      'includeLatest': options.rssDBupdateDoNOTGetLatest,
-                     'maxWorkers': options.rssDBupdateMaxWorkers
+                     'maxWorkers': options.rssDBupdateMaxWorkers,
+                     'metricsFile': options.rssDBupdateMetricsFile,
+                     'profile': options.rssDBprofile,
+                     'profileMemory': options.rssDBprofileMemory
                 }
 
                 con.dbUpdateThread = threading.Thread(target=autoUpdateHelper, args=(cntlr, con, updateKwargsDict), daemon=True)
                 con.dbUpdateThread.start()
                 time.sleep(3) # give time to setup thread and add info msg to cntlr
             else:
-                con.doAll(dateFrom=options.rssDBupdateDateFrom, dateTo=options.rssDBupdateDateTo, includeLatest = options.rssDBupdateDoNOTGetLatest, maxWorkers=options.rssDBupdateMaxWorkers)
+                try:
+                    from .SqliteProfile import bulkLoad
+                except:
+                    from rssDB.SqliteProfile import bulkLoad
+                with bulkLoad(con, deferIndexes=True) if options.rssDBbulkLoad else contextlib.nullcontext(con):
+                    con.doAll(loc=updateLoc, dateFrom=options.rssDBupdateDateFrom, dateTo=options.rssDBupdateDateTo, includeLatest = options.rssDBupdateDoNOTGetLatest, maxWorkers=options.rssDBupdateMaxWorkers,
+                                metricsFile=options.rssDBupdateMetricsFile, profile=options.rssDBprofile, profileMemory=options.rssDBprofileMemory)
+
+        if options.rssDBexportParquet:
+            try:
+                from .Export import exportParquet
+            except:
+                from rssDB.Export import exportParquet
+            try:
+                exportParquet(con, options.rssDBexportParquet, full=options.rssDBexportParquetFull)
+            except Exception as e:
+                cntlr.addToLog(_('Error while exporting to parquet:\n{}').format(str(e)), messageCode="RssDB.Error", file=con.conParams.get('database', ''), level=logging.ERROR)
+
+        if options.rssDBbenchmark:
+            try:
+                from .Benchmark import benchmarkConnection, reportBenchmark
+            except:
+                from rssDB.Benchmark import benchmarkConnection, reportBenchmark
+            try:
+                benchmarkResult = benchmarkConnection(con, options.rssDBbenchmark, maxWorkers=options.rssDBupdateMaxWorkers)
+                reportBenchmark(cntlr, [benchmarkResult], baselineFile=options.rssDBbenchmarkBaseline,
+                                updateBaseline=options.rssDBbenchmarkUpdateBaseline, tolerance=options.rssDBbenchmarkTolerance)
+            except Exception as e:
+                cntlr.addToLog(_('Error while running benchmark:\n{}').format(str(e)), messageCode="RssDB.Error", file=con.conParams.get('database', ''), level=logging.ERROR)
 
         if options.rssDBreportlaunch:
             reportLog = logging.getLogger('werkzeug')
@@ -255,6 +474,19 @@ def utilityRun(cntlr, options, **kwargs):
                     con.rollback()
                 cntlr.addToLog(_('Error while adding formula to db:\n{}').format(str(e)), messageCode="RssDB.Error", file=con.conParams.get('database', ''), level=logging.ERROR)
 
+        # Suggest filers names and tickers
+        if options.rssDBsuggest:
+            try:
+                from .Autocomplete import suggestFilers
+            except:
+                from rssDB.Autocomplete import suggestFilers
+            suggestions = suggestFilers(con, options.rssDBsuggest, limit=options.rssDBsearchlimit or 10)
+            lines = [_('Filers names starting with "{}":').format(options.rssDBsuggest)]
+            lines.extend('  {} (cik {}){}'.format(name, cik, _(', now {}').format(currentName) if currentName else '') for name, cik, currentName in suggestions['names'])
+            lines.append(_('Ticker symbols starting with "{}":').format(options.rssDBsuggest))
+            lines.extend('  {} - {} (cik {})'.format(ticker, name, cik) for ticker, cik, name in suggestions['tickers'])
+            cntlr.addToLog('\n'.join(lines), messageCode="RssDB.Info", file=con.conParams.get('database', ''), level=logging.INFO)
+
         # Search DB
         if options.rssDBsearch:
             qResult = con.searchFilings(
@@ -292,14 +524,21 @@ def utilityRun(cntlr, options, **kwargs):
                             cntlr.addToLog(_('A formula Id to run must be entered for option --arellepyRunFormulaId'),
                                             messageCode="RssDB.Error", file=resultFile, level=logging.ERROR)                            
                         else:
-                            from arellepy.CntlrPy import runFormulaFromDBonRssItems
+                            try:
+                                from .FormulaRunner import runFormulaParallel
+                            except:
+                                from rssDB.FormulaRunner import runFormulaParallel
                             cntlr.formulaeResults = defaultdict(dict)
                             try:
-                                formulaResults = runFormulaFromDBonRssItems(conn=con, rssItems=rssItems, formulaId=int(options.arellepyRunFormulaId) if options.arellepyRunFormulaId else options.arellepyRunFormulaId,
-                                                                            insertResultIntoDb=options.arellepyRunFormulaFromDBInsertResultIntoDb,
-                                                                            updateExistingResults=options.arellepyRunFormulaFromDBUpdateExistingResults,
-                                                                            saveResultsToFolder=options.arellepyRunFormulaSaveResultsToFolder,
-                                                                            folderPath=options.arellepyRunFormulaFolderPath)
+                                formulaResults = runFormulaParallel(conn=con, rssItems=rssItems, formulaId=int(options.arellepyRunFormulaId) if options.arellepyRunFormulaId else options.arellepyRunFormulaId,
+                                                                    insertResultIntoDb=options.arellepyRunFormulaFromDBInsertResultIntoDb,
+                                                                    updateExistingResults=options.arellepyRunFormulaFromDBUpdateExistingResults,
+                                                                    saveResultsToFolder=options.arellepyRunFormulaSaveResultsToFolder,
+                                                                    folderPath=options.arellepyRunFormulaFolderPath,
+                                                                    maxWorkers=options.rssDBFormulaMaxWorkers, batchSize=options.rssDBFormulaBatchSize,
+                                                                    recomputeUnchanged=options.rssDBFormulaRecomputeUnchanged,
+                                                                    dryRun=options.rssDBFormulaDryRun, returnResults=True,
+                                                                    archiveCache=getattr(con, 'archiveCache', None))
                                 cntlr.formulaeResults[options.arellepyRunFormulaId] = formulaResults
                             except Exception as e:
                                 cntlr.addToLog(_('Error while running formula:\n {}').format(str(e)),
@@ -309,7 +548,8 @@ def utilityRun(cntlr, options, **kwargs):
                         _pluginDir = options.rssDBsearchEdgarRenderPlugins
                         pluginDir = [p.strip() for p in  _pluginDir.split(',')] if _pluginDir else None
                         if options.rssDBsearchEdgarRenderFolder:
-                            output = runRenderEdgar(mainCntlr=cntlr, rssItems=rssItems, saveToFolder=options.rssDBsearchEdgarRenderFolder, pluginsDirs=pluginDir)
+                            output = runRenderEdgar(mainCntlr=cntlr, rssItems=rssItems, saveToFolder=options.rssDBsearchEdgarRenderFolder, pluginsDirs=pluginDir,
+                                                    archiveCache=getattr(con, 'archiveCache', None))
                             cntlr.addToLog(_('Render results saved to folder {}').format(output),
                                             messageCode="RssDB.Info", file=resultFile,  level=logging.INFO)
                             if options.rssDBsearchEdgarViewer:
@@ -323,7 +563,8 @@ def utilityRun(cntlr, options, **kwargs):
                             for _i in rssItems:
                                 _i.status = None
                                 _i.results = []
-                            storeInToXbrlDB(cntlr=cntlr,rssItems= rssItems,params=options.rssDBStoreSearchResultsIntoXBRLDB)
+                            storeInToXbrlDB(cntlr=cntlr,rssItems= rssItems,params=options.rssDBStoreSearchResultsIntoXBRLDB, archiveCache=getattr(con, 'archiveCache', None),
+                                            maxWorkers=options.rssDBStoreIntoXBRLDBMaxWorkers)
                         except Exception as e:
                             cntlr.addToLog(str(e), messageCode="RssDB.Error",  level=logging.ERROR)
         if options.arellepyRunFormula:
@@ -66,7 +66,7 @@ CREATE TABLE IF NOT EXISTS "filingsInfo" (
         REFERENCES "feedsInfo" ("feedId")
             ON UPDATE RESTRICT 
             ON DELETE CASCADE
-);
+) /*rssDB:partitionBy("filingId")*/;
 
 CREATE INDEX "filingsInfo_idx02" ON "filingsInfo" USING btree ("accessionNumber"); 
 CREATE INDEX "filingsInfo_idx03" ON "filingsInfo" USING btree ("formType"); 
@@ -94,7 +94,7 @@ CREATE TABLE IF NOT EXISTS "filesInfo" (
     REFERENCES "filingsInfo" ("filingId")
         ON UPDATE RESTRICT 
         ON DELETE CASCADE
-);
+) /*rssDB:partitionBy("fileId")*/;
 
 CREATE INDEX "filesInfo_idx02" ON "filesInfo" USING btree ("filingId");
 CREATE INDEX "filesInfo_idx03" ON "filesInfo" USING btree ("duplicate");
@@ -102,7 +102,7 @@ CREATE INDEX "filesInfo_idx04" ON "filesInfo" USING btree ("type_tag");
 
 CREATE TABLE IF NOT EXISTS "rssItems" (
 	"filingId" BIGINT NOT NULL UNIQUE PRIMARY KEY,
-	"rssItem" XML,
+	"rssItem" BYTEA,
 	FOREIGN KEY ("filingId") 
         REFERENCES "filingsInfo" ("filingId")
             ON UPDATE RESTRICT 
@@ -164,10 +164,12 @@ CREATE TABLE IF NOT EXISTS "formulaeResults" (
     "filingId" BIGINT NOT NULL,
     "formulaId" BIGINT NOT NULL,
     "inlineXBRL" INTEGER DEFAULT 0,
-    "formulaOutput" XML,
-    "assertionsResults" JSON,
+    "formulaOutput" BYTEA,
+    "assertionsResults" BYTEA,
     "dateTimeProcessed" TIMESTAMP WITHOUT TIME ZONE,
-    "processingLog" XML,
+    "processingLog" BYTEA,
+    "formulaHash" TEXT,
+    "arelleVersion" TEXT,
     UNIQUE ("filingId", "formulaId"),
     FOREIGN KEY ("filingId") 
     REFERENCES "filingsInfo" ("filingId")
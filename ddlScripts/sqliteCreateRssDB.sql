@@ -143,6 +143,8 @@ CREATE TABLE IF NOT EXISTS "formulaeResults" (
     "assertionsResults" BLOB,
     "dateTimeProcessed" TEXT,
     "processingLog" BLOB,
+    "formulaHash" TEXT,
+    "arelleVersion" TEXT,
     UNIQUE ("filingId", "formulaId"),
     FOREIGN KEY (filingId) 
     REFERENCES filingsInfo (filingId)